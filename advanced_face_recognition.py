@@ -3,10 +3,12 @@ import numpy as np
 import face_recognition
 from collections import defaultdict
 import time
+from exemplar_gallery import ExemplarGallery
 
 class AdvancedFaceRecognition:
     def __init__(self):
-        self.face_encodings = {}
+        # One centroid + up to 5 exemplar encodings per student in shared matrices
+        self.face_encodings = ExemplarGallery(128, max_exemplars=5)
         self.face_names = {}
         self.quality_threshold = 0.6
         self.confidence_threshold = 0.6
@@ -75,22 +77,17 @@ class AdvancedFaceRecognition:
         if not face_encodings:
             return False, "Could not encode face"
         
-        # Store multiple encodings for the same person
+        # Store multiple encodings for the same person (keeps only the last 5)
         if student_id not in self.face_encodings:
-            self.face_encodings[student_id] = []
             self.face_names[student_id] = name
         
-        self.face_encodings[student_id].append(face_encodings[0])
-        
-        # Keep only last 5 encodings per person
-        if len(self.face_encodings[student_id]) > 5:
-            self.face_encodings[student_id] = self.face_encodings[student_id][-5:]
+        self.face_encodings.add(student_id, face_encodings[0])
         
         return True, "Face encoding added successfully"
     
     def recognize_face(self, face_image):
         """Recognize face with improved accuracy"""
-        if not self.face_encodings:
+        if len(self.face_encodings) == 0:
             return None, 0, "No registered faces"
         
         quality_ok, quality_msg = self.assess_face_quality(face_image)
@@ -114,16 +111,16 @@ class AdvancedFaceRecognition:
         
         unknown_encoding = face_encodings[0]
         
-        # Compare with all registered faces
+        # Two-stage search: centroids first, then exemplars of the closest students
         best_match = None
         best_confidence = 0
         
-        for student_id, known_encodings in self.face_encodings.items():
-            distances = face_recognition.face_distance(known_encodings, unknown_encoding)
-            min_distance = np.min(distances)
+        matches = self.face_encodings.search(unknown_encoding, k=1)
+        if matches:
+            student_id, min_distance = matches[0]
             confidence = 1 - min_distance
             
-            if confidence > best_confidence and confidence > self.confidence_threshold:
+            if confidence > self.confidence_threshold:
                 best_confidence = confidence
                 best_match = student_id
         
@@ -140,7 +137,7 @@ class AdvancedFaceRecognition:
         """Get recognition statistics"""
         return {
             'total_registered_faces': len(self.face_encodings),
-            'total_encodings': sum(len(encodings) for encodings in self.face_encodings.values()),
+            'total_encodings': self.face_encodings.total_exemplars,
             'confidence_threshold': self.confidence_threshold,
             'anti_spoofing_enabled': self.anti_spoofing_enabled
         }
\ No newline at end of file
@@ -8,62 +8,153 @@ import numpy as np
 import cv2
 import os
 import pickle
+import threading
 from datetime import datetime
+from embedding_store import EmbeddingStore, StaleSegmentError
+from face_gallery import FaceGallery
+from ann_index import IVFIndex
+from incremental_training import train_incremental
+from parallel_encoder import parallel_encoder, encode_image
+
+ENCODING_DIM = 128
+DEFAULT_SCHOOL_ID = 'SCH001'
+SAVE_RETRIES = 3
 
 class AdvancedFaceRecognition:
     def __init__(self, data_dir='data/students'):
         self.data_dir = data_dir
-        self.known_faces = []
-        self.known_ids = []
-        self.model_file = 'data/face_model.pkl'
+        self.indexes = {}  # {school_id: IVFIndex} สร้างจาก memmap ของ segment โรงเรียนนั้น
+        self.store = EmbeddingStore('data/embeddings/dlib128', ENCODING_DIM)
+        self.generations = {}  # {school_id: generation} ของ segment ที่โหลดอยู่
+        self._refresh_lock = threading.Lock()
+        self.model_file = 'data/face_model.pkl'  # ไฟล์ pickle รุ่นเก่า (migrate ครั้งเดียว)
         
-    def train(self, students):
-        """เทรนโมเดลจากรูปนักเรียน"""
+    def train(self, students, progress=None, remove_missing=True):
+        """เทรนโมเดลจากรูปนักเรียน (incremental - encode เฉพาะรูปใหม่/เปลี่ยนไป แบบขนานทุก core)"""
         print("🤖 กำลังเทรนโมเดล AI...")
-        self.known_faces = []
-        self.known_ids = []
         
+        by_school = {}
         for student in students:
-            image_path = student.get('image_path')
-            if image_path and os.path.exists(image_path):
-                try:
-                    image = face_recognition.load_image_file(image_path)
-                    encodings = face_recognition.face_encodings(image)
-                    
-                    if encodings:
-                        self.known_faces.append(encodings[0])
-                        self.known_ids.append(student['student_id'])
-                        print(f"✅ เทรน: {student['name']}")
-                except Exception as e:
-                    print(f"❌ ข้ามไฟล์: {image_path} - {e}")
+            by_school.setdefault(student.get('school_id') or DEFAULT_SCHOOL_ID, []).append(student)
         
-        # บันทึกโมเดล
-        self.save_model()
-        print(f"✅ เทรนเสร็จ! จำนวน: {len(self.known_faces)} คน")
+        totals = {}
+        offset = 0
+        for school_id, school_students in by_school.items():
+            def school_progress(done, total, stats, offset=offset):
+                if progress:
+                    progress(offset + done, len(students), stats)
+            
+            for attempt in range(SAVE_RETRIES):
+                gallery, generation = self.store.load_gallery_versioned(school_id)
+                gallery = gallery or FaceGallery(ENCODING_DIM)
+                
+                def upsert(student_id, encoding, gallery=gallery, names={s['student_id']: s.get('name') for s in school_students}):
+                    gallery.upsert(student_id, encoding)
+                    print(f"✅ เทรน: {names.get(student_id)}")
+                
+                stats, sources = train_incremental(
+                    school_students,
+                    gallery.ids,
+                    self.store.read_sources(school_id),
+                    self._encode_student,
+                    upsert,
+                    gallery.remove,
+                    school_progress,
+                    on_error=lambda student, e: print(f"❌ ข้ามไฟล์: {student.get('image_path')} - {e}"),
+                    encode_many=parallel_encoder.encode,
+                    remove_missing=remove_missing
+                )
+                if not (stats['added'] or stats['updated'] or stats['removed'] or not self.store.segment_info(school_id)):
+                    break
+                try:
+                    self.store.save_gallery(school_id, gallery, sources, expected_generation=generation)
+                    break
+                except StaleSegmentError:
+                    # worker อื่นเทรนโรงเรียนนี้ไปก่อน - เทรนซ้ำบน segment ใหม่ (encode เฉพาะส่วนต่าง)
+                    print(f"🔄 โมเดลของ {school_id} ถูกบันทึกโดย process อื่น - โหลดใหม่แล้วเทรนซ้ำ")
+            offset += len(school_students)
+            
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
         
-    def save_model(self):
-        """บันทึกโมเดล"""
-        os.makedirs('data', exist_ok=True)
-        with open(self.model_file, 'wb') as f:
-            pickle.dump({
-                'faces': self.known_faces,
-                'ids': self.known_ids
-            }, f)
-        print(f"💾 บันทึกโมเดล: {self.model_file}")
+        # โหลดกลับเฉพาะโรงเรียนที่ segment เปลี่ยน
+        self.refresh()
+        print(f"✅ เทรนเสร็จ! จำนวน: {len(self)} คน")
+        return totals
+    
+    def enroll(self, students, progress=None):
+        """เพิ่ม/อัพเดทใบหน้าของนักเรียนกลุ่มนี้ โดยไม่ลบนักเรียนคนอื่นของโรงเรียน (เช่นตอน import)"""
+        return self.train(students, progress=progress, remove_missing=False)
+    
+    def _encode_student(self, student):
+        """encode ใบหน้าจากรูปนักเรียน (None ถ้าไม่พบใบหน้า)"""
+        return encode_image(student['image_path'])
+    
+    def __len__(self):
+        return sum(len(index) for index in list(self.indexes.values()))
     
     def load_model(self):
-        """โหลดโมเดล"""
-        if os.path.exists(self.model_file):
-            with open(self.model_file, 'rb') as f:
-                data = pickle.load(f)
-                self.known_faces = data['faces']
-                self.known_ids = data['ids']
-            print(f"📂 โหลดโมเดล: {len(self.known_faces)} คน")
-            return True
-        return False
+        """โหลดโมเดล (mmap จาก embedding store ไม่ต้อง unpickle) - False ถ้ายังไม่เคยเทรน"""
+        if not self.store.exists() and os.path.exists(self.model_file):
+            self._migrate_pickle()
+        
+        if not self.store.exists():
+            return False
+        
+        self.refresh()
+        print(f"📂 โหลดโมเดล: {len(self)} คน ({len(self.indexes)} โรงเรียน)")
+        return True
+    
+    def refresh(self):
+        """
+        โหลด segment ที่ generation เปลี่ยน (เทรนใน worker อื่น) - โรงเรียนอื่นไม่ต้องโหลด/สร้าง index ใหม่
+        ปกติแค่ stat manifest
+        """
+        current = self.store.generations()
+        if current == self.generations:
+            return
+        with self._refresh_lock:
+            for school_id, generation in current.items():
+                if self.generations.get(school_id) != generation:
+                    self._load_school(school_id)
+            for school_id in [s for s in self.generations if s not in current]:
+                # segment ถูกลบ
+                self.indexes.pop(school_id, None)
+                self.generations.pop(school_id, None)
+    
+    def _load_school(self, school_id):
+        segment = self.store.read_segment_versioned(school_id)
+        if segment is None:
+            self.indexes.pop(school_id, None)
+            self.generations.pop(school_id, None)
+            return
+        ids, matrix, generation = segment
+        # gallery เล็กค้นบน memmap ตรงๆ (zero-copy) - ใหญ่พอจึง k-means เฉพาะโรงเรียนนี้
+        index = IVFIndex(ENCODING_DIM)
+        index.build(ids, matrix)
+        self.indexes[school_id] = index
+        self.generations[school_id] = generation
+    
+    def _migrate_pickle(self):
+        """แปลง data/face_model.pkl รุ่นเก่าเป็น embedding store"""
+        with open(self.model_file, 'rb') as f:
+            data = pickle.load(f)
+        self.store.write_segment(DEFAULT_SCHOOL_ID, list(data['ids']),
+                                 np.asarray(data['faces'], dtype=np.float32).reshape(-1, ENCODING_DIM))
+        print(f"✅ Migrate {self.model_file} -> {self.store.root}: {len(data['ids'])} คน")
     
-    def recognize(self, frame, tolerance=0.6):
-        """จำแนกใบหน้าจากภาพ"""
+    def recognize(self, frame, tolerance=0.6, school_id=None):
+        """จำแนกใบหน้าจากภาพ (ระบุ school_id เพื่อค้นเฉพาะนักเรียนของโรงเรียนนั้น)"""
+        # process อื่นเทรน/ลบ segment - โหลดเฉพาะโรงเรียนที่เปลี่ยนก่อนค้น
+        self.refresh()
+        if school_id is not None:
+            indexes = [self.indexes[school_id]] if school_id in self.indexes else []
+        else:
+            indexes = list(self.indexes.values())
+        indexes = [index for index in indexes if len(index) > 0]
+        if not indexes:
+            return []
+        
         # ลดขนาดเพื่อประมวลผลเร็วขึ้น
         small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
         rgb_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
@@ -73,17 +164,23 @@ class AdvancedFaceRecognition:
         face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
         
         results = []
-        for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-            # เปรียบเทียบกับใบหน้าที่รู้จัก
-            matches = face_recognition.compare_faces(self.known_faces, face_encoding, tolerance=tolerance)
-            face_distances = face_recognition.face_distance(self.known_faces, face_encoding)
-            
-            if len(face_distances) > 0:
-                best_match_index = np.argmin(face_distances)
-                
-                if matches[best_match_index]:
-                    student_id = self.known_ids[best_match_index]
-                    confidence = 1 - face_distances[best_match_index]
+        if not face_encodings:
+            return results
+        
+        # ค้นทุกใบหน้าในเฟรมพร้อมกันผ่าน ANN index (ระยะทางคำนวณครั้งเดียว, re-rank แบบ exact)
+        queries = np.array(face_encodings, dtype=np.float32)
+        best = [(None, float('inf'))] * len(face_encodings)
+        for index in indexes:
+            match_ids, distances = index.search(queries, k=1)
+            for i, (ids, dists) in enumerate(zip(match_ids, distances)):
+                if len(ids) > 0 and float(dists[0]) < best[i][1]:
+                    best[i] = (ids[0], float(dists[0]))
+        
+        for (top, right, bottom, left), (student_id, distance) in zip(face_locations, best):
+            if student_id is not None:
+                # เทียบเท่า compare_faces: distance <= tolerance
+                if distance <= tolerance:
+                    confidence = 1 - distance
                     
                     # ขยายตำแหน่งกลับเป็นขนาดเดิม
                     top *= 4
@@ -99,7 +196,7 @@ class AdvancedFaceRecognition:
         
         return results
     
-    def recognize_from_base64(self, image_data):
+    def recognize_from_base64(self, image_data, school_id=None):
         """จำแนกจาก base64 image"""
         import base64
         
@@ -109,7 +206,7 @@ class AdvancedFaceRecognition:
         nparr = np.frombuffer(base64.b64decode(image_data), np.uint8)
         frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
-        return self.recognize(frame)
+        return self.recognize(frame, school_id=school_id)
 
 # สร้าง instance
 ai_face = AdvancedFaceRecognition()
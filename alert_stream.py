@@ -0,0 +1,202 @@
+"""
+Hikvision alertStream Parser
+แยก event จาก /ISAPI/Event/notification/alertStream แบบ incremental
+
+- รับ chunk ตามที่ได้จาก socket แล้วคืน XML ของทุก event ที่ครบใน chunk นั้น
+- ทำงานกับ bytes ทั้งหมด ไม่ decode buffer ซ้ำ และค้นหา marker ต่อจากตำแหน่งเดิม (ไม่ scan ข้อมูลที่เคยดูแล้ว)
+- รองรับ multipart/mixed (boundary จาก Content-Type) ทั้ง part ที่มี Content-Length และไม่มี
+  part ที่ไม่ใช่ XML (เช่นรูป JPEG ของ faceCapture) ถูกข้ามขณะที่ข้อมูลไหลเข้า โดยไม่เก็บไว้ใน buffer
+- buffer มีขนาดจำกัด (ALERT_STREAM_MAX_BUFFER) ถ้าข้อมูลเสียจนหา event ไม่เจอ จะทิ้งเฉพาะส่วนที่เสียแล้วหา boundary ใหม่
+- XML ที่ parse ไม่ได้ทิ้งเฉพาะ event นั้น event ถัดไปใน buffer ยังอยู่ครบ
+"""
+
+import os
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+MAX_BUFFER = int(os.environ.get('ALERT_STREAM_MAX_BUFFER', str(1024 * 1024)))
+
+XML_END = b'</EventNotificationAlert>'
+HEADER_END = b'\r\n\r\n'
+
+_BOUNDARY_RE = re.compile(r'boundary="?([^";]+)"?', re.IGNORECASE)
+
+
+def boundary_from_content_type(content_type):
+    """boundary จาก header Content-Type ของ response (None ถ้าไม่ใช่ multipart)"""
+    match = _BOUNDARY_RE.search(content_type or '')
+    return match.group(1).strip() if match else None
+
+
+class AlertStreamParser:
+    def __init__(self, boundary=None, max_buffer=MAX_BUFFER):
+        """boundary=None: stream เป็น XML ต่อกันโดยไม่มี multipart header"""
+        self.marker = b'--' + boundary.encode('latin-1') if boundary else None
+        self.max_buffer = max_buffer
+        self._buffer = bytearray()
+        self._scan = 0  # ตำแหน่งที่ค้นหา marker ค้างไว้ (ข้อมูลก่อนหน้านี้ดูแล้วว่าไม่มี marker)
+        self._state = 'boundary' if self.marker else 'xml'
+        self._length = None  # Content-Length ของ part ปัจจุบัน
+        self._skip = 0  # byte ที่เหลือของ part ที่ไม่ต้องการ (ทิ้งทันทีที่มาถึง)
+        self.counters = {'bytes': 0, 'events': 0, 'parts_skipped': 0, 'resyncs': 0, 'dropped_bytes': 0}
+
+    def feed(self, chunk):
+        """เพิ่มข้อมูลจาก stream คืนค่า list ของ XML (bytes) ของ event ที่ครบแล้ว"""
+        self.counters['bytes'] += len(chunk)
+        if self._skip:
+            skipped = min(self._skip, len(chunk))
+            self._skip -= skipped
+            chunk = chunk[skipped:]
+        self._buffer += chunk
+
+        events = []
+        while self._step(events):
+            pass
+        if len(self._buffer) > self.max_buffer:
+            self._resync()
+        return events
+
+    def _step(self, events):
+        """ประมวลผลหนึ่งขั้นของ state machine คืนค่า False เมื่อต้องรอข้อมูลเพิ่ม"""
+        buffer = self._buffer
+        if self._skip:
+            return False
+
+        if self._state == 'boundary':
+            index = self._find(self.marker)
+            if index < 0:
+                # ข้อมูลก่อน boundary ไม่ใช้ - เก็บไว้เฉพาะท้ายที่อาจเป็นต้น marker
+                self._consume(max(0, len(buffer) - len(self.marker) + 1))
+                return False
+            self._consume(index + len(self.marker))
+            self._state = 'headers'
+            return True
+
+        if self._state == 'headers':
+            index = self._find(HEADER_END)
+            if index < 0:
+                return False
+            headers = self._parse_headers(bytes(buffer[:index]))
+            self._consume(index + len(HEADER_END))
+            length = headers.get('content-length')
+            self._length = int(length) if length and length.isdigit() else None
+            content_type = headers.get('content-type', '')
+            wanted = 'xml' in content_type or not content_type
+            if wanted and (self._length is None or self._length <= self.max_buffer):
+                self._state = 'body'
+            elif self._length is not None:
+                # รูปภาพ: ทิ้งตาม Content-Length ไม่ต้องค้นหา boundary ในข้อมูล binary
+                self.counters['parts_skipped'] += 1
+                skipped = min(self._length, len(buffer))
+                self._consume(skipped)
+                self._skip = self._length - skipped
+                self._state = 'boundary'
+            else:
+                self.counters['parts_skipped'] += 1
+                self._state = 'boundary'
+            return True
+
+        if self._state == 'body' and self._length is not None:
+            if len(buffer) < self._length:
+                return False
+            self._emit(bytes(buffer[:self._length]), events)
+            self._consume(self._length)
+            self._state = 'boundary'
+            return True
+
+        # 'xml' (ไม่มี multipart) หรือ part XML ที่ไม่มี Content-Length - จบที่ tag ปิด
+        index = self._find(XML_END)
+        if index < 0:
+            return False
+        if self.marker:
+            self._state = 'boundary'
+            cut = buffer.find(self.marker, 0, index)
+            if cut >= 0:
+                # part นี้ขาดก่อนถึง tag ปิด - ทิ้งเฉพาะ part นี้ ไม่กิน event ของ part ถัดไป
+                self.counters['dropped_bytes'] += cut
+                self._consume(cut)
+                return True
+        end = index + len(XML_END)
+        self._emit(bytes(buffer[:end]), events)
+        self._consume(end)
+        return True
+
+    def _find(self, marker):
+        """ค้นหา marker ต่อจากตำแหน่งที่ค้นหาค้างไว้"""
+        start = max(0, self._scan - len(marker) + 1)
+        index = self._buffer.find(marker, start)
+        self._scan = len(self._buffer) if index < 0 else 0
+        return index
+
+    def _consume(self, size):
+        # del ส่วนหน้าของ bytearray ไม่ copy ข้อมูลที่เหลือทุกครั้ง (ขยับตำแหน่งเริ่มต้นภายใน)
+        del self._buffer[:size]
+        self._scan = 0
+
+    def _emit(self, body, events):
+        start = body.find(b'<')
+        if start < 0:
+            return
+        self.counters['events'] += 1
+        events.append(body[start:].strip())
+
+    def _resync(self):
+        """ข้อมูลเกิน max_buffer โดยไม่ครบ event - ทิ้งข้อมูลเดิมแล้วหา boundary/event ถัดไป"""
+        keep = len(XML_END) - 1
+        dropped = len(self._buffer) - keep
+        self.counters['resyncs'] += 1
+        self.counters['dropped_bytes'] += dropped
+        self._consume(dropped)
+        self._state = 'boundary' if self.marker else 'xml'
+        print(f"⚠️ alertStream: ทิ้งข้อมูลที่ไม่ครบ event {dropped} bytes")
+
+    @staticmethod
+    def _parse_headers(raw):
+        headers = {}
+        for line in raw.decode('latin-1').split('\r\n'):
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        return headers
+
+    def stats(self):
+        return dict(self.counters, buffered=len(self._buffer))
+
+
+def _text(root, tag):
+    # {*} รองรับทั้ง XML ที่มี namespace ของ Hikvision และไม่มี
+    element = root.find(f'.//{{*}}{tag}')
+    return element.text if element is not None else None
+
+
+def parse_face_event(xml):
+    """
+    แปลง XML ของ event เป็น dict ของการจับใบหน้า
+    คืนค่า None ถ้าไม่ใช่ faceDetection, ไม่มีข้อมูลนักเรียน หรือ XML เสีย
+    """
+    try:
+        root = ET.fromstring(xml)
+    except ET.ParseError as e:
+        print(f"⚠️ Parse Error: {str(e)}")
+        return None
+
+    event_type = _text(root, 'eventType')
+    if not event_type or 'faceDetection' not in event_type:
+        return None
+    student_id = _text(root, 'TargetID')
+    name = _text(root, 'name')
+    if student_id is None or name is None:
+        return None
+
+    similarity = _text(root, 'similarity')
+    try:
+        confidence = float(similarity) / 100 if similarity else 0.0
+    except ValueError:
+        confidence = 0.0
+    return {
+        'student_id': student_id,
+        'name': name,
+        'confidence': confidence,
+        'timestamp': _text(root, 'dateTime') or datetime.now().isoformat()
+    }
@@ -0,0 +1,197 @@
+"""
+ANN Index (IVF) สำหรับ face encodings 128 มิติของ dlib
+- แบ่ง encodings เป็น nlist กลุ่มด้วย k-means แล้วค้นเฉพาะ nprobe กลุ่มที่ใกล้ query ที่สุด
+- คัด candidate ด้วย dot product แล้ว re-rank `rerank` อันดับแรกด้วยระยะทาง exact ก่อนตัดสินผลเสมอ
+- nprobe คือ knob ระหว่าง recall กับ latency (nprobe = nlist เท่ากับค้นทั้งหมด)
+- gallery เล็กกว่า min_train_size จะค้นแบบ brute force (exact)
+- เพิ่ม/ลบ/อัพเดทได้โดยไม่ rebuild: ของใหม่อยู่ใน delta gallery, ของที่ลบติด tombstone
+  แล้ว rebuild อัตโนมัติเมื่อ delta โตเกิน rebuild_ratio
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from face_gallery import FaceGallery
+
+DEFAULT_NPROBE = int(os.environ.get('ANN_NPROBE', '8'))
+DEFAULT_MIN_TRAIN_SIZE = int(os.environ.get('ANN_MIN_TRAIN_SIZE', '2048'))
+
+
+def kmeans(matrix, nlist, iterations=10, seed=0, chunk_rows=8192):
+    """k-means แบบง่าย (Lloyd) - คืนค่า (centroids, assignments)"""
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(matrix.shape[0], nlist, replace=False)].astype(np.float32)
+    assignments = np.zeros(matrix.shape[0], dtype=np.int64)
+
+    for _ in range(iterations):
+        assignments = assign(matrix, centroids, chunk_rows)
+        counts = np.bincount(assignments, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, matrix)
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+        # กลุ่มว่าง - สุ่มจุดใหม่
+        empty = np.flatnonzero(~nonempty)
+        if len(empty):
+            centroids[empty] = matrix[rng.choice(matrix.shape[0], len(empty), replace=False)]
+
+    return centroids, assign(matrix, centroids, chunk_rows)
+
+
+def assign(matrix, centroids, chunk_rows=8192):
+    """หากลุ่มที่ใกล้ที่สุดของแต่ละแถว"""
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+    result = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], chunk_rows):
+        block = np.asarray(matrix[start:start + chunk_rows], dtype=np.float32)
+        scores = centroid_norms - 2.0 * (block @ centroids.T)
+        result[start:start + block.shape[0]] = np.argmin(scores, axis=1)
+    return result
+
+
+class IVFIndex:
+    def __init__(self, dim, nprobe=DEFAULT_NPROBE, min_train_size=DEFAULT_MIN_TRAIN_SIZE,
+                 rebuild_ratio=0.2, rerank=8, seed=0):
+        self.dim = int(dim)
+        self.nprobe = int(nprobe)
+        self.min_train_size = int(min_train_size)
+        self.rebuild_ratio = rebuild_ratio
+        self.rerank = int(rerank)  # จำนวน candidate ที่คำนวณระยะทาง exact ซ้ำ
+        self.seed = seed
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.centroids = np.zeros((0, self.dim), dtype=np.float32)
+        self._centroid_norms = np.zeros(0, dtype=np.float32)
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)  # เรียงตามกลุ่ม
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._offsets = np.zeros(1, dtype=np.int64)                 # กลุ่ม i = แถว offsets[i]:offsets[i+1]
+        self._ids = []
+        self._rows = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._dead = 0
+        self._delta = FaceGallery(self.dim)
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    def __len__(self):
+        return len(self._ids) - self._dead + len(self._delta)
+
+    def __contains__(self, face_id):
+        row = self._rows.get(face_id)
+        return (row is not None and self._alive[row]) or face_id in self._delta
+
+    def build(self, face_ids, matrix, nlist=None):
+        """สร้าง index ใหม่ทั้งหมดจาก (ids, matrix)"""
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(len(face_ids), self.dim)
+        with self._lock:
+            self._reset()
+            if len(face_ids) < self.min_train_size:
+                # brute force - ใช้ matrix เดิม (เช่น memmap) โดยไม่ copy
+                if len(face_ids):
+                    self._delta = FaceGallery.from_arrays(list(face_ids), matrix)
+                return
+
+            nlist = nlist or max(1, int(np.sqrt(len(face_ids))))
+            centroids, assignments = kmeans(matrix, nlist, seed=self.seed)
+            order = np.argsort(assignments, kind='stable')
+
+            self.centroids = centroids
+            self._centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+            self._vectors = np.ascontiguousarray(matrix[order])
+            self._sq_norms = np.einsum('ij,ij->i', self._vectors, self._vectors)
+            self._offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))])
+            self._ids = [face_ids[i] for i in order]
+            self._rows = {face_id: row for row, face_id in enumerate(self._ids)}
+            self._alive = np.ones(len(self._ids), dtype=bool)
+
+    def add(self, face_id, vector):
+        """เพิ่มหรืออัพเดท (เก็บใน delta จนกว่าจะ rebuild)"""
+        with self._lock:
+            self._tombstone(face_id)
+            self._delta.upsert(face_id, vector)
+            self._maybe_rebuild()
+
+    def remove(self, face_id):
+        with self._lock:
+            removed = self._tombstone(face_id)
+            removed = self._delta.remove(face_id) or removed
+            self._maybe_rebuild()
+            return removed
+
+    def _tombstone(self, face_id):
+        row = self._rows.get(face_id)
+        if row is None or not self._alive[row]:
+            return False
+        self._alive[row] = False
+        self._dead += 1
+        return True
+
+    def _maybe_rebuild(self):
+        base = max(len(self._ids), self.min_train_size)
+        if len(self._delta) + self._dead > base * self.rebuild_ratio:
+            ids, matrix = self._all()
+            self.build(ids, matrix)
+
+    def _all(self):
+        alive = np.flatnonzero(self._alive)
+        ids = [self._ids[row] for row in alive] + self._delta.ids
+        matrix = np.vstack([self._vectors[alive], self._delta.matrix]) if len(ids) else np.zeros((0, self.dim), np.float32)
+        return ids, matrix
+
+    def search(self, queries, k=1, nprobe=None):
+        """
+        คืนค่า (ids, distances) เหมือน FaceGallery.search (ระยะทาง L2 แบบ exact)
+        nprobe - จำนวนกลุ่มที่ค้น (ยิ่งมาก recall ยิ่งสูงแต่ช้าลง)
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+
+        with self._lock:
+            delta_ids, delta_dist = self._delta.search(queries, k)
+            if self.nlist == 0:
+                return delta_ids, delta_dist
+
+            nprobe = min(nprobe or self.nprobe, self.nlist)
+            probe_scores = self._centroid_norms - 2.0 * (queries @ self.centroids.T)
+            probes = np.argpartition(probe_scores, nprobe - 1, axis=1)[:, :nprobe]
+
+            results_ids, results_dist = [], []
+            for qi, query in enumerate(queries):
+                # แต่ละกลุ่มเป็นแถวต่อเนื่องกันใน _vectors - slice ได้โดยไม่ copy
+                rows, dists = [], []
+                for c in probes[qi]:
+                    start, end = self._offsets[c], self._offsets[c + 1]
+                    if start == end:
+                        continue
+                    sq = self._sq_norms[start:end] - 2.0 * (self._vectors[start:end] @ query)
+                    sq[~self._alive[start:end]] = np.inf
+                    rows.append(np.arange(start, end))
+                    dists.append(sq)
+                rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+                sq = np.concatenate(dists) if dists else np.zeros(0, dtype=np.float32)
+
+                n_rerank = max(k, self.rerank)
+                top = np.argpartition(sq, n_rerank - 1)[:n_rerank] if len(sq) > n_rerank else np.arange(len(sq))
+                top = top[np.isfinite(sq[top])]
+                # exact re-rank ของ candidate ที่เหลือ
+                diff = self._vectors[rows[top]] - query
+                exact = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+                cand_ids = [self._ids[row] for row in rows[top]] + list(delta_ids[qi])
+                cand_dist = np.concatenate([exact, delta_dist[qi]])
+                order = np.argsort(cand_dist)[:k]
+                results_ids.append([cand_ids[i] for i in order])
+                results_dist.append(cand_dist[order])
+
+            width = max((len(d) for d in results_dist), default=0)
+            distances = np.full((len(queries), width), np.inf, dtype=np.float32)
+            for qi, dist in enumerate(results_dist):
+                distances[qi, :len(dist)] = dist
+            return results_ids, distances
@@ -0,0 +1,284 @@
+"""
+Attendance Write-Behind Queue
+รับ event การเข้า-ออกจากกล้อง/gate แล้วคืนค่าทันที โดยไม่รอ INSERT + COMMIT ของ database
+- thread เบื้องหลังรวม event เป็น batch แล้วเขียนใน transaction เดียว
+  (flush เมื่อครบ max_batch แถว หรือเมื่อ event แรกของ batch รอครบ flush_interval)
+- timestamp ถูกบันทึกตอนรับ event ไม่ใช่ตอน flush
+- ถ้าเขียนไม่สำเร็จ (database ล่ม/lock) จะลองใหม่แบบ backoff โดยไม่ทิ้ง event
+  batch ที่ล้มเหลวครบ ATTENDANCE_MAX_ATTEMPTS ครั้งจะถูกแบ่งครึ่ง จนเหลือแถวเดียวที่เขียนไม่ได้
+  แถวนั้นย้ายไป dead-letter file (JSON lines) - แถวเสียแถวเดียวไม่ขวาง event อื่น
+- spool (ไม่บังคับ): ทุก event ถูก append ลงไฟล์ก่อนตอบกลับ ถ้า process ตายก่อน flush
+  process ถัดไปจะเขียน event ที่ค้างอยู่ให้ตอน start (at-least-once - batch ที่ commit แล้ว
+  แต่ยังไม่ได้บันทึก checkpoint อาจถูกเขียนซ้ำหนึ่งครั้ง)
+
+spool แยกไฟล์ตาม pid (attendance-<pid>.log) เพราะ gunicorn หลาย worker เขียนพร้อมกัน
+ไฟล์ของ process ที่ตายแล้วจะถูก process อื่นรับไปเขียนต่อ และไฟล์เก่าที่ pid ซ้ำกับ process ใหม่
+(container restart) จะถูกอ่านก่อนเปิดไฟล์ใหม่
+"""
+
+import atexit
+import glob
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+MAX_BATCH = int(os.environ.get('ATTENDANCE_BATCH_SIZE', '200'))
+FLUSH_INTERVAL = float(os.environ.get('ATTENDANCE_FLUSH_MS', '200')) / 1000
+SPOOL_DIR = os.environ.get('ATTENDANCE_SPOOL_DIR') or None
+SPOOL_FSYNC = os.environ.get('ATTENDANCE_SPOOL_FSYNC', 'false').lower() == 'true'
+DEAD_LETTER_PATH = os.environ.get('ATTENDANCE_DEAD_LETTER', 'data/attendance_dead_letter.jsonl')
+MAX_ATTEMPTS = int(os.environ.get('ATTENDANCE_MAX_ATTEMPTS', '5'))
+MAX_RETRY_DELAY = 30.0
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Spool:
+    """
+    append-only log ของ event: {"seq": n, "event": {...}} และ checkpoint {"committed": n}
+    event ที่ seq มากกว่า checkpoint ล่าสุดคือ event ที่ยังไม่ถูกเขียนลง database
+    """
+
+    def __init__(self, directory, fsync=SPOOL_FSYNC):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'attendance-{os.getpid()}.log')
+        # ไฟล์ชื่อเดียวกันจากการรันครั้งก่อน (pid ซ้ำหลัง restart) - รับ event ค้างก่อนเปิดไฟล์ใหม่
+        self._previous = self._claim(self.path) if os.path.exists(self.path) else []
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def append(self, seq, event):
+        self._write({'seq': seq, 'event': event})
+
+    def checkpoint(self, seq):
+        self._write({'committed': seq})
+
+    def truncate(self):
+        """ไม่มี event ค้าง - เริ่มไฟล์ใหม่"""
+        self._file.truncate(0)
+        self._file.seek(0)
+
+    def close(self):
+        self._file.close()
+
+    @staticmethod
+    def read_pending(path):
+        events, committed = {}, 0
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # บรรทัดสุดท้ายเขียนไม่ครบตอน process ตาย
+                if 'committed' in entry:
+                    committed = max(committed, entry['committed'])
+                else:
+                    events[entry['seq']] = entry['event']
+        return [event for seq, event in sorted(events.items()) if seq > committed]
+
+    def _claim(self, path):
+        """อ่าน event ค้างแล้วลบไฟล์ คืนค่า [] ถ้า process อื่นรับไปก่อน"""
+        claimed = f'{path}.{os.getpid()}.claim'
+        try:
+            os.rename(path, claimed)  # atomic - process อื่นที่ start พร้อมกันจะไม่ได้ไฟล์เดียวกัน
+        except OSError:
+            return []
+        pending = self.read_pending(claimed)
+        os.remove(claimed)
+        return pending
+
+    def claim_orphans(self):
+        """event ค้างจากการรันครั้งก่อนของ pid นี้ และจากไฟล์ของ process ที่ตายแล้ว (ไฟล์ถูกลบหลังอ่าน)"""
+        pending, self._previous = self._previous, []
+        for path in sorted(glob.glob(os.path.join(self.directory, 'attendance-*.log'))):
+            match = re.search(r'attendance-(\d+)\.log$', path)
+            if path == self.path or not match or _pid_alive(int(match.group(1))):
+                continue
+            pending.extend(self._claim(path))
+        return pending
+
+
+class AttendanceQueue:
+    def __init__(self, write_batch, max_batch=MAX_BATCH, flush_interval=FLUSH_INTERVAL,
+                 spool_dir=SPOOL_DIR, fsync=SPOOL_FSYNC, max_attempts=MAX_ATTEMPTS, dead_letter_path=DEAD_LETTER_PATH):
+        """write_batch(events) เขียน event ทั้งหมดใน transaction เดียว (เช่น Database.add_attendance_batch)"""
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.spool_dir = spool_dir
+        self.fsync = fsync
+        self.max_attempts = max_attempts
+        self.dead_letter_path = dead_letter_path
+        self._condition = threading.Condition()
+        self._pending = []   # [(seq, event)]
+        self._seq = 0
+        self._inflight = 0   # จำนวน event ที่กำลังเขียน
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.spool = None
+        self.counters = {'enqueued': 0, 'written': 0, 'batches': 0, 'failures': 0, 'recovered': 0, 'dead_letter': 0}
+
+    def _ensure_started(self):
+        # start แบบ lazy และเริ่มใหม่หลัง fork (gunicorn preload) - thread ไม่ติดไปกับ fork
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._pending = []
+        self._inflight = 0
+        if self.spool_dir:
+            self.spool = Spool(self.spool_dir, self.fsync)
+            for event in self.spool.claim_orphans():
+                self._append(event)
+                self.counters['recovered'] += 1
+        self._thread = threading.Thread(target=self._run, name='attendance-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _append(self, event):
+        self._seq += 1
+        if self.spool is not None:
+            self.spool.append(self._seq, event)
+        self._pending.append((self._seq, event))
+        self.counters['enqueued'] += 1
+
+    def put(self, student_id, student_name, school_id, camera_type='general', timestamp=None):
+        """บันทึก event แล้วคืนค่าทันที (เขียนลง database ภายใน flush_interval)"""
+        event = {
+            'student_id': student_id,
+            'student_name': student_name,
+            'school_id': school_id,
+            'camera_type': camera_type,
+            'timestamp': (timestamp or datetime.now()).isoformat()
+        }
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('attendance queue is closed')
+            self._ensure_started()
+            self._append(event)
+            if len(self._pending) in (1, self.max_batch):
+                self._condition.notify_all()
+        return True
+
+    def _take_batch(self):
+        """รอจนครบ max_batch หรือ event แรกรอครบ flush_interval (เรียกภายใน lock)"""
+        while not self._pending:
+            if self._closed:
+                return None
+            self._condition.wait()
+        deadline = time.monotonic() + self.flush_interval
+        while len(self._pending) < self.max_batch and not self._closed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._condition.wait(remaining)
+        batch = self._pending[:self.max_batch]
+        self._pending = self._pending[self.max_batch:]
+        self._inflight = len(batch)
+        return batch
+
+    def _run(self):
+        delay = 0.5
+        attempts = 0
+        work = []  # batch ที่รอเขียนตามลำดับ (batch ที่ล้มเหลวซ้ำถูกแบ่งครึ่งไว้ในนี้)
+        while True:
+            if not work:
+                with self._condition:
+                    batch = self._take_batch()
+                if batch is None:
+                    return
+                work = [batch]
+            batch = work[0]
+            try:
+                self.write_batch([event for seq, event in batch])
+            except Exception as e:
+                attempts += 1
+                self.counters['failures'] += 1
+                if attempts >= self.max_attempts:
+                    attempts = 0
+                    if len(batch) > 1:
+                        # อาจมีแถวเสีย - แบ่งครึ่งเพื่อหาแถวนั้น แถวอื่นเขียนต่อได้
+                        half = len(batch) // 2
+                        work[0:1] = [batch[:half], batch[half:]]
+                        print(f"⚠️ Attendance batch failed {self.max_attempts} times, splitting {len(batch)} rows: {e}")
+                        continue
+                    self._dead_letter(batch[0][1], e)
+                    self._done(work.pop(0), dead=True)
+                    continue
+                print(f"⚠️ Attendance batch write failed ({len(batch)} rows), retry in {delay:.1f}s: {e}")
+                with self._condition:
+                    if self._closed and self.spool is not None:
+                        # ปิด process อยู่ - event ยังอยู่ใน spool ให้ process ถัดไปเขียน
+                        self._inflight = 0
+                        self._condition.notify_all()
+                        return
+                    self._condition.wait(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                continue
+
+            delay = 0.5
+            attempts = 0
+            self._done(work.pop(0))
+
+    def _dead_letter(self, event, error):
+        os.makedirs(os.path.dirname(self.dead_letter_path) or '.', exist_ok=True)
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'event': event, 'error': str(error), 'failed_at': datetime.now().isoformat()},
+                               ensure_ascii=False) + '\n')
+        print(f"❌ Attendance event moved to dead-letter ({self.dead_letter_path}): {event['student_id']} - {error}")
+
+    def _done(self, batch, dead=False):
+        """batch เขียนเสร็จ (หรือย้ายไป dead-letter) - บันทึก checkpoint ของ spool"""
+        with self._condition:
+            if dead:
+                self.counters['dead_letter'] += len(batch)
+            else:
+                self.counters['written'] += len(batch)
+                self.counters['batches'] += 1
+            self._inflight -= len(batch)
+            if self.spool is not None:
+                if self._pending or self._inflight:
+                    self.spool.checkpoint(batch[-1][0])
+                else:
+                    self.spool.truncate()
+            self._condition.notify_all()
+
+    def flush(self, timeout=10.0):
+        """รอจนกว่า event ที่รับมาแล้วทั้งหมดถูกเขียน คืนค่า True ถ้าเสร็จทันเวลา"""
+        with self._condition:
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._pending and not self._inflight, timeout)
+
+    def close(self, timeout=10.0):
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        if self.spool is not None:
+            self.spool.close()
+
+    def stats(self):
+        with self._condition:
+            return dict(self.counters, pending=len(self._pending) + self._inflight,
+                        spool=self.spool.path if self.spool is not None else None)
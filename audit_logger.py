@@ -3,18 +3,19 @@ Audit Log System
 บันทึกการใช้งานระบบทั้งหมด
 """
 
-import sqlite3
+from sqlite_pool import get_pool
 from datetime import datetime
 import json
 
 class AuditLogger:
     def __init__(self, db_path='data/database.db'):
         self.db_path = db_path
+        self.pool = get_pool(db_path)  # ใช้ connection ร่วมกับ Database
         self.init_table()
     
     def init_table(self):
         """สร้างตาราง audit_logs"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.pool.acquire()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -40,7 +41,7 @@ class AuditLogger:
             resource_id=None, details=None, ip_address=None, 
             user_agent=None, status='success'):
         """บันทึก audit log"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.pool.acquire()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -66,8 +67,7 @@ class AuditLogger:
     
     def get_logs(self, limit=100, user_id=None, action=None, resource=None):
         """ดึง audit logs"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self.pool.acquire()
         cursor = conn.cursor()
         
         query = 'SELECT * FROM audit_logs WHERE 1=1'
@@ -100,8 +100,7 @@ class AuditLogger:
         
         start_date = (datetime.now() - timedelta(days=days)).isoformat()
         
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        conn = self.pool.acquire()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -121,7 +120,7 @@ class AuditLogger:
         
         start_date = (datetime.now() - timedelta(days=days)).isoformat()
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self.pool.acquire()
         cursor = conn.cursor()
         
         # Total logs
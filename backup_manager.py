@@ -6,6 +6,7 @@ Backup and Restore System
 import os
 import shutil
 import sqlite3
+from sqlite_pool import get_pool
 from datetime import datetime
 import zipfile
 import json
@@ -14,10 +15,33 @@ class BackupManager:
     def __init__(self, db_path='data/database.db', backup_dir='backups'):
         self.db_path = db_path
         self.backup_dir = backup_dir
+        self.pool = get_pool(db_path)
         os.makedirs(backup_dir, exist_ok=True)
     
-    def create_backup(self, include_images=True):
-        """สร้าง backup"""
+    def _copy_database(self, target_path):
+        """สำเนา database ผ่าน SQLite backup API (ได้ข้อมูลใน WAL ครบ และไม่ต้องหยุดการเขียน)"""
+        conn = self.pool.acquire()
+        try:
+            target = sqlite3.connect(target_path)
+            try:
+                conn.backup(target)
+            finally:
+                target.close()
+        finally:
+            conn.close()
+    
+    def _restore_database(self, source_path):
+        """เขียนทับ database ปัจจุบันด้วยไฟล์ backup ผ่าน connection ที่ใช้ร่วมกัน"""
+        source = sqlite3.connect(source_path)
+        conn = self.pool.acquire()
+        try:
+            source.backup(conn)
+        finally:
+            conn.close()
+            source.close()
+    
+    def create_backup(self, include_images=True, progress=None):
+        """สร้าง backup - progress: callback(done, total, counts) ระหว่างบีบอัดไฟล์ (เช่น Job.progress)"""
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         backup_name = f"backup_{timestamp}"
         backup_path = os.path.join(self.backup_dir, backup_name)
@@ -26,14 +50,16 @@ class BackupManager:
         
         # Backup database
         if os.path.exists(self.db_path):
-            shutil.copy2(self.db_path, os.path.join(backup_path, 'database.db'))
+            self._copy_database(os.path.join(backup_path, 'database.db'))
         
         # Backup images
         if include_images and os.path.exists('data/students'):
             shutil.copytree('data/students', os.path.join(backup_path, 'students'))
         
-        # Backup face model
-        if os.path.exists('data/face_model.pkl'):
+        # Backup face model (embedding store)
+        if os.path.exists('data/embeddings'):
+            shutil.copytree('data/embeddings', os.path.join(backup_path, 'embeddings'))
+        elif os.path.exists('data/face_model.pkl'):
             shutil.copy2('data/face_model.pkl', os.path.join(backup_path, 'face_model.pkl'))
         
         # Create metadata
@@ -49,15 +75,21 @@ class BackupManager:
         
         # Create zip
         zip_path = f"{backup_path}.zip"
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(backup_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, backup_path)
-                    zipf.write(file_path, arcname)
-        
-        # Remove temp folder
-        shutil.rmtree(backup_path)
+        file_paths = [os.path.join(root, file) for root, dirs, files in os.walk(backup_path) for file in files]
+        try:
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                for index, file_path in enumerate(file_paths, 1):
+                    zipf.write(file_path, os.path.relpath(file_path, backup_path))
+                    if progress:
+                        progress(index, len(file_paths), None)
+        except BaseException:
+            # ยกเลิก/ผิดพลาดระหว่างบีบอัด - ไม่ทิ้งไฟล์ zip ที่ไม่สมบูรณ์ไว้ในรายการ backup
+            if os.path.exists(zip_path):
+                os.remove(zip_path)
+            raise
+        finally:
+            # Remove temp folder
+            shutil.rmtree(backup_path)
         
         return {
             'success': True,
@@ -114,9 +146,9 @@ class BackupManager:
             if os.path.exists(db_backup):
                 # Backup current database first
                 if os.path.exists(self.db_path):
-                    shutil.copy2(self.db_path, f"{self.db_path}.before_restore")
+                    self._copy_database(f"{self.db_path}.before_restore")
                 
-                shutil.copy2(db_backup, self.db_path)
+                self._restore_database(db_backup)
             
             # Restore images
             students_backup = os.path.join(restore_path, 'students')
@@ -126,6 +158,12 @@ class BackupManager:
                 shutil.copytree(students_backup, 'data/students')
             
             # Restore face model
+            embeddings_backup = os.path.join(restore_path, 'embeddings')
+            if os.path.exists(embeddings_backup):
+                if os.path.exists('data/embeddings'):
+                    shutil.rmtree('data/embeddings')
+                shutil.copytree(embeddings_backup, 'data/embeddings')
+            
             model_backup = os.path.join(restore_path, 'face_model.pkl')
             if os.path.exists(model_backup):
                 shutil.copy2(model_backup, 'data/face_model.pkl')
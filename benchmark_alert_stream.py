@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark: parse alertStream แบบเดิม (ต่อ bytes + decode ทั้ง buffer ทุก chunk) vs AlertStreamParser
+replay stream ที่บันทึกจากกล้องจริง (HikvisionFaceAPI.get_face_detection_events(record_path=...))
+ถ้าไม่ระบุไฟล์ จะสร้าง stream จำลอง: burst ของ faceDetection + รูป JPEG + heartbeat videoloss
+
+Usage: python benchmark_alert_stream.py [capture_path] [chunk_size] [repeat]
+"""
+
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from alert_stream import AlertStreamParser, parse_face_event
+
+BOUNDARY = 'boundary'
+
+FACE_EVENT = '''<?xml version="1.0" encoding="UTF-8"?>
+<EventNotificationAlert version="2.0" xmlns="http://www.hikvision.com/ver20/XMLSchema">
+<ipAddress>192.168.1.64</ipAddress>
+<channelID>1</channelID>
+<dateTime>2024-01-15T07:{minute:02d}:{second:02d}+07:00</dateTime>
+<activePostCount>1</activePostCount>
+<eventType>faceDetection</eventType>
+<eventState>active</eventState>
+<eventDescription>faceDetection alarm</eventDescription>
+<FaceInfo><TargetID>STD{index:04d}</TargetID><name>นักเรียน {index}</name><similarity>{similarity}</similarity></FaceInfo>
+</EventNotificationAlert>'''
+
+HEARTBEAT = '''<?xml version="1.0" encoding="UTF-8"?>
+<EventNotificationAlert version="2.0" xmlns="http://www.hikvision.com/ver20/XMLSchema">
+<ipAddress>192.168.1.64</ipAddress>
+<dateTime>2024-01-15T07:00:00+07:00</dateTime>
+<eventType>videoloss</eventType>
+<eventState>inactive</eventState>
+</EventNotificationAlert>'''
+
+
+def part(content_type, body):
+    return (f'--{BOUNDARY}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n'.encode()
+            + body + b'\r\n')
+
+
+def synthetic_capture(events=2000, image_size=8 * 1024):
+    """stream จำลองตอนเช้า: นักเรียนเดินผ่าน gate ต่อเนื่อง แต่ละ event มีรูปใบหน้าแนบ"""
+    image = os.urandom(image_size)
+    data = bytearray()
+    for index in range(events):
+        xml = FACE_EVENT.format(minute=index // 60 % 60, second=index % 60, index=index,
+                                similarity=80 + index % 20).encode('utf-8')
+        data += part('application/xml; charset="UTF-8"', xml)
+        data += part('image/jpeg', image)
+        if index % 50 == 0:
+            data += part('application/xml; charset="UTF-8"', HEARTBEAT.encode('utf-8'))
+    return bytes(data)
+
+
+def capture_boundary(data):
+    """boundary จากบรรทัดแรกของ capture (None = XML ต่อกันไม่มี multipart)"""
+    first_line = data.lstrip().split(b'\r\n', 1)[0]
+    return first_line[2:].decode('latin-1') if first_line.startswith(b'--') else None
+
+
+def legacy(chunks, boundary=None):
+    """ตรรกะเดิมของ get_face_detection_events (นับ event ที่ parse XML ได้)"""
+    found = 0
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        if b'</EventNotificationAlert>' in buffer:
+            try:
+                xml_str = buffer.decode('utf-8', errors='ignore')
+                start = xml_str.find('<?xml')
+                end = xml_str.find('</EventNotificationAlert>') + len('</EventNotificationAlert>')
+                if start >= 0 and end > start:
+                    ET.fromstring(xml_str[start:end])
+                    found += 1
+                    buffer = buffer[buffer.find(b'</EventNotificationAlert>') + len(b'</EventNotificationAlert>'):]
+            except Exception:
+                buffer = b""
+    return found
+
+
+def incremental(chunks, boundary=None):
+    parser = AlertStreamParser(boundary)
+    found = 0
+    for chunk in chunks:
+        for event_xml in parser.feed(chunk):
+            parse_face_event(event_xml)
+            found += 1
+    return found
+
+
+def run(label, fn, chunks, boundary, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = fn(chunks, boundary)
+        best = min(best, time.perf_counter() - start)
+    total_bytes = sum(len(chunk) for chunk in chunks)
+    print(f"{label:<12} {found:6d} events   {best * 1000:9.1f} ms   {total_bytes / best / 1024 / 1024:8.1f} MB/s")
+    return best
+
+
+def main():
+    capture_path = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] != '-' else None
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    if capture_path:
+        with open(capture_path, 'rb') as f:
+            data = f.read()
+    else:
+        data = synthetic_capture()
+    boundary = capture_boundary(data)
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    print(f"Capture {len(data) / 1024:.0f} KB, {len(chunks)} chunks of {chunk_size} bytes")
+
+    before = run('legacy', legacy, chunks, boundary, repeat)
+    after = run('incremental', incremental, chunks, boundary, repeat)
+    print(f"Speedup: {before / after:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
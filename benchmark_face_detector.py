@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark: สร้าง CascadeClassifier ใหม่ทุก request vs ใช้ detector_registry
+จำลอง request พร้อมกันหลาย thread (เหมือน gunicorn threads/greenlets)
+
+Usage: python benchmark_face_detector.py [image_path] [threads] [requests]
+"""
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from face_detector import detector_registry, DEFAULT_CASCADE
+
+
+def load_gray(image_path=None):
+    if image_path:
+        image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if image is not None:
+            return image
+    # ภาพสุ่มขนาดเท่าเฟรมจากกล้อง gate (640x480)
+    return np.random.default_rng(0).integers(0, 256, (480, 640), dtype=np.uint8)
+
+
+def per_request(gray):
+    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + DEFAULT_CASCADE)
+    return face_cascade.detectMultiScale(gray, 1.3, 5)
+
+
+def shared(gray):
+    return detector_registry.detect(gray, 1.3, 5)
+
+
+def run(label, fn, gray, threads, requests):
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        fn(gray)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    print(f"{label:<14} {requests / elapsed:8.1f} req/s   "
+          f"p50 {np.percentile(latencies_ms, 50):7.2f} ms   "
+          f"p95 {np.percentile(latencies_ms, 95):7.2f} ms")
+    return float(np.mean(latencies_ms))
+
+
+def main():
+    image_path = sys.argv[1] if len(sys.argv) > 1 else None
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    requests = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    gray = load_gray(image_path)
+    print(f"Image {gray.shape[1]}x{gray.shape[0]}, {threads} threads, {requests} requests")
+
+    detector_registry.warm_up()
+    before = run('per-request', per_request, gray, threads, requests)
+    after = run('registry', shared, gray, threads, requests)
+    print(f"Saving per request: {before - after:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
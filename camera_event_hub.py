@@ -0,0 +1,329 @@
+"""
+Camera Event Hub
+รับ alertStream จากกล้อง Hikvision ทุกตัวในตาราง cameras ด้วย asyncio ใน process เดียว
+(แทนการรัน hikvision_gate_listener หนึ่ง process ต่อหนึ่งกล้อง)
+
+- หนึ่ง task ต่อกล้อง: เชื่อมต่อค้างไว้, ต่อใหม่อัตโนมัติด้วย exponential backoff + jitter
+- event ถูกติด school_id / camera_type (gate_in/gate_out) ตามแถวของกล้องนั้น
+- ส่งต่อให้ EventSink (บันทึก attendance, LINE, cloud sync) ที่มีคิวและจำนวน worker จำกัด
+  handler ที่ช้า (เช่น LINE API) ไม่ทำให้การอ่าน stream ของกล้องอื่นหยุด
+- โหลดรายการกล้องใหม่ทุก CAMERA_HUB_REFRESH วินาที: กล้องที่เพิ่ม/แก้/ลบ มีผลโดยไม่ต้อง restart
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import parse_http_list, parse_keqv_list
+
+from alert_stream import AlertStreamParser, boundary_from_content_type, parse_face_event
+
+REFRESH_SECONDS = float(os.environ.get('CAMERA_HUB_REFRESH', '60'))
+RECONNECT_MAX = float(os.environ.get('CAMERA_HUB_RECONNECT_MAX', '60'))
+CONNECT_TIMEOUT = float(os.environ.get('CAMERA_HUB_CONNECT_TIMEOUT', '10'))
+READ_TIMEOUT = float(os.environ.get('CAMERA_HUB_READ_TIMEOUT', '120'))  # ไม่มีข้อมูล (รวม heartbeat) นานเกินนี้ = ต่อใหม่
+HANDLER_WORKERS = int(os.environ.get('CAMERA_HUB_HANDLER_WORKERS', '4'))
+HANDLER_QUEUE = int(os.environ.get('CAMERA_HUB_QUEUE_SIZE', '1000'))
+
+ALERT_STREAM_PATH = '/ISAPI/Event/notification/alertStream'
+
+
+def camera_direction(camera_type):
+    """type ของกล้องในตาราง cameras -> camera_type ของ attendance"""
+    value = (camera_type or '').lower()
+    if 'out' in value or 'exit' in value or 'ออก' in value:
+        return 'gate_out'
+    return 'gate_in'
+
+
+def load_cameras(db, school_id=None):
+    """
+    กล้องทั้งหมดที่ hub ต้องติดตาม {key: camera} (หรือเฉพาะของโรงเรียน school_id)
+    รวมกล้องตั้งค่าแบบเดิม (schools.camera_ip) ที่ยังไม่ได้ย้ายเข้าตาราง cameras เป็นกล้องขาเข้า
+    """
+    cameras = {}
+    for row in db.get_cameras(school_id):
+        key = f"camera:{row['id']}"
+        cameras[key] = {
+            'key': key,
+            'camera_id': row['id'],
+            'school_id': row['school_id'],
+            'name': row['name'],
+            'ip': row['ip'],
+            'port': int(row.get('port') or 80),
+            'username': row.get('username') or 'admin',
+            'password': row.get('password') or '',
+            'camera_type': camera_direction(row['type'])
+        }
+
+    registered = {(camera['ip'], camera['port']) for camera in cameras.values()}
+    schools = [db.get_school(school_id)] if school_id else db.get_all_schools()
+    for school in schools:
+        if school and school.get('camera_ip') and (school['camera_ip'], 80) not in registered:
+            key = f"school:{school['school_id']}"
+            cameras[key] = {
+                'key': key,
+                'camera_id': None,
+                'school_id': school['school_id'],
+                'name': school['name'],
+                'ip': school['camera_ip'],
+                'port': 80,
+                'username': school.get('camera_user') or 'admin',
+                'password': school.get('camera_pass') or '',
+                'camera_type': 'gate_in'
+            }
+    return cameras
+
+
+def _digest_authorization(challenge, method, path, username, password):
+    """header Authorization แบบ Digest (MD5, qop=auth) จาก WWW-Authenticate ของกล้อง"""
+    params = parse_keqv_list(parse_http_list(challenge))
+    realm, nonce = params.get('realm', ''), params.get('nonce', '')
+
+    def md5(value):
+        return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+    ha1 = md5(f'{username}:{realm}:{password}')
+    ha2 = md5(f'{method}:{path}')
+    fields = [f'username="{username}"', f'realm="{realm}"', f'nonce="{nonce}"', f'uri="{path}"', 'algorithm=MD5']
+    if 'auth' in [qop.strip() for qop in params.get('qop', '').split(',')]:
+        cnonce = os.urandom(8).hex()
+        response = md5(f'{ha1}:{nonce}:00000001:{cnonce}:auth:{ha2}')
+        fields += ['qop=auth', 'nc=00000001', f'cnonce="{cnonce}"']
+    else:
+        response = md5(f'{ha1}:{nonce}:{ha2}')
+    fields.append(f'response="{response}"')
+    if 'opaque' in params:
+        fields.append(f"opaque=\"{params['opaque']}\"")
+    return 'Digest ' + ', '.join(fields)
+
+
+async def _request(camera, authorization=None):
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(camera['ip'], camera['port']), CONNECT_TIMEOUT)
+    lines = [f'GET {ALERT_STREAM_PATH} HTTP/1.1', f"Host: {camera['ip']}:{camera['port']}", 'Accept: */*']
+    if authorization:
+        lines.append(f'Authorization: {authorization}')
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    await writer.drain()
+
+    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), CONNECT_TIMEOUT)
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    status = int(status_line.split()[1])
+    headers = {}
+    for line in header_lines:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return reader, writer, status, headers
+
+
+async def _read_body(reader, headers):
+    """ข้อมูลของ response ตามที่มาถึง (รองรับ Transfer-Encoding: chunked)"""
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        while True:
+            size_line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+            size = int(size_line.split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                return
+            data = await asyncio.wait_for(reader.readexactly(size + 2), READ_TIMEOUT)
+            yield data[:-2]
+    else:
+        while True:
+            data = await asyncio.wait_for(reader.read(65536), READ_TIMEOUT)
+            if not data:
+                return
+            yield data
+
+
+async def open_alert_stream(camera):
+    """เปิด alertStream ของกล้อง คืนค่า (boundary, async iterator ของ chunk)"""
+    reader, writer, status, headers = await _request(camera)
+    if status == 401:
+        writer.close()
+        challenge = headers.get('www-authenticate', '')
+        if challenge.lower().startswith('digest'):
+            authorization = _digest_authorization(challenge[len('digest'):].strip(), 'GET', ALERT_STREAM_PATH,
+                                                  camera['username'], camera['password'])
+        else:
+            token = base64.b64encode(f"{camera['username']}:{camera['password']}".encode('utf-8')).decode('ascii')
+            authorization = f'Basic {token}'
+        reader, writer, status, headers = await _request(camera, authorization)
+    if status != 200:
+        writer.close()
+        raise ConnectionError(f'HTTP {status}')
+
+    async def chunks():
+        try:
+            async for data in _read_body(reader, headers):
+                yield data
+        finally:
+            writer.close()
+
+    return boundary_from_content_type(headers.get('content-type')), chunks()
+
+
+class EventSink:
+    def __init__(self, name, handler, workers=HANDLER_WORKERS, maxsize=HANDLER_QUEUE, block=False):
+        """
+        handler(event) - function ปกติ (รันใน thread pool ของ sink) หรือ coroutine function
+        block=True: คิวเต็มแล้วรอ (ไม่ทิ้ง event เช่นการบันทึก attendance)
+        block=False: คิวเต็มแล้วทิ้ง event (เช่น LINE / cloud sync ที่ปลายทางช้า)
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self.block = block
+        self._queue = None
+        self._tasks = []
+        self._executor = None
+        self.counters = {'handled': 0, 'errors': 0, 'dropped': 0}
+
+    def start(self):
+        self._queue = asyncio.Queue(self.maxsize)
+        if not asyncio.iscoroutinefunction(self.handler):
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'sink-{self.name}')
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def offer(self, event):
+        if self.block:
+            await self._queue.put(event)
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.counters['dropped'] += 1
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            event = await self._queue.get()
+            try:
+                if self._executor is None:
+                    await self.handler(event)
+                else:
+                    await loop.run_in_executor(self._executor, self.handler, event)
+                self.counters['handled'] += 1
+            except Exception as e:
+                self.counters['errors'] += 1
+                print(f"⚠️ Event handler '{self.name}' error: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def join(self):
+        await self._queue.join()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def stats(self):
+        return dict(self.counters, queued=self._queue.qsize() if self._queue else 0)
+
+
+class CameraEventHub:
+    def __init__(self, cameras_fn, sinks, accept=None, open_stream=open_alert_stream,
+                 refresh=REFRESH_SECONDS, backoff=(1.0, RECONNECT_MAX)):
+        """
+        cameras_fn() -> {key: camera} (เช่น lambda: load_cameras(db)) - เรียกใน thread
+        accept(event) -> False เพื่อไม่ส่ง event ต่อ (เช่น GateDebouncer) - เรียกใน thread
+        """
+        self.cameras_fn = cameras_fn
+        self.sinks = sinks
+        self.accept = accept
+        self.open_stream = open_stream
+        self.refresh = refresh
+        self.backoff = backoff
+        self._cameras = {}
+        self._tasks = {}
+        self._state = {}
+        self.counters = {'events': 0, 'dispatched': 0, 'suppressed': 0}
+
+    async def run(self):
+        """ทำงานจนกว่าจะถูก cancel"""
+        for sink in self.sinks:
+            sink.start()
+        try:
+            while True:
+                try:
+                    cameras = await asyncio.to_thread(self.cameras_fn)
+                    self._sync_followers(cameras)
+                except Exception as e:
+                    print(f"⚠️ Camera list error: {e}")
+                await asyncio.sleep(self.refresh)
+        finally:
+            await self.stop()
+
+    def _sync_followers(self, cameras):
+        for key in list(self._tasks):
+            if cameras.get(key) != self._cameras.get(key):
+                self._tasks.pop(key).cancel()
+                self._state.pop(key, None)
+        for key, camera in cameras.items():
+            if key not in self._tasks:
+                self._state[key] = {'school_id': camera['school_id'], 'name': camera['name'], 'status': 'connecting',
+                                    'events': 0, 'reconnects': 0, 'last_error': None, 'last_event_at': None}
+                self._tasks[key] = asyncio.create_task(self._follow(camera, self._state[key]))
+        self._cameras = dict(cameras)
+        print(f"🎥 Camera hub: ติดตาม {len(self._tasks)} กล้อง")
+
+    async def _follow(self, camera, state):
+        initial, maximum = self.backoff
+        delay = initial
+        while True:
+            try:
+                boundary, chunks = await self.open_stream(camera)
+                state['status'] = 'online'
+                delay = initial
+                parser = AlertStreamParser(boundary)
+                async for chunk in chunks:
+                    for event_xml in parser.feed(chunk):
+                        await self._handle(camera, state, event_xml)
+                raise ConnectionError('stream closed')
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if state['status'] != 'offline':
+                    print(f"⚠️ Camera {camera['name']} ({camera['ip']}): {e}")
+                state.update(status='offline', last_error=str(e) or type(e).__name__)
+                state['reconnects'] += 1
+            # jitter กันกล้องหลายร้อยตัวต่อใหม่พร้อมกันหลังเครือข่ายกลับมา
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(maximum, delay * 2)
+
+    async def _handle(self, camera, state, event_xml):
+        result = parse_face_event(event_xml)
+        if result is None:
+            return
+        self.counters['events'] += 1
+        state['events'] += 1
+        state['last_event_at'] = time.time()
+        event = dict(result, school_id=camera['school_id'], camera_type=camera['camera_type'],
+                     camera_id=camera['camera_id'], camera_name=camera['name'])
+
+        if self.accept is not None and not await asyncio.to_thread(self.accept, event):
+            self.counters['suppressed'] += 1
+            return
+        self.counters['dispatched'] += 1
+        for sink in self.sinks:
+            await sink.offer(event)
+
+    async def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+        for sink in self.sinks:
+            await sink.stop()
+
+    def stats(self):
+        return dict(self.counters,
+                    cameras={key: dict(state) for key, state in self._state.items()},
+                    sinks={sink.name: sink.stats() for sink in self.sinks})
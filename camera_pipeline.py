@@ -0,0 +1,171 @@
+"""
+Camera Pipeline
+แยกงานของกล้องแต่ละตัวเป็น stage ที่ทำงานคนละ thread:
+    capture thread  -> อ่านเฟรมจากกล้องตลอดเวลา ใส่คิวขนาด 1 (เฟรมเก่าที่ยังไม่ถูกใช้จะถูกทิ้ง)
+    process thread  -> detect/recognize/วาดกรอบ ตามความเร็วของตัวเอง แล้ว encode JPEG ครั้งเดียว
+    FrameBroadcaster -> เก็บ JPEG ล่าสุดให้ viewer ทุกคนอ่านร่วมกัน
+
+viewer ที่เพิ่มขึ้นไม่เพิ่มงาน CPU และ viewer ที่ช้าจะข้ามเฟรมไปเอง ไม่ทำให้ recognition ช้าตาม
+"""
+
+import queue
+import threading
+import time
+
+
+def encode_jpeg(frame, quality=80):
+    import cv2
+    ok, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return buffer.tobytes() if ok else None
+
+
+def put_latest(q, item):
+    """ใส่คิวแบบไม่ block - ถ้าเต็มให้ทิ้งของเก่าแล้วใส่ของใหม่ คืนค่า True ถ้ามีเฟรมถูกทิ้ง"""
+    dropped = False
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped = True
+            except queue.Empty:
+                pass
+
+
+class FrameBroadcaster:
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._jpeg = None
+        self._seq = 0
+        self._closed = False
+        self.viewers = 0
+
+    def publish(self, jpeg):
+        with self._condition:
+            self._jpeg = jpeg
+            self._seq += 1
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def latest(self):
+        with self._condition:
+            return self._jpeg
+
+    def stream(self, timeout=1.0):
+        """yield JPEG ใหม่ทุกครั้งที่มี (ข้ามเฟรมที่ viewer อ่านไม่ทัน) จนกว่าจะ close"""
+        last = 0
+        with self._condition:
+            self.viewers += 1
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._seq != last or self._closed, timeout)
+                    if self._closed:
+                        return
+                    if self._seq == last:
+                        continue
+                    last, jpeg = self._seq, self._jpeg
+                yield jpeg
+        finally:
+            with self._condition:
+                self.viewers -= 1
+
+
+class CameraPipeline:
+    def __init__(self, open_capture, process_fn, encode_fn=encode_jpeg, reconnect_delay=1.0):
+        """
+        open_capture() -> object ที่มี read() / release() (เช่น cv2.VideoCapture)
+        process_fn(frame) -> เฟรมที่วาดผลแล้ว (ทำงานใน process thread)
+        encode_fn(frame) -> JPEG bytes
+        """
+        self.open_capture = open_capture
+        self.process_fn = process_fn
+        self.encode_fn = encode_fn
+        self.reconnect_delay = reconnect_delay
+        self.broadcaster = FrameBroadcaster()
+        self._frames = queue.Queue(maxsize=1)
+        self._latest_frame = None
+        self._lock = threading.Lock()
+        self._running = False
+        self._threads = []
+        self.counters = {'captured': 0, 'processed': 0, 'dropped': 0, 'errors': 0}
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name='camera-capture', daemon=True),
+            threading.Thread(target=self._process_loop, name='camera-process', daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=2.0):
+        self._running = False
+        self.broadcaster.close()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+        self._threads = []
+
+    def latest_frame(self):
+        """เฟรมดิบล่าสุดจากกล้อง (copy)"""
+        with self._lock:
+            return None if self._latest_frame is None else self._latest_frame.copy()
+
+    def stream(self):
+        return self.broadcaster.stream()
+
+    def stats(self):
+        return dict(self.counters, viewers=self.broadcaster.viewers, running=self._running)
+
+    def _capture_loop(self):
+        cap = None
+        try:
+            while self._running:
+                if cap is None:
+                    cap = self.open_capture()
+                ret, frame = cap.read()
+                if not ret:
+                    # กล้องหยุดทำงาน ลองเชื่อมต่อใหม่
+                    print("Camera disconnected, reconnecting...")
+                    cap.release()
+                    cap = None
+                    time.sleep(self.reconnect_delay)
+                    continue
+                with self._lock:
+                    self._latest_frame = frame
+                self.counters['captured'] += 1
+                if put_latest(self._frames, frame):
+                    self.counters['dropped'] += 1
+        finally:
+            if cap is not None:
+                cap.release()
+
+    def _process_loop(self):
+        while self._running:
+            try:
+                frame = self._frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                # copy ก่อนวาด - latest_frame() ต้องคืนเฟรมดิบ
+                jpeg = self.encode_fn(self.process_fn(frame.copy()))
+            except Exception as e:
+                self.counters['errors'] += 1
+                print(f"Camera pipeline error: {e}")
+                continue
+            if jpeg is not None:
+                self.counters['processed'] += 1
+                self.broadcaster.publish(jpeg)
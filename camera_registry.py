@@ -0,0 +1,296 @@
+"""
+Camera Registry
+สถานะและ connection ของกล้อง/terminal Hikvision ที่ request handler ใช้ร่วมกัน - handler ไม่ต้องรอกล้องที่ติดต่อไม่ได้
+
+- โหลดกล้องของโรงเรียนจาก database ครั้งแรกที่ใช้ แล้ว cache (ล้างด้วย invalidate เมื่อแก้การตั้งค่า)
+- HikvisionFaceAPI หนึ่งตัวต่อกล้อง ใช้ซ้ำทุก request (keep-alive session)
+- thread เบื้องหลัง probe สุขภาพกล้องทุก CAMERA_PROBE_INTERVAL วินาที
+- circuit breaker ต่อกล้อง: ล้มเหลวติดกัน CAMERA_BREAKER_FAILURES ครั้งแล้วหยุดติดต่อชั่วคราว
+  (รอ CAMERA_BREAKER_RESET วินาที เพิ่มเป็นสองเท่าทุกครั้งที่ยังไม่กลับมา สูงสุด CAMERA_BREAKER_RESET_MAX)
+- งานกับกล้อง (add_face / delete_face) เข้าคิวของกล้องนั้นแล้วทำเบื้องหลังทีละงาน
+  กล้องออฟไลน์: งานรออยู่ในคิว (งานล่าสุดต่อนักเรียนเท่านั้น) และทำต่อเมื่อกล้องกลับมา
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+PROBE_INTERVAL = float(os.environ.get('CAMERA_PROBE_INTERVAL', '30'))
+CONFIG_TTL = float(os.environ.get('CAMERA_CONFIG_TTL', '300'))
+BREAKER_FAILURES = int(os.environ.get('CAMERA_BREAKER_FAILURES', '3'))
+BREAKER_RESET = float(os.environ.get('CAMERA_BREAKER_RESET', '30'))
+BREAKER_RESET_MAX = float(os.environ.get('CAMERA_BREAKER_RESET_MAX', '300'))
+REGISTRY_WORKERS = int(os.environ.get('CAMERA_REGISTRY_WORKERS', '4'))
+PENDING_MAX = 5000  # งานค้างต่อกล้องสูงสุด (เกินแล้วทิ้งงานเก่าสุด - face sync เก็บตกได้)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET,
+                 max_reset_timeout=BREAKER_RESET_MAX, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.timeout = reset_timeout
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self.clock() - self.opened_at >= self.timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """True = ติดต่อกล้องได้ (closed หรือถึงเวลาลองใหม่)"""
+        return self.state != 'open'
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.timeout = self.reset_timeout
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None:
+            # ลองใหม่แล้วยังล้มเหลว - รอนานขึ้น
+            self.timeout = min(self.max_reset_timeout, self.timeout * 2)
+            self.opened_at = self.clock()
+        elif self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+
+
+class CameraEntry:
+    def __init__(self, camera, device, breaker):
+        self.camera = camera
+        self.device = device
+        self.breaker = breaker
+        self.status = 'unknown'  # unknown / online / offline
+        self.last_probe = None
+        self.last_error = None
+        self.pending = OrderedDict()  # key -> (name, fn)
+        self.draining = False
+        self.counters = {'done': 0, 'failed': 0, 'dropped': 0}
+
+    def to_dict(self):
+        return {
+            'name': self.camera['name'],
+            'ip': self.camera['ip'],
+            'port': self.camera['port'],
+            'camera_type': self.camera['camera_type'],
+            'status': self.status,
+            'breaker': self.breaker.state,
+            'last_probe': self.last_probe,
+            'last_error': self.last_error,
+            'pending': len(self.pending),
+            **self.counters
+        }
+
+
+class CameraRegistry:
+    def __init__(self, cameras_fn, device_factory, probe_interval=PROBE_INTERVAL, config_ttl=CONFIG_TTL,
+                 workers=REGISTRY_WORKERS, clock=time.monotonic, breaker_factory=None):
+        """
+        cameras_fn(school_id) -> list ของ camera dict (ดู camera_event_hub.load_cameras)
+        device_factory(camera) -> device ที่มี test_connection() (เช่น HikvisionFaceAPI)
+        """
+        self.cameras_fn = cameras_fn
+        self.device_factory = device_factory
+        self.probe_interval = probe_interval
+        self.config_ttl = config_ttl
+        self.workers = workers
+        self.clock = clock
+        self.breaker_factory = breaker_factory or (lambda: CircuitBreaker(clock=clock))
+        self._entries = {}  # device key -> CameraEntry (ใช้ซ้ำเมื่อโหลดการตั้งค่าใหม่)
+        self._schools = {}  # school_id -> (expires_at, [device key])
+        self._lock = threading.Lock()
+        self._executor = None
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _key(camera):
+        return f"{camera['ip']}:{camera['port']}:{camera['username']}"
+
+    @staticmethod
+    def _credentials(camera):
+        return camera['username'], camera['password']
+
+    def _ensure_started(self):
+        # start หลัง fork (gunicorn preload) - thread ของ process แม่ไม่ติดมา
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='camera')
+        for entry in self._entries.values():
+            entry.draining = False
+        if self.probe_interval:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._probe_loop, name='camera-probe', daemon=True)
+            self._thread.start()
+
+    def entries(self, school_id):
+        """CameraEntry ของโรงเรียน - อ่านการตั้งค่าจาก database เมื่อ cache หมดอายุเท่านั้น ไม่ติดต่อกล้อง"""
+        with self._lock:
+            self._ensure_started()
+            cached = self._schools.get(school_id)
+            if cached is not None and cached[0] > self.clock():
+                return [self._entries[key] for key in cached[1]]
+
+        cameras = list(self.cameras_fn(school_id))
+        new_entries = []
+        with self._lock:
+            keys = []
+            for camera in cameras:
+                key = self._key(camera)
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._entries[key] = CameraEntry(camera, self.device_factory(camera), self.breaker_factory())
+                    new_entries.append(entry)
+                else:
+                    if self._credentials(camera) != self._credentials(entry.camera):
+                        # เปลี่ยนรหัสผ่าน: สร้าง connection ใหม่และเริ่ม breaker/สถานะใหม่ (งานค้างในคิวยังอยู่)
+                        entry.device = self.device_factory(camera)
+                        entry.breaker = self.breaker_factory()
+                        entry.status = 'unknown'
+                        entry.last_error = None
+                        new_entries.append(entry)
+                    entry.camera = camera
+                keys.append(key)
+            self._schools[school_id] = (self.clock() + self.config_ttl, keys)
+            entries = [self._entries[key] for key in keys]
+        # กล้องใหม่: probe ทันทีเบื้องหลัง (สถานะจะเป็น unknown จนกว่าจะเสร็จ)
+        for entry in new_entries:
+            self._executor.submit(self._probe, entry)
+        return entries
+
+    def get(self, school_id):
+        """device ที่ออนไลน์อยู่ตัวแรกของโรงเรียน หรือ None (ไม่รอ network)"""
+        for entry in self.entries(school_id):
+            if entry.status == 'online' and entry.breaker.allow():
+                return entry.device
+        return None
+
+    def devices(self, school_id, include_unknown=True):
+        """device ที่น่าจะติดต่อได้ (สำหรับงานเบื้องหลัง เช่น face sync) - ข้ามกล้องที่ breaker เปิดอยู่"""
+        return [entry.device for entry in self.entries(school_id)
+                if entry.breaker.allow() and (entry.status == 'online' or (include_unknown and entry.status == 'unknown'))]
+
+    def submit(self, school_id, key, name, fn):
+        """
+        เข้าคิว fn(device) กับทุกกล้องของโรงเรียน คืนจำนวนกล้องที่รับงาน
+        key เดียวกัน (เช่น student_id) แทนที่งานที่ยังค้างอยู่ - ลบหลังเพิ่มจะเหลือแค่ลบ
+        """
+        entries = self.entries(school_id)
+        for entry in entries:
+            with self._lock:
+                entry.pending.pop(key, None)
+                entry.pending[key] = (name, fn)
+                if len(entry.pending) > PENDING_MAX:
+                    entry.pending.popitem(last=False)
+                    entry.counters['dropped'] += 1
+            self._schedule_drain(entry)
+        return len(entries)
+
+    def _schedule_drain(self, entry):
+        with self._lock:
+            if entry.draining or not entry.pending or not entry.breaker.allow() or entry.status == 'offline':
+                return None
+            entry.draining = True
+        return self._executor.submit(self._drain, entry)
+
+    def _drain(self, entry):
+        """ทำงานในคิวของกล้องทีละงาน - หยุดเมื่อ breaker เปิด (งานที่เหลือรอกล้องกลับมา)"""
+        try:
+            while True:
+                with self._lock:
+                    if not entry.pending or entry.status == 'offline' or not entry.breaker.allow():
+                        return
+                    key, (name, fn) = next(iter(entry.pending.items()))
+                try:
+                    result = fn(entry.device)
+                    ok = not (isinstance(result, dict) and result.get('success') is False)
+                    error = None if ok else result.get('message')
+                except Exception as e:
+                    ok, error = False, str(e)
+
+                # ล้มเหลว: probe เพื่อแยกว่ากล้องติดต่อไม่ได้ (เก็บงานไว้ทำเมื่อกลับมา) หรือกล้องปฏิเสธงานนี้ (ทิ้งงาน)
+                if not ok and not self._probe(entry, drain=False):
+                    print(f"⚠️ Camera {entry.camera['ip']} {name} ({key}): {error} - รอกล้องกลับมา")
+                    return
+                with self._lock:
+                    # งานใหม่ของ key เดียวกันอาจเข้ามาระหว่างทำ - ลบเฉพาะงานที่ทำไปแล้ว
+                    if entry.pending.get(key, (None, None))[1] is fn:
+                        del entry.pending[key]
+                    if ok:
+                        entry.counters['done'] += 1
+                    else:
+                        entry.counters['failed'] += 1
+                        entry.last_error = error
+                if not ok:
+                    print(f"⚠️ Camera {entry.camera['ip']} {name} ({key}): {error}")
+        finally:
+            with self._lock:
+                entry.draining = False
+
+    def _probe(self, entry, drain=True):
+        try:
+            ok = bool(entry.device.test_connection())
+            error = None if ok else 'ไม่สามารถเชื่อมต่อกล้องได้'
+        except Exception as e:
+            ok, error = False, str(e)
+        with self._lock:
+            entry.last_probe = time.time()
+            if ok:
+                entry.breaker.record_success()
+                if entry.status != 'online':
+                    print(f"✅ Camera online: {entry.camera['name']} ({entry.camera['ip']})")
+                entry.status = 'online'
+                entry.last_error = None
+            else:
+                entry.breaker.record_failure()
+                entry.last_error = error
+                if entry.status != 'offline':
+                    print(f"⚠️ Camera offline: {entry.camera['name']} ({entry.camera['ip']})")
+                entry.status = 'offline'
+        if ok and drain:
+            self._schedule_drain(entry)
+        return ok
+
+    def probe_due(self):
+        """probe กล้องที่ breaker อนุญาต (closed ทุกรอบ, open เมื่อถึงเวลาลองใหม่) คืนค่า list ของ future"""
+        with self._lock:
+            self._ensure_started()
+            entries = [entry for entry in self._entries.values() if entry.breaker.allow()]
+        return [self._executor.submit(self._probe, entry) for entry in entries]
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.probe_interval):
+            try:
+                self.probe_due()
+            except Exception as e:
+                print(f"⚠️ Camera probe error: {e}")
+
+    def invalidate(self, school_id=None):
+        """การตั้งค่ากล้องเปลี่ยน - โหลดใหม่ครั้งถัดไป (connection/สถานะของกล้องเดิมยังใช้ต่อ)"""
+        with self._lock:
+            if school_id is None:
+                self._schools.clear()
+            else:
+                self._schools.pop(school_id, None)
+
+    def stats(self, school_id=None):
+        if school_id is not None:
+            return [entry.to_dict() for entry in self.entries(school_id)]
+        with self._lock:
+            return {key: entry.to_dict() for key, entry in self._entries.items()}
+
+    def close(self):
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,158 @@
+"""
+Dashboard Stats
+ตัวนับของ dashboard (/api/dashboard_stats, /api/realtime/status, /api/super_admin/dashboard)
+- ตัวนับของโรงเรียนคำนวณใน query เดียว (Database.dashboard_counts) แทน COUNT แยกทีละตาราง
+- cache แยกตามโรงเรียนพร้อม TTL สั้นๆ: dashboard หลายจอที่ poll พร้อมกันใช้ผลเดียวกัน
+  และมี request เดียวที่ query เมื่อ cache หมดอายุ (request อื่นรอผลเดียวกัน)
+- ล้าง cache ของโรงเรียนทันทีเมื่อมีการเขียน attendance / behavior / students (Database.on_write)
+
+cache อยู่ใน process เดียว - gunicorn worker อื่นจะเห็นข้อมูลใหม่ภายใน TTL
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+SCHOOL_TTL = float(os.environ.get('DASHBOARD_CACHE_TTL', '10'))
+REALTIME_TTL = float(os.environ.get('REALTIME_CACHE_TTL', '3'))
+PLATFORM_TTL = float(os.environ.get('PLATFORM_CACHE_TTL', '60'))
+
+
+class _Load:
+    """การโหลดที่กำลังทำอยู่ของ key หนึ่ง - request อื่นที่ miss พร้อมกันรอผลนี้"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    def __init__(self, ttl, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = {}     # key -> (expires_at, value)
+        self._loads = {}       # key -> _Load
+        self._generation = 0   # เพิ่มทุกครั้งที่ invalidate - ผลที่โหลดก่อน invalidate จะไม่ถูกเก็บ
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, key, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self.counters['hits'] += 1
+                return entry[1]
+            load = self._loads.get(key)
+            leader = load is None
+            if leader:
+                load = self._loads[key] = _Load()
+                self.counters['misses'] += 1
+                generation = self._generation
+
+        if not leader:
+            load.done.wait()
+            if load.error is not None:
+                raise load.error
+            return load.value
+
+        try:
+            load.value = loader()
+        except Exception as e:
+            load.error = e
+            raise
+        finally:
+            with self._lock:
+                if load.error is None and generation == self._generation:
+                    self._entries[key] = (self.clock() + self.ttl, load.value)
+                self._loads.pop(key, None)
+            load.done.set()
+        return load.value
+
+    def invalidate(self, key=None):
+        """ล้าง key เดียว (หรือทั้งหมดถ้าไม่ระบุ)"""
+        with self._lock:
+            self._generation += 1
+            self.counters['invalidations'] += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), ttl=self.ttl)
+
+
+class DashboardStats:
+    def __init__(self, db, school_ttl=SCHOOL_TTL, realtime_ttl=REALTIME_TTL, platform_ttl=PLATFORM_TTL,
+                 clock=time.monotonic):
+        self.db = db
+        self.schools = TTLCache(school_ttl, clock)
+        self.realtime = TTLCache(realtime_ttl, clock)
+        self.platform = TTLCache(platform_ttl, clock)
+        if hasattr(db, 'on_write'):
+            db.on_write(self.invalidate)
+
+    @staticmethod
+    def _today():
+        # timestamp ของ attendance บันทึกด้วย datetime.now() ของเครื่อง
+        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return start, start + timedelta(days=1)
+
+    def school_stats(self, school_id):
+        """ตัวนับของหน้า dashboard โรงเรียน"""
+        return self.schools.get(school_id, lambda: self._load_school(school_id))
+
+    def _load_school(self, school_id):
+        counts = self.db.dashboard_counts(school_id, *self._today())
+        total = counts['total_students']
+        counts['attendance_rate'] = round((counts['today_attendance'] / total * 100) if total > 0 else 0, 1)
+        return counts
+
+    def realtime_status(self, school_id):
+        """การเข้าเรียนล่าสุดของวันนี้ 10 รายการ + พฤติกรรมที่ต้องติดตาม 5 รายการ"""
+        return self.realtime.get(school_id, lambda: self._load_realtime(school_id))
+
+    def _load_realtime(self, school_id):
+        start, end = self._today()
+        return {
+            'recent_attendance': self.db.query_attendance(school_id, start, end, limit=10),
+            'alerts': self.db.get_behavior(school_id, severities=('warning', 'danger'), limit=5)
+        }
+
+    def platform_stats(self):
+        """ตัวนับของ super admin dashboard (ทุกโรงเรียน)"""
+        return self.platform.get('platform', self._load_platform)
+
+    def _load_platform(self):
+        expire_before = (datetime.now().date() + timedelta(days=30)).isoformat()
+        counts = self.db.platform_counts(expire_before)
+        total = counts['total_schools']
+        # resellers / payments มีเฉพาะบาง backend
+        resellers = self.db.get_all_resellers() if hasattr(self.db, 'get_all_resellers') else []
+        return {
+            'total_schools': total,
+            'total_resellers': len(resellers),
+            'total_students': counts['total_students'],
+            'monthly_revenue': self.db.get_revenue('month') if hasattr(self.db, 'get_revenue') else 0,
+            'expiring_soon': counts['expiring_soon'],
+            'active_rate': round((counts['active_schools'] / total * 100) if total > 0 else 0, 1)
+        }
+
+    def invalidate(self, table, school_id=None):
+        """listener ของ Database.on_write"""
+        # school_id = None (เช่นลบนักเรียนด้วย student_id) ล้างทุกโรงเรียน
+        self.schools.invalidate(school_id)
+        if table in ('attendance', 'behavior'):
+            self.realtime.invalidate(school_id)
+        elif table == 'students':
+            self.platform.invalidate()
+
+    def stats(self):
+        return {
+            'schools': self.schools.stats(),
+            'realtime': self.realtime.stats(),
+            'platform': self.platform.stats()
+        }
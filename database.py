@@ -1,9 +1,9 @@
 # Database Manager for Student Care System
 # © 2025 SOFTUBON CO.,LTD.
 
-import sqlite3
 import json
 from datetime import datetime
+from sqlite_pool import get_pool
 
 class Database:
     def __init__(self, db_path='data/database.db'):
@@ -11,9 +11,8 @@ class Database:
         self.init_database()
     
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        # connection จาก pool (WAL, busy_timeout) - conn.close() คืนเข้า pool
+        return get_pool(self.db_path).acquire()
     
     def init_database(self):
         conn = self.get_connection()
@@ -1,10 +1,16 @@
 import os
 import json
-from datetime import datetime
+from contextlib import contextmanager
+import time as time_module
+from datetime import datetime, time, timedelta, timezone
 from dotenv import load_dotenv
+from db_migrations import MigrationRunner
 
 load_dotenv(override=True)
 
+# อ่านค่า ATTENDANCE_* จาก .env
+from attendance_queue import AttendanceQueue
+
 try:
     from security.password_manager import password_manager
 except:
@@ -20,31 +26,42 @@ except:
 
 USE_POSTGRES = os.environ.get('USE_POSTGRES', 'false').lower() == 'true'
 
+def day_range(start_date, end_date=None):
+    """ช่วงเวลา [start, end) ครอบคลุมวันที่ start_date ถึง end_date (รวมวันสุดท้าย)"""
+    start = datetime.fromisoformat(start_date) if isinstance(start_date, str) else start_date
+    end = datetime.fromisoformat(end_date) if isinstance(end_date, str) and end_date else (end_date or start)
+    return start, end + timedelta(days=1)
+
 class Database:
     def __init__(self):
         self.db_type = 'postgresql' if USE_POSTGRES else 'sqlite'
         self.pool = None
+        self._write_listeners = []
+        self.attendance_queue = AttendanceQueue(self.add_attendance_batch)
         
         if self.db_type == 'postgresql':
             import psycopg2
-            from psycopg2 import pool
             from psycopg2.extras import RealDictCursor
+            from pg_pool import PgPool, patch_gevent
             self.psycopg2 = psycopg2
             self.RealDictCursor = RealDictCursor
             
-            self.pool = pool.ThreadedConnectionPool(
-                10, 100,
+            # เปิด connection เมื่อใช้จริง ขนาดตามจำนวน gunicorn worker (ดู pg_pool.py)
+            patch_gevent()
+            self.pool = PgPool(lambda: psycopg2.connect(
                 host=os.environ.get('DB_HOST'),
                 database=os.environ.get('DB_NAME', 'postgres'),
                 user=os.environ.get('DB_USER'),
                 password=os.environ.get('DB_PASSWORD'),
                 port=os.environ.get('DB_PORT', '5432'),
                 connect_timeout=10
-            )
+            ))
         else:
             import sqlite3
+            from sqlite_pool import get_pool
             self.sqlite3 = sqlite3
             self.db_path = 'data/database.db'
+            self.sqlite_pool = get_pool(self.db_path)
         
         self.init_database()
     
@@ -52,9 +69,8 @@ class Database:
         if self.db_type == 'postgresql':
             return self.pool.getconn()
         else:
-            conn = self.sqlite3.connect(self.db_path)
-            conn.row_factory = self.sqlite3.Row
-            return conn
+            # connection จาก pool (WAL, busy_timeout, mmap) - close() คืนเข้า pool
+            return self.sqlite_pool.acquire()
     
     def close_connection(self, conn):
         if self.db_type == 'postgresql':
@@ -62,6 +78,34 @@ class Database:
         else:
             conn.close()
     
+    @contextmanager
+    def connection(self):
+        """with db.connection() as conn: - คืน connection เข้า pool เสมอแม้ query ล้มเหลว"""
+        conn = self.get_connection()
+        try:
+            yield conn
+        finally:
+            self.close_connection(conn)
+    
+    def dict_cursor(self, conn):
+        """cursor ที่อ่านแถวเป็น dict ได้ทั้ง SQLite (sqlite3.Row) และ PostgreSQL (RealDictCursor)"""
+        return conn.cursor() if self.db_type == 'sqlite' else conn.cursor(cursor_factory=self.RealDictCursor)
+    
+    def on_write(self, listener):
+        """ลงทะเบียน listener(table, school_id) ที่ถูกเรียกหลังเขียน students / attendance / behavior (เช่นล้าง cache)"""
+        self._write_listeners.append(listener)
+    
+    def _notify_write(self, table, school_id=None):
+        for listener in self._write_listeners:
+            try:
+                listener(table, school_id)
+            except Exception as e:
+                print(f"⚠️ Write listener error: {e}")
+    
+    def pool_stats(self):
+        """metrics ของ connection pool"""
+        return self.pool.stats() if self.db_type == 'postgresql' else self.sqlite_pool.stats()
+    
     def init_database(self):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -283,7 +327,12 @@ class Database:
         
         conn.commit()
         cursor.close()
-        self.close_connection(conn)
+        
+        # index และการเปลี่ยน schema หลังจากนี้อยู่ใน db_migrations (มีเวอร์ชัน)
+        try:
+            MigrationRunner(self.db_type).run(conn)
+        finally:
+            self.close_connection(conn)
     
     def get_user(self, username):
         conn = self.get_connection()
@@ -345,6 +394,23 @@ class Database:
         finally:
             self.close_connection(conn)
     
+    def get_student(self, school_id, student_id):
+        """นักเรียนหนึ่งคน (ใช้ unique index ของ student_id) คืนค่า None ถ้าไม่พบ"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor() if self.db_type == 'sqlite' else conn.cursor(cursor_factory=self.RealDictCursor)
+            
+            if self.db_type == 'postgresql':
+                cursor.execute('SELECT * FROM students WHERE student_id = %s AND school_id = %s', (student_id, school_id))
+            else:
+                cursor.execute('SELECT * FROM students WHERE student_id = ? AND school_id = ?', (student_id, school_id))
+            
+            row = cursor.fetchone()
+            cursor.close()
+            return dict(row) if row else None
+        finally:
+            self.close_connection(conn)
+    
     def add_student(self, student_id, name, class_name, school_id, image_path, parent_line_token=None):
         conn = self.get_connection()
         try:
@@ -365,6 +431,88 @@ class Database:
             cursor.close()
         finally:
             self.close_connection(conn)
+        self._notify_write('students', school_id)
+    
+    def upsert_students(self, school_id, students):
+        """
+        เพิ่ม/อัพเดทนักเรียนหลายคนใน transaction เดียว (ใช้โดยการนำเข้าแบบ bulk)
+        students - [{'student_id', 'name', 'class_name', 'parent_line_token' (ว่าง = คงค่าเดิม)}]
+        image_path ของนักเรียนที่มีอยู่แล้วไม่ถูกเปลี่ยน
+        คืนค่า {'inserted': n, 'updated': n, 'conflicts': [student_id ที่เป็นของโรงเรียนอื่น]}
+        """
+        result = {'inserted': 0, 'updated': 0, 'conflicts': []}
+        if not students:
+            return result
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        now = datetime.now() if self.db_type == 'postgresql' else datetime.now().isoformat()
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            
+            # student_id เป็น unique ทั้งระบบ - แยกรหัสที่เป็นของโรงเรียนอื่นออกก่อน
+            ids = [student['student_id'] for student in students]
+            existing = {}
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                cursor.execute(
+                    f"SELECT student_id, school_id FROM students WHERE student_id IN ({', '.join([ph] * len(chunk))})",
+                    chunk
+                )
+                existing.update((row[0], row[1]) for row in cursor.fetchall())
+            
+            rows = []
+            for student in students:
+                owner = existing.get(student['student_id'])
+                if owner is not None and owner != school_id:
+                    result['conflicts'].append(student['student_id'])
+                    continue
+                result['updated' if owner is not None else 'inserted'] += 1
+                rows.append((student['student_id'], student['name'], student.get('class_name') or '', school_id,
+                             student.get('parent_line_token') or None, now))
+            
+            sql = '''
+                INSERT INTO students (student_id, name, class_name, school_id, parent_line_token, created_at)
+                VALUES {values}
+                ON CONFLICT (student_id) DO UPDATE SET
+                    name = excluded.name,
+                    class_name = excluded.class_name,
+                    parent_line_token = COALESCE(excluded.parent_line_token, students.parent_line_token)
+                WHERE students.school_id = excluded.school_id
+            '''
+            if self.db_type == 'postgresql':
+                from psycopg2.extras import execute_values
+                execute_values(cursor, sql.format(values='%s'), rows, page_size=500)
+            else:
+                cursor.executemany(sql.format(values='(?, ?, ?, ?, ?, ?)'), rows)
+            
+            conn.commit()
+            cursor.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.close_connection(conn)
+        self._notify_write('students', school_id)
+        return result
+    
+    def set_student_images(self, school_id, image_paths):
+        """อัพเดท image_path หลายคนใน transaction เดียว - image_paths = {student_id: path}"""
+        if not image_paths:
+            return
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(
+                f'UPDATE students SET image_path = {ph} WHERE student_id = {ph} AND school_id = {ph}',
+                [(path, student_id, school_id) for student_id, path in image_paths.items()]
+            )
+            conn.commit()
+            cursor.close()
+        finally:
+            self.close_connection(conn)
+        self._notify_write('students', school_id)
     
     def update_student(self, student_id, name, class_name, school_id, image_path):
         conn = self.get_connection()
@@ -386,6 +534,7 @@ class Database:
             cursor.close()
         finally:
             self.close_connection(conn)
+        self._notify_write('students', school_id)
     
     def delete_student(self, student_id):
         conn = self.get_connection()
@@ -401,6 +550,7 @@ class Database:
             cursor.close()
         finally:
             self.close_connection(conn)
+        self._notify_write('students')
     
     def add_attendance(self, student_id, student_name, school_id, camera_type='general'):
         conn = self.get_connection()
@@ -422,29 +572,230 @@ class Database:
             cursor.close()
         finally:
             self.close_connection(conn)
+        self._notify_write('attendance', school_id)
     
-    def get_attendance(self, school_id=None, date=None):
+    def add_attendance_batch(self, events):
+        """
+        INSERT หลายแถวใน transaction เดียว (ใช้โดย AttendanceQueue)
+        events - [{'student_id', 'student_name', 'school_id', 'camera_type', 'timestamp' (isoformat)}]
+        """
+        if not events:
+            return
         conn = self.get_connection()
         try:
-            cursor = conn.cursor() if self.db_type == 'sqlite' else conn.cursor(cursor_factory=self.RealDictCursor)
+            cursor = conn.cursor()
             
             if self.db_type == 'postgresql':
-                if school_id:
-                    cursor.execute('SELECT * FROM attendance WHERE school_id = %s ORDER BY timestamp DESC LIMIT 1000', (school_id,))
-                else:
-                    cursor.execute('SELECT * FROM attendance ORDER BY timestamp DESC LIMIT 1000')
+                from psycopg2.extras import execute_values
+                rows = [(e['student_id'], e['student_name'], e['school_id'], e['camera_type'],
+                         datetime.fromisoformat(e['timestamp'])) for e in events]
+                execute_values(cursor, '''
+                    INSERT INTO attendance (student_id, student_name, school_id, camera_type, timestamp)
+                    VALUES %s
+                ''', rows, page_size=500)
             else:
-                if school_id:
-                    cursor.execute('SELECT * FROM attendance WHERE school_id = ? ORDER BY timestamp DESC LIMIT 1000', (school_id,))
-                else:
-                    cursor.execute('SELECT * FROM attendance ORDER BY timestamp DESC LIMIT 1000')
+                rows = [(e['student_id'], e['student_name'], e['school_id'], e['camera_type'], e['timestamp'])
+                        for e in events]
+                cursor.executemany('''
+                    INSERT INTO attendance (student_id, student_name, school_id, camera_type, timestamp)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', rows)
             
+            conn.commit()
+            cursor.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.close_connection(conn)
+        for school_id in {e['school_id'] for e in events}:
+            self._notify_write('attendance', school_id)
+    
+    def claim_gate_event(self, school_id, student_id, camera_type, window, now=None):
+        """
+        จอง event ของนักเรียนที่กล้องนี้ (ใช้ร่วมกันทุก worker) - คืนค่า True ถ้าไม่มี event เดียวกัน
+        ภายใน window วินาทีที่ผ่านมา (UPSERT เดียว: แถวถูกอัพเดทเฉพาะเมื่อ event ก่อนหน้าเก่ากว่า window)
+        """
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        now = time_module.time() if now is None else now
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                INSERT INTO gate_debounce (school_id, student_id, camera_type, last_seen)
+                VALUES ({ph}, {ph}, {ph}, {ph})
+                ON CONFLICT (school_id, student_id, camera_type)
+                DO UPDATE SET last_seen = excluded.last_seen WHERE gate_debounce.last_seen <= {ph}
+            ''', (school_id, student_id, camera_type, now, now - window))
+            claimed = cursor.rowcount == 1
+            conn.commit()
+            cursor.close()
+            return claimed
+        finally:
+            self.close_connection(conn)
+    
+    def enqueue_attendance(self, student_id, student_name, school_id, camera_type='general'):
+        """บันทึกการเข้า-ออกแบบ write-behind - คืนค่าทันที เขียนเป็น batch ภายหลัง (ดู attendance_queue.py)"""
+        return self.attendance_queue.put(student_id, student_name, school_id, camera_type)
+    
+    def get_attendance(self, school_id=None, date=None):
+        """ล่าสุด 1000 รายการ หรือทั้งหมดของวันที่ระบุ (date = 'YYYY-MM-DD')"""
+        if date:
+            start, end = day_range(date)
+            return self.query_attendance(school_id, start, end, limit=None)
+        return self.query_attendance(school_id, limit=1000)
+    
+    def _ts_param(self, value):
+        """แปลงขอบเขตเวลา ('YYYY-MM-DD[THH:MM:SS]', date, datetime) ให้ตรงกับชนิดคอลัมน์ timestamp"""
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        elif not isinstance(value, datetime):
+            value = datetime.combine(value, time.min)
+        
+        # PostgreSQL เก็บเวลา UTC แบบ naive, SQLite เก็บ isoformat ของเวลาเครื่อง
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc) if self.db_type == 'postgresql' else value.astimezone()
+            value = value.replace(tzinfo=None)
+        return value if self.db_type == 'postgresql' else value.isoformat()
+    
+    def _attendance_filters(self, school_id=None, start=None, end=None, student_id=None, camera_types=None):
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        clauses, params = [], []
+        
+        if school_id:
+            clauses.append(f'school_id = {ph}')
+            params.append(school_id)
+        if student_id:
+            clauses.append(f'student_id = {ph}')
+            params.append(student_id)
+        if camera_types:
+            if isinstance(camera_types, str):
+                camera_types = [camera_types]
+            clauses.append(f"camera_type IN ({', '.join([ph] * len(camera_types))})")
+            params.extend(camera_types)
+        if start is not None:
+            clauses.append(f'timestamp >= {ph}')
+            params.append(self._ts_param(start))
+        if end is not None:
+            clauses.append(f'timestamp < {ph}')
+            params.append(self._ts_param(end))
+        
+        return clauses, params
+    
+    def query_attendance(self, school_id=None, start=None, end=None, student_id=None,
+                         camera_types=None, limit=1000, before=None):
+        """
+        ค้นหา attendance ด้วยเงื่อนไขใน SQL (เรียงใหม่ -> เก่า)
+        start/end - ช่วงเวลา [start, end)
+        camera_types - ชนิดกล้องเดียวหรือหลายชนิด เช่น ('gate_in', 'gate_out')
+        limit - จำนวนแถวต่อหน้า (None = ทั้งหมด)
+        before - cursor จาก decode_cursor() ของหน้าก่อน (keyset pagination)
+        """
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        clauses, params = self._attendance_filters(school_id, start, end, student_id, camera_types)
+        
+        if before is not None:
+            clauses.append(f'(timestamp, id) < ({ph}, {ph})')
+            params.extend(before)
+        
+        sql = 'SELECT * FROM attendance'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY timestamp DESC, id DESC'
+        if limit is not None:
+            sql += f' LIMIT {ph}'
+            params.append(int(limit))
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor() if self.db_type == 'sqlite' else conn.cursor(cursor_factory=self.RealDictCursor)
+            cursor.execute(sql, params)
             attendance = [dict(row) for row in cursor.fetchall()]
             cursor.close()
             return attendance
         finally:
             self.close_connection(conn)
     
+    def count_attendance(self, school_id=None, start=None, end=None, student_id=None,
+                         camera_types=None, group_by=None):
+        """นับ attendance ใน SQL - group_by=None คืนจำนวนรวม, group_by='camera_type' คืน {camera_type: count}"""
+        if group_by not in (None, 'camera_type', 'student_id'):
+            raise ValueError(f"unsupported group_by: {group_by}")
+        
+        clauses, params = self._attendance_filters(school_id, start, end, student_id, camera_types)
+        where = (' WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        if group_by:
+            sql = f'SELECT {group_by}, COUNT(*) FROM attendance{where} GROUP BY {group_by}'
+        else:
+            sql = f'SELECT COUNT(*) FROM attendance{where}'
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            if group_by:
+                result = {row[0]: row[1] for row in cursor.fetchall()}
+            else:
+                result = cursor.fetchone()[0]
+            cursor.close()
+            return result
+        finally:
+            self.close_connection(conn)
+    
+    def dashboard_counts(self, school_id, start, end):
+        """ตัวนับของ dashboard โรงเรียนใน round trip เดียว (start/end = ช่วงเวลาของ "วันนี้")"""
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        sql = f'''
+            SELECT
+                (SELECT COUNT(*) FROM students WHERE school_id = {ph}),
+                (SELECT COUNT(DISTINCT student_id) FROM attendance
+                    WHERE school_id = {ph} AND timestamp >= {ph} AND timestamp < {ph}),
+                (SELECT COUNT(*) FROM behavior WHERE school_id = {ph} AND severity IN ('warning', 'danger')),
+                (SELECT COUNT(*) FROM notifications WHERE school_id = {ph} AND read = 0)
+        '''
+        params = (school_id, school_id, self._ts_param(start), self._ts_param(end), school_id, school_id)
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            row = tuple(cursor.fetchone())
+            cursor.close()
+            return dict(zip(('total_students', 'today_attendance', 'behavior_alerts', 'unread_notifications'), row))
+        finally:
+            self.close_connection(conn)
+    
+    def platform_counts(self, expire_before):
+        """ตัวนับของ super admin dashboard ใน round trip เดียว (expire_before = 'YYYY-MM-DD')"""
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        sql = f'''
+            SELECT
+                (SELECT COUNT(*) FROM schools),
+                (SELECT COUNT(*) FROM schools WHERE status = 'active'),
+                (SELECT COUNT(*) FROM schools WHERE status = 'active' AND expire_date <= {ph}),
+                (SELECT COUNT(*) FROM students)
+        '''
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, (expire_before,))
+            row = tuple(cursor.fetchone())
+            cursor.close()
+            return dict(zip(('total_schools', 'active_schools', 'expiring_soon', 'total_students'), row))
+        finally:
+            self.close_connection(conn)
+    
+    def encode_cursor(self, row):
+        """cursor ของหน้าถัดไปจากแถวสุดท้ายของหน้าปัจจุบัน"""
+        timestamp = row['timestamp']
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.isoformat()
+        return f"{timestamp}|{row['id']}"
+    
+    def decode_cursor(self, value):
+        timestamp, row_id = value.rsplit('|', 1)
+        return self._ts_param(timestamp), int(row_id)
+    
     def get_school(self, school_id):
         conn = self.get_connection()
         try:
@@ -499,32 +850,61 @@ class Database:
             cursor.close()
         finally:
             self.close_connection(conn)
+        self._notify_write('students')
     
-    def get_behavior(self, school_id=None, student_id=None):
+    def get_behavior(self, school_id=None, student_id=None, severities=None, limit=None):
+        """พฤติกรรมเรียงใหม่ -> เก่า (severities เช่น ('warning', 'danger'), limit = จำนวนแถวสูงสุด)"""
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        clauses, params = [], []
+        if student_id:
+            clauses.append(f'student_id = {ph}')
+            params.append(student_id)
+        elif school_id:
+            clauses.append(f'school_id = {ph}')
+            params.append(school_id)
+        if severities:
+            clauses.append(f"severity IN ({', '.join([ph] * len(severities))})")
+            params.extend(severities)
+        
+        sql = 'SELECT * FROM behavior'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY timestamp DESC'
+        if limit is not None:
+            sql += f' LIMIT {ph}'
+            params.append(int(limit))
+        
         conn = self.get_connection()
         try:
             cursor = conn.cursor() if self.db_type == 'sqlite' else conn.cursor(cursor_factory=self.RealDictCursor)
+            cursor.execute(sql, params)
+            behaviors = [dict(row) for row in cursor.fetchall()]
+            cursor.close()
+            return behaviors
+        finally:
+            self.close_connection(conn)
+    
+    def add_behavior(self, student_id, student_name, school_id, behavior, severity='normal'):
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
             
             if self.db_type == 'postgresql':
-                if student_id:
-                    cursor.execute('SELECT * FROM behavior WHERE student_id = %s ORDER BY timestamp DESC', (student_id,))
-                elif school_id:
-                    cursor.execute('SELECT * FROM behavior WHERE school_id = %s ORDER BY timestamp DESC', (school_id,))
-                else:
-                    cursor.execute('SELECT * FROM behavior ORDER BY timestamp DESC')
+                cursor.execute('''
+                    INSERT INTO behavior (student_id, student_name, school_id, behavior, severity, timestamp)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                ''', (student_id, student_name, school_id, behavior, severity, datetime.now()))
             else:
-                if student_id:
-                    cursor.execute('SELECT * FROM behavior WHERE student_id = ? ORDER BY timestamp DESC', (student_id,))
-                elif school_id:
-                    cursor.execute('SELECT * FROM behavior WHERE school_id = ? ORDER BY timestamp DESC', (school_id,))
-                else:
-                    cursor.execute('SELECT * FROM behavior ORDER BY timestamp DESC')
+                cursor.execute('''
+                    INSERT INTO behavior (student_id, student_name, school_id, behavior, severity, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (student_id, student_name, school_id, behavior, severity, datetime.now().isoformat()))
             
-            behaviors = [dict(row) for row in cursor.fetchall()]
+            conn.commit()
             cursor.close()
-            return behaviors
         finally:
             self.close_connection(conn)
+        self._notify_write('behavior', school_id)
     
     def get_all_schools(self):
         conn = self.get_connection()
@@ -537,6 +917,100 @@ class Database:
         finally:
             self.close_connection(conn)
     
+    # Camera Management
+    def add_camera(self, school_id, data):
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        now = datetime.now() if self.db_type == 'postgresql' else datetime.now().isoformat()
+        sql = f'''
+            INSERT INTO cameras (school_id, name, location, type, ip, port, username, password, rtsp_url, created_at, updated_at)
+            VALUES ({', '.join([ph] * 11)})
+        '''
+        params = (school_id, data['name'], data['location'], data['type'], data['ip'], data.get('port', '80'),
+                  data.get('username'), data.get('password'), data.get('rtsp_url'), now, now)
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            if self.db_type == 'postgresql':
+                cursor.execute(sql + ' RETURNING id', params)
+                camera_id = cursor.fetchone()[0]
+            else:
+                cursor.execute(sql, params)
+                camera_id = cursor.lastrowid
+            conn.commit()
+            cursor.close()
+            return camera_id
+        finally:
+            self.close_connection(conn)
+    
+    def get_cameras(self, school_id=None):
+        """กล้องของโรงเรียน (หรือทุกโรงเรียนถ้าไม่ระบุ)"""
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor() if self.db_type == 'sqlite' else conn.cursor(cursor_factory=self.RealDictCursor)
+            if school_id:
+                cursor.execute(f'SELECT * FROM cameras WHERE school_id = {ph} ORDER BY created_at DESC', (school_id,))
+            else:
+                cursor.execute('SELECT * FROM cameras ORDER BY created_at DESC')
+            cameras = [dict(row) for row in cursor.fetchall()]
+            cursor.close()
+            return cameras
+        finally:
+            self.close_connection(conn)
+    
+    def get_camera(self, camera_id):
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor() if self.db_type == 'sqlite' else conn.cursor(cursor_factory=self.RealDictCursor)
+            cursor.execute(f'SELECT * FROM cameras WHERE id = {ph}', (camera_id,))
+            camera = cursor.fetchone()
+            cursor.close()
+            return dict(camera) if camera else None
+        finally:
+            self.close_connection(conn)
+    
+    def update_camera(self, camera_id, data):
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        now = datetime.now() if self.db_type == 'postgresql' else datetime.now().isoformat()
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                UPDATE cameras
+                SET name = {ph}, location = {ph}, type = {ph}, ip = {ph}, port = {ph},
+                    username = {ph}, password = {ph}, rtsp_url = {ph}, updated_at = {ph}
+                WHERE id = {ph}
+            ''', (data['name'], data['location'], data['type'], data['ip'], data.get('port', '80'),
+                  data.get('username'), data.get('password'), data.get('rtsp_url'), now, camera_id))
+            conn.commit()
+            cursor.close()
+        finally:
+            self.close_connection(conn)
+    
+    def delete_camera(self, camera_id):
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'DELETE FROM cameras WHERE id = {ph}', (camera_id,))
+            conn.commit()
+            cursor.close()
+        finally:
+            self.close_connection(conn)
+    
+    def update_camera_status(self, camera_id, status):
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        now = datetime.now() if self.db_type == 'postgresql' else datetime.now().isoformat()
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'UPDATE cameras SET status = {ph}, updated_at = {ph} WHERE id = {ph}', (status, now, camera_id))
+            conn.commit()
+            cursor.close()
+        finally:
+            self.close_connection(conn)
+    
     def get_stats(self):
         conn = self.get_connection()
         try:
@@ -556,6 +1030,6 @@ class Database:
             }
         finally:
             self.close_connection(conn)
-
+    
 db = Database()
 print(f"✅ Database initialized: {db.db_type.upper()} (Pool: {db.pool is not None})")
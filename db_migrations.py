@@ -0,0 +1,270 @@
+"""
+Database Migrations
+ตัวรัน migration แบบมีเวอร์ชันสำหรับ database_universal (SQLite และ PostgreSQL)
+- เก็บเวอร์ชันที่รันแล้วในตาราง schema_migrations
+- รันเฉพาะ migration ที่ยังไม่เคยรันตามลำดับ ภายใน transaction เดียวกับการบันทึกเวอร์ชัน
+- หลาย gunicorn worker start พร้อมกันได้: SQLite ใช้ BEGIN IMMEDIATE, PostgreSQL ใช้ advisory lock
+
+ตรวจ query plan ของ dashboard:
+    python db_migrations.py --explain
+"""
+
+import re
+import sys
+from datetime import datetime, timedelta
+
+# (version, description, steps) - step เป็น SQL string หรือ {'sqlite': ..., 'postgresql': ...}
+MIGRATIONS = [
+    (1, 'composite indexes for dashboard predicates', [
+        'CREATE INDEX IF NOT EXISTS idx_attendance_school_ts ON attendance(school_id, timestamp, id)',
+        'CREATE INDEX IF NOT EXISTS idx_attendance_school_camera_ts ON attendance(school_id, camera_type, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_attendance_school_student_ts ON attendance(school_id, student_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_behavior_school_severity_ts ON behavior(school_id, severity, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_behavior_school_ts ON behavior(school_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_behavior_student_ts ON behavior(student_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_notifications_school_read_ts ON notifications(school_id, read, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_notifications_school_ts ON notifications(school_id, timestamp)',
+        'ANALYZE',
+    ]),
+    (2, 'gate_debounce claims shared by all workers', [
+        {
+            'sqlite': '''
+                CREATE TABLE IF NOT EXISTS gate_debounce (
+                    school_id TEXT NOT NULL,
+                    student_id TEXT NOT NULL,
+                    camera_type TEXT NOT NULL,
+                    last_seen REAL NOT NULL,
+                    PRIMARY KEY (school_id, student_id, camera_type)
+                )
+            ''',
+            'postgresql': '''
+                CREATE TABLE IF NOT EXISTS gate_debounce (
+                    school_id VARCHAR(50) NOT NULL,
+                    student_id VARCHAR(50) NOT NULL,
+                    camera_type VARCHAR(50) NOT NULL,
+                    last_seen DOUBLE PRECISION NOT NULL,
+                    PRIMARY KEY (school_id, student_id, camera_type)
+                )
+            '''
+        },
+    ]),
+    (3, 'cameras registry (one row per terminal)', [
+        {
+            'sqlite': '''
+                CREATE TABLE IF NOT EXISTS cameras (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    school_id TEXT,
+                    name TEXT NOT NULL,
+                    location TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    ip TEXT NOT NULL,
+                    port TEXT DEFAULT '80',
+                    username TEXT,
+                    password TEXT,
+                    rtsp_url TEXT,
+                    status TEXT DEFAULT 'offline',
+                    created_at TEXT,
+                    updated_at TEXT
+                )
+            ''',
+            'postgresql': '''
+                CREATE TABLE IF NOT EXISTS cameras (
+                    id SERIAL PRIMARY KEY,
+                    school_id VARCHAR(50),
+                    name VARCHAR(255) NOT NULL,
+                    location VARCHAR(255) NOT NULL,
+                    type VARCHAR(50) NOT NULL,
+                    ip VARCHAR(100) NOT NULL,
+                    port VARCHAR(10) DEFAULT '80',
+                    username VARCHAR(100),
+                    password VARCHAR(255),
+                    rtsp_url TEXT,
+                    status VARCHAR(20) DEFAULT 'offline',
+                    created_at TIMESTAMP,
+                    updated_at TIMESTAMP
+                )
+            '''
+        },
+        'CREATE INDEX IF NOT EXISTS idx_cameras_school ON cameras(school_id)',
+    ]),
+]
+
+MIGRATION_LOCK_ID = 720411  # PostgreSQL advisory lock key
+
+
+class MigrationRunner:
+    def __init__(self, db_type, migrations=MIGRATIONS):
+        self.db_type = db_type
+        self.migrations = sorted(migrations, key=lambda migration: migration[0])
+
+    @property
+    def latest_version(self):
+        return self.migrations[-1][0] if self.migrations else 0
+
+    def _ensure_table(self, cursor):
+        if self.db_type == 'postgresql':
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description VARCHAR(255),
+                    applied_at TIMESTAMP
+                )
+            ''')
+        else:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT,
+                    applied_at TEXT
+                )
+            ''')
+
+    def current_version(self, conn):
+        cursor = conn.cursor()
+        self._ensure_table(cursor)
+        cursor.execute('SELECT MAX(version) FROM schema_migrations')
+        row = cursor.fetchone()
+        cursor.close()
+        return row[0] or 0
+
+    def run(self, conn):
+        """รัน migration ที่ค้างอยู่ คืนค่ารายการเวอร์ชันที่รันในครั้งนี้"""
+        ph = '%s' if self.db_type == 'postgresql' else '?'
+        conn.commit()
+        cursor = conn.cursor()
+        applied = []
+        try:
+            self._ensure_table(cursor)
+            conn.commit()
+
+            # ล็อกก่อนอ่านเวอร์ชัน - worker อื่นที่ start พร้อมกันจะรอแล้วเห็นเวอร์ชันใหม่
+            if self.db_type == 'postgresql':
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATION_LOCK_ID,))
+            else:
+                cursor.execute('BEGIN IMMEDIATE')
+
+            cursor.execute('SELECT MAX(version) FROM schema_migrations')
+            current = cursor.fetchone()[0] or 0
+
+            for version, description, steps in self.migrations:
+                if version <= current:
+                    continue
+                for step in steps:
+                    sql = step.get(self.db_type) if isinstance(step, dict) else step
+                    if sql:
+                        cursor.execute(sql)
+                applied_at = datetime.now() if self.db_type == 'postgresql' else datetime.now().isoformat()
+                cursor.execute(
+                    f'INSERT INTO schema_migrations (version, description, applied_at) VALUES ({ph}, {ph}, {ph})',
+                    (version, description, applied_at)
+                )
+                applied.append(version)
+                print(f"✅ Migration {version}: {description}")
+
+            conn.commit()
+            return applied
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+# Query ที่ dashboard ใช้บ่อย (predicate เดียวกับ Database.query_attendance / count_attendance)
+DASHBOARD_QUERIES = [
+    ('attendance_today',
+     'SELECT COUNT(DISTINCT student_id) FROM attendance WHERE school_id = {ph} AND timestamp >= {ph} AND timestamp < {ph}',
+     ('school', 'today', 'tomorrow')),
+    ('attendance_page',
+     'SELECT * FROM attendance WHERE school_id = {ph} ORDER BY timestamp DESC, id DESC LIMIT 200',
+     ('school',)),
+    ('gate_counts',
+     'SELECT camera_type, COUNT(*) FROM attendance WHERE school_id = {ph} AND camera_type IN ({ph}, {ph}) '
+     'AND timestamp >= {ph} AND timestamp < {ph} GROUP BY camera_type',
+     ('school', 'gate_in', 'gate_out', 'today', 'tomorrow')),
+    ('student_attendance',
+     'SELECT * FROM attendance WHERE school_id = {ph} AND student_id = {ph} ORDER BY timestamp DESC, id DESC LIMIT 1000',
+     ('school', 'student')),
+    ('behavior_alerts',
+     'SELECT COUNT(*) FROM behavior WHERE school_id = {ph} AND severity IN ({ph}, {ph})',
+     ('school', 'warning', 'danger')),
+    ('behavior_recent',
+     'SELECT * FROM behavior WHERE school_id = {ph} ORDER BY timestamp DESC',
+     ('school',)),
+    ('unread_notifications',
+     'SELECT COUNT(*) FROM notifications WHERE school_id = {ph} AND read = 0',
+     ('school',)),
+    ('notifications_recent',
+     'SELECT * FROM notifications WHERE school_id = {ph} ORDER BY timestamp DESC LIMIT 50',
+     ('school',)),
+]
+
+
+def _sqlite_full_scans(rows):
+    # "SCAN attendance" หรือ "SCAN attendance USING INDEX ..." = อ่านทั้งตาราง/ทั้ง index
+    return [row[-1] for row in rows if re.match(r'^SCAN (?!CONSTANT|SUBQUERY)', row[-1])]
+
+
+def _postgres_full_scans(plan):
+    scans = []
+    if plan.get('Node Type') == 'Seq Scan':
+        scans.append(f"Seq Scan on {plan.get('Relation Name')}")
+    for child in plan.get('Plans', []):
+        scans.extend(_postgres_full_scans(child))
+    return scans
+
+
+def explain_dashboard(conn, db_type, school_id='SCH001', student_id='STD001'):
+    """
+    EXPLAIN query ของ dashboard ทั้งหมด คืนค่า [{name, plan, full_scans}]
+    PostgreSQL ปิด enable_seqscan ชั่วคราว (ตารางเล็ก planner จะเลือก seq scan เสมอ)
+    เพื่อตรวจว่ามี index ที่ใช้กับ predicate ได้จริง
+    """
+    ph = '%s' if db_type == 'postgresql' else '?'
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    values = {
+        'school': school_id, 'student': student_id,
+        'today': today, 'tomorrow': today + timedelta(days=1),
+        'gate_in': 'gate_in', 'gate_out': 'gate_out', 'warning': 'warning', 'danger': 'danger'
+    }
+    if db_type != 'postgresql':
+        values['today'] = values['today'].isoformat()
+        values['tomorrow'] = values['tomorrow'].isoformat()
+
+    results = []
+    cursor = conn.cursor()
+    try:
+        if db_type == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, sql, params in DASHBOARD_QUERIES:
+            sql = sql.format(ph=ph)
+            args = tuple(values[key] for key in params)
+            if db_type == 'postgresql':
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', args)
+                plan = cursor.fetchone()[0][0]['Plan']
+                results.append({'name': name, 'plan': plan, 'full_scans': _postgres_full_scans(plan)})
+            else:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', args)
+                rows = [tuple(row) for row in cursor.fetchall()]
+                results.append({'name': name, 'plan': [row[-1] for row in rows], 'full_scans': _sqlite_full_scans(rows)})
+    finally:
+        cursor.close()
+        conn.rollback()
+    return results
+
+
+if __name__ == '__main__':
+    from database_universal import db
+
+    conn = db.get_connection()
+    try:
+        print(f"📋 Schema version: {MigrationRunner(db.db_type).current_version(conn)}")
+        if '--explain' in sys.argv:
+            failed = False
+            for result in explain_dashboard(conn, db.db_type):
+                status = '❌ FULL SCAN' if result['full_scans'] else '✅'
+                print(f"{status} {result['name']}: {result['full_scans'] or result['plan']}")
+                failed = failed or bool(result['full_scans'])
+            sys.exit(1 if failed else 0)
+    finally:
+        db.close_connection(conn)
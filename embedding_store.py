@@ -0,0 +1,243 @@
+"""
+Embedding Store
+เก็บ face embeddings แบบ binary (แทนไฟล์ pickle) แยก segment ตามโรงเรียน
+
+โครงสร้างไฟล์ใน root:
+    manifest.json                    - format_version, dim, segments ทั้งหมด
+    <school_id>.<generation>.npy     - float32 matrix (rows x dim)
+    <school_id>.<generation>.ids.json - student_id เรียงตามแถวของ matrix
+    <school_id>.<generation>.sources.json - fingerprint ของรูปที่ใช้เทรน (สำหรับ incremental training)
+
+matrix เปิดด้วย np.load(mmap_mode='r') ทุก gunicorn worker จึงใช้หน้าเดียวกันใน
+page cache โดยไม่ต้อง copy และไม่ต้อง unpickle ทั้ง gallery ตอน start
+การเขียนใช้ generation ใหม่ + os.replace ของ manifest เสมอ worker ที่ยัง mmap
+ไฟล์เก่าอยู่จึงอ่านต่อได้จนกว่าจะ reload
+
+การแก้ manifest (อ่าน -> เขียน generation ใหม่ -> replace -> ลบไฟล์เก่า) ถือ flock บน <root>/.lock
+ตลอดทั้งขั้นตอน - gunicorn หลาย worker บันทึกคนละโรงเรียนพร้อมกันได้โดย manifest ไม่หาย
+การอ่าน segment ถือ shared lock ระหว่างอ่าน manifest และเปิดไฟล์ (ไฟล์ไม่ถูกลบระหว่างนั้น)
+
+worker ที่โหลด segment ไว้ตรวจ generations() (stat manifest - อ่านไฟล์เฉพาะเมื่อเปลี่ยน) เพื่อ reload
+และบันทึกด้วย expected_generation - ถ้า process อื่นเขียน segment นั้นไปก่อนจะได้ StaleSegmentError
+แทนการเขียนทับด้วยข้อมูลเก่า
+"""
+
+import os
+import json
+import re
+import threading
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows - lock ได้เฉพาะภายใน process
+    fcntl = None
+
+from face_gallery import FaceGallery
+
+FORMAT_VERSION = 1
+
+
+class EmbeddingStoreError(Exception):
+    pass
+
+
+class StaleSegmentError(EmbeddingStoreError):
+    """segment ถูกเขียนโดย process อื่นหลังจากที่โหลดมา - ต้อง reload แล้วทำซ้ำ"""
+
+
+class EmbeddingStore:
+    def __init__(self, root, dim):
+        self.root = root
+        self.dim = int(dim)
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        self.lock_path = os.path.join(root, '.lock')
+        self._lock = threading.Lock()
+        self._generations_cache = None  # (stat ของ manifest, {school_id: generation})
+
+    @contextmanager
+    def _locked(self, shared=False):
+        """lock ข้าม process: exclusive สำหรับแก้ manifest, shared สำหรับอ่าน"""
+        if shared and (fcntl is None or not os.path.isdir(self.root)):
+            yield
+            return
+        with self._lock if not shared else nullcontext():
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def _read_manifest(self):
+        if not self.exists():
+            return {'format_version': FORMAT_VERSION, 'dim': self.dim, 'segments': {}}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != FORMAT_VERSION:
+            raise EmbeddingStoreError(f"unsupported embedding store version: {manifest.get('format_version')}")
+        if manifest.get('dim') != self.dim:
+            raise EmbeddingStoreError(f"embedding dim {manifest.get('dim')} != {self.dim}")
+        return manifest
+
+    def _write_manifest(self, manifest):
+        tmp_path = f'{self.manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def _segment_name(school_id):
+        # school_id มาจากผู้ใช้ - กันไม่ให้มี path separator
+        return re.sub(r'[^A-Za-z0-9_-]', '_', str(school_id))
+
+    def schools(self):
+        return list(self._read_manifest()['segments'].keys())
+
+    def segment_info(self, school_id):
+        return self._read_manifest()['segments'].get(school_id)
+
+    def generations(self):
+        """{school_id: generation} ปัจจุบัน - อ่าน manifest ใหม่เฉพาะเมื่อไฟล์เปลี่ยน (ใช้ตรวจว่าต้อง reload)"""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return {}
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = self._generations_cache
+        if cached is None or cached[0] != signature:
+            with self._locked(shared=True):
+                segments = self._read_manifest()['segments']
+            cached = self._generations_cache = (signature, {school_id: info['generation']
+                                                            for school_id, info in segments.items()})
+        return dict(cached[1])
+
+    def read_segment(self, school_id):
+        """คืนค่า (ids, matrix แบบ memmap read-only) หรือ None ถ้าไม่มี segment"""
+        segment = self.read_segment_versioned(school_id)
+        return None if segment is None else segment[:2]
+
+    def read_segment_versioned(self, school_id):
+        """(ids, matrix, generation) จาก manifest เดียวกัน หรือ None ถ้าไม่มี segment"""
+        with self._locked(shared=True):
+            info = self.segment_info(school_id)
+            if info is None:
+                return None
+            with open(os.path.join(self.root, info['ids']), 'r', encoding='utf-8') as f:
+                ids = json.load(f)
+            if info['rows'] == 0:
+                return ids, np.zeros((0, self.dim), dtype=np.float32), info['generation']
+            matrix = np.load(os.path.join(self.root, info['matrix']), mmap_mode='r')
+        if matrix.shape != (len(ids), self.dim) or matrix.dtype != np.float32:
+            raise EmbeddingStoreError(f"segment {school_id} is corrupt: {matrix.shape} {matrix.dtype}")
+        return ids, matrix, info['generation']
+
+    def read_sources(self, school_id):
+        """{student_id: fingerprint} ของการเทรนครั้งล่าสุด"""
+        with self._locked(shared=True):
+            info = self.segment_info(school_id)
+            if not info or not info.get('sources'):
+                return {}
+            with open(os.path.join(self.root, info['sources']), 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+    def write_segment(self, school_id, ids, matrix, sources=None, expected_generation=None):
+        """
+        เขียน segment ของโรงเรียนใหม่ทั้งก้อน (atomic) คืนค่า generation ใหม่
+        expected_generation: generation ที่โหลดมาแก้ (0 = ยังไม่มี segment) - ไม่ตรงกับปัจจุบัน raise StaleSegmentError
+        """
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(len(ids), self.dim)
+        os.makedirs(self.root, exist_ok=True)
+
+        with self._locked():
+            manifest = self._read_manifest()
+            old = manifest['segments'].get(school_id)
+            current = old['generation'] if old else 0
+            if expected_generation is not None and expected_generation != current:
+                raise StaleSegmentError(f"segment {school_id} is at generation {current}, "
+                                        f"loaded {expected_generation}")
+            generation = current + 1
+            base = f'{self._segment_name(school_id)}.{generation}'
+
+            matrix_file = f'{base}.npy'
+            with open(os.path.join(self.root, matrix_file), 'wb') as f:
+                np.save(f, matrix)
+                f.flush()
+                os.fsync(f.fileno())
+
+            ids_file = f'{base}.ids.json'
+            with open(os.path.join(self.root, ids_file), 'w', encoding='utf-8') as f:
+                json.dump(list(ids), f, ensure_ascii=False)
+
+            segment = {
+                'generation': generation,
+                'rows': len(ids),
+                'matrix': matrix_file,
+                'ids': ids_file
+            }
+            if sources is None and old and old.get('sources'):
+                # บันทึกโดยไม่ระบุ sources (เช่นลบนักเรียน) - ใช้ของเดิมเฉพาะ id ที่ยังอยู่
+                with open(os.path.join(self.root, old['sources']), 'r', encoding='utf-8') as f:
+                    previous = json.load(f)
+                kept = set(ids)
+                sources = {student_id: fp for student_id, fp in previous.items() if student_id in kept}
+            if sources is not None:
+                segment['sources'] = f'{base}.sources.json'
+                with open(os.path.join(self.root, segment['sources']), 'w', encoding='utf-8') as f:
+                    json.dump(sources, f, ensure_ascii=False)
+
+            manifest['segments'][school_id] = segment
+            self._write_manifest(manifest)
+
+            if old:
+                self._remove_files(old)
+            return generation
+
+    def delete_segment(self, school_id):
+        with self._locked():
+            manifest = self._read_manifest()
+            old = manifest['segments'].pop(school_id, None)
+            if old is None:
+                return False
+            self._write_manifest(manifest)
+            self._remove_files(old)
+            return True
+
+    def _remove_files(self, info):
+        # worker ที่ mmap ไฟล์เก่าไว้ยังอ่านได้ (Linux จะลบจริงเมื่อไม่มีใครเปิดอยู่)
+        for name in (info['matrix'], info['ids'], info.get('sources')):
+            if not name:
+                continue
+            try:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
+                pass
+
+    def load_gallery(self, school_id):
+        """เปิด segment เป็น FaceGallery แบบ zero-copy (None ถ้าไม่มี)"""
+        return self.load_gallery_versioned(school_id)[0]
+
+    def load_gallery_versioned(self, school_id):
+        """(FaceGallery หรือ None, generation ที่โหลด - 0 ถ้าไม่มี segment)"""
+        segment = self.read_segment_versioned(school_id)
+        if segment is None:
+            return None, 0
+        ids, matrix, generation = segment
+        if len(ids) == 0:
+            return FaceGallery(self.dim), generation
+        return FaceGallery.from_arrays(ids, matrix), generation
+
+    def save_gallery(self, school_id, gallery, sources=None, expected_generation=None):
+        with gallery._lock:
+            return self.write_segment(school_id, gallery.ids, gallery.matrix, sources, expected_generation)
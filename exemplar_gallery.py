@@ -0,0 +1,95 @@
+"""
+Exemplar Gallery
+เก็บหลาย encoding ต่อนักเรียนแบบ compact:
+- centroid 1 แถวต่อคน (ค่าเฉลี่ยของ exemplars) ใน gallery ของ centroid
+- exemplar สูงสุด max_exemplars แถวต่อคน ใน matrix เดียวที่ใช้ร่วมกันทุกคน
+
+ค้นหา 2 ขั้น: ขั้นแรกเทียบกับ centroid ทุกคน (1 แถวต่อคน) เลือก candidates คนที่ใกล้ที่สุด
+แล้วขั้นสองเทียบ exemplar ของ candidates เท่านั้น - ระยะทางที่คืนเป็นระยะถึง exemplar ที่ใกล้สุด
+"""
+
+import threading
+from collections import deque
+
+import numpy as np
+
+from face_gallery import FaceGallery
+
+
+class ExemplarGallery:
+    def __init__(self, dim, max_exemplars=5, candidates=8):
+        self.dim = int(dim)
+        self.max_exemplars = int(max_exemplars)
+        self.candidates = int(candidates)  # จำนวนคนที่ส่งต่อไปขั้นสอง
+        self.centroids = FaceGallery(self.dim)
+        self.exemplars = FaceGallery(self.dim)  # id = (student_id, slot)
+        self._slots = {}                        # student_id -> deque ของ slot (เก่า -> ใหม่)
+        self._next_slot = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.centroids)
+
+    def __contains__(self, student_id):
+        return student_id in self._slots
+
+    @property
+    def total_exemplars(self):
+        return len(self.exemplars)
+
+    def add(self, student_id, encoding):
+        """เพิ่ม exemplar ใหม่ (เก็บเฉพาะ max_exemplars ล่าสุด) แล้วคำนวณ centroid ใหม่"""
+        with self._lock:
+            slots = self._slots.setdefault(student_id, deque())
+            slots.append(self._next_slot)
+            self.exemplars.upsert((student_id, self._next_slot), encoding)
+            self._next_slot += 1
+
+            while len(slots) > self.max_exemplars:
+                self.exemplars.remove((student_id, slots.popleft()))
+            self._update_centroid(student_id)
+
+    def remove(self, student_id):
+        with self._lock:
+            slots = self._slots.pop(student_id, None)
+            if slots is None:
+                return False
+            for slot in slots:
+                self.exemplars.remove((student_id, slot))
+            self.centroids.remove(student_id)
+            return True
+
+    def encodings(self, student_id):
+        """exemplars ของนักเรียน (เก่า -> ใหม่)"""
+        with self._lock:
+            slots = self._slots.get(student_id, ())
+            return [self.exemplars.get((student_id, slot)) for slot in slots]
+
+    def _update_centroid(self, student_id):
+        self.centroids.upsert(student_id, np.mean(self.encodings(student_id), axis=0))
+
+    def search(self, query, k=1, candidates=None):
+        """
+        คืนค่า [(student_id, distance), ...] เรียงจากใกล้ไปไกล สูงสุด k คน
+        candidates - จำนวนคนจากขั้น centroid ที่นำไปเทียบ exemplar (knob ระหว่าง recall กับ latency)
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if len(self.centroids) == 0:
+                return []
+
+            # ขั้นแรก: centroid ทุกคน
+            candidate_ids, _ = self.centroids.search(query, k=max(k, candidates or self.candidates))
+            candidate_ids = candidate_ids[0]
+
+            # ขั้นสอง: exemplar ของ candidates
+            keys = [(student_id, slot) for student_id in candidate_ids for slot in self._slots[student_id]]
+            vectors = np.vstack([self.exemplars.get(key) for key in keys])
+            diff = vectors - query
+            distances = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+            best = {}
+            for (student_id, _), distance in zip(keys, distances):
+                if student_id not in best or distance < best[student_id]:
+                    best[student_id] = float(distance)
+            return sorted(best.items(), key=lambda item: item[1])[:k]
@@ -0,0 +1,87 @@
+"""
+Face Detector Registry
+โหลด Haar cascade ครั้งเดียวตอน start แล้วใช้ร่วมกันทุก request / ทุก thread
+CascadeClassifier.detectMultiScale ไม่รับประกันว่า thread-safe จึงเก็บเป็น pool
+ของ instance ที่โหลดไว้แล้ว - แต่ละ detect ยืม instance หนึ่งตัวแล้วคืน
+"""
+
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+DEFAULT_CASCADE = 'haarcascade_frontalface_default.xml'
+DEFAULT_POOL_SIZE = int(os.environ.get('FACE_DETECTOR_POOL_SIZE', str(os.cpu_count() or 2)))
+
+
+class CascadePool:
+    """pool ของ cv2.CascadeClassifier ที่โหลด XML เดียวกัน - ใช้แทน CascadeClassifier ได้โดยตรง"""
+
+    def __init__(self, cascade_path, size=DEFAULT_POOL_SIZE):
+        import cv2
+        self.cv2 = cv2
+        self.cascade_path = cascade_path
+        self.size = max(1, int(size))
+        self._pool = queue.LifoQueue()
+        for _ in range(self.size):
+            classifier = cv2.CascadeClassifier(cascade_path)
+            if classifier.empty():
+                raise IOError(f"ไม่สามารถโหลด cascade: {cascade_path}")
+            self._pool.put(classifier)
+
+    @contextmanager
+    def acquire(self):
+        classifier = self._pool.get()
+        try:
+            yield classifier
+        finally:
+            self._pool.put(classifier)
+
+    def detectMultiScale(self, image, *args, **kwargs):
+        with self.acquire() as classifier:
+            return classifier.detectMultiScale(image, *args, **kwargs)
+
+    def warm_up(self):
+        """รัน detect กับภาพว่างหนึ่งครั้งต่อ instance ให้ OpenCV จัดสรร buffer ล่วงหน้า"""
+        import numpy as np
+        blank = np.zeros((240, 320), dtype=np.uint8)
+        classifiers = [self._pool.get() for _ in range(self.size)]
+        try:
+            for classifier in classifiers:
+                classifier.detectMultiScale(blank, 1.3, 5)
+        finally:
+            for classifier in classifiers:
+                self._pool.put(classifier)
+
+
+class FaceDetectorRegistry:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        self.pool_size = pool_size
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get(self, name=DEFAULT_CASCADE):
+        """ดึง CascadePool ตามชื่อไฟล์ cascade (โหลดครั้งแรกครั้งเดียว)"""
+        pool = self._pools.get(name)
+        if pool is not None:
+            return pool
+        with self._lock:
+            pool = self._pools.get(name)
+            if pool is None:
+                import cv2
+                path = name if os.path.isabs(name) else cv2.data.haarcascades + name
+                pool = CascadePool(path, self.pool_size)
+                self._pools[name] = pool
+            return pool
+
+    def detect(self, image, *args, name=DEFAULT_CASCADE, **kwargs):
+        return self.get(name).detectMultiScale(image, *args, **kwargs)
+
+    def warm_up(self, names=(DEFAULT_CASCADE,)):
+        for name in names:
+            self.get(name).warm_up()
+        print(f"✅ Face detector warm-up: {', '.join(names)} x{self.pool_size}")
+
+
+# สร้าง instance
+detector_registry = FaceDetectorRegistry()
@@ -0,0 +1,203 @@
+"""
+Face Gallery
+เก็บ feature ใบหน้าทั้งหมดใน matrix float32 ต่อเนื่องกัน + id array คู่ขนาน
+ค้นหาใบหน้าทุกใบในเฟรมด้วยการคำนวณระยะทางครั้งเดียว (batched) แล้วเลือก top-k
+"""
+
+import threading
+import numpy as np
+
+
+class FaceGallery:
+    def __init__(self, dim, initial_capacity=64):
+        self.dim = int(dim)
+        self._matrix = np.zeros((max(1, initial_capacity), self.dim), dtype=np.float32)
+        self._sq_norms = np.zeros(max(1, initial_capacity), dtype=np.float32)
+        self._ids = []          # row -> face_id (ขนานกับ matrix)
+        self._rows = {}         # face_id -> row
+        self._lock = threading.RLock()
+        self._readonly = False
+
+    @classmethod
+    def from_arrays(cls, face_ids, matrix):
+        """
+        สร้าง gallery ที่อ้างอิง matrix เดิมโดยไม่ copy (เช่น np.memmap จาก EmbeddingStore)
+        จะ copy เป็น array ของตัวเองเมื่อมีการแก้ไขครั้งแรกเท่านั้น
+        """
+        gallery = cls(matrix.shape[1], initial_capacity=1)
+        gallery._matrix = matrix
+        gallery._sq_norms = None
+        gallery._ids = list(face_ids)
+        gallery._rows = {face_id: row for row, face_id in enumerate(gallery._ids)}
+        gallery._readonly = True
+        return gallery
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, face_id):
+        return face_id in self._rows
+
+    @property
+    def ids(self):
+        """รายการ id ตามลำดับแถวใน matrix"""
+        with self._lock:
+            return list(self._ids)
+
+    @property
+    def matrix(self):
+        """view ของแถวที่ใช้งานอยู่ (ห้ามแก้ไขจากภายนอก)"""
+        return self._matrix[:len(self._ids)]
+
+    @property
+    def nbytes(self):
+        """memory ที่ gallery เป็นเจ้าของ (matrix แบบ mmap อยู่ใน page cache ไม่นับ)"""
+        norms = 0 if self._sq_norms is None else self._sq_norms.nbytes
+        return norms if self._readonly else self._matrix.nbytes + norms
+
+    def _ensure_norms(self):
+        if self._sq_norms is None:
+            self._sq_norms = np.einsum('ij,ij->i', self._matrix, self._matrix).astype(np.float32)
+
+    def _make_writable(self):
+        if self._readonly:
+            self._ensure_norms()
+            self._matrix = np.array(self._matrix, dtype=np.float32)
+            self._readonly = False
+
+    def _ensure_capacity(self, size):
+        self._make_writable()
+        capacity = self._matrix.shape[0]
+        if size <= capacity:
+            return
+        new_capacity = max(size, capacity * 2)
+        matrix = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        matrix[:capacity] = self._matrix
+        sq_norms = np.zeros(new_capacity, dtype=np.float32)
+        sq_norms[:capacity] = self._sq_norms
+        self._matrix = matrix
+        self._sq_norms = sq_norms
+
+    def _as_row(self, vector):
+        row = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if row.shape[0] != self.dim:
+            raise ValueError(f"feature dimension {row.shape[0]} != gallery dimension {self.dim}")
+        return row
+
+    def upsert(self, face_id, vector):
+        """เพิ่มหรืออัพเดท feature ของ face_id (เขียนทับแถวเดิม ไม่ rebuild)"""
+        row_vector = self._as_row(vector)
+        with self._lock:
+            self._make_writable()
+            row = self._rows.get(face_id)
+            if row is None:
+                row = len(self._ids)
+                self._ensure_capacity(row + 1)
+                self._ids.append(face_id)
+                self._rows[face_id] = row
+            self._matrix[row] = row_vector
+            self._sq_norms[row] = float(np.dot(row_vector, row_vector))
+
+    def upsert_many(self, face_ids, vectors):
+        """เพิ่ม/อัพเดทหลายรายการพร้อมกัน"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(face_ids), -1)
+        with self._lock:
+            self._ensure_capacity(len(self._ids) + len(face_ids))
+            for face_id, vector in zip(face_ids, vectors):
+                self.upsert(face_id, vector)
+
+    def remove(self, face_id):
+        """ลบ face_id โดยย้ายแถวสุดท้ายมาแทนที่ (O(1))"""
+        with self._lock:
+            if face_id not in self._rows:
+                return False
+            self._make_writable()
+            row = self._rows.pop(face_id)
+            last = len(self._ids) - 1
+            if row != last:
+                moved_id = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                self._ids[row] = moved_id
+                self._rows[moved_id] = row
+            self._ids.pop()
+            self._matrix[last] = 0
+            self._sq_norms[last] = 0
+            return True
+
+    def get(self, face_id):
+        with self._lock:
+            row = self._rows.get(face_id)
+            return None if row is None else self._matrix[row].copy()
+
+    def clear(self):
+        with self._lock:
+            self._ids = []
+            self._rows = {}
+            if self._readonly:
+                self._matrix = np.zeros((1, self.dim), dtype=np.float32)
+                self._sq_norms = np.zeros(1, dtype=np.float32)
+                self._readonly = False
+            else:
+                self._matrix[:] = 0
+                self._sq_norms[:] = 0
+
+    def items(self):
+        """(face_id, feature) ทุกแถว - ใช้ตอนบันทึกโมเดล"""
+        with self._lock:
+            return [(face_id, self._matrix[row].copy()) for row, face_id in enumerate(self._ids)]
+
+    def search(self, queries, k=1, metric='l2'):
+        """
+        ค้นหา top-k ของทุก query ในครั้งเดียว
+        metric: 'l2' (euclidean) หรือ 'l1' (ผลรวม absdiff)
+        คืนค่า (ids, distances) - ids เป็น list ของ list, distances shape (n_queries, k)
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+
+        with self._lock:
+            size = len(self._ids)
+            if size == 0 or queries.shape[0] == 0:
+                return [[] for _ in range(queries.shape[0])], np.zeros((queries.shape[0], 0), dtype=np.float32)
+
+            if metric == 'l1':
+                dist = self._l1_distances(queries, size)
+            elif metric == 'l2':
+                dist = self._sq_l2_distances(queries, size)
+            else:
+                raise ValueError(f"unknown metric: {metric}")
+
+            k = min(int(k), size)
+            if k < size:
+                top = np.argpartition(dist, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(size), (queries.shape[0], size))
+            top_dist = np.take_along_axis(dist, top, axis=1)
+            order = np.argsort(top_dist, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            distances = np.take_along_axis(top_dist, order, axis=1)
+            if metric == 'l2':
+                distances = np.sqrt(distances)
+
+            ids = [[self._ids[row] for row in query_rows] for query_rows in top]
+            return ids, distances
+
+    def _sq_l2_distances(self, queries, size):
+        # ||q - x||^2 = ||q||^2 - 2 q.x + ||x||^2
+        self._ensure_norms()
+        sq_dist = queries @ self._matrix[:size].T
+        sq_dist *= -2.0
+        sq_dist += self._sq_norms[:size]
+        sq_dist += np.einsum('ij,ij->i', queries, queries)[:, None]
+        np.maximum(sq_dist, 0, out=sq_dist)
+        return sq_dist
+
+    def _l1_distances(self, queries, size, chunk_rows=256):
+        # แบ่ง chunk เพื่อไม่ให้ใช้ memory (n_queries x rows x dim) มากเกินไป
+        dist = np.empty((queries.shape[0], size), dtype=np.float32)
+        for start in range(0, size, chunk_rows):
+            block = self._matrix[start:min(start + chunk_rows, size)]
+            dist[:, start:start + block.shape[0]] = np.abs(queries[:, None, :] - block[None, :, :]).sum(axis=2)
+        return dist
@@ -4,105 +4,232 @@ Face Recognition System (OpenCV Version)
 """
 
 import cv2
+from face_detector import detector_registry
 import numpy as np
 import os
 import pickle
 from datetime import datetime
+from face_gallery import FaceGallery
+from embedding_store import EmbeddingStore, StaleSegmentError
+from incremental_training import train_incremental
+
+FACE_SIZE = (100, 100)
+FACE_DIM = FACE_SIZE[0] * FACE_SIZE[1]
+DEFAULT_SCHOOL_ID = 'SCH001'
+SAVE_RETRIES = 3
 
 class FaceRecognitionSystem:
     def __init__(self):
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        self.known_faces = {}  # {student_id: face_features}
-        self.labels_path = 'data/face_labels.pkl'
+        self.face_cascade = detector_registry.get()
+        self.galleries = {}  # {school_id: FaceGallery} เปิดจาก embedding store แบบ mmap
+        self.generations = {}  # {school_id: generation ของ segment ที่โหลด/บันทึกล่าสุด}
+        self.store = EmbeddingStore('data/embeddings/face_roi', FACE_DIM)
+        self.labels_path = 'data/face_labels.pkl'  # ไฟล์ pickle รุ่นเก่า (migrate ครั้งเดียว)
         self.load_model()
     
-    def train_from_students(self, students):
-        """เทรนโมเดลจากข้อมูลนักเรียน"""
+    def _gallery(self, school_id):
+        if school_id not in self.galleries:
+            self.galleries[school_id] = FaceGallery(FACE_DIM)
+        return self.galleries[school_id]
+    
+    def _load_school(self, school_id):
+        gallery, generation = self.store.load_gallery_versioned(school_id)
+        if gallery is None:
+            self.galleries.pop(school_id, None)
+            self.generations.pop(school_id, None)
+        else:
+            self.galleries[school_id] = gallery
+            self.generations[school_id] = generation
+    
+    def refresh(self):
+        """
+        reload segment ที่ process อื่นเขียนใหม่ (เช่น job เทรนใน gunicorn worker อื่น)
+        ปกติแค่ stat manifest - อ่าน/โหลดเฉพาะเมื่อ generation เปลี่ยน
+        """
+        try:
+            current = self.store.generations()
+            for school_id, generation in current.items():
+                if self.generations.get(school_id) != generation:
+                    self._load_school(school_id)
+            for school_id in [s for s in self.generations if s not in current]:
+                # segment ถูกลบโดย process อื่น
+                self.galleries.pop(school_id, None)
+                self.generations.pop(school_id, None)
+        except Exception as e:
+            print(f"⚠️ ไม่สามารถ reload โมเดล: {str(e)}")
+    
+    def _save(self, school_id, sources=None):
+        """บันทึก segment เฉพาะเมื่อยังเป็น generation ที่โหลดมา (StaleSegmentError ถ้า process อื่นเขียนไปก่อน)"""
+        self.generations[school_id] = self.store.save_gallery(
+            school_id, self.galleries[school_id], sources, expected_generation=self.generations.get(school_id, 0))
+    
+    def train_from_students(self, students, progress=None):
+        """
+        เทรนโมเดลจากข้อมูลนักเรียน (incremental)
+        ประมวลผลเฉพาะรูปใหม่/เปลี่ยนไป และลบนักเรียนที่ไม่อยู่ในรายชื่อแล้ว
+        """
         print("🔄 กำลังเทรนโมเดล Face Recognition...")
         
-        success_count = 0
+        by_school = {}
         for student in students:
-            image_path = student.get('image_path')
-            student_id = student.get('student_id')
-            
-            if not image_path or not os.path.exists(image_path):
-                continue
+            by_school.setdefault(student.get('school_id') or DEFAULT_SCHOOL_ID, []).append(student)
+        
+        totals = {}
+        offset = 0
+        self.refresh()
+        for school_id, school_students in by_school.items():
+            def school_progress(done, total, stats, offset=offset):
+                if progress:
+                    progress(offset + done, len(students), stats)
             
-            try:
-                image = cv2.imread(image_path)
-                if image is None:
-                    continue
-                
-                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-                detected_faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-                
-                if len(detected_faces) > 0:
-                    (x, y, w, h) = detected_faces[0]
-                    face_roi = gray[y:y+h, x:x+w]
-                    face_roi = cv2.resize(face_roi, (100, 100))
-                    
-                    # เก็บ histogram เป็น feature
-                    self.known_faces[student_id] = face_roi.flatten()
-                    success_count += 1
-                    print(f"✅ เทรนสำเร็จ: {student.get('name')} ({student_id})")
-                else:
-                    print(f"⚠️ ไม่พบใบหน้า: {student.get('name')}")
+            for attempt in range(SAVE_RETRIES):
+                gallery = self._gallery(school_id)
+                stats, sources = train_incremental(
+                    school_students,
+                    gallery.ids,
+                    self.store.read_sources(school_id),
+                    self._encode_student,
+                    gallery.upsert,
+                    gallery.remove,
+                    school_progress
+                )
+                if not (stats['added'] or stats['updated'] or stats['removed'] or not self.store.segment_info(school_id)):
+                    break
+                try:
+                    self._save(school_id, sources)
+                    break
+                except StaleSegmentError:
+                    # worker อื่นเทรนโรงเรียนนี้ไปก่อน - โหลดของใหม่แล้วเทรนต่อจากนั้น (encode เฉพาะส่วนต่าง)
+                    print(f"🔄 โมเดลของ {school_id} ถูกบันทึกโดย process อื่น - โหลดใหม่แล้วเทรนซ้ำ")
+                    self._load_school(school_id)
+            offset += len(school_students)
             
-            except Exception as e:
-                print(f"❌ Error: {student.get('name')} - {str(e)}")
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
         
-        if success_count > 0:
-            self.save_model()
-            print(f"✅ เทรนเสร็จสิ้น! จำนวน {success_count}/{len(students)} คน")
+        if totals.get('trained'):
+            print(f"✅ เทรนเสร็จสิ้น! จำนวน {totals['trained']}/{len(students)} คน "
+                  f"(ใหม่ {totals['added']}, อัพเดท {totals['updated']}, เหมือนเดิม {totals['unchanged']}, ลบ {totals['removed']})")
         else:
             print("❌ ไม่มีข้อมูลให้เทรน")
         
-        return success_count
+        return totals
     
-    def save_model(self):
-        """บันทึกโมเดล"""
-        os.makedirs('data', exist_ok=True)
-        with open(self.labels_path, 'wb') as f:
-            pickle.dump(self.known_faces, f)
-        print(f"💾 บันทึกโมเดลที่: {self.labels_path}")
+    def _encode_student(self, student):
+        """ดึง feature ใบหน้าจากรูปนักเรียน (None ถ้าไม่พบใบหน้า)"""
+        image = cv2.imread(student['image_path'])
+        if image is None:
+            raise IOError(f"อ่านรูปไม่ได้: {student['image_path']}")
+        
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        detected_faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
+        
+        if len(detected_faces) == 0:
+            print(f"⚠️ ไม่พบใบหน้า: {student.get('name')}")
+            return None
+        
+        (x, y, w, h) = detected_faces[0]
+        face_roi = cv2.resize(gray[y:y+h, x:x+w], FACE_SIZE)
+        print(f"✅ เทรนสำเร็จ: {student.get('name')} ({student.get('student_id')})")
+        return face_roi.flatten()
     
-    def load_model(self):
-        """โหลดโมเดล"""
-        if os.path.exists(self.labels_path):
+    def remove_student(self, student_id):
+        """ลบใบหน้าของนักเรียนออกจาก gallery"""
+        self.refresh()
+        for school_id in list(self.galleries):
+            for attempt in range(SAVE_RETRIES):
+                if not self.galleries[school_id].remove(student_id):
+                    break
+                try:
+                    self._save(school_id)
+                    return True
+                except StaleSegmentError:
+                    # ไม่เขียน gallery เก่าทับ segment ที่เพิ่งเทรน - โหลดใหม่แล้วลบอีกครั้ง
+                    self._load_school(school_id)
+                    if school_id not in self.galleries:
+                        break
+        return False
+    
+    def save_model(self, school_ids=None):
+        """บันทึกโมเดลลง embedding store (เฉพาะ segment ของโรงเรียนที่ระบุ)"""
+        for school_id in list(self.galleries.keys() if school_ids is None else school_ids):
             try:
-                with open(self.labels_path, 'rb') as f:
-                    self.known_faces = pickle.load(f)
-                print(f"✅ โหลดโมเดล: {len(self.known_faces)} คน")
-            except Exception as e:
-                print(f"⚠️ ไม่สามารถโหลดโมเดล: {str(e)}")
+                self._save(school_id)
+            except StaleSegmentError:
+                print(f"⚠️ โมเดลของ {school_id} ถูกบันทึกโดย process อื่นแล้ว - โหลดของใหม่แทนการเขียนทับ")
+                self._load_school(school_id)
+        print(f"💾 บันทึกโมเดลที่: {self.store.root}")
+    
+    def load_model(self):
+        """โหลดโมเดล (mmap segment ของแต่ละโรงเรียน ไม่ copy ข้อมูลเข้า memory)"""
+        try:
+            if not self.store.exists() and os.path.exists(self.labels_path):
+                self._migrate_pickle()
+            
+            self.galleries = {}
+            self.generations = {}
+            for school_id in self.store.schools():
+                self._load_school(school_id)
+            if self.galleries:
+                print(f"✅ โหลดโมเดล: {len(self.known_face_ids)} คน ({len(self.galleries)} โรงเรียน)")
+        except Exception as e:
+            print(f"⚠️ ไม่สามารถโหลดโมเดล: {str(e)}")
+    
+    def _migrate_pickle(self):
+        """แปลง data/face_labels.pkl รุ่นเก่าเป็น embedding store"""
+        with open(self.labels_path, 'rb') as f:
+            known_faces = pickle.load(f)
+        gallery = FaceGallery(FACE_DIM)
+        gallery.upsert_many(list(known_faces.keys()), list(known_faces.values()))
+        self.store.save_gallery(DEFAULT_SCHOOL_ID, gallery)
+        print(f"✅ Migrate {self.labels_path} -> {self.store.root}: {len(gallery)} คน")
+    
+    @property
+    def known_faces(self):
+        """{student_id: face_features} - สำเนาจากทุก gallery"""
+        known_faces = {}
+        for gallery in self.galleries.values():
+            known_faces.update(gallery.items())
+        return known_faces
     
-    def recognize_face(self, image_array):
-        """จดจำใบหน้าจากรูปภาพ"""
+    def recognize_face(self, image_array, school_id=None):
+        """จดจำใบหน้าจากรูปภาพ (ระบุ school_id เพื่อค้นเฉพาะโรงเรียนนั้น)"""
         try:
-            if len(self.known_faces) == 0:
+            self.refresh()
+            if school_id is not None:
+                galleries = [self.galleries[school_id]] if school_id in self.galleries else []
+            else:
+                galleries = list(self.galleries.values())
+            galleries = [g for g in galleries if len(g) > 0]
+            if not galleries:
                 return []
             
             gray = cv2.cvtColor(image_array, cv2.COLOR_BGR2GRAY)
             faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
+            if len(faces) == 0:
+                return []
             
-            results = []
-            for (x, y, w, h) in faces:
+            # รวมทุกใบหน้าในเฟรมเป็น batch เดียว
+            face_features = np.empty((len(faces), FACE_DIM), dtype=np.float32)
+            for i, (x, y, w, h) in enumerate(faces):
                 face_roi = gray[y:y+h, x:x+w]
-                face_roi = cv2.resize(face_roi, (100, 100))
-                face_features = face_roi.flatten()
-                
-                # เปรียบเทียบกับใบหน้าที่รู้จัก
-                best_match = None
-                best_distance = float('inf')
-                
-                for student_id, known_features in self.known_faces.items():
-                    distance = np.linalg.norm(face_features - known_features)
-                    if distance < best_distance:
-                        best_distance = distance
-                        best_match = student_id
+                face_features[i] = cv2.resize(face_roi, FACE_SIZE).flatten()
+            
+            # เปรียบเทียบกับใบหน้าที่รู้จักทั้งหมดในครั้งเดียว (ต่อ gallery)
+            best = [(None, float('inf'))] * len(faces)
+            for gallery in galleries:
+                match_ids, distances = gallery.search(face_features, k=1)
+                for i, (ids, dists) in enumerate(zip(match_ids, distances)):
+                    if ids and float(dists[0]) < best[i][1]:
+                        best[i] = (ids[0], float(dists[0]))
+            
+            results = []
+            for (x, y, w, h), (best_match, best_distance) in zip(faces, best):
+                if best_match is None:
+                    continue
                 
                 # threshold สำหรับการจับคู่
-                if best_match and best_distance < 3000:
+                if best_distance < 3000:
                     confidence = max(0, 1 - (best_distance / 5000))
                     results.append({
                         'student_id': best_match,
@@ -116,7 +243,7 @@ class FaceRecognitionSystem:
             print(f"❌ Error in recognize_face: {str(e)}")
             return []
     
-    def recognize_from_base64(self, base64_image):
+    def recognize_from_base64(self, base64_image, school_id=None):
         """จดจำใบหน้าจาก base64 string"""
         import base64
         from io import BytesIO
@@ -134,7 +261,7 @@ class FaceRecognitionSystem:
             if len(image_array.shape) == 3:
                 image_array = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
             
-            return self.recognize_face(image_array)
+            return self.recognize_face(image_array, school_id)
         
         except Exception as e:
             print(f"❌ Error in recognize_from_base64: {str(e)}")
@@ -143,7 +270,10 @@ class FaceRecognitionSystem:
     @property
     def known_face_ids(self):
         """รายการ student_id ที่เทรนแล้ว"""
-        return list(self.known_faces.values())
+        ids = []
+        for gallery in self.galleries.values():
+            ids.extend(gallery.ids)
+        return ids
 
 # สร้าง instance
 face_recognition_system = FaceRecognitionSystem()
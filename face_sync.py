@@ -0,0 +1,177 @@
+"""
+Face Sync Engine
+sync ใบหน้านักเรียนเข้ากล้อง/terminal Hikvision หลายตัวพร้อมกัน
+
+- ส่งเฉพาะใบหน้าที่เปลี่ยน: เทียบกับ get_face_list ของกล้อง + checkpoint ของกล้องนั้น
+  (checkpoint เก็บ fingerprint ของรูป/ชื่อที่ส่งสำเร็จแล้ว - รูปที่ถูกเปลี่ยนจะถูกส่งใหม่)
+- checkpoint บันทึกระหว่าง sync (ทุก CHECKPOINT_EVERY คน) และตอนจบ/ยกเลิก - sync ที่ถูกขัดจังหวะทำต่อจากเดิม
+- ต่อกล้องส่งพร้อมกันไม่เกิน FACE_SYNC_CONCURRENCY request (terminal รับ request พร้อมกันได้น้อย)
+  หลายกล้องทำงานขนานกันได้สูงสุด FACE_SYNC_DEVICES ตัว
+- progress(done, total, counts) ถูกเรียกจาก thread ที่เรียก sync (ใช้ Job.progress ได้ - ยกเลิกแล้วหยุดส่งทันที)
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+CHECKPOINT_DIR = os.environ.get('FACE_SYNC_CHECKPOINT_DIR', 'data/face_sync')
+PER_DEVICE = int(os.environ.get('FACE_SYNC_CONCURRENCY', '4'))
+MAX_DEVICES = int(os.environ.get('FACE_SYNC_DEVICES', '4'))
+CHECKPOINT_EVERY = 50
+
+
+def face_fingerprint(student):
+    """ชื่อ + ขนาด + mtime ของรูป (ไม่ต้องอ่านไฟล์ทั้งไฟล์)"""
+    stat = os.stat(student['image_path'])
+    return f"{student['name']}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+class SyncCheckpoint:
+    def __init__(self, path):
+        self.path = path
+        self._faces = {}
+        self._dirty = 0
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._faces = json.load(f).get('faces', {})
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Face sync checkpoint เสีย ({path}): {e} - sync ใหม่ทั้งหมด")
+
+    def get(self, student_id):
+        with self._lock:
+            return self._faces.get(student_id)
+
+    def mark(self, student_id, fingerprint):
+        with self._lock:
+            self._faces[student_id] = fingerprint
+            self._dirty += 1
+            due = self._dirty >= CHECKPOINT_EVERY
+        if due:
+            self.save()
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({'faces': self._faces}, ensure_ascii=False)
+            self._dirty = 0
+            # เขียนไฟล์ชั่วคราวแล้ว rename - ไฟล์ไม่เสียถ้า process ตายระหว่างเขียน
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            temp_path = f'{self.path}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_path, self.path)
+
+
+class FaceSyncEngine:
+    def __init__(self, checkpoint_dir=CHECKPOINT_DIR, per_device=PER_DEVICE, max_devices=MAX_DEVICES):
+        self.checkpoint_dir = checkpoint_dir
+        self.per_device = per_device
+        self.max_devices = max_devices
+
+    @staticmethod
+    def device_key(device):
+        return f'{device.ip}:{device.port}'
+
+    def checkpoint_for(self, device):
+        return SyncCheckpoint(os.path.join(self.checkpoint_dir, f"{device.ip}_{device.port}.json"))
+
+    def plan(self, device, checkpoint, students):
+        """
+        งานที่ต้องส่งเข้ากล้องนี้ คืนค่า (tasks [(student, fingerprint, replace)], จำนวนที่ข้าม)
+        - ไม่มีในกล้อง: เพิ่ม
+        - มีในกล้องแต่ชื่อ/รูปเปลี่ยนจากที่เคยส่ง: ลบแล้วเพิ่มใหม่
+        - มีในกล้องและตรงกับ checkpoint (หรือยังไม่มี checkpoint แต่ชื่อตรง): ข้าม
+        ถ้าดึงรายการจากกล้องไม่ได้ จะใช้ checkpoint อย่างเดียว
+        """
+        listing = device.get_face_list()
+        on_device = {face['id']: face['name'] for face in listing['faces']} if listing.get('success') else None
+
+        tasks, skipped = [], 0
+        for student in students:
+            student_id = student['student_id']
+            fingerprint = face_fingerprint(student)
+            previous = checkpoint.get(student_id)
+            if on_device is None:
+                if previous == fingerprint:
+                    skipped += 1
+                else:
+                    tasks.append((student, fingerprint, previous is not None))
+                continue
+            if student_id not in on_device:
+                tasks.append((student, fingerprint, False))
+            elif on_device[student_id] != student['name'] or previous not in (None, fingerprint):
+                tasks.append((student, fingerprint, True))
+            else:
+                if previous is None:
+                    checkpoint.mark(student_id, fingerprint)
+                skipped += 1
+        return tasks, skipped
+
+    def sync(self, devices, students, progress=None):
+        """
+        sync นักเรียน (ที่มีรูป) เข้ากล้องทุกตัวใน devices
+        Returns:
+            dict: {'success', 'failed', 'skipped', 'total', 'devices': {'ip:port': {'success', 'failed', 'skipped', 'total'}}}
+        """
+        students = [s for s in students if s.get('image_path') and os.path.exists(s['image_path'])]
+        checkpoints = {}
+        per_device = {}
+        work = []
+        for device in devices:
+            key = self.device_key(device)
+            checkpoint = checkpoints[key] = self.checkpoint_for(device)
+            tasks, skipped = self.plan(device, checkpoint, students)
+            per_device[key] = {'success': 0, 'failed': 0, 'skipped': skipped, 'total': len(students)}
+            work.append((device, threading.Semaphore(self.per_device), tasks))
+            print(f"🔄 {key}: ต้องส่ง {len(tasks)} คน (ข้าม {skipped} คนที่ตรงกับกล้องแล้ว)")
+
+        # สลับงานของแต่ละกล้อง (round-robin) - ทุกกล้องเริ่มพร้อมกัน thread ไม่ติดรอ semaphore ของกล้องเดียว
+        interleaved = []
+        for index in range(max((len(tasks) for _, _, tasks in work), default=0)):
+            for device, semaphore, tasks in work:
+                if index < len(tasks):
+                    interleaved.append((device, semaphore, tasks[index]))
+
+        total = len(students) * len(devices)
+        done = sum(counts['skipped'] for counts in per_device.values())
+        counts = {'success': 0, 'failed': 0, 'skipped': done}
+        workers = max(1, min(len(devices), self.max_devices) * self.per_device)
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='face-sync')
+        try:
+            futures = {executor.submit(self._push, device, semaphore, task, checkpoints[self.device_key(device)]): device
+                       for device, semaphore, task in interleaved}
+            if progress:
+                progress(done, total, counts)
+            for future in as_completed(futures):
+                result = 'success' if future.result() else 'failed'
+                per_device[self.device_key(futures[future])][result] += 1
+                counts[result] += 1
+                done += 1
+                if progress:
+                    progress(done, total, counts)
+        finally:
+            # ยกเลิก (เช่น JobCancelled จาก progress) - ไม่เริ่มงานที่เหลือ แล้วบันทึกสิ่งที่ส่งไปแล้ว
+            executor.shutdown(wait=True, cancel_futures=True)
+            for checkpoint in checkpoints.values():
+                checkpoint.save()
+
+        print(f"📊 สรุป Sync: สำเร็จ {counts['success']}, ไม่สำเร็จ {counts['failed']}, ข้าม {counts['skipped']}")
+        return dict(counts, total=total, devices=per_device)
+
+    def _push(self, device, semaphore, task, checkpoint):
+        student, fingerprint, replace = task
+        with semaphore:
+            result = device.add_face(student['student_id'], student['name'], student['image_path'], replace=replace)
+        if result['success']:
+            checkpoint.mark(student['student_id'], fingerprint)
+            return True
+        print(f"❌ {device.ip} {student['name']}: {result['message']}")
+        return False
+
+
+# สร้าง instance
+face_sync_engine = FaceSyncEngine()
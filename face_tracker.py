@@ -0,0 +1,118 @@
+"""
+Face Tracker
+ติดตามใบหน้าข้ามเฟรมด้วย track id เพื่อไม่ต้อง detect + recognize ทุกเฟรม
+- detect ทุก detect_every เฟรม หรือทันทีในเฟรมถัดไปเมื่อมี track หลุด
+- จับคู่กล่องใหม่กับ track เดิมด้วย IoU
+- recognize เฉพาะ track ที่ยังไม่ยืนยันตัวตน เมื่อได้ label เดิมครบ confirm_hits ครั้ง
+  ถือว่ายืนยันแล้วและใช้ตัวตนเดิมต่อโดยไม่ predict ซ้ำ
+"""
+
+import os
+import itertools
+from collections import Counter
+
+DETECT_EVERY = int(os.environ.get('FACE_DETECT_EVERY', '5'))
+CONFIRM_HITS = int(os.environ.get('FACE_CONFIRM_HITS', '2'))
+
+
+def iou(a, b):
+    """IoU ของกล่อง (x, y, w, h)"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = tuple(int(v) for v in box)
+        self.label = None          # label ล่าสุด (None = ไม่รู้จัก)
+        self.confidence = 0
+        self.confirmed = False
+        self.just_confirmed = False  # True เฉพาะเฟรมที่เพิ่งยืนยัน (ใช้ทำ check-in ครั้งเดียว)
+        self.missed = 0
+        self.votes = Counter()
+
+    def vote(self, label, confidence, confirm_hits):
+        self.label = label
+        self.confidence = confidence
+        if label is None:
+            return
+        self.votes[label] += 1
+        if self.votes[label] >= confirm_hits:
+            self.confirmed = True
+            self.just_confirmed = True
+
+
+class FaceTracker:
+    def __init__(self, detect_every=DETECT_EVERY, confirm_hits=CONFIRM_HITS, max_missed=2, iou_threshold=0.3):
+        self.detect_every = max(1, int(detect_every))
+        self.confirm_hits = max(1, int(confirm_hits))
+        self.max_missed = max_missed
+        self.iou_threshold = iou_threshold
+        self.tracks = []
+        self.frame_count = 0
+        self.detections = 0
+        self.recognitions = 0
+        self._force_detect = True
+        self._ids = itertools.count(1)
+
+    def should_detect(self):
+        return self._force_detect or self.frame_count % self.detect_every == 0
+
+    def step(self, detect_fn, recognize_fn):
+        """
+        เรียกทุกเฟรม
+        detect_fn() -> รายการกล่อง (x, y, w, h) ของเฟรมนี้
+        recognize_fn(box) -> (label หรือ None, confidence)
+        คืนค่า tracks ที่เห็นในเฟรมล่าสุด
+        """
+        for track in self.tracks:
+            track.just_confirmed = False
+
+        if self.should_detect():
+            self.detections += 1
+            self.update([tuple(box) for box in detect_fn()])
+            for track in self.tracks:
+                if track.missed == 0 and not track.confirmed:
+                    self.recognitions += 1
+                    label, confidence = recognize_fn(track.box)
+                    track.vote(label, confidence, self.confirm_hits)
+
+        self.frame_count += 1
+        return [track for track in self.tracks if track.missed == 0]
+
+    def update(self, boxes):
+        """จับคู่กล่องที่ detect ได้กับ track เดิม (greedy ตาม IoU)"""
+        pairs = sorted(
+            ((iou(track.box, box), ti, bi) for ti, track in enumerate(self.tracks) for bi, box in enumerate(boxes)),
+            reverse=True
+        )
+        matched_tracks, matched_boxes = set(), set()
+        for score, ti, bi in pairs:
+            if score < self.iou_threshold:
+                break
+            if ti in matched_tracks or bi in matched_boxes:
+                continue
+            matched_tracks.add(ti)
+            matched_boxes.add(bi)
+            self.tracks[ti].box = tuple(int(v) for v in boxes[bi])
+            self.tracks[ti].missed = 0
+
+        lost = False
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.missed += 1
+                lost = True
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for bi, box in enumerate(boxes):
+            if bi not in matched_boxes:
+                self.tracks.append(Track(next(self._ids), box))
+
+        # track หลุด - detect ใหม่ทันทีในเฟรมถัดไปแทนที่จะรอครบรอบ
+        self._force_detect = lost and bool(self.tracks)
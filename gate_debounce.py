@@ -0,0 +1,66 @@
+"""
+Gate Debounce
+กล้อง Hikvision ส่ง faceDetection ซ้ำหลายครั้งขณะที่นักเรียนยืนหน้ากล้อง
+ตัวกรองนี้ให้บันทึก/แจ้งเตือนผู้ปกครองเพียงครั้งเดียวต่อ (school_id, student_id, camera_type) ภายใน window
+- ชั้นแรก: memory ของ process - event ซ้ำส่วนใหญ่ถูกตัดโดยไม่ต้องถาม database
+- ชั้นที่สอง: claim_fn (เช่น Database.claim_gate_event) ตรวจกับ store กลาง ให้ถูกต้องข้าม gunicorn worker
+ถ้า store กลางใช้ไม่ได้ จะตัดสินจาก memory อย่างเดียว (ยอมให้ซ้ำข้าม worker ดีกว่าทิ้ง event)
+"""
+
+import os
+import threading
+import time
+
+DEBOUNCE_SECONDS = float(os.environ.get('GATE_DEBOUNCE_SECONDS', '60'))
+PRUNE_EVERY = 1000
+
+
+class GateDebouncer:
+    def __init__(self, claim_fn=None, window=DEBOUNCE_SECONDS, clock=time.time):
+        """claim_fn(school_id, student_id, camera_type, window, now) -> True ถ้าเป็น event แรกใน window"""
+        self.claim_fn = claim_fn
+        self.window = window
+        self.clock = clock
+        self._seen = {}  # (school_id, student_id, camera_type) -> เวลาที่บันทึกล่าสุด
+        self._lock = threading.Lock()
+        self._calls = 0
+        self.counters = {'accepted': 0, 'suppressed': 0, 'shared_suppressed': 0, 'store_errors': 0}
+
+    def should_record(self, school_id, student_id, camera_type):
+        """True = event แรกของนักเรียนที่กล้องนี้ภายใน window ให้บันทึก/แจ้งเตือน"""
+        key = (school_id, student_id, camera_type)
+        now = self.clock()
+        with self._lock:
+            self._calls += 1
+            if self._calls % PRUNE_EVERY == 0:
+                self._prune(now)
+            last = self._seen.get(key)
+            if last is not None and now - last < self.window:
+                self.counters['suppressed'] += 1
+                return False
+            # จองไว้ก่อนถาม store กลาง - event ซ้ำที่เข้ามาพร้อมกันใน process นี้จะถูกตัด
+            self._seen[key] = now
+
+        if self.claim_fn is not None:
+            try:
+                claimed = self.claim_fn(school_id, student_id, camera_type, self.window, now)
+            except Exception as e:
+                print(f"⚠️ Gate debounce store error: {e}")
+                self.counters['store_errors'] += 1
+                claimed = True
+            if not claimed:
+                # worker อื่นบันทึกไปแล้ว
+                self.counters['shared_suppressed'] += 1
+                return False
+
+        self.counters['accepted'] += 1
+        return True
+
+    def _prune(self, now):
+        expired = [key for key, last in self._seen.items() if now - last >= self.window]
+        for key in expired:
+            del self._seen[key]
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, tracked=len(self._seen), window=self.window)
@@ -5,12 +5,16 @@ Hikvision Face Recognition API Integration
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPDigestAuth
 import base64
 import json
 from datetime import datetime
 import xml.etree.ElementTree as ET
 
+from alert_stream import AlertStreamParser, boundary_from_content_type, parse_face_event
+from face_sync import PER_DEVICE, face_sync_engine
+
 class HikvisionFaceAPI:
     def __init__(self, ip, username='admin', password='admin', port=80):
         """
@@ -27,18 +31,25 @@ class HikvisionFaceAPI:
         self.auth = HTTPDigestAuth(username, password)
         self.base_url = f"http://{ip}:{port}/ISAPI"
         self.timeout = 10
+        
+        # keep-alive: ใช้ TCP connection ซ้ำระหว่าง request (ขนาด pool = จำนวน request พร้อมกันตอน sync)
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PER_DEVICE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
     
     def test_connection(self):
         """ทดสอบการเชื่อมต่อ"""
         try:
             url = f"{self.base_url}/System/deviceInfo"
-            response = requests.get(url, auth=self.auth, timeout=self.timeout)
+            response = self.session.get(url, timeout=self.timeout)
             return response.status_code == 200
         except Exception as e:
             print(f"❌ Connection Error: {str(e)}")
             return False
     
-    def add_face(self, student_id, name, image_path):
+    def add_face(self, student_id, name, image_path, replace=False):
         """
         เพิ่มใบหน้าเข้า Face Library ของกล้อง
         
@@ -46,11 +57,15 @@ class HikvisionFaceAPI:
             student_id: รหัสนักเรียน
             name: ชื่อนักเรียน
             image_path: path ของรูปภาพ
+            replace: ลบใบหน้าเดิมของรหัสนี้ก่อน (เปลี่ยนชื่อ/รูป)
         
         Returns:
             dict: {'success': bool, 'message': str}
         """
         try:
+            if replace:
+                self.delete_face(student_id)
+            
             # อ่านรูปภาพและแปลงเป็น base64
             with open(image_path, 'rb') as f:
                 image_data = f.read()
@@ -68,13 +83,13 @@ class HikvisionFaceAPI:
 </FaceDataRecord>"""
             
             headers = {'Content-Type': 'application/xml'}
-            response = requests.post(url, data=xml_data, auth=self.auth, headers=headers, timeout=self.timeout)
+            response = self.session.post(url, data=xml_data, headers=headers, timeout=self.timeout)
             
             if response.status_code in [200, 201]:
                 # อัพโหลดรูปภาพ
                 face_url = f"{self.base_url}/Intelligent/FDLib/FaceDataRecord/picture/{student_id}"
                 files = {'file': ('face.jpg', image_data, 'image/jpeg')}
-                pic_response = requests.put(face_url, files=files, auth=self.auth, timeout=self.timeout)
+                pic_response = self.session.put(face_url, files=files, timeout=self.timeout)
                 
                 if pic_response.status_code in [200, 201]:
                     return {'success': True, 'message': f'เพิ่มใบหน้า {name} สำเร็จ'}
@@ -90,7 +105,7 @@ class HikvisionFaceAPI:
         """ลบใบหน้าออกจาก Face Library"""
         try:
             url = f"{self.base_url}/Intelligent/FDLib/FaceDataRecord/{student_id}"
-            response = requests.delete(url, auth=self.auth, timeout=self.timeout)
+            response = self.session.delete(url, timeout=self.timeout)
             
             if response.status_code in [200, 204]:
                 return {'success': True, 'message': f'ลบใบหน้า {student_id} สำเร็จ'}
@@ -104,15 +119,16 @@ class HikvisionFaceAPI:
         """ดึงรายการใบหน้าทั้งหมดในกล้อง"""
         try:
             url = f"{self.base_url}/Intelligent/FDLib/FaceDataRecord"
-            response = requests.get(url, auth=self.auth, timeout=self.timeout)
+            response = self.session.get(url, timeout=self.timeout)
             
             if response.status_code == 200:
                 # Parse XML response
                 root = ET.fromstring(response.content)
                 faces = []
-                for record in root.findall('.//FaceDataRecord'):
-                    face_id = record.find('id').text if record.find('id') is not None else None
-                    name = record.find('name').text if record.find('name') is not None else None
+                # {*} รองรับ XML ที่มี namespace ของ Hikvision
+                for record in root.findall('.//{*}FaceDataRecord'):
+                    face_id = record.findtext('{*}id')
+                    name = record.findtext('{*}name')
                     if face_id and name:
                         faces.append({'id': face_id, 'name': name})
                 return {'success': True, 'faces': faces}
@@ -122,67 +138,45 @@ class HikvisionFaceAPI:
         except Exception as e:
             return {'success': False, 'message': f'Error: {str(e)}'}
     
-    def get_face_detection_events(self, callback=None):
+    def get_face_detection_events(self, callback=None, record_path=None):
         """
         รับ Event การจับใบหน้าแบบ Real-time
         
         Args:
             callback: ฟังก์ชันที่จะถูกเรียกเมื่อจับใบหน้าได้
                       callback(student_id, name, confidence, timestamp)
+            record_path: บันทึก stream ดิบลงไฟล์ (ใช้กับ benchmark_alert_stream.py)
         """
+        record = None
         try:
             url = f"{self.base_url}/Event/notification/alertStream"
             response = requests.get(url, auth=self.auth, stream=True, timeout=None)
+            parser = AlertStreamParser(boundary_from_content_type(response.headers.get('Content-Type')))
+            if record_path:
+                record = open(record_path, 'wb')
             
             print("🎥 เริ่มรับ Event จากกล้อง...")
             
-            buffer = b""
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:
-                    buffer += chunk
+            # chunk_size=None: ได้ข้อมูลทันทีที่มาถึง ไม่ต้องรอให้ครบ 1 KB
+            for chunk in response.iter_content(chunk_size=None):
+                if record:
+                    record.write(chunk)
+                for event_xml in parser.feed(chunk):
+                    result = parse_face_event(event_xml)
+                    if result is None:
+                        continue
                     
-                    # หา boundary ของ event
-                    if b'</EventNotificationAlert>' in buffer:
-                        try:
-                            # Parse XML
-                            xml_str = buffer.decode('utf-8', errors='ignore')
-                            start = xml_str.find('<?xml')
-                            end = xml_str.find('</EventNotificationAlert>') + len('</EventNotificationAlert>')
-                            
-                            if start >= 0 and end > start:
-                                event_xml = xml_str[start:end]
-                                root = ET.fromstring(event_xml)
-                                
-                                # ดึงข้อมูลจาก Event
-                                event_type = root.find('.//eventType')
-                                if event_type is not None and 'faceDetection' in event_type.text:
-                                    student_id = root.find('.//TargetID')
-                                    name = root.find('.//name')
-                                    similarity = root.find('.//similarity')
-                                    timestamp = root.find('.//dateTime')
-                                    
-                                    if student_id is not None and name is not None:
-                                        result = {
-                                            'student_id': student_id.text,
-                                            'name': name.text,
-                                            'confidence': float(similarity.text) / 100 if similarity is not None else 0.0,
-                                            'timestamp': timestamp.text if timestamp is not None else datetime.now().isoformat()
-                                        }
-                                        
-                                        print(f"✅ จับใบหน้า: {result['name']} ({result['confidence']*100:.1f}%)")
-                                        
-                                        if callback:
-                                            callback(result)
-                                
-                                buffer = buffer[buffer.find(b'</EventNotificationAlert>') + len(b'</EventNotificationAlert>'):]
-                        
-                        except Exception as e:
-                            print(f"⚠️ Parse Error: {str(e)}")
-                            buffer = b""
+                    print(f"✅ จับใบหน้า: {result['name']} ({result['confidence']*100:.1f}%)")
+                    
+                    if callback:
+                        callback(result)
         
         except Exception as e:
             print(f"❌ Event Stream Error: {str(e)}")
             return {'success': False, 'message': f'Error: {str(e)}'}
+        finally:
+            if record:
+                record.close()
     
     def get_rtsp_url(self, channel=1, stream=1):
         """
@@ -199,42 +193,21 @@ class HikvisionFaceAPI:
         password = self.auth.password
         return f"rtsp://{username}:{password}@{self.ip}:554/Streaming/Channels/{channel}0{stream}"
     
-    def sync_all_students(self, students):
+    def sync_all_students(self, students, progress=None):
         """
-        Sync นักเรียนทั้งหมดเข้ากล้อง
+        Sync นักเรียนทั้งหมดเข้ากล้อง (ส่งเฉพาะใบหน้าที่เปลี่ยน ทำต่อจาก checkpoint ถ้าถูกขัดจังหวะ - ดู face_sync.py)
         
         Args:
             students: list of dict [{'student_id': '', 'name': '', 'image_path': ''}]
+            progress: callback(done, total, counts) หลัง sync แต่ละคน (เช่น Job.progress)
         
         Returns:
-            dict: {'success': int, 'failed': int, 'total': int}
+            dict: {'success': int, 'failed': int, 'skipped': int, 'total': int}
         """
-        success = 0
-        failed = 0
-        
         print(f"🔄 เริ่ม Sync {len(students)} คน...")
-        
-        for student in students:
-            result = self.add_face(
-                student['student_id'],
-                student['name'],
-                student['image_path']
-            )
-            
-            if result['success']:
-                success += 1
-                print(f"✅ {student['name']}")
-            else:
-                failed += 1
-                print(f"❌ {student['name']}: {result['message']}")
-        
-        print(f"\n📊 สรุป: สำเร็จ {success}/{len(students)} คน")
-        
-        return {
-            'success': success,
-            'failed': failed,
-            'total': len(students)
-        }
+        result = face_sync_engine.sync([self], students, progress=progress)
+        result.pop('devices')
+        return result
 
 # สร้าง instance
 hikvision_api = None
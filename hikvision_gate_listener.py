@@ -1,10 +1,13 @@
 """
 Hikvision Gate Camera Event Listener
-รับ Event การตรวจจับใบหน้าจากกล้อง Hikvision แบบ Real-time
+รับ Event การตรวจจับใบหน้าจากกล้อง Hikvision ทุกตัว (ตาราง cameras) แบบ Real-time ใน process เดียว
+ดู camera_event_hub.py
 """
 
-from hikvision_face_api import init_hikvision
+import asyncio
+from camera_event_hub import CameraEventHub, EventSink, load_cameras
 from database_universal import db
+from gate_debounce import GateDebouncer
 from local_client import CloudSync
 from line_oa import LineOA
 from datetime import datetime
@@ -15,54 +18,44 @@ load_dotenv()
 
 CLOUD_API_URL = os.environ.get('CLOUD_API_URL', 'http://43.210.87.220:8080')
 cloud_sync = CloudSync(CLOUD_API_URL)
+gate_debouncer = GateDebouncer(db.claim_gate_event)
 
-def handle_face_detection(result):
-    """จัดการเมื่อกล้องตรวจจับใบหน้า"""
-    student_id = result['student_id']
-    student_name = result['name']
-    confidence = result['confidence']
-    
-    print(f"✅ ตรวจจับ: {student_name} ({confidence*100:.1f}%)")
-    
-    # บันทึกเข้าฐานข้อมูล
-    school_id = 'SCH001'  # ดึงจาก config
-    camera_type = 'gate_in'  # หรือ gate_out
-    
-    db.add_attendance(student_id, student_name, school_id, camera_type)
-    
-    # แจ้งเตือน LINE
-    line_user_id = db.get_student_line_token(student_id)
+def accept_event(event):
+    """กล้องส่ง event ซ้ำขณะนักเรียนยืนหน้ากล้อง - บันทึก/แจ้ง LINE ครั้งเดียวต่อ window"""
+    return gate_debouncer.should_record(event['school_id'], event['student_id'], event['camera_type'])
+
+def record_attendance(event):
+    print(f"✅ ตรวจจับ: {event['name']} ({event['confidence']*100:.1f}%) - {event['camera_name']}")
+    db.enqueue_attendance(event['student_id'], event['name'], event['school_id'], event['camera_type'])
+
+def notify_parent(event):
+    """แจ้งเตือน LINE"""
+    line_user_id = db.get_student_line_token(event['student_id'])
     if line_user_id:
-        school = db.get_school(school_id)
+        school = db.get_school(event['school_id'])
         if school and school.get('line_channel_token'):
             line = LineOA(school['line_channel_token'])
             current_time = datetime.now().strftime('%H:%M น.')
-            line.send_gate_entry(line_user_id, student_name, 'checkin', current_time)
-    
-    # Sync to Cloud
-    cloud_sync.send_attendance(student_id, student_name, camera_type=camera_type)
+            entry_type = 'checkout' if event['camera_type'] == 'gate_out' else 'checkin'
+            line.send_gate_entry(line_user_id, event['name'], entry_type, current_time)
+
+def sync_cloud(event):
+    cloud_sync.send_attendance(event['student_id'], event['name'], camera_type=event['camera_type'])
 
 if __name__ == '__main__':
-    # อ่าน config จาก database
-    school = db.get_school('SCH001')
-    
-    if not school or not school.get('camera_ip'):
-        print("❌ กรุณาตั้งค่ากล้อง Hikvision ก่อน")
-        exit(1)
-    
-    # เชื่อมต่อกล้อง
-    camera = init_hikvision(
-        school['camera_ip'],
-        school.get('camera_user', 'admin'),
-        school.get('camera_pass', 'admin')
+    hub = CameraEventHub(
+        lambda: load_cameras(db),
+        [
+            # attendance ไม่ทิ้ง event (รอคิว), LINE / cloud ทิ้งได้ถ้าปลายทางช้าจนคิวเต็ม
+            EventSink('attendance', record_attendance, workers=2, block=True),
+            EventSink('line', notify_parent),
+            EventSink('cloud', sync_cloud)
+        ],
+        accept=accept_event
     )
-    
-    if not camera.test_connection():
-        print("❌ ไม่สามารถเชื่อมต่อกล้องได้")
-        exit(1)
-    
-    print(f"🎥 เชื่อมต่อกล้อง {school['camera_ip']} สำเร็จ")
-    print("⏳ รอรับ Event...")
-    
-    # เริ่มรับ Event
-    camera.get_face_detection_events(callback=handle_face_detection)
+
+    print("⏳ รอรับ Event จากกล้องทุกตัว...")
+    try:
+        asyncio.run(hub.run())
+    except KeyboardInterrupt:
+        print("👋 หยุดรับ Event")
@@ -0,0 +1,139 @@
+"""
+Incremental Training
+เทรนเฉพาะรูปที่เพิ่มใหม่/เปลี่ยนไป โดยเทียบ fingerprint (mtime + size + sha1) กับครั้งก่อน
+และลบนักเรียนที่ไม่อยู่ในรายชื่อแล้วออกจาก gallery
+"""
+
+import os
+import hashlib
+
+
+def file_sha1(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def image_fingerprint(path, previous=None):
+    """
+    fingerprint ของไฟล์รูป - ถ้า path/mtime/size ตรงกับครั้งก่อนจะใช้ sha1 เดิมโดยไม่อ่านไฟล์
+    """
+    stat = os.stat(path)
+    fingerprint = {'path': path, 'mtime': stat.st_mtime, 'size': stat.st_size}
+    if previous and all(previous.get(key) == fingerprint[key] for key in ('path', 'mtime', 'size')):
+        fingerprint['sha1'] = previous.get('sha1')
+    else:
+        fingerprint['sha1'] = file_sha1(path)
+    return fingerprint
+
+
+def _print_error(student, error):
+    print(f"❌ Error: {student.get('name')} - {str(error)}")
+
+
+def _serial_encode(encode_fn, students):
+    for student in students:
+        try:
+            yield student, encode_fn(student), None
+        except Exception as e:
+            yield student, None, e
+
+
+def train_incremental(students, known_ids, previous_sources, encode_fn, upsert_fn, remove_fn,
+                      progress=None, on_error=_print_error, encode_many=None, remove_missing=True):
+    """
+    students         - รายชื่อนักเรียนปัจจุบันของโรงเรียน (ต้องมี student_id, image_path)
+    known_ids        - student_id ที่อยู่ใน gallery ตอนนี้
+    previous_sources - {student_id: fingerprint} จากการเทรนครั้งก่อน
+    encode_fn(student) -> feature หรือ None ถ้าไม่พบใบหน้า
+    upsert_fn(student_id, feature), remove_fn(student_id)
+    progress(done, total, stats) - เรียกหลังประมวลผลนักเรียนแต่ละคน
+    on_error(student, error) - รายงานรูปที่ประมวลผลไม่ได้
+    encode_many(students) -> iterable ของ (student, feature, error) เช่น ParallelEncoder.encode
+                             (ถ้าไม่ระบุจะเรียก encode_fn ทีละคน)
+    remove_missing   - ลบนักเรียนที่ไม่อยู่ใน students ออกจาก gallery (False = เพิ่ม/อัพเดทอย่างเดียว)
+
+    คืนค่า (stats, sources ใหม่)
+    """
+    known_ids = set(known_ids)
+    stats = {'total': len(students), 'added': 0, 'updated': 0, 'unchanged': 0,
+             'removed': 0, 'no_face': 0, 'failed': 0}
+    sources = dict(previous_sources) if not remove_missing else {}
+    current_ids = set()
+    fingerprints = {}
+    to_encode = []
+    done = 0
+
+    def step():
+        nonlocal done
+        done += 1
+        if progress:
+            progress(done, len(students), stats)
+
+    def failed(student, error):
+        student_id = student.get('student_id')
+        on_error(student, error)
+        stats['failed'] += 1
+        # รูปอ่านไม่ได้ชั่วคราว - เก็บ feature เดิมไว้
+        if student_id in previous_sources and student_id in known_ids:
+            sources[student_id] = previous_sources[student_id]
+
+    # รอบแรก: เทียบ fingerprint แยกรูปที่ไม่เปลี่ยนออก
+    for student in students:
+        student_id = student.get('student_id')
+        image_path = student.get('image_path')
+        current_ids.add(student_id)
+
+        try:
+            if not image_path or not os.path.exists(image_path):
+                if student_id in known_ids:
+                    remove_fn(student_id)
+                    sources.pop(student_id, None)
+                    stats['removed'] += 1
+            else:
+                previous = previous_sources.get(student_id)
+                fingerprint = image_fingerprint(image_path, previous)
+
+                if student_id in known_ids and previous and previous.get('sha1') == fingerprint['sha1']:
+                    sources[student_id] = fingerprint
+                    stats['unchanged'] += 1
+                else:
+                    fingerprints[student_id] = fingerprint
+                    to_encode.append(student)
+                    continue
+        except Exception as e:
+            failed(student, e)
+        # นอก try - JobCancelled จาก progress ต้องหลุดออกไป ไม่นับเป็นรูปที่ผิดพลาด
+        step()
+
+    # รอบสอง: encode เฉพาะรูปใหม่/เปลี่ยน - ผลลัพธ์เข้า gallery ทันทีที่เสร็จ
+    results = encode_many(to_encode) if encode_many else _serial_encode(encode_fn, to_encode)
+    for student, feature, error in results:
+        student_id = student.get('student_id')
+        try:
+            if error is not None:
+                failed(student, error)
+            elif feature is None:
+                if student_id in known_ids:
+                    remove_fn(student_id)
+                    stats['removed'] += 1
+                sources.pop(student_id, None)
+                stats['no_face'] += 1
+            else:
+                upsert_fn(student_id, feature)
+                sources[student_id] = fingerprints[student_id]
+                stats['updated' if student_id in known_ids else 'added'] += 1
+        except Exception as e:
+            failed(student, e)
+        step()
+
+    # นักเรียนที่ถูกลบออกจากโรงเรียนแล้ว
+    if remove_missing:
+        for student_id in known_ids - current_ids:
+            remove_fn(student_id)
+            stats['removed'] += 1
+
+    stats['trained'] = stats['added'] + stats['updated'] + stats['unchanged']
+    return stats, sources
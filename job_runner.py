@@ -0,0 +1,395 @@
+"""
+Background Job Runner
+รันงานที่ใช้เวลานาน (เช่นเทรนโมเดล, sync กล้อง, backup, นำเข้านักเรียน) นอก request - HTTP คืน job_id ทันที
+แล้วให้หน้าเว็บ poll สถานะที่ /api/jobs/<job_id>
+
+- งานรันใน thread pool ขนาดจำกัด (JOB_WORKERS) ของ process ที่รับ request
+- สถานะ/ความคืบหน้า/ผลลัพธ์ถูกบันทึกใน SQLite (JOB_DB_PATH) ทุก gunicorn worker จึง poll
+  และยกเลิกงานได้ไม่ว่างานจะรันอยู่ใน worker ไหน
+- ยกเลิกแบบ cooperative: job.progress() / job.check_cancelled() raise JobCancelled
+  เมื่อมีคำขอยกเลิก งานที่ยังอยู่ในคิวจะไม่ถูกเริ่ม
+- งานที่ค้างสถานะ running ของ process ที่ตายแล้วจะถูกทำเครื่องหมาย failed
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlite_pool import get_pool
+
+MAX_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_DB_PATH = os.environ.get('JOB_DB_PATH', 'data/jobs.db')
+KEEP_FINISHED = 200
+SYNC_INTERVAL = 0.5  # วินาที - เขียนความคืบหน้า/อ่านคำขอยกเลิกจาก store ไม่บ่อยกว่านี้
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Job:
+    def __init__(self, name, key=None, school_id=None, store=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.key = key
+        self.school_id = school_id
+        self.status = 'queued'
+        self.done = 0
+        self.total = 0
+        self.counts = {}
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.owner_pid = os.getpid()
+        self.store = store
+        self._synced_at = 0.0
+
+    def progress(self, done=None, total=None, counts=None):
+        """อัพเดทความคืบหน้า (เรียกจากในงาน) - raise JobCancelled ถ้ามีคำขอยกเลิก"""
+        if done is not None:
+            self.done = done
+        if total is not None:
+            self.total = total
+        if counts is not None:
+            self.counts = dict(counts)
+        self._sync(force=self.total and self.done >= self.total)
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        """เรียกระหว่างงานเพื่อหยุดเมื่อผู้ใช้ยกเลิก"""
+        if self.cancel_requested:
+            raise JobCancelled(f'job {self.id} cancelled')
+
+    def _sync(self, force=False):
+        if self.store is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._synced_at < SYNC_INTERVAL:
+            return
+        self._synced_at = now
+        if self.store.save(self):
+            self.cancel_requested = True
+
+    @property
+    def active(self):
+        return self.status in ACTIVE_STATUSES
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'name': self.name,
+            'school_id': self.school_id,
+            'status': self.status,
+            'done': self.done,
+            'total': self.total,
+            'percent': round(self.done / self.total * 100, 1) if self.total else 0,
+            'counts': self.counts,
+            'result': self.result,
+            'error': self.error,
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobStore:
+    """ตาราง jobs ใน SQLite ที่ทุก worker ใช้ร่วมกัน"""
+
+    COLUMNS = ('id', 'name', 'key', 'school_id', 'status', 'done', 'total', 'counts', 'result', 'error',
+               'cancel_requested', 'created_at', 'started_at', 'finished_at', 'owner_pid')
+
+    def __init__(self, path=JOB_DB_PATH):
+        # เปิดไฟล์/สร้างตารางเมื่อใช้ครั้งแรก - import module ไม่สร้าง data/jobs.db
+        self.path = path
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    pool = get_pool(self.path)
+                    self._create_table(pool)
+                    self._pool = pool
+        return self._pool
+
+    @staticmethod
+    def _create_table(pool):
+        conn = pool.acquire()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    key TEXT,
+                    school_id TEXT,
+                    status TEXT NOT NULL,
+                    done INTEGER DEFAULT 0,
+                    total INTEGER DEFAULT 0,
+                    counts TEXT,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER DEFAULT 0,
+                    created_at TEXT,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    owner_pid INTEGER
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_key_status ON jobs(key, status)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_school_created ON jobs(school_id, created_at)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _values(job):
+        return (job.id, job.name, job.key, job.school_id, job.status, job.done, job.total,
+                json.dumps(job.counts, ensure_ascii=False, default=str),
+                json.dumps(job.result, ensure_ascii=False, default=str), job.error,
+                int(job.cancel_requested), job.created_at, job.started_at, job.finished_at, job.owner_pid)
+
+    def insert_unique(self, job):
+        """
+        บันทึกงานใหม่ - ถ้ามีงาน active ที่ key เดียวกัน (จาก worker ใดก็ได้) คืน id ของงานนั้นแทน
+        BEGIN IMMEDIATE ทำให้ worker ที่ submit พร้อมกันไม่ได้งานซ้ำ
+        """
+        conn = self.pool.acquire()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            if job.key is not None:
+                rows = conn.execute(
+                    "SELECT id, owner_pid FROM jobs WHERE key = ? AND status IN ('queued', 'running')",
+                    (job.key,)
+                ).fetchall()
+                for row in rows:
+                    if _pid_alive(row['owner_pid']):
+                        conn.rollback()
+                        return row['id']
+                    self._mark_lost(conn, row['id'])
+            conn.execute(f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                         self._values(job))
+            conn.commit()
+            return job.id
+        finally:
+            conn.close()
+
+    def save(self, job):
+        """อัพเดทสถานะ/ความคืบหน้า คืนค่า True ถ้ามีคำขอยกเลิกงานนี้"""
+        conn = self.pool.acquire()
+        try:
+            conn.execute('''
+                UPDATE jobs SET status = ?, done = ?, total = ?, counts = ?, result = ?, error = ?,
+                       started_at = ?, finished_at = ?
+                WHERE id = ?
+            ''', (job.status, job.done, job.total, json.dumps(job.counts, ensure_ascii=False, default=str),
+                  json.dumps(job.result, ensure_ascii=False, default=str), job.error,
+                  job.started_at, job.finished_at, job.id))
+            row = conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job.id,)).fetchone()
+            conn.commit()
+            return bool(row and row['cancel_requested'])
+        finally:
+            conn.close()
+
+    def request_cancel(self, job_id):
+        """ทำเครื่องหมายยกเลิก - งานที่ยังไม่เริ่มถูกยกเลิกทันที คืนค่า False ถ้าไม่พบงานที่ยัง active"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')", (job_id,))
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (datetime.now().isoformat(), job_id))
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def _mark_lost(self, conn, job_id):
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+            ('worker process exited before the job finished', datetime.now().isoformat(), job_id))
+
+    def load(self, job_id):
+        conn = self.pool.acquire()
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row['status'] in ACTIVE_STATUSES and not _pid_alive(row['owner_pid']):
+                self._mark_lost(conn, job_id)
+                conn.commit()
+                row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            return self._from_row(row)
+        finally:
+            conn.close()
+
+    def list(self, school_id=None, limit=50):
+        conn = self.pool.acquire()
+        try:
+            if school_id:
+                rows = conn.execute('SELECT * FROM jobs WHERE school_id = ? ORDER BY created_at DESC LIMIT ?',
+                                    (school_id, limit)).fetchall()
+            else:
+                rows = conn.execute('SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?', (limit,)).fetchall()
+            return [self._from_row(row) for row in rows]
+        finally:
+            conn.close()
+
+    def prune(self, keep=KEEP_FINISHED):
+        conn = self.pool.acquire()
+        try:
+            conn.execute('''
+                DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND id NOT IN (
+                    SELECT id FROM jobs WHERE status NOT IN ('queued', 'running') ORDER BY created_at DESC LIMIT ?
+                )
+            ''', (keep,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _from_row(self, row):
+        job = Job(row['name'], key=row['key'], school_id=row['school_id'])
+        job.id = row['id']
+        job.status = row['status']
+        job.done = row['done']
+        job.total = row['total']
+        job.counts = json.loads(row['counts']) if row['counts'] else {}
+        job.result = json.loads(row['result']) if row['result'] else None
+        job.error = row['error']
+        job.cancel_requested = bool(row['cancel_requested'])
+        job.created_at = row['created_at']
+        job.started_at = row['started_at']
+        job.finished_at = row['finished_at']
+        job.owner_pid = row['owner_pid']
+        return job
+
+
+class JobRunner:
+    def __init__(self, max_workers=MAX_WORKERS, store=None):
+        """store=None เก็บสถานะใน memory ของ process เท่านั้น"""
+        self.max_workers = max_workers
+        self.store = store
+        self._executor = None
+        self._pid = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _ensure_executor(self):
+        # สร้าง pool หลัง fork (gunicorn preload) - thread ของ process แม่ไม่ติดมา
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+            self._pid = os.getpid()
+            self._jobs = {}
+
+    def submit(self, name, fn, *args, key=None, school_id=None, **kwargs):
+        """
+        ส่งงานเข้าคิว - fn(job, *args, **kwargs) คืนค่าเป็น result ของงาน (ต้องแปลงเป็น JSON ได้)
+        ถ้ามีงานที่ key เดียวกันยังไม่เสร็จ (ใน worker ใดก็ได้) จะคืนงานเดิมแทนการสร้างใหม่
+        """
+        with self._lock:
+            self._ensure_executor()
+            if key is not None:
+                for job in self._jobs.values():
+                    if job.key == key and job.active:
+                        return job
+            job = Job(name, key=key, school_id=school_id, store=self.store)
+            if self.store is not None:
+                existing_id = self.store.insert_unique(job)
+                if existing_id != job.id:
+                    return self.get(existing_id)
+            self._jobs[job.id] = job
+            self._prune()
+
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if self.store is not None and self.store.save(job):
+            job.cancel_requested = True
+        if job.cancel_requested:
+            job.status = 'cancelled'
+            job.finished_at = datetime.now().isoformat()
+            self._save(job)
+            return
+
+        job.status = 'running'
+        job.started_at = datetime.now().isoformat()
+        self._save(job)
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = 'done'
+        except JobCancelled:
+            job.status = 'cancelled'
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = datetime.now().isoformat()
+            self._save(job)
+
+    def _save(self, job):
+        if self.store is None:
+            return
+        try:
+            self.store.save(job)
+        except Exception as e:
+            print(f"⚠️ Job store error: {e}")
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if not job.active]
+        for job in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self._jobs[job.id]
+        if self.store is not None and len(finished) > KEEP_FINISHED:
+            self.store.prune()
+
+    def get(self, job_id):
+        """งานจาก process นี้ (สถานะล่าสุด) หรือจาก store (งานของ worker อื่น)"""
+        job = self._jobs.get(job_id)
+        if job is not None or self.store is None:
+            return job
+        return self.store.load(job_id)
+
+    def list(self, school_id=None, limit=50):
+        if self.store is not None:
+            return self.store.list(school_id, limit)
+        jobs = [job for job in self._jobs.values() if school_id is None or job.school_id == school_id]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)[:limit]
+
+    def cancel(self, job_id):
+        """ขอยกเลิกงาน คืนค่า False ถ้าไม่พบงานที่ยังไม่เสร็จ"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            if not job.active:
+                return False
+            job.cancel_requested = True
+        if self.store is not None:
+            return self.store.request_cancel(job_id) or job is not None
+        return job is not None
+
+
+# สร้าง instance
+job_runner = JobRunner(store=JobStore())
@@ -28,7 +28,7 @@ load_dotenv()
 
 # Use Universal Database (supports both SQLite and PostgreSQL RDS)
 try:
-    from database_universal import db
+    from database_universal import db, day_range
 except Exception as e:
     print(f"Database initialization failed: {str(e)}")
     print("Falling back to original database")
@@ -44,6 +44,13 @@ except:
     password_manager = _PM()
 from line_oa import line_oa
 from face_recognition_system import face_recognition_system
+from face_detector import detector_registry
+from job_runner import job_runner
+from camera_event_hub import load_cameras
+from camera_registry import CameraRegistry
+from dashboard_stats import DashboardStats
+from gate_debounce import GateDebouncer
+from roster_cache import RosterCache
 from line_notification import line_notification
 import os
 import json
@@ -57,6 +64,22 @@ app.secret_key = os.environ.get('SECRET_KEY') or os.urandom(24).hex()
 from database_setup_api import db_setup_bp
 app.register_blueprint(db_setup_bp)
 
+# Preload Haar cascade ตอน start (ใช้ร่วมกันทุก request)
+if os.environ.get('FACE_DETECTOR_WARMUP', 'true').lower() == 'true':
+    try:
+        detector_registry.warm_up()
+    except Exception as e:
+        print(f"⚠️ Face detector warm-up failed: {str(e)}")
+
+# ตัวนับ dashboard (cache ตาม TTL ล้างอัตโนมัติเมื่อ db เขียน attendance/behavior/students)
+dashboard_stats = DashboardStats(db)
+
+# ตัด faceDetection ซ้ำจากกล้อง gate (ตรวจข้าม worker ด้วยตาราง gate_debounce)
+gate_debouncer = GateDebouncer(getattr(db, 'claim_gate_event', None))
+
+# ค้นหานักเรียนทีละคนโดยไม่โหลดทั้งโรงเรียน (ล้างเมื่อมีการเขียนตาราง students)
+roster = RosterCache(db)
+
 # Initialize WebSocket
 from websocket_manager import init_socketio
 socketio = init_socketio(app)
@@ -66,32 +89,16 @@ CLOUD_API_URL = os.environ.get('CLOUD_API_URL', 'http://localhost:8080')
 cloud_sync = CloudSync(CLOUD_API_URL)
 
 # Hikvision Camera Setup
-# ไม่ใช้ .env แล้ว - ใช้ Database แทน
-hikvision_cameras = {}  # {school_id: camera_instance}
+# ไม่ใช้ .env แล้ว - ใช้ Database แทน (ตาราง cameras + schools.camera_ip แบบเดิม)
+def _camera_device(camera):
+    from hikvision_face_api import HikvisionFaceAPI
+    return HikvisionFaceAPI(camera['ip'], camera['username'], camera['password'], camera['port'])
+
+camera_registry = CameraRegistry(lambda school_id: load_cameras(db, school_id).values(), _camera_device)
 
 def get_school_camera(school_id):
-    """ดึงกล้องของโรงเรียน"""
-    if school_id in hikvision_cameras:
-        return hikvision_cameras[school_id]
-    
-    # ดึง config จาก database
-    school = db.get_school(school_id)
-    if school and school.get('camera_ip'):
-        try:
-            from hikvision_face_api import init_hikvision
-            camera = init_hikvision(
-                school['camera_ip'],
-                school.get('camera_user', 'admin'),
-                school.get('camera_pass', 'admin')
-            )
-            if camera.test_connection():
-                hikvision_cameras[school_id] = camera
-                print(f"✅ Camera Connected: {school['name']}")
-                return camera
-        except Exception as e:
-            print(f"⚠️ Camera Error ({school_id}): {str(e)}")
-    
-    return None
+    """ดึงกล้องของโรงเรียนที่ออนไลน์อยู่ (health check ทำเบื้องหลัง - ไม่รอกล้องที่ติดต่อไม่ได้)"""
+    return camera_registry.get(school_id)
 
 # Login required decorator
 def login_required(f):
@@ -261,16 +268,28 @@ def student_image(student_id):
     
     return send_file(buffer, mimetype='image/jpeg')
 
+def _cloud_sync_job(job, students):
+    success_count = 0
+    for index, student in enumerate(students, 1):
+        if cloud_sync.sync_student(student['student_id'], student['name'], student.get('class_name', ''), student.get('image_path')):
+            success_count += 1
+        job.progress(index, len(students), {'success': success_count, 'failed': index - success_count})
+    return {'success': success_count, 'total': len(students), 'message': f'Sync {success_count}/{len(students)} students'}
+
 @app.route('/sync_all_students', methods=['POST'])
 @login_required
 def sync_all_students():
+    """Sync นักเรียนขึ้น cloud (background job)"""
     school_id = get_current_school_id()
     students = db.get_students(school_id)
-    success_count = 0
-    for student in students:
-        if cloud_sync.sync_student(student['student_id'], student['name'], student.get('class_name', ''), student.get('image_path')):
-            success_count += 1
-    return jsonify({'success': True, 'message': f'Sync {success_count}/{len(students)} students'})
+    job = job_runner.submit('cloud_sync', _cloud_sync_job, students,
+                            key=f'cloud_sync:{school_id}', school_id=school_id)
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'total': len(students),
+        'message': f'เริ่ม Sync {len(students)} students'
+    }), 202
 
 @app.route('/delete_student/<student_id>', methods=['DELETE'])
 @login_required
@@ -281,18 +300,12 @@ def delete_student(student_id):
         os.remove(image_path)
     
     # ลบจาก cache
-    global face_cache
-    if student_id in face_cache:
-        del face_cache[student_id]
-    
-    # ลบจาก Hikvision Camera
     school_id = get_current_school_id()
-    camera = get_school_camera(school_id)
-    if camera:
-        try:
-            camera.delete_face(student_id)
-        except Exception as e:
-            print(f"Hikvision Delete Error: {str(e)}")
+    face_gallery_cache.remove_student(school_id, student_id)
+    face_recognition_system.remove_student(student_id)
+    
+    # ลบจาก Hikvision Camera (เข้าคิว - กล้องออฟไลน์จะลบเมื่อกลับมา)
+    camera_registry.submit(school_id, student_id, 'delete_face', lambda camera: camera.delete_face(student_id))
     
     # ลบจาก database
     db.delete_student(student_id)
@@ -311,8 +324,7 @@ def manual_checkin():
     student_id = request.json.get('student_id')
     camera_type = request.json.get('camera_type', 'general')
     school_id = get_current_school_id()
-    students = db.get_students(school_id)
-    student = next((s for s in students if s['student_id'] == student_id), None)
+    student = roster.get(school_id, student_id)
     if student:
         db.add_attendance(student_id, student['name'], school_id, camera_type)
         cloud_sync.send_attendance(student_id, student['name'], camera_type=camera_type)
@@ -350,8 +362,7 @@ def line_setup():
 @login_required
 def student_profile(student_id):
     school_id = get_current_school_id()
-    students = db.get_students(school_id)
-    student = next((s for s in students if s['student_id'] == student_id), None)
+    student = roster.get(school_id, student_id)
     if student:
         attendance = db.get_attendance(school_id)
         behaviors = db.get_behavior(school_id, student_id)
@@ -652,11 +663,10 @@ def register_school_page():
 def get_plans():
     """ดึงรายการแพ็กเกจ"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM plans WHERE active = TRUE ORDER BY price')
-        plans = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        with db.connection() as conn:
+            cursor = db.dict_cursor(conn)
+            cursor.execute('SELECT * FROM plans WHERE active = TRUE ORDER BY price')
+            plans = [dict(row) for row in cursor.fetchall()]
         return jsonify({'success': True, 'plans': plans})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -688,20 +698,20 @@ def register_school_api():
         )
         
         # สร้าง subscription
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO subscriptions (school_id, plan_id, status, start_date, end_date)
-            VALUES (%s, %s, %s, %s, %s)
-        ''', (
-            school_id,
-            data.get('plan_id', 1),
-            'trial',
-            datetime.now().isoformat(),
-            (datetime.now() + timedelta(days=30)).isoformat()
-        ))
-        conn.commit()
-        conn.close()
+        ph = '%s' if db.db_type == 'postgresql' else '?'
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                INSERT INTO subscriptions (school_id, plan_id, status, start_date, end_date)
+                VALUES ({ph}, {ph}, {ph}, {ph}, {ph})
+            ''', (
+                school_id,
+                data.get('plan_id', 1),
+                'trial',
+                datetime.now().isoformat(),
+                (datetime.now() + timedelta(days=30)).isoformat()
+            ))
+            conn.commit()
         
         return jsonify({
             'success': True,
@@ -716,18 +726,18 @@ def register_school_api():
 def get_subscription(school_id):
     """ดึงข้อมูล subscription"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT s.*, p.name as plan_name, p.price, p.max_students
-            FROM subscriptions s
-            JOIN plans p ON s.plan_id = p.id
-            WHERE s.school_id = %s
-            ORDER BY s.start_date DESC
-            LIMIT 1
-        ''', (school_id,))
-        subscription = cursor.fetchone()
-        conn.close()
+        ph = '%s' if db.db_type == 'postgresql' else '?'
+        with db.connection() as conn:
+            cursor = db.dict_cursor(conn)
+            cursor.execute(f'''
+                SELECT s.*, p.name as plan_name, p.price, p.max_students
+                FROM subscriptions s
+                JOIN plans p ON s.plan_id = p.id
+                WHERE s.school_id = {ph}
+                ORDER BY s.start_date DESC
+                LIMIT 1
+            ''', (school_id,))
+            subscription = cursor.fetchone()
         
         if subscription:
             return jsonify({'success': True, 'subscription': dict(subscription)})
@@ -743,34 +753,34 @@ def upgrade_subscription():
         data = request.json
         school_id = get_current_school_id()
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # อัพเดท subscription
-        cursor.execute('''
-            UPDATE subscriptions
-            SET plan_id = %s, status = %s, end_date = %s
-            WHERE school_id = %s
-        ''', (
-            data['plan_id'],
-            'active',
-            (datetime.now() + timedelta(days=365)).isoformat(),
-            school_id
-        ))
-        
-        # บันทึกการชำระเงิน
-        cursor.execute('''
-            INSERT INTO payments (school_id, amount, payment_method, status)
-            VALUES (%s, %s, %s, %s)
-        ''', (
-            school_id,
-            data['amount'],
-            data.get('payment_method', 'credit_card'),
-            'completed'
-        ))
-        
-        conn.commit()
-        conn.close()
+        ph = '%s' if db.db_type == 'postgresql' else '?'
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            
+            # อัพเดท subscription
+            cursor.execute(f'''
+                UPDATE subscriptions
+                SET plan_id = {ph}, status = {ph}, end_date = {ph}
+                WHERE school_id = {ph}
+            ''', (
+                data['plan_id'],
+                'active',
+                (datetime.now() + timedelta(days=365)).isoformat(),
+                school_id
+            ))
+            
+            # บันทึกการชำระเงิน
+            cursor.execute(f'''
+                INSERT INTO payments (school_id, amount, payment_method, status)
+                VALUES ({ph}, {ph}, {ph}, {ph})
+            ''', (
+                school_id,
+                data['amount'],
+                data.get('payment_method', 'credit_card'),
+                'completed'
+            ))
+            
+            conn.commit()
         
         return jsonify({'success': True, 'message': 'อัพเกรดสำเร็จ!'})
     except Exception as e:
@@ -925,16 +935,16 @@ def get_users_api():
         return jsonify({'success': False, 'message': 'ไม่มีสิทธิ์เข้าถึง'})
     
     school_id = get_current_school_id()
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
-    if session.get('role') == 'super_admin':
-        cursor.execute('SELECT * FROM users ORDER BY created_at DESC')
-    else:
-        cursor.execute('SELECT * FROM users WHERE school_id = ? ORDER BY created_at DESC', (school_id,))
-    
-    users = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    ph = '%s' if db.db_type == 'postgresql' else '?'
+    with db.connection() as conn:
+        cursor = db.dict_cursor(conn)
+        
+        if session.get('role') == 'super_admin':
+            cursor.execute('SELECT * FROM users ORDER BY created_at DESC')
+        else:
+            cursor.execute(f'SELECT * FROM users WHERE school_id = {ph} ORDER BY created_at DESC', (school_id,))
+        
+        users = [dict(row) for row in cursor.fetchall()]
     
     return jsonify({'success': True, 'users': users})
 
@@ -953,22 +963,22 @@ def create_user_api():
         return jsonify({'success': False, 'message': 'Username นี้มีอยู่ในระบบแล้ว'})
     
     # เพิ่มผู้ใช้ใหม่
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO users (username, password, name, role, school_id, class_info, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        data['username'],
-        data['password'],
-        data['name'],
-        data['role'],
-        school_id,
-        data.get('class_info', ''),
-        datetime.now().isoformat()
-    ))
-    conn.commit()
-    conn.close()
+    ph = '%s' if db.db_type == 'postgresql' else '?'
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            INSERT INTO users (username, password, name, role, school_id, class_info, created_at)
+            VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})
+        ''', (
+            data['username'],
+            data['password'],
+            data['name'],
+            data['role'],
+            school_id,
+            data.get('class_info', ''),
+            datetime.now().isoformat()
+        ))
+        conn.commit()
     
     return jsonify({'success': True, 'message': 'เพิ่มผู้ใช้งานสำเร็จ'})
 
@@ -978,11 +988,11 @@ def delete_user_api(user_id):
     if session.get('role') not in ['admin', 'super_admin']:
         return jsonify({'success': False, 'message': 'ไม่มีสิทธิ์เข้าถึง'})
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    ph = '%s' if db.db_type == 'postgresql' else '?'
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'DELETE FROM users WHERE id = {ph}', (user_id,))
+        conn.commit()
     
     return jsonify({'success': True, 'message': 'ลบผู้ใช้งานสำเร็จ'})
 
@@ -1011,9 +1021,8 @@ def recognize_face():
             return jsonify({'success': False, 'message': 'Invalid image'})
         
         # Simple face detection
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+        faces = detector_registry.detect(gray, 1.3, 5)
         
         if len(faces) > 0:
             students = db.get_students(school_id)
@@ -1057,8 +1066,7 @@ def add_student():
             f.write(base64.b64decode(image_data))
         
         # ตรวจสอบว่ามีอยู่แล้วหรือไม่
-        students = db.get_students(school_id)
-        existing = any(s['student_id'] == student_id for s in students)
+        existing = roster.get(school_id, student_id) is not None
         
         if existing:
             # UPDATE
@@ -1069,18 +1077,20 @@ def add_student():
             db.add_student(student_id, name, class_name, school_id, image_path)
             message = f'เพิ่มนักเรียน {name} สำเร็จ'
         
+        # อัพเดท face gallery cache ของโรงเรียน
+        face_gallery_cache.upsert_student(school_id, {
+            'student_id': student_id,
+            'name': name,
+            'image_path': image_path
+        })
+        
         # Sync to Cloud
         cloud_sync.sync_student(student_id, name, class_name, image_path)
         
-        # Sync to Hikvision Camera
-        camera = get_school_camera(school_id)
-        if camera:
-            try:
-                result = camera.add_face(student_id, name, image_path)
-                if result['success']:
-                    message += ' + Sync ไปกล้องสำเร็จ'
-            except Exception as e:
-                print(f"Hikvision Sync Error: {str(e)}")
+        # Sync to Hikvision Camera (เข้าคิว - ไม่รอกล้อง, กล้องออฟไลน์จะ sync เมื่อกลับมา)
+        if camera_registry.submit(school_id, student_id, 'add_face',
+                                  lambda camera: camera.add_face(student_id, name, image_path, replace=True)):
+            message += ' + ส่งเข้าคิว Sync กล้อง'
         
         return jsonify({'success': True, 'message': message})
     except Exception as e:
@@ -1099,8 +1109,7 @@ def self_register_api():
         if not student_id or not name or not image_data:
             return jsonify({'success': False, 'message': 'กรุณากรอกข้อมูลให้ครบถ้วน'})
         
-        students = db.get_students(school_id)
-        if any(s['student_id'] == student_id for s in students):
+        if roster.get(school_id, student_id) is not None:
             return jsonify({'success': False, 'message': 'รหัสนักเรียนนี้มีในระบบแล้ว'})
         
         os.makedirs('data/students', exist_ok=True)
@@ -1114,6 +1123,7 @@ def self_register_api():
             f.write(base64.b64decode(image_data))
         
         db.add_student(student_id, name, class_name, school_id, image_path)
+        face_gallery_cache.upsert_student(school_id, {'student_id': student_id, 'name': name, 'image_path': image_path})
         cloud_sync.sync_student(student_id, name, class_name, image_path)
         
         return jsonify({'success': True, 'message': f'ลงทะเบียน {name} สำเร็จ'})
@@ -1195,63 +1205,32 @@ def add_behavior_api():
 @login_required
 def get_notifications_api():
     school_id = get_current_school_id()
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM notifications WHERE school_id = ? ORDER BY timestamp DESC LIMIT 50', (school_id,))
-    notifications = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    ph = '%s' if db.db_type == 'postgresql' else '?'
+    with db.connection() as conn:
+        cursor = db.dict_cursor(conn)
+        cursor.execute(f'SELECT * FROM notifications WHERE school_id = {ph} ORDER BY timestamp DESC LIMIT 50', (school_id,))
+        notifications = [dict(row) for row in cursor.fetchall()]
     return jsonify({'success': True, 'notifications': notifications})
 
 @app.route('/api/dashboard_stats', methods=['GET'])
 @login_required
 def get_dashboard_stats():
     school_id = get_current_school_id()
-    
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT COUNT(*) FROM students WHERE school_id = %s', (school_id,))
-    total_students = cursor.fetchone()[0]
-    
-    today = datetime.now().strftime('%Y-%m-%d')
-    cursor.execute('SELECT COUNT(DISTINCT student_id) FROM attendance WHERE school_id = %s AND date(timestamp) = %s', (school_id, today))
-    today_attendance = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT COUNT(*) FROM behavior WHERE school_id = %s AND severity IN (%s, %s)', (school_id, 'warning', 'danger'))
-    behavior_alerts = cursor.fetchone()[0]
-    
-    if db.db_type == 'postgresql':
-        cursor.execute('SELECT COUNT(*) FROM notifications WHERE school_id = %s AND read = FALSE', (school_id,))
-    else:
-        cursor.execute('SELECT COUNT(*) FROM notifications WHERE school_id = %s AND read = 0', (school_id,))
-    unread_notifications = cursor.fetchone()[0]
-    
-    conn.close()
-    
-    return jsonify({
-        'success': True,
-        'stats': {
-            'total_students': total_students,
-            'today_attendance': today_attendance,
-            'attendance_rate': round((today_attendance / total_students * 100) if total_students > 0 else 0, 1),
-            'behavior_alerts': behavior_alerts,
-            'unread_notifications': unread_notifications
-        }
-    })
+    # query เดียวต่อโรงเรียน cache ตาม TTL และล้างเมื่อมีการเขียน attendance/behavior
+    return jsonify({'success': True, 'stats': dashboard_stats.school_stats(school_id)})
 
 @app.route('/api/student/<student_id>', methods=['GET'])
 @login_required
 def get_student_detail(student_id):
     school_id = get_current_school_id()
-    students = db.get_students(school_id)
-    student = next((s for s in students if s['student_id'] == student_id), None)
+    student = roster.get(school_id, student_id)
     
     if not student:
         return jsonify({'success': False, 'message': 'ไม่พบนักเรียน'})
     
-    attendance = db.get_attendance(school_id)
+    student_attendance = db.query_attendance(school_id, student_id=student_id,
+                                             limit=request.args.get('limit', 1000, type=int))
     behaviors = db.get_behavior(school_id, student_id)
-    student_attendance = [a for a in attendance if a['student_id'] == student_id]
     
     return jsonify({
         'success': True,
@@ -1327,17 +1306,16 @@ def import_students_api():
         students = data.get('students', [])
         school_id = data.get('school_id', 'SCH001')
         
-        imported = 0
-        for student in students:
-            student_id = student.get('student_id')
-            name = student.get('name')
-            class_name = student.get('class_name', '')
-            
-            if student_id and name:
-                db.add_student(student_id, name, class_name, school_id, None)
-                imported += 1
+        rows = [{'student_id': str(student['student_id']).strip(), 'name': str(student['name']).strip(),
+                 'class_name': student.get('class_name', '')}
+                for student in students if student.get('student_id') and student.get('name')]
+        # upsert ทั้งหมดใน transaction เดียว
+        result = db.upsert_students(school_id, rows)
+        face_gallery_cache.invalidate(school_id)
+        imported = result['inserted'] + result['updated']
         
-        return jsonify({'success': True, 'imported': imported, 'message': f'นำเข้าสำเร็จ {imported} คน'})
+        return jsonify({'success': True, 'imported': imported, 'conflicts': result['conflicts'],
+                        'message': f'นำเข้าสำเร็จ {imported} คน'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
@@ -1349,17 +1327,16 @@ def import_students_api_auth():
         students = data.get('students', [])
         school_id = get_current_school_id()
         
-        imported = 0
-        for student in students:
-            student_id = student.get('student_id')
-            name = student.get('name')
-            class_name = student.get('class_name', '')
-            
-            if student_id and name:
-                db.add_student(student_id, name, class_name, school_id, None)
-                imported += 1
+        rows = [{'student_id': str(student['student_id']).strip(), 'name': str(student['name']).strip(),
+                 'class_name': student.get('class_name', '')}
+                for student in students if student.get('student_id') and student.get('name')]
+        # upsert ทั้งหมดใน transaction เดียว
+        result = db.upsert_students(school_id, rows)
+        face_gallery_cache.invalidate(school_id)
+        imported = result['inserted'] + result['updated']
         
-        return jsonify({'success': True, 'imported': imported, 'message': f'นำเข้าสำเร็จ {imported} คน'})
+        return jsonify({'success': True, 'imported': imported, 'conflicts': result['conflicts'],
+                        'message': f'นำเข้าสำเร็จ {imported} คน'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
@@ -1388,12 +1365,31 @@ def import_from_db():
         return jsonify({'success': False, 'message': str(e)})
 
 # Import System APIs
+def _student_import_job(job, school_id, excel_path, zip_path=None):
+    from student_import_system import StudentImportSystem
+    
+    import_system = StudentImportSystem(db)
+    try:
+        if zip_path:
+            result = import_system.import_with_images(excel_path, zip_path, school_id, progress=job.progress)
+        else:
+            result = import_system.import_from_excel(excel_path, school_id, progress=job.progress)
+    finally:
+        for path in (excel_path, zip_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+        # นำเข้าแบบ bulk ไม่ผ่าน hook รายคน - ให้ cache โหลดรายชื่อ/รูปใหม่
+        face_gallery_cache.invalidate(school_id)
+    if not result.get('success'):
+        raise RuntimeError(result.get('message'))
+    return result
+
 @app.route('/api/import/with_images', methods=['POST'])
 @login_required
 def import_students_with_images():
-    """นำเข้าข้อมูลพร้อมรูปภาพ"""
+    """นำเข้าข้อมูล (พร้อมรูปภาพ) แบบ background job - ตรวจสอบความคืบหน้าที่ /api/jobs/<job_id>"""
     try:
-        from student_import_system import StudentImportSystem
+        import uuid
         
         school_id = get_current_school_id()
         excel_file = request.files.get('excel')
@@ -1402,14 +1398,26 @@ def import_students_with_images():
         if not excel_file:
             return jsonify({'success': False, 'message': 'กรุณาอัพโหลดไฟล์ Excel'})
         
-        import_system = StudentImportSystem(db)
-        
+        # ไฟล์ใน request ใช้ได้ถึงจบ request เท่านั้น - บันทึกไว้ให้ job อ่านทีละ chunk
+        os.makedirs('data/imports', exist_ok=True)
+        prefix = f"data/imports/{uuid.uuid4().hex}_"
+        extension = os.path.splitext(excel_file.filename or '')[1].lower()
+        # เก็บนามสกุลเดิม - .xls ต้องอ่านด้วย xlrd ไม่ใช่ openpyxl
+        excel_path = prefix + 'students' + (extension if extension in ('.csv', '.xls') else '.xlsx')
+        excel_file.save(excel_path)
+        zip_path = None
         if images_zip:
-            result = import_system.import_with_images(excel_file, images_zip, school_id)
-        else:
-            result = import_system.import_from_excel(excel_file, school_id)
+            zip_path = prefix + 'images.zip'
+            images_zip.save(zip_path)
         
-        return jsonify(result)
+        job = job_runner.submit('student_import', _student_import_job, school_id, excel_path, zip_path,
+                                key=f'student_import:{school_id}', school_id=school_id)
+        
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'message': 'เริ่มนำเข้าข้อมูลนักเรียน'
+        }), 202
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
@@ -1469,7 +1477,11 @@ def export_attendance_pdf():
         start_date = data.get('start_date')
         end_date = data.get('end_date')
         
-        attendance = db.get_attendance(school_id, start_date)
+        if start_date:
+            start, end = day_range(start_date, end_date)
+            attendance = db.query_attendance(school_id, start, end, limit=None)
+        else:
+            attendance = db.get_attendance(school_id)
         
         buffer = export_manager.export_attendance_pdf(attendance, school_name)
         
@@ -1492,8 +1504,13 @@ def export_attendance_excel():
         school_id = get_current_school_id()
         data = request.json
         start_date = data.get('start_date')
+        end_date = data.get('end_date')
         
-        attendance = db.get_attendance(school_id, start_date)
+        if start_date:
+            start, end = day_range(start_date, end_date)
+            attendance = db.query_attendance(school_id, start, end, limit=None)
+        else:
+            attendance = db.get_attendance(school_id)
         
         buffer = export_manager.export_attendance_excel(attendance)
         
@@ -1563,23 +1580,22 @@ def export_summary_pdf():
         school_name = school['name'] if school else 'โรงเรียน'
         
         # ดึงสถิติ
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT COUNT(*) FROM students WHERE school_id = ?', (school_id,))
-        total_students = cursor.fetchone()[0]
-        
-        today = datetime.now().strftime('%Y-%m-%d')
-        cursor.execute('SELECT COUNT(DISTINCT student_id) FROM attendance WHERE school_id = ? AND date(timestamp) = ?', (school_id, today))
-        today_attendance = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM behavior WHERE school_id = ? AND severity IN ("warning", "danger")', (school_id,))
-        behavior_alerts = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM notifications WHERE school_id = ? AND read = 0', (school_id,))
-        unread_notifications = cursor.fetchone()[0]
-        
-        conn.close()
+        ph = '%s' if db.db_type == 'postgresql' else '?'
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f'SELECT COUNT(*) FROM students WHERE school_id = {ph}', (school_id,))
+            total_students = cursor.fetchone()[0]
+            
+            today = datetime.now().strftime('%Y-%m-%d')
+            cursor.execute(f'SELECT COUNT(DISTINCT student_id) FROM attendance WHERE school_id = {ph} AND date(timestamp) = {ph}', (school_id, today))
+            today_attendance = cursor.fetchone()[0]
+            
+            cursor.execute(f"SELECT COUNT(*) FROM behavior WHERE school_id = {ph} AND severity IN ('warning', 'danger')", (school_id,))
+            behavior_alerts = cursor.fetchone()[0]
+            
+            cursor.execute(f'SELECT COUNT(*) FROM notifications WHERE school_id = {ph} AND read = 0', (school_id,))
+            unread_notifications = cursor.fetchone()[0]
         
         stats = {
             'total_students': total_students,
@@ -1631,12 +1647,11 @@ def learning_analytics_predict():
     student_id = data.get('student_id')
     school_id = get_current_school_id()
     
-    # ดึงข้อมูลการเข้าเรียนและพฤติกรรม
-    attendance = db.get_attendance(school_id)
+    # ดึงข้อมูลการเข้าเรียน 30 วันล่าสุด (นับใน SQL) และพฤติกรรม
+    attendance_count = db.count_attendance(school_id, start=now_bkk() - timedelta(days=30), student_id=student_id)
     behaviors = db.get_behavior(school_id, student_id)
     
-    student_attendance = [a for a in attendance if a['student_id'] == student_id]
-    attendance_rate = len(student_attendance) / 30 * 100 if student_attendance else 0
+    attendance_rate = attendance_count / 30 * 100
     
     # คำนวณคะแนนพฤติกรรม
     behavior_score = 100
@@ -1772,37 +1787,9 @@ def mark_notification_read_api(notification_id):
 def realtime_status():
     school_id = get_current_school_id()
     
-    # ข้อมูล Real-time
-    today = datetime.now().strftime('%Y-%m-%d')
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
-    # การเข้าเรียนล่าสุด
-    cursor.execute('''
-        SELECT * FROM attendance 
-        WHERE school_id = ? AND date(timestamp) = ?
-        ORDER BY timestamp DESC LIMIT 10
-    ''', (school_id, today))
-    recent_attendance = [dict(row) for row in cursor.fetchall()]
-    
-    # พฤติกรรมที่ต้องติดตาม
-    cursor.execute('''
-        SELECT * FROM behavior 
-        WHERE school_id = ? AND severity IN ("warning", "danger")
-        ORDER BY timestamp DESC LIMIT 5
-    ''', (school_id,))
-    alerts = [dict(row) for row in cursor.fetchall()]
-    
-    conn.close()
-    
-    return jsonify({
-        'success': True,
-        'realtime': {
-            'recent_attendance': recent_attendance,
-            'alerts': alerts,
-            'timestamp': datetime.now().isoformat()
-        }
-    })
+    # ข้อมูล Real-time (การเข้าเรียนล่าสุดของวันนี้ + พฤติกรรมที่ต้องติดตาม)
+    realtime = dict(dashboard_stats.realtime_status(school_id), timestamp=datetime.now().isoformat())
+    return jsonify({'success': True, 'realtime': realtime})
 
 @app.route('/api/gate_entry', methods=['POST'])
 def gate_entry():
@@ -1818,7 +1805,18 @@ def gate_entry():
             return jsonify({'success': False, 'message': 'Missing student_id or student_name'})
         
         camera_type = 'gate_in' if entry_type == 'checkin' else 'gate_out'
-        db.add_attendance(student_id, student_name, school_id, camera_type)
+        if not gate_debouncer.should_record(school_id, student_id, camera_type):
+            # event ซ้ำขณะนักเรียนยังยืนหน้ากล้อง - ตอบสำเร็จแต่ไม่บันทึกซ้ำ
+            return jsonify({
+                'success': True,
+                'duplicate': True,
+                'student_id': student_id,
+                'student_name': student_name,
+                'type': entry_type
+            })
+        
+        # write-behind: ตอบกล้องทันที แถวถูกเขียนเป็น batch ภายใน ATTENDANCE_FLUSH_MS
+        db.enqueue_attendance(student_id, student_name, school_id, camera_type)
         
         current_time = now_bkk().strftime('%H:%M')
         
@@ -1890,16 +1888,16 @@ def save_line_config():
         data = request.json
         school_id = get_current_school_id()
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE schools 
-            SET line_oa_id = %s, line_channel_token = %s, line_channel_secret = %s
-            WHERE school_id = %s
-        """, (data['line_oa_id'], data['channel_access_token'], data['channel_secret'], school_id))
-        conn.commit()
-        conn.close()
+        ph = '%s' if db.db_type == 'postgresql' else '?'
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f"""
+                UPDATE schools 
+                SET line_oa_id = {ph}, line_channel_token = {ph}, line_channel_secret = {ph}
+                WHERE school_id = {ph}
+            """, (data['line_oa_id'], data['channel_access_token'], data['channel_secret'], school_id))
+            conn.commit()
         
         return jsonify({'success': True, 'message': 'บันทึกการตั้งค่าสำเร็จ'})
     except Exception as e:
@@ -1926,8 +1924,7 @@ def test_line_message():
         if not line_user_id:
             return jsonify({'success': False, 'message': 'ยังไม่ได้เชื่อมต่อ LINE'})
         
-        students = db.get_students(school_id)
-        student = next((s for s in students if s['student_id'] == student_id), None)
+        student = roster.get(school_id, student_id)
         
         if student:
             result = line.send_message(line_user_id, f"""📢 ข้อความทดสอบ
@@ -1966,8 +1963,7 @@ def line_webhook():
                 
                 print(f'[WEBHOOK] User {user_id} sent: {text}', flush=True)
                 
-                students = db.get_students('SCH001')
-                student = next((s for s in students if s['student_id'] == text), None)
+                student = roster.get('SCH001', text)
                 
                 if student:
                     print(f'[WEBHOOK] Found student: {student["name"]}', flush=True)
@@ -2017,24 +2013,65 @@ def line_webhook():
 @login_required
 def get_gate_logs():
     school_id = get_current_school_id()
-    attendance = db.get_attendance(school_id)
+    limit = min(request.args.get('limit', 200, type=int), 1000)
+    cursor = request.args.get('cursor')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    
+    # ช่วงวันที่แบบรวมวันสุดท้าย (เหมือน export)
+    try:
+        start = day_range(start_date)[0] if start_date else None
+        end = day_range(end_date)[1] if end_date else None
+        before = db.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'รูปแบบวันที่หรือ cursor ไม่ถูกต้อง (YYYY-MM-DD)'}), 400
+    
+    # กรองเฉพาะ gate entries ใน SQL (keyset pagination ด้วย cursor)
+    attendance = db.query_attendance(
+        school_id,
+        start=start,
+        end=end,
+        camera_types=('gate_in', 'gate_out'),
+        limit=limit,
+        before=before
+    )
     
-    # กรองเฉพาะ gate entries
     gate_logs = []
     for a in attendance:
-        if a['camera_type'] in ['gate_in', 'gate_out']:
-            gate_logs.append({
-                'student_id': a['student_id'],
-                'student_name': a['student_name'],
-                'type': 'checkin' if a['camera_type'] == 'gate_in' else 'checkout',
-                'timestamp': a['timestamp']
-            })
+        gate_logs.append({
+            'student_id': a['student_id'],
+            'student_name': a['student_name'],
+            'type': 'checkin' if a['camera_type'] == 'gate_in' else 'checkout',
+            'timestamp': a['timestamp']
+        })
     
-    return jsonify({'success': True, 'logs': gate_logs})
+    next_cursor = db.encode_cursor(attendance[-1]) if len(attendance) == limit else None
+    return jsonify({'success': True, 'logs': gate_logs, 'next_cursor': next_cursor})
 
 # Gate Camera APIs (No login required)
-# Simple face recognition cache
-face_cache = {}
+# Face gallery cache แยกตามโรงเรียน
+from school_gallery_cache import SchoolGalleryCache
+
+def _cache_face_features(student):
+    """ดึง feature ใบหน้า 100x100 จากรูปนักเรียน (ใช้โหลด face gallery cache)"""
+    import cv2
+    
+    image_path = student.get('image_path')
+    if not image_path or not os.path.exists(image_path):
+        return None
+    
+    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+    
+    student_faces = detector_registry.detect(img, 1.3, 5)
+    if len(student_faces) == 0:
+        return None
+    
+    sx, sy, sw, sh = student_faces[0]
+    return cv2.resize(img[sy:sy+sh, sx:sx+sw], (100, 100)).flatten()
+
+face_gallery_cache = SchoolGalleryCache(db.get_students, _cache_face_features, dim=100 * 100)
 
 @app.route('/api/face/recognize', methods=['POST'])
 def face_recognize():
@@ -2046,7 +2083,11 @@ def face_recognize():
         data = request.json
         image_data = data.get('image')
         camera_type = data.get('camera_type', 'general')
+        school_id = data.get('school_id') or session.get('school_id')
         
+        if not school_id:
+            # ไม่เดาโรงเรียน - ไม่งั้นจะจับคู่กับนักเรียนของโรงเรียนอื่น
+            return jsonify({'success': False, 'message': 'school_id is required'}), 400
         if not image_data:
             return jsonify({'success': False, 'message': 'No image data'})
         
@@ -2068,9 +2109,8 @@ def face_recognize():
             return jsonify({'success': False, 'message': 'Invalid image'})
         
         # Face detection
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+        faces = detector_registry.detect(gray, 1.3, 5)
         
         if len(faces) > 0:
             (x, y, w, h) = faces[0]
@@ -2080,48 +2120,18 @@ def face_recognize():
             face_roi = gray[y:y+h, x:x+w]
             face_roi = cv2.resize(face_roi, (100, 100))
             
-            # Load cache if empty
-            global face_cache
-            if not face_cache:
-                print('Loading face cache...')
-                students = db.get_students('SCH001')  # ใช้ school_id แทน None
-                print(f'Found {len(students)} students')
-                for student in students:
-                    if student.get('image_path') and os.path.exists(student['image_path']):
-                        try:
-                            img = cv2.imread(student['image_path'], cv2.IMREAD_GRAYSCALE)
-                            if img is not None:
-                                student_faces = face_cascade.detectMultiScale(img, 1.3, 5)
-                                if len(student_faces) > 0:
-                                    sx, sy, sw, sh = student_faces[0]
-                                    student_face = img[sy:sy+sh, sx:sx+sw]
-                                    student_face = cv2.resize(student_face, (100, 100))
-                                    face_cache[student['student_id']] = {
-                                        'face': student_face,
-                                        'name': student['name']
-                                    }
-                                    print(f'Cached: {student["student_id"]} - {student["name"]}')
-                        except Exception as e:
-                            print(f'Error caching {student.get("student_id")}: {e}')
-                            continue
-                print(f'Cache loaded: {len(face_cache)} faces')
-            
-            # Compare with cached faces
-            best_match = None
-            best_score = float('inf')
-            
-            for student_id, cache_data in face_cache.items():
-                diff = cv2.absdiff(face_roi, cache_data['face'])
-                score = np.sum(diff)
-                
-                if score < best_score:
-                    best_score = score
-                    best_match = student_id
+            # Compare with cached faces ของโรงเรียนนี้ (ผลรวม absdiff)
+            school_faces = face_gallery_cache.get(school_id)
+            match_ids, scores = school_faces.gallery.search(face_roi.flatten(), k=1, metric='l1')
+            best_match = match_ids[0][0] if match_ids[0] else None
+            best_score = float(scores[0][0]) if match_ids[0] else float('inf')
             
             print(f'Best match: {best_match}, Score: {best_score}')  # Debug
             
             # Threshold for recognition
             if best_match and best_score < 2000000:  # ลด threshold ให้เข้มงวดขึ้น
+                student_name = school_faces.names.get(best_match)
+                
                 # ส่ง LINE แจ้งเตือนผู้ปกครอง
                 line_user_id = db.get_student_line_token(best_match)
                 if line_user_id:
@@ -2129,7 +2139,7 @@ def face_recognize():
                         current_time = datetime.now().strftime('%H:%M น.')
                         line_oa.send_message(line_user_id, f"""🟢 บุตรของท่านมาถึงโรงเรียนแล้ว
 
-👤 ชื่อ: {face_cache[best_match]['name']}
+👤 ชื่อ: {student_name}
 🆔 รหัส: {best_match}
 ⏰ เวลา: {current_time}
 
@@ -2140,7 +2150,7 @@ def face_recognize():
                 return jsonify({
                     'success': True,
                     'student_id': best_match,
-                    'student_name': face_cache[best_match]['name'],
+                    'student_name': student_name,
                     'face_location': face_location,
                     'camera_type': camera_type
                 })
@@ -2164,34 +2174,13 @@ def gate_recognize():
 def gate_stats():
     """Get today's gate statistics - no login required"""
     try:
-        from datetime import timezone, timedelta
-        
-        # ใช้ timezone +07:00 (Bangkok)
-        tz = timezone(timedelta(hours=7))
+        # นับเฉพาะวันนี้ (เวลาไทย +07:00) ใน SQL
         now = now_bkk()
-        today = now.strftime('%Y-%m-%d')
-        
-        attendance = db.get_attendance('SCH001')
-        
-        checkin = 0
-        checkout = 0
-        
-        for a in attendance:
-            timestamp = a['timestamp']
-            if isinstance(timestamp, str):
-                date_part = timestamp.split()[0] if ' ' in timestamp else timestamp[:10]
-            else:
-                # Convert to Bangkok timezone
-                if timestamp.tzinfo is None:
-                    timestamp = timestamp.replace(tzinfo=timezone.utc)
-                timestamp_bkk = timestamp.astimezone(tz)
-                date_part = timestamp_bkk.strftime('%Y-%m-%d')
-            
-            if date_part == today:
-                if a['camera_type'] == 'gate_in':
-                    checkin += 1
-                elif a['camera_type'] == 'gate_out':
-                    checkout += 1
+        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        counts = db.count_attendance('SCH001', start, start + timedelta(days=1),
+                                     camera_types=('gate_in', 'gate_out'), group_by='camera_type')
+        checkin = counts.get('gate_in', 0)
+        checkout = counts.get('gate_out', 0)
         
         return jsonify({
             'success': True,
@@ -2205,24 +2194,21 @@ def gate_stats():
 def gate_recent():
     """Get recent gate logs - no login required"""
     try:
-        attendance = db.get_attendance(None)  # All schools
+        # 10 รายการล่าสุดของทุกโรงเรียน (เรียงและจำกัดใน SQL)
+        attendance = db.query_attendance(None, camera_types=('gate_in', 'gate_out'), limit=10)
         
         gate_logs = []
         for a in attendance:
-            if a['camera_type'] in ['gate_in', 'gate_out']:
-                gate_logs.append({
-                    'student_id': a['student_id'],
-                    'student_name': a['student_name'],
-                    'type': 'checkin' if a['camera_type'] == 'gate_in' else 'checkout',
-                    'timestamp': a['timestamp']
-                })
-        
-        # Sort by timestamp descending and get last 10
-        gate_logs.sort(key=lambda x: x['timestamp'], reverse=True)
+            gate_logs.append({
+                'student_id': a['student_id'],
+                'student_name': a['student_name'],
+                'type': 'checkin' if a['camera_type'] == 'gate_in' else 'checkout',
+                'timestamp': a['timestamp']
+            })
         
         return jsonify({
             'success': True,
-            'logs': gate_logs[:10]
+            'logs': gate_logs
         })
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -2242,10 +2228,17 @@ def add_camera_api():
         data = request.json
         school_id = get_current_school_id()
         camera_id = db.add_camera(school_id, data)
+        camera_registry.invalidate(school_id)
         return jsonify({'success': True, 'camera_id': camera_id, 'message': 'เพิ่มกล้องสำเร็จ'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/cameras/status', methods=['GET'])
+@login_required
+def cameras_status_api():
+    """สถานะกล้องจาก health check เบื้องหลัง (online/offline, circuit breaker, งานค้างในคิว)"""
+    return jsonify({'success': True, 'cameras': camera_registry.stats(get_current_school_id())})
+
 @app.route('/api/cameras/<int:camera_id>', methods=['GET'])
 @login_required
 def get_camera_api(camera_id):
@@ -2260,6 +2253,7 @@ def update_camera_api(camera_id):
     try:
         data = request.json
         db.update_camera(camera_id, data)
+        camera_registry.invalidate(get_current_school_id())
         return jsonify({'success': True, 'message': 'แก้ไขกล้องสำเร็จ'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -2269,6 +2263,7 @@ def update_camera_api(camera_id):
 def delete_camera_api(camera_id):
     try:
         db.delete_camera(camera_id)
+        camera_registry.invalidate(get_current_school_id())
         return jsonify({'success': True, 'message': 'ลบกล้องสำเร็จ'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -2340,28 +2335,18 @@ def save_camera_config():
         data = request.json
         school_id = get_current_school_id()
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        if db.db_type == 'postgresql':
-            cursor.execute("""
+        ph = '%s' if db.db_type == 'postgresql' else '?'
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
                 UPDATE schools 
-                SET camera_ip = %s, camera_user = %s, camera_pass = %s
-                WHERE school_id = %s
+                SET camera_ip = {ph}, camera_user = {ph}, camera_pass = {ph}
+                WHERE school_id = {ph}
             """, (data['camera_ip'], data['camera_user'], data['camera_pass'], school_id))
-        else:
-            cursor.execute("""
-                UPDATE schools 
-                SET camera_ip = ?, camera_user = ?, camera_pass = ?
-                WHERE school_id = ?
-            """, (data['camera_ip'], data['camera_user'], data['camera_pass'], school_id))
-        
-        conn.commit()
-        db.close_connection(conn)
+            conn.commit()
         
         # Clear camera cache
-        if school_id in hikvision_cameras:
-            del hikvision_cameras[school_id]
+        camera_registry.invalidate(school_id)
         
         return jsonify({'success': True, 'message': 'บันทึกการตั้งค่าสำเร็จ'})
     except Exception as e:
@@ -2391,10 +2376,15 @@ def test_camera_connection():
 @login_required
 def sync_students_to_camera():
     try:
+        from face_sync import face_sync_engine
+        
         school_id = get_current_school_id()
-        camera = get_school_camera(school_id)
+        # ทุก terminal ของโรงเรียน (ตาราง cameras + กล้องที่ตั้งค่าแบบเดิม) ยกเว้นกล้องที่ออฟไลน์อยู่
+        devices = camera_registry.devices(school_id)
         
-        if not camera:
+        if not devices:
+            if camera_registry.entries(school_id):
+                return jsonify({'success': False, 'message': 'กล้องทุกตัวออฟไลน์อยู่'})
             return jsonify({'success': False, 'message': 'กรุณาตั้งค่ากล้องก่อน'})
         
         students = db.get_students(school_id)
@@ -2403,13 +2393,17 @@ def sync_students_to_camera():
         if not students_with_images:
             return jsonify({'success': False, 'message': 'ไม่มีนักเรียนที่มีรูปภาพ'})
         
-        result = camera.sync_all_students(students_with_images)
+        # ส่งเฉพาะใบหน้าที่เปลี่ยน หลายกล้องพร้อมกัน - ตรวจสอบความคืบหน้าที่ /api/jobs/<job_id>
+        job = job_runner.submit('camera_sync',
+                                lambda job: face_sync_engine.sync(devices, students_with_images, progress=job.progress),
+                                key=f'camera_sync:{school_id}', school_id=school_id)
         
         return jsonify({
-            'success': result['success'],
-            'total': result['total'],
-            'message': f"Sync สำเร็จ {result['success']}/{result['total']} คน"
-        })
+            'success': True,
+            'job_id': job.id,
+            'total': len(students_with_images) * len(devices),
+            'message': f'เริ่ม Sync {len(students_with_images)} คนเข้ากล้อง {len(devices)} ตัว'
+        }), 202
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
@@ -2421,39 +2415,7 @@ def sync_students_to_camera():
 @super_admin_required
 def get_super_admin_dashboard():
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT COUNT(*) FROM schools')
-        total_schools = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM resellers')
-        total_resellers = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM students')
-        total_students = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM schools WHERE status = "active"')
-        active_schools = cursor.fetchone()[0]
-        
-        today = datetime.now().date()
-        days_30 = (today + timedelta(days=30)).isoformat()
-        cursor.execute('SELECT COUNT(*) FROM schools WHERE expire_date <= ? AND status = "active"', (days_30,))
-        expiring_soon = cursor.fetchone()[0]
-        
-        conn.close()
-        
-        monthly_revenue = db.get_revenue('month')
-        
-        stats = {
-            'total_schools': total_schools,
-            'total_resellers': total_resellers,
-            'total_students': total_students,
-            'monthly_revenue': monthly_revenue,
-            'expiring_soon': expiring_soon,
-            'active_rate': round((active_schools / total_schools * 100) if total_schools > 0 else 0, 1)
-        }
-        return jsonify({'success': True, 'stats': stats})
+        return jsonify({'success': True, 'stats': dashboard_stats.platform_stats()})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
@@ -2553,13 +2515,13 @@ def get_reseller_me():
     username = session.get('user')
     
     # ดึงข้อมูล reseller จาก username
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM resellers WHERE username = ?', (username,))
-    reseller = cursor.fetchone()
+    ph = '%s' if db.db_type == 'postgresql' else '?'
+    with db.connection() as conn:
+        cursor = db.dict_cursor(conn)
+        cursor.execute(f'SELECT * FROM resellers WHERE username = {ph}', (username,))
+        reseller = cursor.fetchone()
     
     if not reseller:
-        conn.close()
         return jsonify({'success': False, 'message': 'ไม่พบข้อมูล Reseller'})
     
     reseller = dict(reseller)
@@ -2572,9 +2534,10 @@ def get_reseller_me():
     commission = db.calculate_reseller_commission(reseller_id)
     
     # อัพเดทจำนวนโรงเรียนที่ใช้แล้ว
-    cursor.execute('UPDATE resellers SET schools_used = ? WHERE reseller_id = ?', (len(schools), reseller_id))
-    conn.commit()
-    conn.close()
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'UPDATE resellers SET schools_used = {ph} WHERE reseller_id = {ph}', (len(schools), reseller_id))
+        conn.commit()
     
     reseller['schools_used'] = len(schools)
     
@@ -2594,28 +2557,25 @@ def reseller_add_school():
     username = session.get('user')
     
     # ดึงข้อมูล reseller
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM resellers WHERE username = ?', (username,))
-    reseller = cursor.fetchone()
-    
-    if not reseller:
-        conn.close()
-        return jsonify({'success': False, 'message': 'ไม่พบข้อมูล Reseller'})
-    
-    reseller = dict(reseller)
-    reseller_id = reseller['reseller_id']
-    
-    # ตรวจสอบ Quota
-    cursor.execute('SELECT COUNT(*) FROM schools WHERE reseller_id = ?', (reseller_id,))
-    schools_used = cursor.fetchone()[0]
+    ph = '%s' if db.db_type == 'postgresql' else '?'
+    with db.connection() as conn:
+        cursor = db.dict_cursor(conn)
+        cursor.execute(f'SELECT * FROM resellers WHERE username = {ph}', (username,))
+        reseller = cursor.fetchone()
+        
+        if not reseller:
+            return jsonify({'success': False, 'message': 'ไม่พบข้อมูล Reseller'})
+        
+        reseller = dict(reseller)
+        reseller_id = reseller['reseller_id']
+        
+        # ตรวจสอบ Quota
+        cursor.execute(f'SELECT COUNT(*) AS total FROM schools WHERE reseller_id = {ph}', (reseller_id,))
+        schools_used = cursor.fetchone()['total']
     
     if schools_used >= reseller['max_schools']:
-        conn.close()
         return jsonify({'success': False, 'message': 'คุณใช้ Quota เต็มแล้ว! ติดต่อ Super Admin เพื่อเพิ่ม Quota'})
     
-    conn.close()
-    
     # เพิ่มโรงเรียน
     data = request.json
     data['reseller_id'] = reseller_id
@@ -2630,10 +2590,15 @@ def reseller_add_school():
     return jsonify({'success': True, 'school_id': school_id, 'message': 'สร้างโรงเรียนสำเร็จ!'})
 
 # Face Recognition APIs
+def _face_train_job(job, school_id, students):
+    stats = face_recognition_system.train_from_students(students, progress=job.progress)
+    face_gallery_cache.invalidate(school_id)
+    return stats
+
 @app.route('/api/face/train', methods=['POST'])
 @login_required
 def train_face_model():
-    """เทรนโมเดล Face Recognition"""
+    """เทรนโมเดล Face Recognition (background job)"""
     try:
         school_id = get_current_school_id()
         students = db.get_students(school_id)
@@ -2647,15 +2612,16 @@ def train_face_model():
                 'message': 'ไม่มีนักเรียนที่มีรูปภาพ'
             })
         
-        # เทรนโมเดล
-        success_count = face_recognition_system.train_from_students(students_with_images)
+        # เทรนเฉพาะรูปที่เปลี่ยน - ตรวจสอบความคืบหน้าที่ /api/jobs/<job_id>
+        job = job_runner.submit('face_train', _face_train_job, school_id, students_with_images,
+                                key=f'face_train:{school_id}', school_id=school_id)
         
         return jsonify({
             'success': True,
-            'trained': success_count,
+            'job_id': job.id,
             'total': len(students_with_images),
-            'message': f'เทรนสำเร็จ {success_count}/{len(students_with_images)} คน'
-        })
+            'message': f'เริ่มเทรนโมเดล {len(students_with_images)} คน'
+        }), 202
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
@@ -2666,27 +2632,66 @@ def face_model_status():
     return jsonify({
         'success': True,
         'trained_count': len(face_recognition_system.known_face_ids),
-        'model_exists': os.path.exists('data/face_model.pkl')
+        'model_exists': face_recognition_system.store.exists()
     })
 
 @app.route('/api/ai/train', methods=['POST'])
 @login_required
 def ai_train():
-    """เทรนโมเดล AI Face Recognition"""
+    """เทรนโมเดล AI Face Recognition (background job)"""
     try:
         from ai_face_recognition import ai_face
         school_id = get_current_school_id()
         students = db.get_students(school_id)
         
-        ai_face.train(students)
+        job = job_runner.submit('ai_train', lambda job: ai_face.train(students, progress=job.progress),
+                                key=f'ai_train:{school_id}', school_id=school_id)
         
         return jsonify({
             'success': True,
-            'message': f'เทรนโมเดลสำเร็จ! จำนวน {len(ai_face.known_faces)} คน'
-        })
+            'job_id': job.id,
+            'total': len(students),
+            'message': f'เริ่มเทรนโมเดล AI {len(students)} คน'
+        }), 202
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+def _job_visible(job):
+    """admin โรงเรียนเห็นเฉพาะงานของโรงเรียนตัวเอง - งานระดับ platform (school_id = None เช่น backup) เฉพาะ super admin"""
+    if not job:
+        return False
+    if session.get('role') == 'super_admin':
+        return True
+    return job.school_id is not None and job.school_id == get_current_school_id()
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job_status(job_id):
+    """สถานะของ background job"""
+    job = job_runner.get(job_id)
+    if not _job_visible(job):
+        return jsonify({'success': False, 'message': 'ไม่พบงาน'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    """ยกเลิก background job (งานจะหยุดที่จุดรายงานความคืบหน้าถัดไป)"""
+    job = job_runner.get(job_id)
+    if not _job_visible(job):
+        return jsonify({'success': False, 'message': 'ไม่พบงาน'}), 404
+    if not job_runner.cancel(job_id):
+        return jsonify({'success': False, 'message': 'งานนี้เสร็จสิ้นแล้ว'}), 409
+    return jsonify({'success': True, 'message': 'กำลังยกเลิกงาน'})
+
+@app.route('/api/jobs', methods=['GET'])
+@login_required
+def list_jobs():
+    """รายการ background job ล่าสุดของโรงเรียน (super admin เห็นทั้งหมด)"""
+    school_id = None if session.get('role') == 'super_admin' else get_current_school_id()
+    limit = min(int(request.args.get('limit', 50)), 200)
+    return jsonify({'success': True, 'jobs': [job.to_dict() for job in job_runner.list(school_id, limit)]})
+
 @app.route('/api/ai/recognize', methods=['POST'])
 @login_required
 def ai_recognize():
@@ -2694,26 +2699,28 @@ def ai_recognize():
     try:
         from ai_face_recognition import ai_face
         
-        # โหลดโมเดล
-        if not ai_face.known_faces:
-            if not ai_face.load_model():
-                return jsonify({'success': False, 'message': 'กรุณาเทรนโมเดลก่อน'})
+        school_id = get_current_school_id()
+        
+        # โหลดโมเดลครั้งแรก (รวม migrate ไฟล์เก่า) ครั้งถัดไปโหลดเฉพาะ segment ที่เปลี่ยน
+        if not ai_face.indexes:
+            ai_face.load_model()
+        ai_face.refresh()
+        if school_id not in ai_face.indexes:
+            return jsonify({'success': False, 'message': 'กรุณาเทรนโมเดลก่อน'})
         
         image_data = request.json.get('image')
         camera_type = request.json.get('camera_type', 'general')
-        school_id = get_current_school_id()
         
-        results = ai_face.recognize_from_base64(image_data)
+        results = ai_face.recognize_from_base64(image_data, school_id)
         
         if results:
             best = max(results, key=lambda x: x['confidence'])
             
             if best['confidence'] > 0.6:
-                students = db.get_students(school_id)
-                student = next((s for s in students if s['student_id'] == best['student_id']), None)
+                student = roster.get(school_id, best['student_id'])
                 
                 if student:
-                    db.add_attendance(student['student_id'], student['name'], school_id, camera_type)
+                    db.enqueue_attendance(student['student_id'], student['name'], school_id, camera_type)
                     
                     # Broadcast via WebSocket
                     socketio.broadcast_attendance(school_id, {
@@ -2746,8 +2753,7 @@ def generate_qr(student_id):
         from flask import send_file
         
         school_id = get_current_school_id()
-        students = db.get_students(school_id)
-        student = next((s for s in students if s['student_id'] == student_id), None)
+        student = roster.get(school_id, student_id)
         
         if not student:
             return jsonify({'success': False, 'message': 'ไม่พบนักเรียน'})
@@ -2773,8 +2779,7 @@ def scan_qr():
         
         if results:
             student_id = results[0]['student_id']
-            students = db.get_students(school_id)
-            student = next((s for s in students if s['student_id'] == student_id), None)
+            student = roster.get(school_id, student_id)
             
             if student:
                 db.add_attendance(student['student_id'], student['name'], school_id, camera_type)
@@ -2804,11 +2809,11 @@ def enable_2fa():
         secret = two_fa.generate_secret()
         
         # บันทึก secret ลง database
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET two_fa_secret = ? WHERE username = ?', (secret, username))
-        conn.commit()
-        conn.close()
+        ph = '%s' if db.db_type == 'postgresql' else '?'
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'UPDATE users SET two_fa_secret = {ph} WHERE username = {ph}', (secret, username))
+            conn.commit()
         
         # สร้าง QR Code
         qr_base64 = two_fa.generate_qr_base64(username, secret)
@@ -2854,11 +2859,11 @@ def disable_2fa():
     try:
         username = session.get('user')
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET two_fa_secret = NULL WHERE username = ?', (username,))
-        conn.commit()
-        conn.close()
+        ph = '%s' if db.db_type == 'postgresql' else '?'
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'UPDATE users SET two_fa_secret = NULL WHERE username = {ph}', (username,))
+            conn.commit()
         
         return jsonify({'success': True, 'message': 'ปิดใช้งาน 2FA สำเร็จ'})
     except Exception as e:
@@ -2904,16 +2909,18 @@ def get_audit_stats():
 # ============================================
 
 @app.route('/api/backup/create', methods=['POST'])
-@login_required
+@super_admin_required
 def create_backup():
-    """สร้าง backup"""
+    """สร้าง backup ของทั้งระบบ (job ระดับ platform - ดู/ยกเลิกได้เฉพาะ super admin)"""
     try:
         from backup_manager import backup_manager
         
         include_images = request.json.get('include_images', True)
-        result = backup_manager.create_backup(include_images=include_images)
+        job = job_runner.submit('backup', lambda job: backup_manager.create_backup(include_images=include_images,
+                                                                                   progress=job.progress),
+                                key='backup')
         
-        return jsonify(result)
+        return jsonify({'success': True, 'job_id': job.id, 'message': 'เริ่มสร้าง backup'}), 202
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
@@ -2965,7 +2972,13 @@ def db_status():
         'db_type': db.db_type.upper(),
         'host': os.environ.get('DB_HOST', 'localhost') if db.db_type == 'postgresql' else 'local file',
         'database': os.environ.get('DB_NAME', 'postgres') if db.db_type == 'postgresql' else 'data/database.db',
-        'pool': db.pool is not None
+        'pool': db.pool is not None,
+        'pool_stats': db.pool_stats() if hasattr(db, 'pool_stats') else None,
+        'dashboard_cache': dashboard_stats.stats(),
+        'attendance_queue': db.attendance_queue.stats() if hasattr(db, 'attendance_queue') else None,
+        'gate_debounce': gate_debouncer.stats(),
+        'roster_cache': roster.stats(),
+        'cameras': camera_registry.stats()
     })
 
 if __name__ == '__main__':
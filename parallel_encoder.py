@@ -0,0 +1,79 @@
+"""
+Parallel Face Encoder
+กระจายงาน decode รูป + detect + encode ใบหน้า (dlib) ไปทุก CPU core ด้วย process pool
+ส่งงานเข้า pool ทีละไม่เกิน max_pending รูป เพื่อไม่ให้ memory โตตามจำนวนรูป
+ผลลัพธ์ส่งกลับแบบ streaming ตามลำดับที่เสร็จ
+"""
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+START_METHOD = os.environ.get('ENCODER_START_METHOD', 'forkserver')
+DEFAULT_WORKERS = int(os.environ.get('ENCODER_WORKERS', str(os.cpu_count() or 1)))
+
+
+def encode_image(image_path):
+    """encode ใบหน้าแรกในรูป (รันใน worker process) - None ถ้าไม่พบใบหน้า"""
+    import face_recognition
+    image = face_recognition.load_image_file(image_path)
+    encodings = face_recognition.face_encodings(image)
+    if not encodings:
+        return None
+    return np.asarray(encodings[0], dtype=np.float32)
+
+
+class ParallelEncoder:
+    def __init__(self, encode_fn=encode_image, max_workers=DEFAULT_WORKERS, max_pending=None):
+        """
+        encode_fn(image_path) ต้องเป็นฟังก์ชันระดับ module (pickle ได้)
+        max_pending - จำนวนรูปที่ส่งเข้า pool พร้อมกันสูงสุด (default 2 เท่าของ workers)
+        """
+        self.encode_fn = encode_fn
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max_pending or self.max_workers * 2
+
+    def encode(self, students):
+        """
+        yield (student, feature, error) ทันทีที่แต่ละรูปเสร็จ
+        error เป็น Exception ของรูปนั้น (รูปอื่นยังทำงานต่อ)
+        """
+        students = list(students)
+        if not students:
+            return
+        if self.max_workers == 1 or len(students) == 1:
+            for student in students:
+                try:
+                    yield student, self.encode_fn(student['image_path']), None
+                except Exception as e:
+                    yield student, None, e
+            return
+
+        context = multiprocessing.get_context(START_METHOD)
+        workers = min(self.max_workers, len(students))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            pending = {}
+            queue = iter(students)
+
+            def fill():
+                for student in queue:
+                    pending[executor.submit(self.encode_fn, student['image_path'])] = student
+                    if len(pending) >= self.max_pending:
+                        break
+
+            fill()
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    student = pending.pop(future)
+                    try:
+                        yield student, future.result(), None
+                    except Exception as e:
+                        yield student, None, e
+                fill()
+
+
+# สร้าง instance
+parallel_encoder = ParallelEncoder()
@@ -0,0 +1,261 @@
+"""
+PostgreSQL Connection Pool
+แทน ThreadedConnectionPool(10, 100) ที่เปิด 10 connection ทันทีตอน import ในทุก gunicorn worker
+- เปิด connection เมื่อต้องใช้จริงเท่านั้น (lazy)
+- ขนาดสูงสุดคำนวณจากจำนวน worker: DB_MAX_CONNECTIONS / จำนวน worker
+- รอ connection ได้ไม่เกิน checkout_timeout แล้ว raise PoolTimeout
+- connection ที่ไม่ถูกคืน (handler error ก่อน putconn) ได้ที่คืน: เมื่อ object ถูก garbage collect
+  หรือถูกยืมนานเกิน max_checkout (ปิดทิ้ง) - error ไม่กี่ครั้งไม่ทำให้ pool ของ worker เต็มถาวร
+- ตรวจ connection ที่ว่างนานเกิน validate_after ด้วย SELECT 1 และเปิดใหม่เมื่ออายุเกิน max_lifetime
+- metrics: in_use / idle / waiting / checkout latency
+- ใช้กับ gevent worker ได้ (threading ถูก monkey-patch เป็น greenlet-aware และ patch psycopg2 ด้วย psycogreen ถ้ามี)
+- fork-safe: ถ้า pid เปลี่ยน (gunicorn preload) จะทิ้ง connection ของ process แม่โดยไม่ปิด socket
+"""
+
+import os
+import threading
+import time
+import weakref
+from collections import deque
+
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', '80'))
+CHECKOUT_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+VALIDATE_AFTER = float(os.environ.get('DB_POOL_VALIDATE_AFTER', '30'))
+MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800'))
+MAX_CHECKOUT = float(os.environ.get('DB_POOL_MAX_CHECKOUT', '300'))
+RECLAIM_POLL = 0.5  # ระหว่างรอ connection ตรวจ connection ที่รั่วทุกกี่วินาที
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def worker_count():
+    """จำนวน gunicorn worker (WEB_CONCURRENCY หรือสูตรเดียวกับ gunicorn_config.py)"""
+    if os.environ.get('WEB_CONCURRENCY'):
+        return max(1, int(os.environ['WEB_CONCURRENCY']))
+    return (os.cpu_count() or 1) * 2 + 1
+
+
+def default_max_size():
+    if os.environ.get('DB_POOL_MAX'):
+        return max(1, int(os.environ['DB_POOL_MAX']))
+    return max(2, DB_MAX_CONNECTIONS // worker_count())
+
+
+def patch_gevent():
+    """ให้ psycopg2 yield ระหว่างรอ I/O เมื่อรันใต้ gevent (ต้องติดตั้ง psycogreen)"""
+    try:
+        from gevent import monkey
+        if not monkey.is_module_patched('socket'):
+            return False
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        return False
+    patch_psycopg()
+    return True
+
+
+class PgPool:
+    def __init__(self, connect_fn, max_size=None, checkout_timeout=CHECKOUT_TIMEOUT,
+                 validate_after=VALIDATE_AFTER, max_lifetime=MAX_LIFETIME, max_checkout=MAX_CHECKOUT,
+                 clock=time.monotonic):
+        self.connect_fn = connect_fn
+        self.max_size = max_size or default_max_size()
+        self.checkout_timeout = checkout_timeout
+        self.validate_after = validate_after
+        self.max_lifetime = max_lifetime
+        self.max_checkout = max_checkout
+        self.clock = clock
+        self._condition = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = []      # LIFO: connection ที่เพิ่งใช้อยู่ท้าย
+        self._meta = {}      # id(conn) -> {'created': t, 'last_used': t, 'checked_out': t}
+        self._in_use = {}    # id(conn) -> weakref ของ conn (ไม่กัน garbage collect ของ connection ที่รั่ว)
+        self._size = 0
+        self._waiting = 0
+        self._latencies = deque(maxlen=1000)
+        self.counters = {'created': 0, 'checkouts': 0, 'timeouts': 0, 'recycled': 0, 'validation_failures': 0,
+                         'leaked': 0}
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # connection ของ process แม่ใช้ร่วมไม่ได้ และห้าม close (จะปิด session ของแม่)
+            self._reset()
+
+    def getconn(self):
+        started = self.clock()
+        deadline = started + self.checkout_timeout
+        # กำหนดเวลาจริงอีกชั้น - clock ที่ส่งเข้ามา (เช่นใน test) อาจไม่เดิน
+        real_deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            conn, create = None, False
+            with self._condition:
+                self._check_fork()
+                while not self._idle and self._size >= self.max_size:
+                    if self._reclaim():
+                        continue
+                    remaining = min(deadline - self.clock(), real_deadline - time.monotonic())
+                    if remaining <= 0:
+                        self.counters['timeouts'] += 1
+                        raise PoolTimeout(f"no database connection available within {self.checkout_timeout}s "
+                                          f"(in use: {len(self._in_use)}/{self.max_size})")
+                    self._waiting += 1
+                    try:
+                        self._condition.wait(min(remaining, RECLAIM_POLL))
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+
+            if create:
+                try:
+                    conn = self.connect_fn()
+                except Exception:
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+                now = self.clock()
+                self._meta[id(conn)] = {'created': now, 'last_used': now}
+                self.counters['created'] += 1
+            elif not self._usable(conn):
+                self._discard(conn)
+                continue
+
+            with self._condition:
+                stale = self._in_use.get(id(conn))
+                if stale is not None and stale() is None:
+                    # connection ที่รั่วถูก collect แล้ว id ถูกใช้ซ้ำ - คืนที่ก่อนเขียนทับ
+                    self._size -= 1
+                    self.counters['leaked'] += 1
+                self._in_use[id(conn)] = self._ref(conn)
+                self._meta.setdefault(id(conn), {'created': self.clock()})['checked_out'] = self.clock()
+                self.counters['checkouts'] += 1
+                self._latencies.append(self.clock() - started)
+            return conn
+
+    def _ref(self, conn):
+        try:
+            # ไม่ใช้ callback (gc อาจเกิดขณะ thread นี้ถือ lock อยู่) - _reclaim ตรวจ ref ที่ตายแล้วเอง
+            return weakref.ref(conn)
+        except TypeError:
+            return lambda: conn
+
+    def _reclaim(self):
+        """
+        คืนที่ให้ connection ที่ยืมไปแล้วไม่ putconn (เรียกภายใน lock):
+        ผู้ใช้ close() เอง, object ถูก garbage collect, หรือยืมนานเกิน max_checkout
+        """
+        reclaimed, expired = 0, []
+        now = self.clock()
+        for key, ref in list(self._in_use.items()):
+            conn = ref()
+            if conn is None:
+                del self._in_use[key]
+                self._meta.pop(key, None)
+                self._size -= 1
+                self.counters['leaked'] += 1
+                reclaimed += 1
+                continue
+            checked_out = self._meta.get(key, {}).get('checked_out', now)
+            if getattr(conn, 'closed', 0) or now - checked_out > self.max_checkout:
+                if not getattr(conn, 'closed', 0):
+                    expired.append(conn)
+                    self.counters['leaked'] += 1
+                del self._in_use[key]
+                self._meta.pop(key, None)
+                self._size -= 1
+                reclaimed += 1
+        for conn in expired:
+            print(f"⚠️ DB connection checked out longer than {self.max_checkout:.0f}s - closing (not returned to pool?)")
+            try:
+                conn.close()
+            except Exception:
+                pass
+        return reclaimed > 0
+
+    def _usable(self, conn):
+        """ตรวจ connection ที่ได้จาก idle (ทำนอก lock)"""
+        meta = self._meta.get(id(conn), {})
+        now = self.clock()
+        if getattr(conn, 'closed', 0):
+            return False
+        if now - meta.get('created', now) > self.max_lifetime:
+            self.counters['recycled'] += 1
+            return False
+        if now - meta.get('last_used', now) > self.validate_after:
+            try:
+                cursor = conn.cursor()
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+                cursor.close()
+                conn.rollback()
+            except Exception:
+                self.counters['validation_failures'] += 1
+                return False
+        return True
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._condition:
+            self._meta.pop(id(conn), None)
+            self._size -= 1
+            self._condition.notify()
+
+    def putconn(self, conn, close=False):
+        with self._condition:
+            if self._pid != os.getpid() or id(conn) not in self._in_use:
+                return  # connection จาก process แม่ หรือคืนซ้ำ
+            del self._in_use[id(conn)]
+            self._meta.get(id(conn), {}).pop('checked_out', None)
+
+        if not close and not getattr(conn, 'closed', 0):
+            try:
+                # ไม่ส่ง transaction ค้าง/aborted ต่อให้ request ถัดไป
+                conn.rollback()
+            except Exception:
+                close = True
+        if close or getattr(conn, 'closed', 0):
+            self._discard(conn)
+            return
+
+        with self._condition:
+            self._meta.setdefault(id(conn), {'created': self.clock()})['last_used'] = self.clock()
+            self._idle.append(conn)
+            self._condition.notify()
+
+    def closeall(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            self._meta.pop(id(conn), None)
+
+    def stats(self):
+        with self._condition:
+            latencies = sorted(self._latencies)
+            return dict(
+                self.counters,
+                max_size=self.max_size,
+                size=self._size,
+                in_use=len(self._in_use),
+                idle=len(self._idle),
+                waiting=self._waiting,
+                checkout_ms_avg=round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0,
+                checkout_ms_p95=round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 3) if latencies else 0,
+                checkout_ms_max=round(latencies[-1] * 1000, 3) if latencies else 0
+            )
@@ -1,5 +1,7 @@
 from flask import Flask, render_template, Response, jsonify
 import cv2
+from face_detector import detector_registry
+from face_tracker import FaceTracker
 import numpy as np
 import json
 import os
@@ -10,7 +12,7 @@ app = Flask(__name__)
 
 class RealtimeSystem:
     def __init__(self):
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.face_cascade = detector_registry.get()
         self.face_recognizer = cv2.face.LBPHFaceRecognizer_create()
         self.students_data = {}
         self.face_images = []
@@ -81,8 +83,21 @@ class RealtimeSystem:
 
 system = RealtimeSystem()
 
+def recognize_face(gray, box):
+    """คืนค่า (label, confidence) - label เป็น None ถ้าไม่รู้จัก"""
+    if not system.is_trained:
+        return None, 0
+    x, y, w, h = box
+    face_roi = cv2.resize(gray[y:y+h, x:x+w], (100, 100))
+    label, confidence = system.face_recognizer.predict(face_roi)
+    if confidence < 100 and label in system.students_data:
+        return label, confidence
+    return None, confidence
+
 def generate_frames():
     cap = cv2.VideoCapture(0)
+    # detect ทุก N เฟรม + ติดตามใบหน้าด้วย track id, recognize เฉพาะ track ที่ยังไม่ยืนยันตัวตน
+    tracker = FaceTracker()
     
     while True:
         ret, frame = cap.read()
@@ -90,29 +105,26 @@ def generate_frames():
             break
         
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = system.face_cascade.detectMultiScale(gray, 1.3, 5)
+        tracks = tracker.step(lambda: system.face_cascade.detectMultiScale(gray, 1.3, 5),
+                              lambda box: recognize_face(gray, box))
         
-        for (x, y, w, h) in faces:
-            if system.is_trained:
-                face_roi = gray[y:y+h, x:x+w]
-                face_roi = cv2.resize(face_roi, (100, 100))
+        for track in tracks:
+            x, y, w, h = track.box
+            if not system.is_trained:
+                color = (255, 0, 0)
+                display_text = "No Training Data"
+            elif track.label is not None:
+                name = system.students_data[track.label]['name']
+                student_id = system.students_data[track.label]['student_id']
                 
-                label, confidence = system.face_recognizer.predict(face_roi)
+                if track.just_confirmed:
+                    system.check_in_student(track.label)
                 
-                if confidence < 100 and label in system.students_data:
-                    name = system.students_data[label]['name']
-                    student_id = system.students_data[label]['student_id']
-                    
-                    system.check_in_student(label)
-                    
-                    color = (0, 255, 0)
-                    display_text = f"{name} ({student_id})"
-                else:
-                    color = (0, 0, 255)
-                    display_text = "Unknown"
+                color = (0, 255, 0)
+                display_text = f"{name} ({student_id})"
             else:
-                color = (255, 0, 0)
-                display_text = "No Training Data"
+                color = (0, 0, 255)
+                display_text = "Unknown"
             
             cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
             cv2.rectangle(frame, (x, y-40), (x+w, y), color, -1)
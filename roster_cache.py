@@ -0,0 +1,66 @@
+"""
+Roster Cache
+ค้นหานักเรียนด้วย (school_id, student_id) แทนการโหลด get_students ทั้งโรงเรียนแล้ววนหา
+- cache miss อ่านแถวเดียวด้วย Database.get_student (index ของ student_id)
+- cache แยกตามโรงเรียน ล้างทั้งโรงเรียนเมื่อมีการเขียนตาราง students (Database.on_write)
+- TTL กันข้อมูลค้างจากการแก้ไขใน gunicorn worker อื่น
+"""
+
+import os
+import threading
+import time
+
+ROSTER_TTL = float(os.environ.get('ROSTER_CACHE_TTL', '300'))
+
+
+class RosterCache:
+    def __init__(self, db, ttl=ROSTER_TTL, clock=time.monotonic):
+        self.db = db
+        self.ttl = ttl
+        self.clock = clock
+        self._schools = {}  # school_id -> {student_id: (expires_at, student)}
+        self._generation = 0  # ผลที่อ่านก่อน invalidate จะไม่ถูกเก็บ
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        if hasattr(db, 'on_write'):
+            db.on_write(self._on_write)
+
+    def get(self, school_id, student_id):
+        """dict ของนักเรียน (copy) หรือ None ถ้าไม่พบ"""
+        if not student_id:
+            return None
+        now = self.clock()
+        with self._lock:
+            entry = self._schools.get(school_id, {}).get(student_id)
+            if entry is not None and entry[0] > now:
+                self.counters['hits'] += 1
+                return dict(entry[1])
+            self.counters['misses'] += 1
+            generation = self._generation
+
+        student = self.db.get_student(school_id, student_id)
+        if student is None:
+            return None  # ไม่ cache ผลว่าง (เช่นข้อความ LINE ที่ไม่ใช่รหัสนักเรียน)
+        with self._lock:
+            if generation == self._generation:
+                self._schools.setdefault(school_id, {})[student_id] = (now + self.ttl, student)
+        return dict(student)
+
+    def invalidate(self, school_id=None):
+        """ล้างทั้งโรงเรียน (หรือทุกโรงเรียนถ้าไม่ระบุ)"""
+        with self._lock:
+            self.counters['invalidations'] += 1
+            self._generation += 1
+            if school_id is None:
+                self._schools.clear()
+            else:
+                self._schools.pop(school_id, None)
+
+    def _on_write(self, table, school_id=None):
+        if table == 'students':
+            self.invalidate(school_id)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, schools=len(self._schools),
+                        students=sum(len(entries) for entries in self._schools.values()))
@@ -0,0 +1,212 @@
+"""
+RTSP Ingest
+อ่าน stream กล้อง Hikvision สำหรับวิเคราะห์ใบหน้า โดยใช้ CPU น้อยที่สุดต่อกล้อง
+
+- ใช้ sub-stream (ChannelX02 ความละเอียดต่ำ) สำหรับวิเคราะห์ - main stream ใช้เฉพาะภาพ snapshot
+- capture thread grab() ทุกเฟรมเพื่อไม่ให้ buffer ของ stream ค้าง (ภาพไม่ดีเลย์)
+  แต่ retrieve() (แปลงเป็นภาพ BGR) เฉพาะเฟรมตาม RTSP_ANALYSIS_FPS
+- เก็บเฉพาะเฟรมล่าสุด - ผู้อ่านที่ช้าจะได้เฟรมใหม่สุดเสมอ เฟรมที่ไม่มีใครอ่านนับเป็น dropped
+- ใช้ hardware decode ถ้า OpenCV/เครื่องรองรับ (VIDEO_ACCELERATION_ANY) ไม่มีก็ decode ด้วย CPU ตามปกติ
+- stream หลุด/อ่านไม่ได้: เชื่อมต่อใหม่อัตโนมัติ (รอ RTSP_RECONNECT_MIN เพิ่มเป็นสองเท่าจนถึง RTSP_RECONNECT_MAX)
+"""
+
+import os
+import re
+import threading
+import time
+from collections import deque
+from urllib.parse import quote
+
+ANALYSIS_FPS = float(os.environ.get('RTSP_ANALYSIS_FPS', '5'))
+RTSP_TRANSPORT = os.environ.get('RTSP_TRANSPORT', 'tcp')
+HW_DECODE = os.environ.get('RTSP_HW_DECODE', 'auto')  # auto / off
+READ_TIMEOUT = float(os.environ.get('RTSP_READ_TIMEOUT', '10'))
+RECONNECT_MIN = float(os.environ.get('RTSP_RECONNECT_MIN', '1'))
+RECONNECT_MAX = float(os.environ.get('RTSP_RECONNECT_MAX', '30'))
+FPS_WINDOW = 5.0  # วินาทีที่ใช้คำนวณ fps
+FPS_SAMPLES = 512
+
+STREAMS = {'main': 1, 'sub': 2}
+
+
+def rtsp_url(ip, username, password, channel=1, stream='sub', port=554):
+    """URL ของ Hikvision: /Streaming/Channels/<channel>01 = main, <channel>02 = sub"""
+    return (f"rtsp://{quote(username, safe='')}:{quote(password, safe='')}@{ip}:{port}"
+            f"/Streaming/Channels/{channel}0{STREAMS[stream]}")
+
+
+def redact_url(url):
+    """ตัด username/password ออกก่อนแสดงใน log"""
+    return re.sub(r'//[^@/]*@', '//', url)
+
+
+def open_rtsp(url):
+    import cv2
+    # TCP ไม่เสีย packet แบบ UDP (ภาพไม่แตก) - ต้องตั้งก่อนเปิด capture
+    os.environ.setdefault('OPENCV_FFMPEG_CAPTURE_OPTIONS', f'rtsp_transport;{RTSP_TRANSPORT}')
+    params = []
+    if HW_DECODE != 'off' and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+        params += [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+    if hasattr(cv2, 'CAP_PROP_READ_TIMEOUT_MSEC'):
+        timeout_ms = int(READ_TIMEOUT * 1000)
+        params += [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms]
+    cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG, params) if params else cv2.VideoCapture(url, cv2.CAP_FFMPEG)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+
+class RtspIngest:
+    def __init__(self, url, name=None, analysis_fps=ANALYSIS_FPS, open_capture=open_rtsp,
+                 reconnect=(RECONNECT_MIN, RECONNECT_MAX), clock=time.monotonic):
+        """
+        open_capture(url) -> object ที่มี grab() / retrieve() / release() (เช่น cv2.VideoCapture)
+        analysis_fps: จำนวนเฟรมต่อวินาทีที่ retrieve (0 = ทุกเฟรม)
+        """
+        self.url = url
+        self.name = name or redact_url(url)
+        self.analysis_fps = analysis_fps
+        self.interval = 1.0 / analysis_fps if analysis_fps else 0.0
+        self.open_capture = open_capture
+        self.reconnect = reconnect
+        self.clock = clock
+        self.status = 'stopped'  # stopped / connecting / online / reconnecting
+        self.last_error = None
+        self.counters = {'grabbed': 0, 'decoded': 0, 'skipped': 0, 'dropped': 0, 'reconnects': 0, 'errors': 0}
+        self._grab_times = deque(maxlen=FPS_SAMPLES)
+        self._decode_times = deque(maxlen=FPS_SAMPLES)
+        self._condition = threading.Condition()
+        self._frame = None
+        self._frame_time = None
+        self._seq = 0
+        self._consumed = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return self
+        self._stop.clear()
+        self.status = 'connecting'
+        self._thread = threading.Thread(target=self._run, name=f'rtsp-{self.name}', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+        self.status = 'stopped'
+
+    def latest(self, after=0, timeout=None):
+        """
+        เฟรมวิเคราะห์ล่าสุดที่ใหม่กว่า seq ``after`` คืนค่า (seq, frame)
+        timeout แล้วยังไม่มีเฟรมใหม่คืน (after, None) - เฟรมใช้ร่วมกันทุกผู้อ่าน ให้ copy ก่อนวาดทับ
+        """
+        with self._condition:
+            if timeout:
+                self._condition.wait_for(lambda: self._seq > after or self._stop.is_set(), timeout)
+            if self._seq <= after:
+                return after, None
+            self._consumed = self._seq
+            return self._seq, self._frame
+
+    def stats(self):
+        now = self.clock()
+        with self._condition:
+            frame_age = None if self._frame_time is None else round(now - self._frame_time, 3)
+            return dict(
+                self.counters,
+                name=self.name,
+                status=self.status,
+                last_error=self.last_error,
+                analysis_fps=self.analysis_fps,
+                source_fps=self._fps(self._grab_times, now),
+                decode_fps=self._fps(self._decode_times, now),
+                frame_age=frame_age
+            )
+
+    @staticmethod
+    def _fps(times, now):
+        times = [t for t in list(times) if now - t <= FPS_WINDOW]
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return round((len(times) - 1) / (times[-1] - times[0]), 2)
+
+    def _set_status(self, status, error=None):
+        if status != self.status:
+            if status == 'online':
+                print(f"✅ RTSP online: {self.name}")
+            elif status == 'reconnecting':
+                print(f"⚠️ RTSP {self.name}: {error} - เชื่อมต่อใหม่")
+        self.status = status
+        if error is not None:
+            self.last_error = error
+
+    def _connect(self):
+        try:
+            cap = self.open_capture(self.url)
+        except Exception as e:
+            self._set_status('reconnecting', str(e))
+            return None
+        if hasattr(cap, 'isOpened') and not cap.isOpened():
+            cap.release()
+            self._set_status('reconnecting', 'เปิด stream ไม่ได้')
+            return None
+        return cap
+
+    def _run(self):
+        cap = None
+        delay = self.reconnect[0]
+        next_decode = 0.0
+        try:
+            while not self._stop.is_set():
+                if cap is None:
+                    cap = self._connect()
+                if cap is not None and not cap.grab():
+                    cap.release()
+                    cap = None
+                    self._set_status('reconnecting', 'อ่านเฟรมไม่ได้')
+                if cap is None:
+                    self.counters['reconnects'] += 1
+                    self._stop.wait(delay)
+                    delay = min(self.reconnect[1], delay * 2)
+                    continue
+
+                delay = self.reconnect[0]
+                now = self.clock()
+                self.counters['grabbed'] += 1
+                self._grab_times.append(now)
+                if now < next_decode:
+                    # ยังไม่ถึงเวลาวิเคราะห์ - ไม่แปลงเฟรมนี้เป็นภาพ
+                    self.counters['skipped'] += 1
+                    continue
+                ok, frame = cap.retrieve()
+                if not ok:
+                    self.counters['errors'] += 1
+                    continue
+                # รักษาจังหวะตาม analysis fps (ไม่สะสมหนี้ถ้าช้ากว่ากำหนด)
+                next_decode = max(next_decode + self.interval, now) if self.interval else 0.0
+                self._publish(frame, now)
+        finally:
+            if cap is not None:
+                cap.release()
+
+    def _publish(self, frame, now):
+        with self._condition:
+            if self._seq > self._consumed:
+                # เฟรมก่อนหน้ายังไม่มีใครอ่าน - ถูกแทนที่
+                self.counters['dropped'] += 1
+            self._frame = frame
+            self._frame_time = now
+            self._seq += 1
+            self.counters['decoded'] += 1
+            self._decode_times.append(now)
+            self._set_status('online')
+            self._condition.notify_all()
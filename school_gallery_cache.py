@@ -0,0 +1,179 @@
+"""
+School Gallery Cache
+cache ของ FaceGallery แยกตามโรงเรียน (tenant)
+- โหลดแบบ lazy เมื่อมีการจดจำใบหน้าของโรงเรียนนั้นครั้งแรก
+- LRU eviction ตาม memory budget (FACE_CACHE_MAX_MB)
+- มี hook สำหรับ invalidate เมื่อเพิ่ม/ลบ/เทรนนักเรียน
+- TTL (FACE_CACHE_TTL) กันข้อมูลค้างจากการแก้ไข/นำเข้าใน gunicorn worker อื่น
+- ผลโหลดที่เริ่มก่อน invalidate/upsert/remove จะไม่ถูกเก็บ (ไม่ทับข้อมูลใหม่ด้วยรายชื่อเก่า)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from face_gallery import FaceGallery
+
+DEFAULT_MAX_MB = int(os.environ.get('FACE_CACHE_MAX_MB', '256'))
+DEFAULT_TTL = float(os.environ.get('FACE_CACHE_TTL', '300'))
+
+
+class SchoolGallery:
+    """gallery + ชื่อนักเรียนของโรงเรียนเดียว"""
+
+    def __init__(self, school_id, dim):
+        self.school_id = school_id
+        self.gallery = FaceGallery(dim)
+        self.names = {}  # {student_id: name}
+        self.expires_at = float('inf')
+
+    @property
+    def nbytes(self):
+        return self.gallery.nbytes
+
+
+class SchoolGalleryCache:
+    def __init__(self, students_loader, feature_fn, dim, max_bytes=None, ttl=DEFAULT_TTL, clock=time.monotonic):
+        """
+        students_loader(school_id) -> list ของ student dict
+        feature_fn(student) -> feature vector หรือ None ถ้าไม่พบใบหน้า
+        ttl: วินาทีก่อนโหลดรายชื่อใหม่จาก database (0 = ไม่หมดอายุ)
+        """
+        self.students_loader = students_loader
+        self.feature_fn = feature_fn
+        self.dim = dim
+        self.max_bytes = max_bytes if max_bytes is not None else DEFAULT_MAX_MB * 1024 * 1024
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # {school_id: SchoolGallery} เรียงจากใช้ล่าสุดน้อยไปมาก
+        self._generations = {}  # {school_id: จำนวนครั้งที่ถูกแก้ไข} ใช้ตรวจว่าผลโหลดยังใหม่อยู่
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def __contains__(self, school_id):
+        entry = self._entries.get(school_id)
+        return entry is not None and entry.expires_at > self.clock()
+
+    def _fresh(self, school_id):
+        # เรียกขณะถือ self._lock
+        entry = self._entries.get(school_id)
+        if entry is None:
+            return None
+        if entry.expires_at <= self.clock():
+            del self._entries[school_id]
+            return None
+        self._entries.move_to_end(school_id)
+        return entry
+
+    def _bump(self, school_id):
+        # เรียกขณะถือ self._lock
+        self._generations[school_id] = self._generations.get(school_id, 0) + 1
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(entry.nbytes for entry in self._entries.values())
+
+    def get(self, school_id):
+        """ดึง gallery ของโรงเรียน (โหลดถ้ายังไม่มีใน cache)"""
+        with self._lock:
+            entry = self._fresh(school_id)
+            if entry is not None:
+                return entry
+            load_lock = self._load_locks.setdefault(school_id, threading.Lock())
+
+        # โหลดนอก lock หลัก เพื่อไม่ให้โรงเรียนอื่นต้องรอ
+        with load_lock:
+            with self._lock:
+                entry = self._fresh(school_id)
+                if entry is not None:
+                    return entry
+                generation = self._generations.get(school_id, 0)
+
+            entry = self._load(school_id)
+
+            with self._lock:
+                self._load_locks.pop(school_id, None)
+                if generation != self._generations.get(school_id, 0):
+                    # มีการแก้ไขระหว่างโหลด - รายชื่อที่อ่านมาอาจเก่า ใช้ตอบครั้งนี้แต่ไม่เก็บ
+                    return entry
+                if self.ttl:
+                    entry.expires_at = self.clock() + self.ttl
+                self._entries[school_id] = entry
+                self._entries.move_to_end(school_id)
+                self._evict()
+            return entry
+
+    def _load(self, school_id):
+        print(f'Loading face cache: {school_id}')
+        entry = SchoolGallery(school_id, self.dim)
+        students = self.students_loader(school_id)
+        for student in students:
+            self._add(entry, student)
+        print(f'Cache loaded ({school_id}): {len(entry.gallery)}/{len(students)} faces')
+        return entry
+
+    def _add(self, entry, student):
+        student_id = student.get('student_id')
+        try:
+            features = self.feature_fn(student)
+        except Exception as e:
+            print(f'Error caching {student_id}: {e}')
+            features = None
+
+        if features is None:
+            entry.gallery.remove(student_id)
+            entry.names.pop(student_id, None)
+            return False
+
+        entry.gallery.upsert(student_id, features)
+        entry.names[student_id] = student.get('name')
+        return True
+
+    def _evict(self):
+        # เก็บโรงเรียนที่ใช้ล่าสุดไว้เสมออย่างน้อย 1 แห่ง
+        total = sum(entry.nbytes for entry in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            school_id, entry = self._entries.popitem(last=False)
+            total -= entry.nbytes
+            print(f'Evicted face cache: {school_id}')
+
+    # ---------- invalidation hooks ----------
+
+    def upsert_student(self, school_id, student):
+        """เรียกหลังเพิ่ม/แก้ไขนักเรียน - อัพเดทเฉพาะแถวของนักเรียนคนนั้น"""
+        with self._lock:
+            self._bump(school_id)
+            entry = self._entries.get(school_id)
+        if entry is not None:
+            self._add(entry, student)
+
+    def remove_student(self, school_id, student_id):
+        """เรียกหลังลบนักเรียน"""
+        with self._lock:
+            self._bump(school_id)
+            entry = self._entries.get(school_id)
+        if entry is not None:
+            entry.gallery.remove(student_id)
+            entry.names.pop(student_id, None)
+
+    def invalidate(self, school_id=None):
+        """ล้าง cache ของโรงเรียน (หรือทั้งหมดถ้าไม่ระบุ) ให้โหลดใหม่ครั้งถัดไป"""
+        with self._lock:
+            if school_id is None:
+                for cached in set(self._entries) | set(self._load_locks):
+                    self._bump(cached)
+                self._entries.clear()
+            else:
+                self._bump(school_id)
+                self._entries.pop(school_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'schools': len(self._entries),
+                'faces': sum(len(entry.gallery) for entry in self._entries.values()),
+                'bytes': sum(entry.nbytes for entry in self._entries.values()),
+                'max_bytes': self.max_bytes
+            }
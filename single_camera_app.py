@@ -1,12 +1,15 @@
 from flask import Flask, render_template, request, jsonify, Response, session, redirect, url_for
 import cv2
+from face_detector import detector_registry
+from face_tracker import FaceTracker
+from camera_pipeline import CameraPipeline
 import numpy as np
 import os
 import json
 import sqlite3
 from datetime import datetime
 import base64
-import threading
+import time
 
 try:
     from database_manager import create_database
@@ -30,7 +33,7 @@ if api:
 
 class SingleCameraSystem:
     def __init__(self):
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.face_cascade = detector_registry.get()
         self.face_recognizer = cv2.face.LBPHFaceRecognizer_create()
         
         self.students_data = {}
@@ -40,11 +43,10 @@ class SingleCameraSystem:
         self.last_recognition = {}
         self.current_detection = {}  # เก็บข้อมูลการตรวจจับปัจจุบัน
         
-        # กล้องเดียว
-        self.cap = None
+        # กล้องเดียว - capture / recognition / encode แยก thread ผ่าน CameraPipeline
         self.camera_active = False
-        self.current_frame = None
-        self.lock = threading.Lock()
+        self.pipeline = None
+        self.tracker = None
         
         os.makedirs("data/students", exist_ok=True)
         
@@ -89,36 +91,20 @@ class SingleCameraSystem:
     
     def start_camera(self):
         if not self.camera_active:
-            self.cap = cv2.VideoCapture(0)
+            self.tracker = FaceTracker()
+            self.pipeline = CameraPipeline(lambda: cv2.VideoCapture(0), annotate_frame)
             self.camera_active = True
-            threading.Thread(target=self._camera_loop, daemon=True).start()
+            self.pipeline.start()
     
     def stop_camera(self):
         self.camera_active = False
-        if self.cap:
-            self.cap.release()
-            self.cap = None
-    
-    def _camera_loop(self):
-        while self.camera_active:
-            if self.cap is None:
-                self.cap = cv2.VideoCapture(0)
-                
-            ret, frame = self.cap.read()
-            if ret:
-                with self.lock:
-                    self.current_frame = frame.copy()
-            else:
-                # กล้องหยุดทำงาน ลองเชื่อมต่อใหม่
-                print("Camera disconnected, reconnecting...")
-                if self.cap:
-                    self.cap.release()
-                self.cap = cv2.VideoCapture(0)
-                cv2.waitKey(1000)  # รอ 1 วินาที
+        if self.pipeline:
+            self.pipeline.stop()
+            self.pipeline = None
     
     def get_frame(self):
-        with self.lock:
-            return self.current_frame.copy() if self.current_frame is not None else None
+        pipeline = self.pipeline
+        return pipeline.latest_frame() if pipeline else None
     
     def add_student_from_image(self, student_id, name, image_data):
         try:
@@ -242,84 +228,104 @@ class SingleCameraSystem:
 
 system = SingleCameraSystem()
 
-def generate_frames():
-    while True:
-        frame = system.get_frame()
-        if frame is None:
-            # สร้าง frame ว่างเมื่อไม่มีข้อมูล
-            blank_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-            cv2.putText(blank_frame, "Camera Disconnected", (150, 240), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-            ret, buffer = cv2.imencode('.jpg', blank_frame)
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            continue
+def detect_faces(gray):
+    try:
+        return system.face_cascade.detectMultiScale(
+            gray, 
+            scaleFactor=1.1, 
+            minNeighbors=5, 
+            minSize=(30, 30),
+            flags=cv2.CASCADE_SCALE_IMAGE
+        )
+    except Exception as e:
+        print(f"Face detection error: {e}")
+        return []
+
+def recognize_face(gray, box):
+    """คืนค่า (label, confidence) - label เป็น None ถ้าไม่รู้จัก"""
+    if not system.is_trained:
+        return None, 0
+    x, y, w, h = box
+    face_roi = cv2.resize(gray[y:y+h, x:x+w], (100, 100))
+    label, confidence = system.face_recognizer.predict(face_roi)
+    if confidence < 70 and label in system.students_data:
+        return label, 100 - confidence
+    return None, 0
+
+def annotate_frame(frame):
+    """recognition stage ของ pipeline - detect ทุก N เฟรม + ติดตามใบหน้าด้วย track id"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    tracks = system.tracker.step(lambda: detect_faces(gray), lambda box: recognize_face(gray, box))
+    
+    for track in tracks:
+        x, y, w, h = track.box
+        if not system.is_trained:
+            color = (255, 0, 0)
+            display_text = "No Data"
+        elif track.label is not None:
+            name = system.students_data[track.label]['name']
+            student_id = system.students_data[track.label]['student_id']
             
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        try:
-            faces = system.face_cascade.detectMultiScale(
-                gray, 
-                scaleFactor=1.1, 
-                minNeighbors=5, 
-                minSize=(30, 30),
-                flags=cv2.CASCADE_SCALE_IMAGE
-            )
-        except Exception as e:
-            print(f"Face detection error: {e}")
-            faces = []
-        
-        for (x, y, w, h) in faces:
-            if system.is_trained:
-                face_roi = gray[y:y+h, x:x+w]
-                face_roi = cv2.resize(face_roi, (100, 100))
+            if track.just_confirmed:
+                print(f"Detected: {name} (ID: {student_id}) - Confidence: {track.confidence:.1f}%")
                 
-                label, confidence = system.face_recognizer.predict(face_roi)
+                # อัปเดตข้อมูลการตรวจจับปัจจุบัน
+                system.current_detection = {
+                    'name': name,
+                    'student_id': student_id,
+                    'confidence': track.confidence,
+                    'timestamp': datetime.now()
+                }
                 
-                if confidence < 70 and label in system.students_data:
-                    name = system.students_data[label]['name']
-                    student_id = system.students_data[label]['student_id']
-                    
-                    print(f"Detected: {name} (ID: {student_id}) - Confidence: {100-confidence:.1f}%")
-                    
-                    # อัปเดตข้อมูลการตรวจจับปัจจุบัน
-                    system.current_detection = {
-                        'name': name,
-                        'student_id': student_id,
-                        'confidence': 100 - confidence,
-                        'timestamp': datetime.now()
-                    }
-                    
-                    if system.check_in_student(label):
-                        print(f"Checked in: {name}")
-                    
-                    color = (0, 255, 0)
-                    display_text = name
-                else:
-                    color = (0, 0, 255)
-                    display_text = "Unknown"
-            else:
-                color = (255, 0, 0)
-                display_text = "No Data"
+                if system.check_in_student(track.label):
+                    print(f"Checked in: {name}")
             
-            cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
-            cv2.rectangle(frame, (x, y-40), (x+w, y), color, -1)
-            cv2.putText(frame, display_text, (x+5, y-10), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-        
-        cv2.putText(frame, f"Students: {len(system.students_data)}", (10, 30), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        
-        current_time = datetime.now().strftime("%H:%M:%S")
-        cv2.putText(frame, current_time, (10, frame.shape[0] - 10), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+            color = (0, 255, 0)
+            display_text = name
+        else:
+            color = (0, 0, 255)
+            display_text = "Unknown"
         
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame = buffer.tobytes()
+        cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+        cv2.rectangle(frame, (x, y-40), (x+w, y), color, -1)
+        cv2.putText(frame, display_text, (x+5, y-10), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+    
+    cv2.putText(frame, f"Students: {len(system.students_data)}", (10, 30), 
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    
+    current_time = datetime.now().strftime("%H:%M:%S")
+    cv2.putText(frame, current_time, (10, frame.shape[0] - 10), 
+               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+    
+    return frame
+
+def disconnected_frame():
+    # สร้าง frame ว่างเมื่อไม่มีข้อมูล (encode ครั้งเดียว)
+    global _disconnected_jpeg
+    if _disconnected_jpeg is None:
+        blank_frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        cv2.putText(blank_frame, "Camera Disconnected", (150, 240), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+        ret, buffer = cv2.imencode('.jpg', blank_frame)
+        _disconnected_jpeg = buffer.tobytes()
+    return _disconnected_jpeg
+
+_disconnected_jpeg = None
+
+def generate_frames():
+    # ทุก viewer อ่าน JPEG ล่าสุดชุดเดียวกันจาก pipeline - ไม่มีการ detect/encode ต่อ viewer
+    while True:
+        pipeline = system.pipeline
+        if pipeline is None or not pipeline.running:
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + disconnected_frame() + b'\r\n')
+            time.sleep(0.5)
+            continue
         
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+        for frame in pipeline.stream():
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
 
 @app.route('/')
 def index():
@@ -417,6 +423,11 @@ def attendance_today():
     results = system.get_today_attendance()
     return jsonify(results)
 
+@app.route('/camera_stats')
+def camera_stats():
+    pipeline = system.pipeline
+    return jsonify(pipeline.stats() if pipeline else {'running': False})
+
 @app.route('/current_detection')
 def current_detection():
     # ส่งข้อมูลการจดจำปัจจุบัน
@@ -0,0 +1,122 @@
+"""
+SQLite Connection Pool
+ใช้ connection ร่วมกันทุก module ที่เปิด data/database.db (Database, AuditLogger, BackupManager)
+- ตั้งค่า WAL + synchronous=NORMAL: ผู้อ่านไม่ถูก block โดยผู้เขียน
+- busy_timeout: รอ lock แทนที่จะ error "database is locked" ทันที
+- mmap_size: อ่านหน้า database ผ่าน mmap
+- connection ถูกใช้ซ้ำ ทำให้ prepared statement cache (cached_statements) ได้ผล
+
+conn.close() ของ connection จาก pool คืน connection เข้า pool (code เดิมที่เรียก close() ใช้ได้เลย)
+ใช้ได้ทั้ง thread ปกติและ gevent greenlet (pool เป็นคิว ไม่ผูกกับ thread)
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+
+BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+MAX_IDLE = int(os.environ.get('SQLITE_POOL_SIZE', '16'))
+CACHED_STATEMENTS = 256
+
+
+class PooledConnection(sqlite3.Connection):
+    pool = None
+    idle = False
+
+    def close(self):
+        """คืน connection เข้า pool (ใช้ really_close() เพื่อปิดจริง)"""
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def really_close(self):
+        super().close()
+
+
+class SQLitePool:
+    def __init__(self, path, max_idle=MAX_IDLE, busy_timeout_ms=BUSY_TIMEOUT_MS, mmap_size=MMAP_SIZE):
+        self.path = path
+        self.max_idle = max_idle
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.counters = {'created': 0, 'reused': 0, 'discarded': 0}
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+            factory=PooledConnection
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.pool = self
+        with self._lock:
+            self.counters['created'] += 1
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+        conn.idle = False
+        with self._lock:
+            self.counters['reused'] += 1
+        return conn
+
+    def release(self, conn):
+        if conn.idle:
+            return  # close() ซ้ำ - อยู่ใน pool แล้ว
+        try:
+            # ผู้ใช้ลืม commit - ไม่ส่ง transaction ค้างต่อให้คนถัดไป
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            conn.really_close()
+            return
+        if self._idle.qsize() >= self.max_idle:
+            with self._lock:
+                self.counters['discarded'] += 1
+            conn.really_close()
+        else:
+            conn.idle = True
+            self._idle.put(conn)
+
+    def close_all(self):
+        """ปิดทุก connection ที่ว่างอยู่ (เช่นก่อน restore ไฟล์ database)"""
+        while True:
+            try:
+                self._idle.get_nowait().really_close()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        return dict(self.counters, idle=self._idle.qsize(), path=self.path)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path='data/database.db'):
+    """pool เดียวต่อไฟล์ database (ทุก module ที่เปิดไฟล์เดียวกันได้ pool เดียวกัน)"""
+    key = os.path.abspath(path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SQLitePool(key)
+        return pool
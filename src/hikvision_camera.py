@@ -2,48 +2,51 @@ import cv2
 import requests
 from requests.auth import HTTPDigestAuth
 import numpy as np
+from rtsp_ingest import RtspIngest, rtsp_url
 
 class HikvisionCamera:
-    def __init__(self, ip, username, password, port=80):
+    def __init__(self, ip, username, password, port=80, rtsp_port=554, channel=1, analysis_fps=None):
         self.ip = ip
         self.username = username
         self.password = password
         self.port = port
-        self.rtsp_url = f"rtsp://{username}:{password}@{ip}:554/Streaming/Channels/101"
-        self.cap = None
+        self.channel = channel
+        # main stream (ความละเอียดเต็ม) สำหรับ snapshot, sub-stream สำหรับวิเคราะห์
+        self.rtsp_url = rtsp_url(ip, username, password, channel, 'main', rtsp_port)
+        self.analysis_url = rtsp_url(ip, username, password, channel, 'sub', rtsp_port)
+        kwargs = {} if analysis_fps is None else {'analysis_fps': analysis_fps}
+        self.ingest = RtspIngest(self.analysis_url, name=ip, **kwargs)
+        self._last_seq = 0
         
-    def connect(self):
-        """เชื่อมต่อกล้อง Hikvision"""
-        try:
-            self.cap = cv2.VideoCapture(self.rtsp_url)
-            if self.cap.isOpened():
-                print(f"เชื่อมต่อกล้อง {self.ip} สำเร็จ")
-                return True
-            else:
-                print(f"ไม่สามารถเชื่อมต่อกล้อง {self.ip}")
-                return False
-        except Exception as e:
-            print(f"ข้อผิดพลาด: {e}")
-            return False
+    def connect(self, timeout=10):
+        """เชื่อมต่อกล้อง Hikvision (เชื่อมต่อใหม่อัตโนมัติเมื่อ stream หลุด)"""
+        self.ingest.start()
+        _, frame = self.ingest.latest(timeout=timeout)
+        if frame is not None:
+            print(f"เชื่อมต่อกล้อง {self.ip} สำเร็จ")
+            return True
+        print(f"ไม่สามารถเชื่อมต่อกล้อง {self.ip}: {self.ingest.last_error} (จะลองเชื่อมต่อใหม่ต่อไป)")
+        return False
+    
+    def get_frame(self, timeout=1.0):
+        """เฟรมวิเคราะห์ล่าสุดจาก sub-stream ที่ยังไม่เคยอ่าน (รอไม่เกิน timeout วินาที)"""
+        self._last_seq, frame = self.ingest.latest(self._last_seq, timeout)
+        return frame
     
-    def get_frame(self):
-        """อ่านเฟรมจากกล้อง"""
-        if self.cap and self.cap.isOpened():
-            ret, frame = self.cap.read()
-            if ret:
-                return frame
-        return None
+    def stats(self):
+        """decode fps / จำนวนเฟรมที่ทิ้ง / สถานะการเชื่อมต่อ"""
+        return self.ingest.stats()
     
     def disconnect(self):
         """ตัดการเชื่อมต่อ"""
-        if self.cap:
-            self.cap.release()
+        if self.ingest.running:
+            self.ingest.stop()
             print("ตัดการเชื่อมต่อกล้องแล้ว")
     
     def capture_snapshot(self):
-        """ถ่ายภาพจากกล้อง"""
+        """ถ่ายภาพความละเอียดเต็มจาก main stream"""
         try:
-            url = f"http://{self.ip}:{self.port}/ISAPI/Streaming/channels/101/picture"
+            url = f"http://{self.ip}:{self.port}/ISAPI/Streaming/channels/{self.channel}01/picture"
             response = requests.get(url, auth=HTTPDigestAuth(self.username, self.password), timeout=10)
             
             if response.status_code == 200:
@@ -1,4 +1,5 @@
 import cv2
+from face_detector import detector_registry
 import numpy as np
 import os
 import json
@@ -7,7 +8,7 @@ from datetime import datetime
 
 class StudentCheckInSystem:
     def __init__(self):
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.face_cascade = detector_registry.get()
         self.face_recognizer = cv2.face.LBPHFaceRecognizer_create()
         
         self.students_data = {}
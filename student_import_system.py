@@ -6,16 +6,175 @@ Student Import System
 import pandas as pd
 import os
 import shutil
+import tempfile
 from datetime import datetime
 import zipfile
 
+from job_runner import JobCancelled
+
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', '500'))
+MAX_STUDENT_ID_LENGTH = 50
+MAX_NAME_LENGTH = 255
+
+
+def _clean(series):
+    """แปลงคอลัมน์เป็นข้อความ (ว่างแทน NaN) - รหัสตัวเลขที่ Excel อ่านเป็น float เช่น 1001.0 -> 1001"""
+    text = series.astype('string').fillna('').str.strip()
+    return text.str.replace(r'^(\d+)\.0$', r'\1', regex=True)
+
+
+def iter_chunks(file, filename=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    อ่านไฟล์ Excel/CSV ทีละ chunk เป็น DataFrame (index = เลขแถวในไฟล์ แถวหัวตาราง = 1)
+    Excel อ่านแบบ read_only ด้วย openpyxl จึงไม่ต้องโหลดทั้ง sheet เข้า memory
+    .xls (Excel 97-2003) openpyxl อ่านไม่ได้ - อ่านด้วย pd.read_excel (xlrd) ทั้ง sheet แล้วแบ่ง chunk
+    (รูปแบบนี้มีได้ไม่เกิน 65,536 แถวอยู่แล้ว)
+    """
+    name = (filename or getattr(file, 'filename', None) or str(file)).lower()
+    first_row = 2
+    if name.endswith('.csv'):
+        for chunk in pd.read_csv(file, dtype=str, chunksize=chunk_size, keep_default_na=False):
+            chunk.index = range(first_row, first_row + len(chunk))
+            first_row += len(chunk)
+            yield chunk
+        return
+    if name.endswith('.xls'):
+        df = pd.read_excel(file, dtype=str, engine='xlrd')
+        df.columns = [str(column).strip() for column in df.columns]
+        df.index = range(first_row, first_row + len(df))
+        df = df.dropna(how='all')  # แถวว่าง
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+        return
+    
+    from openpyxl import load_workbook
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(value).strip() if value is not None else '' for value in next(rows, ())]
+        buffer, row_numbers = [], []
+        for row_number, row in enumerate(rows, start=first_row):
+            if all(value is None for value in row):
+                continue  # แถวว่าง
+            buffer.append(row)
+            row_numbers.append(row_number)
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=header, index=row_numbers)
+                buffer, row_numbers = [], []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header, index=row_numbers)
+    finally:
+        workbook.close()
+
+
+def count_rows(file, filename=None):
+    """จำนวนแถวข้อมูลโดยประมาณ (สำหรับแสดงความคืบหน้า) - 0 ถ้าไม่ทราบ"""
+    name = (filename or getattr(file, 'filename', None) or str(file)).lower()
+    if not isinstance(file, str):
+        return 0
+    if name.endswith('.csv'):
+        with open(file, 'rb') as f:
+            return max(0, sum(1 for _ in f) - 1)
+    if name.endswith('.xls'):
+        import xlrd
+        workbook = xlrd.open_workbook(file, on_demand=True)
+        try:
+            return max(0, workbook.sheet_by_index(0).nrows - 1)
+        finally:
+            workbook.release_resources()
+    from openpyxl import load_workbook
+    workbook = load_workbook(file, read_only=True)
+    try:
+        return max(0, (workbook.active.max_row or 1) - 1)
+    finally:
+        workbook.close()
+
+
+def validate_chunk(df, seen_ids):
+    """
+    ตรวจข้อมูลทั้ง chunk แบบ vectorized
+    คืนค่า (students, errors) - students พร้อม upsert, errors = [(row, student_id, message)]
+    seen_ids - รหัสที่พบใน chunk ก่อนหน้า (ตรวจรหัสซ้ำทั้งไฟล์)
+    """
+    ids = _clean(df['student_id'])
+    names = _clean(df['name'])
+    empty = pd.Series('', index=df.index, dtype='string')
+    class_names = _clean(df['class_name']) if 'class_name' in df.columns else empty
+    line_ids = _clean(df['parent_line_id']) if 'parent_line_id' in df.columns else empty
+    
+    reason = pd.Series('', index=df.index, dtype='string')
+    checks = [
+        ((ids == '') | (names == ''), 'ข้อมูลไม่ครบ'),
+        (ids.str.len() > MAX_STUDENT_ID_LENGTH, f'รหัสนักเรียนยาวเกิน {MAX_STUDENT_ID_LENGTH} ตัวอักษร'),
+        (names.str.len() > MAX_NAME_LENGTH, f'ชื่อยาวเกิน {MAX_NAME_LENGTH} ตัวอักษร'),
+        (ids.duplicated() | ids.isin(seen_ids), 'รหัสนักเรียนซ้ำในไฟล์'),
+    ]
+    for mask, message in checks:
+        reason = reason.mask(mask.fillna(False) & (reason == ''), message)
+    
+    ok = reason == ''
+    seen_ids.update(ids[ok])
+    errors = [(int(row), student_id, message)
+              for row, student_id, message in zip(df.index[~ok], ids[~ok], reason[~ok])]
+    students = [
+        {'student_id': student_id, 'name': name, 'class_name': class_name, 'parent_line_token': line_id}
+        for student_id, name, class_name, line_id in zip(ids[ok], names[ok], class_names[ok], line_ids[ok])
+    ]
+    return students, errors
+
+
 class StudentImportSystem:
     def __init__(self, db):
         self.db = db
     
-    def import_from_excel(self, excel_file, school_id):
+    def bulk_import(self, file, school_id, filename=None, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+        """
+        นำเข้าแบบ streaming: อ่านทีละ chunk -> ตรวจแบบ vectorized -> upsert ทั้ง chunk ใน transaction เดียว
+        progress(done, total, counts) ถูกเรียกหลังแต่ละ chunk (ใช้กับ job_runner)
+        """
+        total = count_rows(file, filename)
+        counts = {'inserted': 0, 'updated': 0, 'errors': 0}
+        errors = []
+        seen_ids = set()
+        done = 0
+        
+        for chunk in iter_chunks(file, filename, chunk_size):
+            if done == 0:
+                missing = [col for col in ('student_id', 'name') if col not in chunk.columns]
+                if missing:
+                    return {'success': False, 'message': f'ไม่พบคอลัมน์ {missing[0]} ในไฟล์ Excel'}
+            
+            students, chunk_errors = validate_chunk(chunk, seen_ids)
+            result = self.db.upsert_students(school_id, students)
+            conflicts = set(result['conflicts'])
+            if conflicts:
+                chunk_errors += [(row, student_id, 'รหัสนักเรียนนี้เป็นของโรงเรียนอื่น')
+                                 for row, student_id in zip(chunk.index, _clean(chunk['student_id']))
+                                 if student_id in conflicts]
+            
+            counts['inserted'] += result['inserted']
+            counts['updated'] += result['updated']
+            counts['errors'] += len(chunk_errors)
+            errors.extend(f"แถว {row} ({student_id}): {message}" if student_id else f"แถว {row}: {message}"
+                          for row, student_id, message in sorted(chunk_errors))
+            done += len(chunk)
+            if progress:
+                progress(done, max(total, done), counts)
+        
+        imported = counts['inserted'] + counts['updated']
+        return {
+            'success': True,
+            'imported': imported,
+            'inserted': counts['inserted'],
+            'updated': counts['updated'],
+            'total': done,
+            'errors': errors,
+            'message': f'นำเข้าสำเร็จ {imported}/{done} คน'
+        }
+    
+    def import_from_excel(self, excel_file, school_id, progress=None):
         """
-        นำเข้าข้อมูลจาก Excel
+        นำเข้าข้อมูลจาก Excel (หรือ CSV)
         
         คอลัมน์ที่ต้องมี:
         - student_id: รหัสนักเรียน (บังคับ)
@@ -27,70 +186,16 @@ class StudentImportSystem:
         - image_filename: ชื่อไฟล์รูปภาพ (ถ้ามี)
         """
         try:
-            # อ่าน Excel
-            df = pd.read_excel(excel_file)
-            
-            # ตรวจสอบคอลัมน์ที่จำเป็น
-            required_columns = ['student_id', 'name']
-            for col in required_columns:
-                if col not in df.columns:
-                    return {
-                        'success': False,
-                        'message': f'ไม่พบคอลัมน์ {col} ในไฟล์ Excel'
-                    }
-            
-            # นำเข้าข้อมูล
-            imported = 0
-            errors = []
-            
-            for index, row in df.iterrows():
-                try:
-                    student_id = str(row['student_id']).strip()
-                    name = str(row['name']).strip()
-                    
-                    if not student_id or not name:
-                        errors.append(f"แถว {index+2}: ข้อมูลไม่ครบ")
-                        continue
-                    
-                    # เตรียมข้อมูล
-                    class_name = str(row.get('class_name', '')).strip()
-                    parent_name = str(row.get('parent_name', '')).strip()
-                    parent_phone = str(row.get('parent_phone', '')).strip()
-                    parent_line_id = str(row.get('parent_line_id', '')).strip()
-                    
-                    # เพิ่มนักเรียน
-                    self.db.add_student(
-                        student_id=student_id,
-                        name=name,
-                        class_name=class_name,
-                        school_id=school_id,
-                        image_path=None
-                    )
-                    
-                    # เพิ่มข้อมูลผู้ปกครอง (ถ้ามี)
-                    if parent_line_id:
-                        self.db.update_student_line_token(student_id, parent_line_id)
-                    
-                    imported += 1
-                
-                except Exception as e:
-                    errors.append(f"แถว {index+2}: {str(e)}")
-            
-            return {
-                'success': True,
-                'imported': imported,
-                'total': len(df),
-                'errors': errors,
-                'message': f'นำเข้าสำเร็จ {imported}/{len(df)} คน'
-            }
-        
+            return self.bulk_import(excel_file, school_id, progress=progress)
+        except JobCancelled:
+            raise  # ให้ job จบเป็น cancelled ไม่ใช่ failed
         except Exception as e:
             return {
                 'success': False,
                 'message': f'เกิดข้อผิดพลาด: {str(e)}'
             }
     
-    def import_with_images(self, excel_file, images_zip, school_id):
+    def import_with_images(self, excel_file, images_zip, school_id, enroll_faces=True, progress=None):
         """
         นำเข้าข้อมูลพร้อมรูปภาพ
         
@@ -98,17 +203,18 @@ class StudentImportSystem:
             excel_file: ไฟล์ Excel ข้อมูลนักเรียน
             images_zip: ไฟล์ ZIP ที่มีรูปภาพ (ชื่อไฟล์ = student_id.jpg)
             school_id: รหัสโรงเรียน
+            enroll_faces: encode ใบหน้าของรูปที่จับคู่ได้เข้า AI model (ขนานทุก core)
+            progress: progress(done, total, stats) ระหว่างนำเข้าข้อมูลและ encode ใบหน้า
         """
+        # แตกไฟล์ ZIP (แยกโฟลเดอร์ต่องาน - หลายโรงเรียนนำเข้าพร้อมกันได้)
+        os.makedirs('data', exist_ok=True)
+        temp_dir = tempfile.mkdtemp(prefix='temp_images_', dir='data')
         try:
-            # แตกไฟล์ ZIP
-            temp_dir = 'data/temp_images'
-            os.makedirs(temp_dir, exist_ok=True)
-            
             with zipfile.ZipFile(images_zip, 'r') as zip_ref:
                 zip_ref.extractall(temp_dir)
             
             # นำเข้าข้อมูลจาก Excel
-            result = self.import_from_excel(excel_file, school_id)
+            result = self.import_from_excel(excel_file, school_id, progress=progress)
             
             if not result['success']:
                 return result
@@ -116,6 +222,8 @@ class StudentImportSystem:
             # จับคู่รูปภาพกับนักเรียน
             students = self.db.get_students(school_id)
             matched = 0
+            matched_students = []
+            image_paths = {}
             
             for student in students:
                 student_id = student['student_id']
@@ -133,35 +241,50 @@ class StudentImportSystem:
                         os.makedirs('data/students', exist_ok=True)
                         shutil.copy(temp_image, final_path)
                         
-                        # อัพเดท database
-                        self.db.update_student(
-                            student_id=student_id,
-                            name=student['name'],
-                            class_name=student.get('class_name', ''),
-                            school_id=school_id,
-                            image_path=final_path
-                        )
-                        
+                        image_paths[student_id] = final_path
                         matched += 1
+                        matched_students.append(dict(student, image_path=final_path, school_id=school_id))
                         image_found = True
                         break
                 
                 if not image_found:
                     print(f"⚠️ ไม่พบรูปภาพ: {student_id}")
             
-            # ลบไฟล์ชั่วคราว
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            # อัพเดท image_path ทั้งหมดใน transaction เดียว
+            self.db.set_student_images(school_id, image_paths)
             
             result['images_matched'] = matched
             result['message'] += f' | จับคู่รูปภาพ {matched} คน'
             
+            if enroll_faces and matched_students:
+                stats = self.enroll_faces(matched_students, progress)
+                if stats:
+                    result['faces_enrolled'] = stats['trained']
+                    result['face_stats'] = stats
+                    result['message'] += f" | ลงทะเบียนใบหน้า {stats['trained']} คน"
+            
             return result
         
+        except JobCancelled:
+            raise
         except Exception as e:
             return {
                 'success': False,
                 'message': f'เกิดข้อผิดพลาด: {str(e)}'
             }
+        finally:
+            # ลบไฟล์ชั่วคราว (รวมถึงกรณีนำเข้าไม่สำเร็จ/ถูกยกเลิก)
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def enroll_faces(self, students, progress=None):
+        """encode ใบหน้าของนักเรียนที่นำเข้าแบบขนาน แล้วเพิ่มเข้า AI face gallery"""
+        try:
+            from ai_face_recognition import ai_face
+        except ImportError as e:
+            print(f"⚠️ ข้ามการลงทะเบียนใบหน้า: {str(e)}")
+            return None
+        
+        return ai_face.enroll(students, progress=progress)
     
     def create_template_excel(self):
         """สร้าง Template Excel สำหรับนำเข้าข้อมูล"""
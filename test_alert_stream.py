@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test incremental alertStream parser (multipart + XML, buffer จำกัดขนาด)
+"""
+
+import random
+
+from alert_stream import AlertStreamParser, boundary_from_content_type, parse_face_event
+from benchmark_alert_stream import HEARTBEAT, part, synthetic_capture
+
+
+def feed_in_chunks(parser, data, sizes):
+    events = []
+    position = 0
+    while position < len(data):
+        size = next(sizes)
+        events += parser.feed(data[position:position + size])
+        position += size
+    return events
+
+
+def test_every_event_is_extracted_regardless_of_chunking():
+    data = synthetic_capture(events=60, image_size=3000)
+    boundary = boundary_from_content_type('multipart/mixed; boundary=boundary')
+    rng = random.Random(7)
+
+    for sizes in (iter(lambda: 1, None), iter(lambda: rng.randint(1, 5000), None), iter(lambda: len(data), None)):
+        parser = AlertStreamParser(boundary)
+        events = feed_in_chunks(parser, data, sizes)
+        faces = [parse_face_event(event) for event in events]
+
+        assert len(events) == 62 and parser.stats()['parts_skipped'] == 60
+        assert [face['student_id'] for face in faces if face] == [f'STD{i:04d}' for i in range(60)]
+        assert faces[0]['name'] == 'นักเรียน 0' and faces[0]['confidence'] == 0.8
+        assert parser.stats()['buffered'] < 100
+
+
+def test_broken_event_does_not_drop_the_following_events():
+    broken = b'<?xml version="1.0"?><EventNotificationAlert><eventType>faceDetection</eventTyp></EventNotificationAlert>'
+    good = ('<EventNotificationAlert><eventType>faceDetection</eventType>'
+            '<TargetID>STD001</TargetID><name>สมชาย</name></EventNotificationAlert>').encode('utf-8')
+
+    # ไม่มี multipart: XML ต่อกันหลาย event ใน chunk เดียว
+    events = AlertStreamParser().feed(broken + b'\r\n' + good + b'\r\n' + HEARTBEAT.encode('utf-8'))
+    assert len(events) == 3
+    assert parse_face_event(events[0]) is None
+    assert parse_face_event(events[1])['student_id'] == 'STD001'
+    assert parse_face_event(events[2]) is None
+
+    # part ที่ไม่มี Content-Length
+    no_length = b'--boundary\r\nContent-Type: application/xml\r\n\r\n' + good + b'\r\n'
+    truncated = b'--boundary\r\nContent-Type: application/xml\r\n\r\n<EventNotificationAlert><eventType>fa\r\n'
+    parser = AlertStreamParser('boundary')
+    assert parser.feed(no_length + truncated + part('application/xml', good)) == [good, good]
+
+
+def test_buffer_is_bounded_and_stream_resyncs_after_garbage():
+    good = part('application/xml', b'<EventNotificationAlert><eventType>videoloss</eventType></EventNotificationAlert>')
+    parser = AlertStreamParser('boundary', max_buffer=4096)
+
+    garbage = b'--boundary\r\nContent-Type: application/xml\r\n\r\n<EventNotificationAlert>' + b'x' * 10000
+    assert parser.feed(garbage[:5000]) == []
+    assert parser.feed(garbage[5000:]) == []
+    assert parser.stats()['buffered'] <= 4096 and parser.stats()['resyncs'] >= 1
+
+    assert len(parser.feed(good + good)) == 2
+    assert parser.stats()['events'] == 2
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test ANN Index (IVF)
+"""
+
+import numpy as np
+
+from ann_index import IVFIndex
+
+
+def _clustered(n=3000, dim=128, clusters=40):
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    return (centers[labels] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def test_small_index_is_exact():
+    features = _clustered(n=200)
+    index = IVFIndex(128, min_train_size=1000)
+    index.build(list(range(200)), features)
+
+    assert index.nlist == 0
+    ids, distances = index.search(features[[5, 9]] + 0.01, k=1)
+    assert [row[0] for row in ids] == [5, 9]
+
+
+def test_ivf_recall_and_exact_rerank():
+    features = _clustered()
+    index = IVFIndex(128, nprobe=8, min_train_size=1000)
+    index.build(list(range(len(features))), features)
+    queries = features[:100] + 0.05
+
+    ids, distances = index.search(queries, k=1)
+    brute = [int(np.argmin(np.linalg.norm(features - q, axis=1))) for q in queries]
+    recall = np.mean([row[0] == expected for row, expected in zip(ids, brute)])
+    assert index.nlist > 1
+    assert recall >= 0.95
+
+    # ระยะทางที่คืนมาเป็นค่า exact ของ candidate ที่เลือก
+    for query, row, dist in zip(queries, ids, distances):
+        assert np.isclose(dist[0], np.linalg.norm(features[row[0]] - query), atol=1e-4)
+
+    # nprobe = nlist เท่ากับค้นทั้งหมด
+    ids, _ = index.search(queries, k=1, nprobe=index.nlist)
+    assert [row[0] for row in ids] == brute
+
+
+def test_add_update_remove_without_rebuild():
+    features = _clustered()
+    index = IVFIndex(128, min_train_size=1000, rebuild_ratio=0.5)
+    index.build(list(range(len(features))), features)
+    nlist = index.nlist
+
+    index.remove(0)
+    assert 0 not in index
+    ids, _ = index.search(features[0], k=1, nprobe=nlist)
+    assert ids[0][0] != 0
+
+    new_vector = features[1] + 0.001
+    index.add('NEW', new_vector)
+    index.add(2, features[3])  # อัพเดท encoding ของ id เดิม
+    assert len(index) == len(features)
+    ids, _ = index.search(np.vstack([new_vector, features[3]]), k=2, nprobe=nlist)
+    assert ids[0][0] == 'NEW'
+    assert set(ids[1]) == {2, 3}
+    assert index.nlist == nlist
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test attendance query API (SQLite backend)
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('dotenv')
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    import database_universal
+    database = database_universal.Database()
+
+    conn = database.get_connection()
+    base = datetime(2026, 1, 10, 7, 0)
+    for i in range(3000):
+        conn.execute(
+            'INSERT INTO attendance (student_id, student_name, school_id, camera_type, timestamp) VALUES (?, ?, ?, ?, ?)',
+            (f'STD{i % 50:03d}', 'Test', 'SCH001', ('gate_in', 'gate_out', 'classroom')[i % 3],
+             (base + timedelta(minutes=i)).isoformat())
+        )
+    conn.commit()
+    database.close_connection(conn)
+    return database
+
+
+def test_date_range_is_not_capped(database):
+    from database_universal import day_range
+
+    start, end = day_range('2026-01-11')
+    rows = database.query_attendance('SCH001', start, end, limit=None)
+    assert len(rows) == 1440
+    assert all(row['timestamp'].startswith('2026-01-11') for row in rows)
+    assert len(database.get_attendance('SCH001', '2026-01-11')) == 1440
+    assert database.count_attendance('SCH001', start, end, group_by='camera_type') == {
+        'gate_in': 480, 'gate_out': 480, 'classroom': 480}
+
+
+def test_student_filter_and_keyset_pages(database):
+    assert database.count_attendance('SCH001', student_id='STD001') == 60
+
+    seen, cursor = [], None
+    while True:
+        page = database.query_attendance('SCH001', camera_types=('gate_in', 'gate_out'), limit=500,
+                                         before=database.decode_cursor(cursor) if cursor else None)
+        seen.extend(row['id'] for row in page)
+        if len(page) < 500:
+            break
+        cursor = database.encode_cursor(page[-1])
+
+    assert len(seen) == len(set(seen)) == 2000
+    assert seen == sorted(seen, reverse=True)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test attendance write-behind queue (batch, retry, spool recovery)
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+
+import pytest
+
+from attendance_queue import AttendanceQueue, Spool
+
+
+class Writer:
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+        self.lock = threading.Lock()
+
+    def __call__(self, events):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError('database is locked')
+            self.batches.append(list(events))
+
+
+def test_events_are_grouped_into_batches_by_size_and_time():
+    writer = Writer()
+    queue = AttendanceQueue(writer, max_batch=50, flush_interval=0.05, spool_dir=None)
+    for i in range(120):
+        assert queue.put(f'STD{i:03d}', 'Test', 'SCH001', 'gate_in') is True
+    assert queue.flush(5)
+
+    assert sum(len(batch) for batch in writer.batches) == 120
+    assert all(len(batch) <= 50 for batch in writer.batches)
+    assert len(writer.batches) <= 4
+    ids = [event['student_id'] for batch in writer.batches for event in batch]
+    assert ids == [f'STD{i:03d}' for i in range(120)]
+
+    stamped = datetime(2026, 1, 10, 7, 30)
+    queue.put('STD999', 'Test', 'SCH001', timestamp=stamped)
+    assert queue.flush(5)
+    assert writer.batches[-1][0]['timestamp'] == stamped.isoformat()
+    assert queue.stats()['written'] == 121 and queue.stats()['pending'] == 0
+    queue.close()
+
+
+def test_failed_batches_are_retried_without_losing_events():
+    writer = Writer(failures=1)
+    queue = AttendanceQueue(writer, max_batch=10, flush_interval=0.01, spool_dir=None)
+    for i in range(5):
+        queue.put(f'STD{i}', 'Test', 'SCH001')
+    assert queue.flush(5)
+    assert [event['student_id'] for event in writer.batches[0]] == [f'STD{i}' for i in range(5)]
+    assert queue.stats()['failures'] == 1
+    queue.close()
+
+
+def test_spool_of_dead_process_is_replayed_once(tmp_path):
+    # process pid 999999 ตายหลังเขียน batch แรก (seq 1-2) ได้ แต่ seq 3-4 ยังไม่ถูกเขียน
+    orphan = tmp_path / 'attendance-999999.log'
+    lines = [{'seq': seq, 'event': {'student_id': f'STD{seq}', 'student_name': 'Test', 'school_id': 'SCH001',
+                                    'camera_type': 'gate_in', 'timestamp': '2026-01-10T07:00:00'}}
+             for seq in (1, 2)]
+    lines.append({'committed': 2})
+    lines += [{'seq': seq, 'event': dict(lines[0]['event'], student_id=f'STD{seq}')} for seq in (3, 4)]
+    orphan.write_text('\n'.join(json.dumps(line) for line in lines) + '\n{"seq": 5, "ev', encoding='utf-8')
+
+    writer = Writer()
+    queue = AttendanceQueue(writer, max_batch=10, flush_interval=0.01, spool_dir=str(tmp_path))
+    queue.put('STD9', 'Test', 'SCH001')
+    assert queue.flush(5)
+    assert [event['student_id'] for batch in writer.batches for event in batch] == ['STD3', 'STD4', 'STD9']
+    assert queue.stats()['recovered'] == 2
+    assert not orphan.exists()
+    assert Spool.read_pending(queue.spool.path) == []  # เขียนครบแล้ว spool ว่าง
+    queue.close()
+
+
+def test_spool_of_previous_run_with_same_pid_is_replayed(tmp_path):
+    # container restart: process ใหม่ได้ pid เดิม - ไฟล์เก่าชื่อเดียวกับไฟล์ของ process นี้
+    event = {'student_id': 'STD1', 'student_name': 'Test', 'school_id': 'SCH001',
+             'camera_type': 'gate_in', 'timestamp': '2026-01-10T07:00:00'}
+    (tmp_path / f'attendance-{os.getpid()}.log').write_text(json.dumps({'seq': 1, 'event': event}) + '\n',
+                                                            encoding='utf-8')
+
+    writer = Writer()
+    queue = AttendanceQueue(writer, max_batch=10, flush_interval=0.01, spool_dir=str(tmp_path))
+    queue.put('STD2', 'Test', 'SCH001')
+    assert queue.flush(5)
+    assert [event['student_id'] for batch in writer.batches for event in batch] == ['STD1', 'STD2']
+    assert queue.stats()['recovered'] == 1
+    queue.close()
+
+
+def test_bad_row_is_moved_to_dead_letter_without_blocking_others(tmp_path):
+    written = []
+
+    def write_batch(events):
+        if any(event['student_id'] == 'BAD' for event in events):
+            raise ValueError('value too long for type character varying(20)')
+        written.extend(event['student_id'] for event in events)
+
+    dead_letter = tmp_path / 'dead.jsonl'
+    queue = AttendanceQueue(write_batch, max_batch=10, flush_interval=0.01, spool_dir=str(tmp_path / 'spool'),
+                            max_attempts=1, dead_letter_path=str(dead_letter))
+    for student_id in ('STD1', 'STD2', 'BAD', 'STD3', 'STD4'):
+        queue.put(student_id, 'Test', 'SCH001')
+    assert queue.flush(5)
+
+    assert written == ['STD1', 'STD2', 'STD3', 'STD4']
+    entries = [json.loads(line) for line in dead_letter.read_text(encoding='utf-8').splitlines()]
+    assert [entry['event']['student_id'] for entry in entries] == ['BAD']
+    stats = queue.stats()
+    assert stats['written'] == 4 and stats['dead_letter'] == 1 and stats['pending'] == 0
+    assert Spool.read_pending(queue.spool.path) == []
+    queue.close()
+
+
+def test_add_attendance_batch_single_transaction(tmp_path, monkeypatch):
+    pytest.importorskip('dotenv')
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    import database_universal
+
+    database = database_universal.Database()
+    written = []
+    database.on_write(lambda table, school_id: written.append((table, school_id)))
+    database.enqueue_attendance('STD001', 'Test', 'SCH001', 'gate_in')
+    database.enqueue_attendance('STD002', 'Test', 'SCH002', 'gate_out')
+    assert database.attendance_queue.flush(5)
+
+    assert database.count_attendance('SCH001') == 1 and database.count_attendance('SCH002') == 1
+    assert sorted(written) == [('attendance', 'SCH001'), ('attendance', 'SCH002')]
+    database.attendance_queue.close()
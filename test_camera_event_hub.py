@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test asyncio camera event hub (alertStream หลายกล้อง, reconnect, sink จำกัดขนาด)
+"""
+
+import asyncio
+import hashlib
+from urllib.request import parse_http_list, parse_keqv_list
+
+import camera_event_hub
+from camera_event_hub import CameraEventHub, EventSink, camera_direction, load_cameras
+from benchmark_alert_stream import part
+
+FACE = ('<EventNotificationAlert xmlns="http://www.hikvision.com/ver20/XMLSchema"><eventType>faceDetection</eventType>'
+        '<TargetID>{student_id}</TargetID><name>{name}</name><similarity>90</similarity></EventNotificationAlert>')
+
+
+def face_part(student_id, name='นักเรียน'):
+    return part('application/xml', FACE.format(student_id=student_id, name=name).encode('utf-8'))
+
+
+def camera(key, school_id, port=80, camera_type='gate_in'):
+    return {'key': key, 'camera_id': 1, 'school_id': school_id, 'name': key, 'ip': '127.0.0.1', 'port': port,
+            'username': 'admin', 'password': 'secret', 'camera_type': camera_type}
+
+
+async def wait_until(condition, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError('timed out')
+
+
+def test_load_cameras_tags_direction_and_includes_legacy_school_camera():
+    class FakeDatabase:
+        def get_cameras(self, school_id=None):
+            return [{'id': 7, 'school_id': 'SCH001', 'name': 'ประตูหลัง', 'ip': '10.0.0.7', 'port': '8000',
+                     'username': 'admin', 'password': 'x', 'type': 'gate_out'}]
+
+        def get_all_schools(self):
+            return [{'school_id': 'SCH001', 'name': 'A'},
+                    {'school_id': 'SCH002', 'name': 'B', 'camera_ip': '10.0.0.9', 'camera_user': 'op'}]
+
+    cameras = load_cameras(FakeDatabase())
+    assert cameras['camera:7']['camera_type'] == 'gate_out' and cameras['camera:7']['port'] == 8000
+    assert cameras['school:SCH002']['camera_type'] == 'gate_in' and cameras['school:SCH002']['username'] == 'op'
+    assert [camera_direction(t) for t in ('gate_in', 'exit', 'ประตูออก', None)] == [
+        'gate_in', 'gate_out', 'gate_out', 'gate_in']
+
+
+def test_hub_reads_digest_protected_chunked_stream_and_tags_events():
+    async def scenario():
+        async def serve(reader, writer):
+            head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+            authorization = next((line.split(':', 1)[1].strip() for line in head.split('\r\n')
+                                  if line.lower().startswith('authorization:')), None)
+            if authorization is None:
+                writer.write(b'HTTP/1.1 401 Unauthorized\r\nWWW-Authenticate: Digest realm="cam", '
+                             b'nonce="abc", qop="auth"\r\nContent-Length: 0\r\n\r\n')
+                await writer.drain()
+                writer.close()
+                return
+            params = parse_keqv_list(parse_http_list(authorization[len('Digest '):]))
+            md5 = lambda value: hashlib.md5(value.encode()).hexdigest()
+            expected = md5(f"{md5('admin:cam:secret')}:abc:{params['nc']}:{params['cnonce']}:auth:"
+                           f"{md5('GET:' + camera_event_hub.ALERT_STREAM_PATH)}")
+            assert params['response'] == expected
+
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: multipart/mixed; boundary=boundary\r\n'
+                         b'Transfer-Encoding: chunked\r\n\r\n')
+            body = face_part('STD001') + part('image/jpeg', b'\xff\xd8' * 500) + face_part('STD001') + face_part('STD002')
+            for start in range(0, len(body), 300):
+                piece = body[start:start + 300]
+                writer.write(b'%x\r\n' % len(piece) + piece + b'\r\n')
+                await writer.drain()
+            await asyncio.sleep(10)
+
+        server = await asyncio.start_server(serve, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        recorded = []
+        seen = set()
+
+        def accept(event):
+            key = (event['school_id'], event['student_id'])
+            if key in seen:
+                return False
+            seen.add(key)
+            return True
+
+        hub = CameraEventHub(lambda: {'gate': camera('gate', 'SCH001', port, 'gate_out')},
+                             [EventSink('attendance', recorded.append, workers=1, block=True)], accept=accept)
+        task = asyncio.create_task(hub.run())
+        await wait_until(lambda: len(recorded) == 2)
+
+        assert [(e['school_id'], e['student_id'], e['camera_type']) for e in recorded] == [
+            ('SCH001', 'STD001', 'gate_out'), ('SCH001', 'STD002', 'gate_out')]
+        stats = hub.stats()
+        assert stats['events'] == 3 and stats['suppressed'] == 1
+        assert stats['cameras']['gate']['status'] == 'online'
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        server.close()
+
+    asyncio.run(scenario())
+
+
+def test_reconnects_with_backoff_and_slow_sink_does_not_block_other_cameras():
+    async def scenario():
+        attempts = {'flaky': 0}
+
+        async def open_stream(cam):
+            if cam['key'] == 'flaky':
+                attempts['flaky'] += 1
+                if attempts['flaky'] < 3:
+                    raise ConnectionError('connection refused')
+
+            async def chunks():
+                for index in range(5):
+                    yield face_part(f"{cam['key']}-{index}")
+                await asyncio.sleep(10)
+            return 'boundary', chunks()
+
+        release = asyncio.Event()
+        stored = []
+
+        async def slow_line(event):
+            await release.wait()
+
+        hub = CameraEventHub(lambda: {'flaky': camera('flaky', 'SCH001'), 'steady': camera('steady', 'SCH002')},
+                             [EventSink('attendance', stored.append, workers=1, block=True),
+                              EventSink('line', slow_line, workers=1, maxsize=2)],
+                             open_stream=open_stream, backoff=(0.01, 0.05))
+        task = asyncio.create_task(hub.run())
+        await wait_until(lambda: len(stored) == 10)
+
+        stats = hub.stats()
+        assert stats['cameras']['flaky']['reconnects'] == 2 and stats['cameras']['flaky']['status'] == 'online'
+        assert {e['school_id'] for e in stored} == {'SCH001', 'SCH002'}
+        assert stats['sinks']['line']['queued'] == 2 and stats['sinks']['line']['dropped'] >= 7
+        release.set()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
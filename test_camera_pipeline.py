@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test Camera Pipeline (capture / process / broadcast)
+"""
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+from camera_pipeline import CameraPipeline, FrameBroadcaster, put_latest
+
+
+class FakeCapture:
+    def __init__(self):
+        self.count = 0
+
+    def read(self):
+        time.sleep(0.001)
+        self.count += 1
+        return True, np.full((4, 4), self.count, dtype=np.int64)
+
+    def release(self):
+        pass
+
+
+def test_put_latest_drops_stale_items():
+    q = queue.Queue(maxsize=1)
+    assert put_latest(q, 1) is False
+    assert put_latest(q, 2) is True
+    assert q.get_nowait() == 2
+
+
+def test_encodes_once_for_all_viewers_and_drops_stale_frames():
+    encoded = []
+
+    def process(frame):
+        time.sleep(0.01)  # recognition ช้ากว่ากล้อง
+        frame[0, 0] = -1  # วาดทับเฟรม
+        return frame
+
+    def encode(frame):
+        encoded.append(int(frame[1, 1]))
+        return b'jpeg%d' % frame[1, 1]
+
+    pipeline = CameraPipeline(FakeCapture, process, encode)
+    pipeline.start()
+    received = [[], []]
+
+    def viewer(out):
+        for jpeg in pipeline.stream():
+            out.append(jpeg)
+            if len(out) >= 5:
+                break
+
+    threads = [threading.Thread(target=viewer, args=(out,)) for out in received]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    pipeline.stop()
+
+    stats = pipeline.stats()
+    assert all(len(out) == 5 for out in received)
+    assert stats['processed'] == len(encoded)      # encode ครั้งเดียวต่อเฟรม ไม่ขึ้นกับจำนวน viewer
+    assert stats['dropped'] > 0                    # เฟรมที่ process ไม่ทันถูกทิ้ง
+    assert stats['captured'] > stats['processed']
+    assert pipeline.latest_frame()[0, 0] != -1     # เฟรมดิบไม่ถูกวาดทับ
+
+
+def test_slow_viewer_skips_to_latest():
+    broadcaster = FrameBroadcaster()
+    stream = broadcaster.stream(timeout=0.1)
+    broadcaster.publish(b'1')
+    assert next(stream) == b'1'
+    broadcaster.publish(b'2')
+    broadcaster.publish(b'3')
+    assert next(stream) == b'3'
+    broadcaster.close()
+    assert list(stream) == []
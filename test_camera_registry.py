@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test camera registry (cache connection, circuit breaker, คิวงานเมื่อกล้องออฟไลน์)
+"""
+
+import time
+
+from camera_registry import CameraRegistry, CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeDevice:
+    def __init__(self, camera):
+        self.ip = camera['ip']
+        self.online = True
+        self.probes = 0
+        self.faces = {}
+        self.calls = []
+        self.reject = set()
+
+    def test_connection(self):
+        self.probes += 1
+        return self.online
+
+    def add_face(self, student_id, name):
+        self.calls.append(('add', student_id))
+        if not self.online:
+            raise ConnectionError('timeout')
+        if student_id in self.reject:
+            return {'success': False, 'message': 'รูปไม่มีใบหน้า'}
+        self.faces[student_id] = name
+        return {'success': True, 'message': 'ok'}
+
+    def delete_face(self, student_id):
+        self.calls.append(('delete', student_id))
+        if not self.online:
+            raise ConnectionError('timeout')
+        self.faces.pop(student_id, None)
+        return {'success': True, 'message': 'ok'}
+
+
+def camera(ip, school_id='SCH001'):
+    return {'key': ip, 'school_id': school_id, 'name': ip, 'ip': ip, 'port': 80,
+            'username': 'admin', 'password': 'x', 'camera_type': 'gate_in'}
+
+
+def make_registry(cameras, clock, loads=None):
+    def cameras_fn(school_id):
+        if loads is not None:
+            loads.append(school_id)
+        return [c for c in cameras if c['school_id'] == school_id]
+
+    devices = {}
+
+    def factory(cam):
+        devices[cam['ip']] = FakeDevice(cam)
+        return devices[cam['ip']]
+
+    registry = CameraRegistry(cameras_fn, factory, probe_interval=0, config_ttl=60, workers=2, clock=clock,
+                              breaker_factory=lambda: CircuitBreaker(2, 10, 40, clock=clock))
+    return registry, devices
+
+
+def settle(registry, futures=()):
+    """รอ probe / คิวงานเบื้องหลังของทุกกล้องเสร็จ"""
+    for future in futures:
+        future.result(timeout=5)
+    for _ in range(500):
+        if all(entry.status != 'unknown' and not entry.draining for entry in registry._entries.values()):
+            return
+        time.sleep(0.01)
+    raise AssertionError('timed out')
+
+
+def test_breaker_opens_after_failures_and_backs_off():
+    clock = FakeClock()
+    breaker = CircuitBreaker(2, 10, 40, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+
+    clock.now += 10
+    assert breaker.state == 'half_open'
+    breaker.record_failure()
+    assert breaker.state == 'open' and breaker.timeout == 20
+    clock.now += 20
+    breaker.record_failure()
+    clock.now += 40
+    breaker.record_failure()
+    assert breaker.timeout == 40
+
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.failures == 0 and breaker.timeout == 10
+
+
+def test_config_and_connection_cached_and_offline_camera_skipped_without_network():
+    clock = FakeClock()
+    loads = []
+    registry, devices = make_registry([camera('10.0.0.1'), camera('10.0.0.2')], clock, loads)
+    try:
+        registry.entries('SCH001')
+        settle(registry)
+        assert registry.get('SCH001') is devices['10.0.0.1']
+        assert registry.get('SCH001') is devices['10.0.0.1'] and loads == ['SCH001']
+
+        devices['10.0.0.1'].online = False
+        settle(registry, registry.probe_due())
+        settle(registry, registry.probe_due())
+        probes = devices['10.0.0.1'].probes
+        assert registry.get('SCH001') is devices['10.0.0.2']
+        assert registry.devices('SCH001') == [devices['10.0.0.2']]
+        # breaker เปิด: probe รอบถัดไปข้ามกล้องนี้จนถึงเวลาลองใหม่
+        settle(registry, registry.probe_due())
+        assert devices['10.0.0.1'].probes == probes
+
+        clock.now += 10
+        devices['10.0.0.1'].online = True
+        settle(registry, registry.probe_due())
+        assert registry.stats('SCH001')[0]['status'] == 'online'
+
+        clock.now += 61
+        registry.get('SCH001')
+        registry.invalidate('SCH001')
+        registry.get('SCH001')
+        assert loads == ['SCH001'] * 3 and len(devices) == 2
+    finally:
+        registry.close()
+
+
+def test_operations_queue_while_offline_and_replay_latest_per_student():
+    clock = FakeClock()
+    registry, devices = make_registry([camera('10.0.0.1')], clock)
+    try:
+        registry.entries('SCH001')
+        settle(registry)
+        device = devices['10.0.0.1']
+        device.online = False
+
+        registry.submit('SCH001', 'STD001', 'add_face', lambda d: d.add_face('STD001', 'ก'))
+        settle(registry)
+        assert registry.stats('SCH001')[0]['status'] == 'offline'
+
+        # กล้องออฟไลน์: ไม่ติดต่อกล้อง งานรอในคิว (key เดียวกันเหลืองานล่าสุด)
+        registry.submit('SCH001', 'STD002', 'add_face', lambda d: d.add_face('STD002', 'ข'))
+        registry.submit('SCH001', 'STD001', 'delete_face', lambda d: d.delete_face('STD001'))
+        settle(registry)
+        assert device.calls == [('add', 'STD001')]
+        assert registry.stats('SCH001')[0]['pending'] == 2
+
+        device.online = True
+        settle(registry, registry.probe_due())
+        settle(registry)
+        assert device.calls[1:] == [('add', 'STD002'), ('delete', 'STD001')]
+        stats = registry.stats('SCH001')[0]
+        assert stats['pending'] == 0 and stats['done'] == 2 and device.faces == {'STD002': 'ข'}
+    finally:
+        registry.close()
+
+
+def test_rejected_operation_is_dropped_without_marking_camera_offline():
+    clock = FakeClock()
+    registry, devices = make_registry([camera('10.0.0.1')], clock)
+    try:
+        registry.entries('SCH001')
+        settle(registry)
+        device = devices['10.0.0.1']
+        device.reject.add('STD009')
+
+        registry.submit('SCH001', 'STD009', 'add_face', lambda d: d.add_face('STD009', 'ค'))
+        registry.submit('SCH001', 'STD010', 'add_face', lambda d: d.add_face('STD010', 'ง'))
+        settle(registry)
+
+        stats = registry.stats('SCH001')[0]
+        assert stats['status'] == 'online' and stats['breaker'] == 'closed'
+        assert (stats['pending'], stats['done'], stats['failed']) == (0, 1, 1)
+        assert stats['last_error'] == 'รูปไม่มีใบหน้า' and device.faces == {'STD010': 'ง'}
+    finally:
+        registry.close()
+
+
+def test_password_change_rebuilds_connection_and_resets_breaker():
+    clock = FakeClock()
+    cameras = [camera('10.0.0.1')]
+    registry, devices = make_registry(cameras, clock)
+    try:
+        registry.entries('SCH001')
+        settle(registry)
+        old = devices['10.0.0.1']
+        old.online = False  # รหัสผ่านเดิมใช้ไม่ได้แล้ว
+        settle(registry, registry.probe_due())
+        settle(registry, registry.probe_due())
+        registry.submit('SCH001', 'STD001', 'add_face', lambda d: d.add_face('STD001', 'ก'))
+        assert registry.stats('SCH001')[0]['breaker'] == 'open'
+
+        cameras[0] = dict(cameras[0], password='new-secret')
+        registry.invalidate('SCH001')
+        registry.entries('SCH001')
+        settle(registry)
+
+        device = devices['10.0.0.1']
+        assert device is not old and registry.get('SCH001') is device
+        stats = registry.stats('SCH001')[0]
+        assert stats['breaker'] == 'closed' and stats['status'] == 'online'
+        # งานที่ค้างไว้ตอนออฟไลน์ทำด้วย connection ใหม่
+        assert device.faces == {'STD001': 'ก'} and stats['pending'] == 0
+    finally:
+        registry.close()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test dashboard stats cache (TTL + invalidation) และ aggregate query ของ Database
+"""
+
+import threading
+import time
+
+import pytest
+
+from dashboard_stats import DashboardStats, TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.listeners = []
+        self.calls = 0
+
+    def on_write(self, listener):
+        self.listeners.append(listener)
+
+    def add_attendance(self, school_id):
+        for listener in self.listeners:
+            listener('attendance', school_id)
+
+    def dashboard_counts(self, school_id, start, end):
+        self.calls += 1
+        return {'total_students': 4, 'today_attendance': self.calls, 'behavior_alerts': 0, 'unread_notifications': 0}
+
+
+def test_school_stats_are_cached_until_ttl_or_write():
+    clock = Clock()
+    db = FakeDatabase()
+    stats = DashboardStats(db, school_ttl=10, clock=clock)
+
+    assert stats.school_stats('SCH001')['attendance_rate'] == 25.0
+    assert stats.school_stats('SCH001')['today_attendance'] == 1
+    assert stats.school_stats('SCH002')['today_attendance'] == 2
+    assert db.calls == 2
+
+    db.add_attendance('SCH001')  # ล้างเฉพาะโรงเรียนที่ถูกเขียน
+    assert stats.school_stats('SCH001')['today_attendance'] == 3
+    assert stats.school_stats('SCH002')['today_attendance'] == 2
+
+    clock.now = 11
+    assert stats.school_stats('SCH002')['today_attendance'] == 4
+    assert stats.stats()['schools']['hits'] == 2
+
+
+def test_concurrent_misses_share_one_load_and_stale_loads_are_dropped():
+    cache = TTLCache(ttl=60)
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def slow_loader():
+        loads.append(1)
+        started.set()
+        release.wait(5)
+        return len(loads)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('SCH001', slow_loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    cache.invalidate('SCH001')  # มีการเขียนระหว่างกำลังโหลด
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [1] * 8 and len(loads) == 1
+    assert cache.get('SCH001', lambda: 'fresh') == 'fresh'
+
+
+def test_dashboard_counts_single_query(tmp_path, monkeypatch):
+    pytest.importorskip('dotenv')
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    import database_universal
+    from datetime import datetime, timedelta
+
+    database = database_universal.Database()
+    stats = DashboardStats(database)
+    for i in range(3):
+        database.add_student(f'STD{i}', 'Test', 'M1', 'SCH001', '')
+    assert stats.school_stats('SCH001')['today_attendance'] == 0
+
+    database.add_attendance('STD0', 'Test', 'SCH001', 'gate_in')
+    database.add_attendance('STD0', 'Test', 'SCH001', 'gate_out')
+    database.add_behavior('STD1', 'Test', 'SCH001', 'sad', 'warning')
+    counts = stats.school_stats('SCH001')
+    assert counts == {'total_students': 3, 'today_attendance': 1, 'behavior_alerts': 1,
+                      'unread_notifications': 0, 'attendance_rate': 33.3}
+
+    realtime = stats.realtime_status('SCH001')
+    assert [row['camera_type'] for row in realtime['recent_attendance']] == ['gate_out', 'gate_in']
+    assert [row['severity'] for row in realtime['alerts']] == ['warning']
+
+    tomorrow = datetime.now() + timedelta(days=1)
+    assert database.dashboard_counts('SCH001', tomorrow, tomorrow + timedelta(days=1))['today_attendance'] == 0
+    assert stats.platform_stats()['total_students'] >= 3
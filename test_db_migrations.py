@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test Database Migrations + dashboard query plans (SQLite)
+"""
+
+import sqlite3
+
+from db_migrations import MigrationRunner, explain_dashboard, MIGRATIONS
+
+
+def _connect(path):
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE attendance (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id TEXT NOT NULL, student_name TEXT,
+                                 school_id TEXT, camera_type TEXT, timestamp TEXT, status TEXT DEFAULT 'present');
+        CREATE TABLE behavior (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id TEXT NOT NULL, student_name TEXT,
+                               school_id TEXT, behavior TEXT, severity TEXT, timestamp TEXT);
+        CREATE TABLE notifications (id INTEGER PRIMARY KEY AUTOINCREMENT, school_id TEXT, student_id TEXT, type TEXT,
+                                    title TEXT, message TEXT, timestamp TEXT, read INTEGER DEFAULT 0);
+    ''')
+    return conn
+
+
+def test_migrations_apply_once_and_record_version(tmp_path):
+    path = str(tmp_path / 'test.db')
+    conn = _connect(path)
+    runner = MigrationRunner('sqlite')
+
+    assert runner.current_version(conn) == 0
+    assert runner.run(conn) == [m[0] for m in MIGRATIONS]
+    assert runner.current_version(conn) == runner.latest_version
+
+    # worker ที่สองเห็นว่ารันแล้ว
+    other = sqlite3.connect(path)
+    assert MigrationRunner('sqlite').run(other) == []
+
+
+def test_dashboard_queries_have_no_full_scans(tmp_path):
+    conn = _connect(str(tmp_path / 'test.db'))
+    before = explain_dashboard(conn, 'sqlite')
+    assert any(result['full_scans'] for result in before)
+
+    MigrationRunner('sqlite').run(conn)
+    after = explain_dashboard(conn, 'sqlite')
+    assert [result['name'] for result in after if result['full_scans']] == []
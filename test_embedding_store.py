@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test embedding store (mmap segments per school)
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStore, EmbeddingStoreError, FORMAT_VERSION, StaleSegmentError
+
+
+def test_write_and_mmap_segment(tmp_path):
+    store = EmbeddingStore(str(tmp_path), 4)
+    matrix = np.arange(12, dtype=np.float32).reshape(3, 4)
+    store.write_segment('SCH001', ['A', 'B', 'C'], matrix)
+
+    ids, loaded = store.read_segment('SCH001')
+
+    assert ids == ['A', 'B', 'C']
+    assert isinstance(loaded, np.memmap)
+    assert np.array_equal(loaded, matrix)
+    assert store.schools() == ['SCH001']
+
+
+def test_rewrite_bumps_generation_and_removes_old_files(tmp_path):
+    store = EmbeddingStore(str(tmp_path), 2)
+    store.write_segment('SCH001', ['A'], np.ones((1, 2)))
+    store.write_segment('SCH001', ['A', 'B'], np.ones((2, 2)))
+
+    info = store.segment_info('SCH001')
+    assert info['generation'] == 2
+    assert sorted(os.listdir(tmp_path)) == ['.lock', 'SCH001.2.ids.json', 'SCH001.2.npy', 'manifest.json']
+
+
+def test_gallery_is_zero_copy_until_modified(tmp_path):
+    store = EmbeddingStore(str(tmp_path), 3)
+    store.write_segment('SCH002', ['X', 'Y'], np.eye(2, 3))
+
+    gallery = store.load_gallery('SCH002')
+    assert isinstance(gallery.matrix, np.memmap)
+    ids, _ = gallery.search([0, 1, 0], k=1)
+    assert ids == [['Y']]
+
+    gallery.upsert('Z', [0, 0, 1])
+    assert not isinstance(gallery.matrix, np.memmap)
+    store.save_gallery('SCH002', gallery)
+    assert store.read_segment('SCH002')[0] == ['X', 'Y', 'Z']
+
+
+def test_save_from_older_generation_is_refused(tmp_path):
+    worker_a = EmbeddingStore(str(tmp_path), 2)
+    worker_b = EmbeddingStore(str(tmp_path), 2)
+    assert worker_a.generations() == {}
+    assert worker_a.write_segment('SCH001', ['A'], np.ones((1, 2)), expected_generation=0) == 1
+
+    gallery_a, generation_a = worker_a.load_gallery_versioned('SCH001')
+    gallery_b, generation_b = worker_b.load_gallery_versioned('SCH001')
+    gallery_b.upsert('B', np.zeros(2))
+    assert worker_b.save_gallery('SCH001', gallery_b, expected_generation=generation_b) == 2
+
+    # worker A เห็นว่า segment เปลี่ยน และเขียน gallery เก่าทับไม่ได้
+    assert worker_a.generations() == {'SCH001': 2}
+    gallery_a.remove('A')
+    with pytest.raises(StaleSegmentError):
+        worker_a.save_gallery('SCH001', gallery_a, expected_generation=generation_a)
+    assert worker_a.read_segment('SCH001')[0] == ['A', 'B']
+
+
+def test_rejects_other_version(tmp_path):
+    store = EmbeddingStore(str(tmp_path), 2)
+    store.write_segment('SCH001', [], np.zeros((0, 2)))
+    manifest = json.loads((tmp_path / 'manifest.json').read_text())
+    manifest['format_version'] = FORMAT_VERSION + 1
+    (tmp_path / 'manifest.json').write_text(json.dumps(manifest))
+
+    with pytest.raises(EmbeddingStoreError):
+        store.schools()
+
+
+def _write_many(root, school_id, rounds):
+    store = EmbeddingStore(root, 4)
+    for index in range(rounds):
+        store.write_segment(school_id, [f'{school_id}-{index}'], np.full((1, 4), index, dtype=np.float32))
+
+
+def test_concurrent_writers_in_separate_processes_keep_every_segment(tmp_path):
+    # gunicorn หลาย worker บันทึกคนละโรงเรียนพร้อมกัน - manifest ต้องไม่ทับกันจนชี้ไปไฟล์ที่ถูกลบ
+    context = __import__('multiprocessing').get_context('fork')
+    schools = [f'SCH{i:03d}' for i in range(4)]
+    processes = [context.Process(target=_write_many, args=(str(tmp_path), school_id, 30)) for school_id in schools]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    store = EmbeddingStore(str(tmp_path), 4)
+    assert sorted(store.schools()) == schools
+    for school_id in schools:
+        ids, matrix = store.read_segment(school_id)
+        assert ids == [f'{school_id}-29'] and matrix[0, 0] == 29
+        assert store.segment_info(school_id)['generation'] == 30
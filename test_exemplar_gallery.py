@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test Exemplar Gallery (centroid + exemplar search)
+"""
+
+import numpy as np
+
+from exemplar_gallery import ExemplarGallery
+
+
+def _students(n=100, per_student=4, dim=128):
+    rng = np.random.default_rng(2)
+    centers = rng.normal(size=(n, dim)).astype(np.float32)
+    samples = centers[:, None, :] + 0.2 * rng.normal(size=(n, per_student, dim)).astype(np.float32)
+    return centers, samples
+
+
+def test_keeps_last_exemplars_and_centroid():
+    gallery = ExemplarGallery(4, max_exemplars=2)
+    for value in (1.0, 2.0, 3.0):
+        gallery.add('STD001', np.full(4, value))
+
+    assert gallery.total_exemplars == 2
+    assert [e[0] for e in gallery.encodings('STD001')] == [2.0, 3.0]
+    assert np.allclose(gallery.centroids.get('STD001'), 2.5)
+
+    assert gallery.remove('STD001')
+    assert len(gallery) == 0 and gallery.total_exemplars == 0
+
+
+def test_two_stage_search_matches_exhaustive():
+    _, samples = _students()
+    gallery = ExemplarGallery(128, max_exemplars=5, candidates=5)
+    for i, encodings in enumerate(samples):
+        for encoding in encodings:
+            gallery.add(f'STD{i:03d}', encoding)
+
+    rng = np.random.default_rng(3)
+    for i in range(0, 100, 7):
+        query = samples[i, 0] + 0.05 * rng.normal(size=128).astype(np.float32)
+        expected_dist = np.linalg.norm(samples.reshape(-1, 128) - query, axis=1)
+        expected = f'STD{int(np.argmin(expected_dist)) // 4:03d}'
+
+        student_id, distance = gallery.search(query, k=1)[0]
+        assert student_id == expected
+        assert np.isclose(distance, expected_dist.min(), atol=1e-4)
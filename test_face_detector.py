@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test face detector registry (cascade pool ใช้ร่วมกันหลาย thread)
+"""
+
+import sys
+import threading
+import time
+import types
+
+from face_detector import FaceDetectorRegistry
+
+
+class FakeClassifier:
+    created = []
+
+    def __init__(self, path):
+        self.path = path
+        self.in_use = threading.Lock()
+        self.threads = set()
+        self.shared = 0  # จำนวนครั้งที่ถูกใช้พร้อมกันสอง thread
+        FakeClassifier.created.append(self)
+
+    def empty(self):
+        return False
+
+    def detectMultiScale(self, image, *args, **kwargs):
+        if not self.in_use.acquire(blocking=False):
+            self.shared += 1
+            return []
+        try:
+            self.threads.add(threading.get_ident())
+            time.sleep(0.005)
+            return [(0, 0, len(image), len(image))]
+        finally:
+            self.in_use.release()
+
+
+def _fake_cv2(monkeypatch):
+    FakeClassifier.created = []
+    cv2 = types.SimpleNamespace(CascadeClassifier=FakeClassifier,
+                                data=types.SimpleNamespace(haarcascades='/cascades/'))
+    monkeypatch.setitem(sys.modules, 'cv2', cv2)
+
+
+def test_threads_borrow_separate_classifiers_within_pool_size(monkeypatch):
+    _fake_cv2(monkeypatch)
+    registry = FaceDetectorRegistry(pool_size=3)
+    pools, results, errors = [], [], []
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            pool = registry.get()
+            pools.append(pool)
+            for _ in range(20):
+                with pool.acquire() as classifier:
+                    with lock:
+                        active[0] += 1
+                        peak[0] = max(peak[0], active[0])
+                    results.append(classifier.detectMultiScale([0] * 4, 1.3, 5))
+                    with lock:
+                        active[0] -= 1
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert not errors and len(results) == 8 * 20
+    # โหลด cascade ครั้งเดียว: pool เดียว classifier เท่ากับ pool size
+    assert all(pool is pools[0] for pool in pools)
+    assert len(FakeClassifier.created) == 3
+    assert {c.path for c in FakeClassifier.created} == {'/cascades/haarcascade_frontalface_default.xml'}
+    # ไม่มี classifier ใดถูกสอง thread ใช้พร้อมกัน และใช้พร้อมกันได้ไม่เกิน pool size
+    assert sum(c.shared for c in FakeClassifier.created) == 0
+    assert 1 < peak[0] <= 3
+    assert sum(len(c.threads) for c in FakeClassifier.created) > 3
+
+
+def test_detect_returns_classifier_to_pool(monkeypatch):
+    _fake_cv2(monkeypatch)
+    registry = FaceDetectorRegistry(pool_size=2)
+
+    assert registry.detect([0, 0], 1.3, 5) == [(0, 0, 2, 2)]
+    registry.warm_up()
+
+    pool = registry.get()
+    assert pool._pool.qsize() == 2 and len(FakeClassifier.created) == 2
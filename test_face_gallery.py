@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test Face Gallery (batched matcher)
+"""
+
+import numpy as np
+
+from face_gallery import FaceGallery
+
+
+def _gallery(n=50, dim=16):
+    rng = np.random.default_rng(0)
+    features = rng.random((n, dim)).astype(np.float32)
+    gallery = FaceGallery(dim, initial_capacity=2)
+    for i, feature in enumerate(features):
+        gallery.upsert(f'STD{i:03d}', feature)
+    return gallery, features
+
+
+def test_batched_search_matches_bruteforce():
+    gallery, features = _gallery()
+    queries = features[[3, 7, 11]] + 0.01
+
+    ids, distances = gallery.search(queries, k=3)
+
+    for query, query_ids, query_dist in zip(queries, ids, distances):
+        brute = np.linalg.norm(features - query, axis=1)
+        expected = [f'STD{i:03d}' for i in np.argsort(brute)[:3]]
+        assert query_ids == expected
+        assert np.allclose(query_dist, np.sort(brute)[:3], atol=1e-3)
+
+
+def test_upsert_overwrites_row_in_place():
+    gallery, features = _gallery()
+    gallery.upsert('STD007', features[3])
+
+    assert len(gallery) == 50
+    ids, distances = gallery.search(features[3], k=2)
+    assert set(ids[0]) == {'STD003', 'STD007'}
+    assert np.allclose(distances[0], 0, atol=1e-3)
+
+
+def test_remove_swaps_last_row():
+    gallery, features = _gallery()
+
+    assert gallery.remove('STD003')
+    assert not gallery.remove('STD003')
+    assert 'STD003' not in gallery
+    assert len(gallery) == 49
+
+    ids, _ = gallery.search(features[49], k=1)
+    assert ids[0] == ['STD049']
+
+
+def test_empty_gallery():
+    gallery = FaceGallery(8)
+    ids, distances = gallery.search(np.zeros((2, 8)), k=1)
+    assert ids == [[], []]
+    assert distances.shape == (2, 0)
+
+
+def test_l1_metric_matches_absdiff_sum():
+    gallery, features = _gallery(n=300)
+    query = features[123] + 0.5
+
+    ids, distances = gallery.search(query, k=1, metric='l1')
+
+    brute = np.abs(features - query).sum(axis=1)
+    assert ids[0] == [f'STD{int(np.argmin(brute)):03d}']
+    assert np.isclose(distances[0][0], brute.min(), rtol=1e-4)
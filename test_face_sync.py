@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test face sync engine (diff กับกล้อง, checkpoint ทำต่อ, concurrency ต่อกล้อง)
+"""
+
+import threading
+import time
+
+import pytest
+
+from face_sync import FaceSyncEngine
+
+
+class FakeDevice:
+    def __init__(self, ip, faces=None, delay=0.0, list_fails=False):
+        self.ip = ip
+        self.port = 80
+        self.faces = dict(faces or {})
+        self.delay = delay
+        self.list_fails = list_fails
+        self.pushed = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def get_face_list(self):
+        if self.list_fails:
+            return {'success': False, 'message': 'timeout'}
+        return {'success': True, 'faces': [{'id': face_id, 'name': name} for face_id, name in self.faces.items()]}
+
+    def add_face(self, student_id, name, image_path, replace=False):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+            self.faces[student_id] = name
+            self.pushed.append((student_id, replace))
+        return {'success': True, 'message': 'ok'}
+
+
+def make_students(tmp_path, count):
+    students = []
+    for index in range(count):
+        path = tmp_path / f'STD{index:03d}.jpg'
+        path.write_bytes(b'jpeg' * (index + 1))
+        students.append({'student_id': f'STD{index:03d}', 'name': f'นักเรียน {index}', 'image_path': str(path)})
+    return students
+
+
+def test_only_missing_or_changed_faces_are_pushed(tmp_path):
+    students = make_students(tmp_path, 6)
+    device = FakeDevice('10.0.0.1', faces={'STD000': 'นักเรียน 0', 'STD001': 'ชื่อเก่า'})
+    engine = FaceSyncEngine(checkpoint_dir=str(tmp_path / 'checkpoints'), per_device=2)
+
+    result = engine.sync([device], students)
+    assert (result['success'], result['skipped'], result['total']) == (5, 1, 6)
+    assert sorted(device.pushed) == [('STD001', True)] + [(f'STD{i:03d}', False) for i in range(2, 6)]
+
+    device.pushed.clear()
+    assert engine.sync([device], students)['skipped'] == 6 and device.pushed == []
+
+    # เปลี่ยนรูป: ชื่อในกล้องตรง แต่ fingerprint ไม่ตรงกับ checkpoint
+    (tmp_path / 'STD003.jpg').write_bytes(b'new face')
+    assert engine.sync([device], students)['success'] == 1
+    assert device.pushed == [('STD003', True)]
+
+
+def test_interrupted_sync_resumes_from_checkpoint(tmp_path):
+    students = make_students(tmp_path, 20)
+    engine = FaceSyncEngine(checkpoint_dir=str(tmp_path / 'checkpoints'), per_device=1)
+
+    class Cancelled(Exception):
+        pass
+
+    def cancel_after_five(done, total, counts):
+        if counts['success'] >= 5:
+            raise Cancelled()
+
+    device = FakeDevice('10.0.0.1', list_fails=True)
+    with pytest.raises(Cancelled):
+        engine.sync([device], students, progress=cancel_after_five)
+    first_run = len(device.pushed)
+    assert 5 <= first_run < 20
+
+    # กล้องไม่ตอบรายการใบหน้า - ใช้ checkpoint อย่างเดียว
+    resumed = FakeDevice('10.0.0.1', list_fails=True)
+    result = engine.sync([resumed], students)
+    assert result['skipped'] == first_run and len(resumed.pushed) == 20 - first_run
+
+
+def test_devices_sync_in_parallel_with_bounded_concurrency_per_device(tmp_path):
+    students = make_students(tmp_path, 12)
+    devices = [FakeDevice(f'10.0.0.{i}', delay=0.02) for i in range(1, 4)]
+    engine = FaceSyncEngine(checkpoint_dir=str(tmp_path / 'checkpoints'), per_device=2, max_devices=3)
+    progress = []
+
+    start = time.monotonic()
+    result = engine.sync(devices, students, progress=lambda done, total, counts: progress.append((done, total)))
+    elapsed = time.monotonic() - start
+
+    assert result['success'] == 36 and set(result['devices']) == {f'10.0.0.{i}:80' for i in range(1, 4)}
+    assert all(device.max_in_flight == 2 for device in devices)
+    assert progress[-1] == (36, 36)
+    # ทีละคนจะใช้ 36 x 0.02 = 0.72 วินาที
+    assert elapsed < 0.5
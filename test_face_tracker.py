@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test Face Tracker (frame skipping + track identity)
+"""
+
+from face_tracker import FaceTracker, iou
+
+
+def test_iou():
+    assert iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert iou((0, 0, 10, 10), (20, 20, 10, 10)) == 0.0
+
+
+def test_detects_every_n_frames_and_reuses_confirmed_identity():
+    tracker = FaceTracker(detect_every=5, confirm_hits=2)
+    detect_calls, recognize_calls = [], []
+
+    def detect():
+        detect_calls.append(tracker.frame_count)
+        x = 100 + tracker.frame_count  # ใบหน้าเลื่อนช้าๆ
+        return [(x, 50, 80, 80)]
+
+    def recognize(box):
+        recognize_calls.append(box)
+        return 7, 90.0
+
+    confirmed = []
+    for _ in range(30):
+        tracks = tracker.step(detect, recognize)
+        assert len(tracks) == 1
+        confirmed.extend(t.id for t in tracks if t.just_confirmed)
+
+    assert detect_calls == [0, 5, 10, 15, 20, 25]
+    assert len(recognize_calls) == 2          # หยุด predict หลังยืนยันตัวตน
+    assert confirmed == [tracks[0].id]        # check-in ได้ครั้งเดียว
+    assert tracks[0].label == 7 and tracks[0].box[0] == 125
+
+
+def test_lost_track_forces_detection_and_is_dropped():
+    tracker = FaceTracker(detect_every=10, max_missed=1)
+    frames = [[(0, 0, 50, 50)], [], [], []]
+    calls = []
+
+    def detect():
+        calls.append(tracker.frame_count)
+        return frames[len(calls) - 1] if len(calls) <= len(frames) else []
+
+    tracker.step(detect, lambda box: (None, 0))
+    for _ in range(9):
+        tracker.step(detect, lambda box: (None, 0))
+    tracks = tracker.step(detect, lambda box: (None, 0))   # เฟรม 10: หลุด
+    assert tracks == []
+    tracker.step(detect, lambda box: (None, 0))            # เฟรม 11: detect ซ้ำทันที
+    assert calls == [0, 10, 11]
+    assert tracker.tracks == []
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test gate debounce (memory + store กลางข้าม worker)
+"""
+
+import sqlite3
+
+from db_migrations import MigrationRunner
+from gate_debounce import GateDebouncer
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_repeated_events_are_suppressed_within_window():
+    clock = Clock()
+    debouncer = GateDebouncer(window=60, clock=clock)
+
+    assert debouncer.should_record('SCH001', 'STD001', 'gate_in')
+    clock.now += 5
+    assert not debouncer.should_record('SCH001', 'STD001', 'gate_in')
+    assert debouncer.should_record('SCH001', 'STD001', 'gate_out')
+    assert debouncer.should_record('SCH002', 'STD001', 'gate_in')
+
+    clock.now += 60
+    assert debouncer.should_record('SCH001', 'STD001', 'gate_in')
+    assert debouncer.stats()['suppressed'] == 1 and debouncer.stats()['accepted'] == 4
+
+
+def test_workers_share_claims_through_gate_debounce_table(tmp_path):
+    # claim SQL เดียวกับ Database.claim_gate_event
+    path = str(tmp_path / 'test.db')
+    setup = sqlite3.connect(path)
+    setup.executescript('''
+        CREATE TABLE attendance (id INTEGER PRIMARY KEY, school_id TEXT, student_id TEXT, camera_type TEXT, timestamp TEXT);
+        CREATE TABLE behavior (id INTEGER PRIMARY KEY, school_id TEXT, student_id TEXT, severity TEXT, timestamp TEXT);
+        CREATE TABLE notifications (id INTEGER PRIMARY KEY, school_id TEXT, read INTEGER, timestamp TEXT);
+    ''')
+    MigrationRunner('sqlite').run(setup)
+
+    def claim(school_id, student_id, camera_type, window, now):
+        conn = sqlite3.connect(path)
+        cursor = conn.execute('''
+            INSERT INTO gate_debounce (school_id, student_id, camera_type, last_seen) VALUES (?, ?, ?, ?)
+            ON CONFLICT (school_id, student_id, camera_type)
+            DO UPDATE SET last_seen = excluded.last_seen WHERE gate_debounce.last_seen <= ?
+        ''', (school_id, student_id, camera_type, now, now - window))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount == 1
+
+    clock = Clock()
+    worker_a = GateDebouncer(claim, window=60, clock=clock)
+    worker_b = GateDebouncer(claim, window=60, clock=clock)
+
+    assert worker_a.should_record('SCH001', 'STD001', 'gate_in')
+    clock.now += 2
+    assert not worker_b.should_record('SCH001', 'STD001', 'gate_in')
+    assert worker_b.stats()['shared_suppressed'] == 1
+
+    clock.now += 61
+    assert worker_b.should_record('SCH001', 'STD001', 'gate_in')
+    assert not worker_a.should_record('SCH001', 'STD001', 'gate_in')
+
+
+def test_store_errors_fall_back_to_local_decision():
+    def broken(*args):
+        raise RuntimeError('database is locked')
+
+    debouncer = GateDebouncer(broken, window=60, clock=Clock())
+    assert debouncer.should_record('SCH001', 'STD001', 'gate_in')
+    assert not debouncer.should_record('SCH001', 'STD001', 'gate_in')
+    assert debouncer.stats()['store_errors'] == 1
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test incremental training (content hash + mtime)
+"""
+
+import os
+
+import pytest
+
+from incremental_training import train_incremental
+from job_runner import JobCancelled
+
+
+def _student(tmp_path, student_id, content=b'face'):
+    path = tmp_path / f'{student_id}.jpg'
+    path.write_bytes(content)
+    return {'student_id': student_id, 'name': student_id, 'image_path': str(path)}
+
+
+def _train(students, gallery, sources):
+    encoded = []
+
+    def encode(student):
+        encoded.append(student['student_id'])
+        return open(student['image_path'], 'rb').read()
+
+    stats, new_sources = train_incremental(
+        students, list(gallery), sources, encode,
+        gallery.__setitem__, gallery.pop
+    )
+    return stats, new_sources, encoded
+
+
+def test_only_new_or_changed_images_are_encoded(tmp_path):
+    students = [_student(tmp_path, 'STD001'), _student(tmp_path, 'STD002')]
+    gallery = {}
+
+    stats, sources, encoded = _train(students, gallery, {})
+    assert encoded == ['STD001', 'STD002']
+    assert stats['added'] == 2
+
+    stats, sources, encoded = _train(students, gallery, sources)
+    assert encoded == []
+    assert stats['unchanged'] == 2
+
+    # แก้รูป STD002 + เพิ่ม STD003
+    with open(students[1]['image_path'], 'wb') as f:
+        f.write(b'new face')
+    students.append(_student(tmp_path, 'STD003'))
+    stats, sources, encoded = _train(students, gallery, sources)
+    assert encoded == ['STD002', 'STD003']
+    assert (stats['updated'], stats['added'], stats['unchanged']) == (1, 1, 1)
+    assert gallery['STD002'] == b'new face'
+
+
+def test_touched_but_identical_image_is_not_encoded(tmp_path):
+    students = [_student(tmp_path, 'STD001')]
+    gallery = {}
+    _, sources, _ = _train(students, gallery, {})
+
+    os.utime(students[0]['image_path'], (1, 1))
+    stats, sources, encoded = _train(students, gallery, sources)
+
+    assert encoded == []
+    assert sources['STD001']['mtime'] == 1
+
+
+def test_removed_students_are_dropped(tmp_path):
+    students = [_student(tmp_path, 'STD001'), _student(tmp_path, 'STD002')]
+    gallery = {}
+    _, sources, _ = _train(students, gallery, {})
+
+    stats, sources, _ = _train(students[:1], gallery, sources)
+
+    assert stats['removed'] == 1
+    assert list(gallery) == ['STD001']
+    assert list(sources) == ['STD001']
+
+
+def test_cancellation_from_progress_is_not_counted_as_failure(tmp_path):
+    students = [_student(tmp_path, 'STD001'), _student(tmp_path, 'STD002')]
+    gallery = {}
+    _, sources, _ = _train(students, gallery, {})
+    errors = []
+
+    def cancel(done, total, stats):
+        raise JobCancelled('job cancelled')
+
+    # รูปไม่เปลี่ยน: progress ถูกเรียกจากรอบแรก
+    with pytest.raises(JobCancelled):
+        train_incremental(students, list(gallery), sources, None, gallery.__setitem__, gallery.pop,
+                          progress=cancel, on_error=lambda student, e: errors.append(e))
+    assert errors == []
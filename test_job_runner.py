@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test background job runner (SQLite job store, dedup ข้าม worker, ยกเลิกงาน)
+"""
+
+import threading
+import time
+
+from job_runner import JobRunner, JobStore
+
+
+def wait_for(runner, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = runner.get(job_id)
+        if not job.active:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def test_result_and_progress_are_visible_from_another_worker(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    runner = JobRunner(max_workers=1, store=JobStore(path))
+    other_worker = JobRunner(store=JobStore(path))
+
+    def work(job, total):
+        for index in range(1, total + 1):
+            job.progress(index, total, {'ok': index})
+        return {'imported': total}
+
+    job = runner.submit('student_import', work, 3, key='student_import:SCH001', school_id='SCH001')
+    wait_for(runner, job.id)
+
+    loaded = other_worker.get(job.id)
+    assert loaded.status == 'done' and loaded.result == {'imported': 3}
+    assert (loaded.done, loaded.total, loaded.counts) == (3, 3, {'ok': 3})
+    assert [j.id for j in other_worker.list('SCH001')] == [job.id]
+    assert other_worker.list('SCH002') == []
+
+
+def test_active_key_is_deduplicated_across_workers(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    runner = JobRunner(store=JobStore(path))
+    other_worker = JobRunner(store=JobStore(path))
+    release = threading.Event()
+
+    first = runner.submit('face_train', lambda job: release.wait(5), key='face_train:SCH001', school_id='SCH001')
+    second = other_worker.submit('face_train', lambda job: None, key='face_train:SCH001', school_id='SCH001')
+    assert second.id == first.id
+
+    release.set()
+    wait_for(runner, first.id)
+    third = other_worker.submit('face_train', lambda job: None, key='face_train:SCH001', school_id='SCH001')
+    assert third.id != first.id
+
+
+def test_cancel_from_another_worker_stops_running_job(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    runner = JobRunner(max_workers=1, store=JobStore(path))
+    other_worker = JobRunner(store=JobStore(path))
+    started = threading.Event()
+
+    def work(job):
+        started.set()
+        for index in range(500):
+            job.progress(index, 500)
+            time.sleep(0.01)
+        return 'finished'
+
+    job = runner.submit('camera_sync', work, key='camera_sync:SCH001')
+    queued = runner.submit('backup', lambda job: 'ran', key='backup')
+    assert started.wait(5)
+
+    assert other_worker.cancel(queued.id)
+    assert other_worker.cancel(job.id)
+    assert wait_for(runner, job.id).status == 'cancelled'
+    assert wait_for(runner, queued.id).status == 'cancelled' and queued.result is None
+    assert not other_worker.cancel(job.id)
+
+
+def test_jobs_of_dead_worker_are_marked_failed(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    runner = JobRunner(store=store)
+    release = threading.Event()
+    job = runner.submit('backup', lambda job: release.wait(5), key='backup')
+
+    conn = store.pool.acquire()
+    conn.execute('UPDATE jobs SET owner_pid = ? WHERE id = ?', (2 ** 22 + 1, job.id))
+    conn.commit()
+    conn.close()
+
+    other_worker = JobRunner(store=store)
+    lost = other_worker.get(job.id)
+    assert lost.status == 'failed' and 'exited' in lost.error
+    assert other_worker.submit('backup', lambda job: None, key='backup').id != job.id
+    release.set()
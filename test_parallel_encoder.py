@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test parallel (process pool) face encoder
+"""
+
+import numpy as np
+
+from parallel_encoder import ParallelEncoder
+
+
+def fake_encode(image_path):
+    if image_path.endswith('bad.jpg'):
+        raise ValueError('cannot decode')
+    if image_path.endswith('noface.jpg'):
+        return None
+    return np.full(4, len(image_path), dtype=np.float32)
+
+
+def _students(n):
+    students = [{'student_id': f'STD{i:03d}', 'image_path': f'data/STD{i:03d}.jpg'} for i in range(n)]
+    students.append({'student_id': 'BAD', 'image_path': 'data/bad.jpg'})
+    students.append({'student_id': 'NOFACE', 'image_path': 'data/noface.jpg'})
+    return students
+
+
+def test_streams_every_result_with_per_image_errors():
+    encoder = ParallelEncoder(fake_encode, max_workers=2, max_pending=3)
+
+    results = {student['student_id']: (feature, error) for student, feature, error in encoder.encode(_students(10))}
+
+    assert len(results) == 12
+    assert isinstance(results['BAD'][1], ValueError)
+    assert results['NOFACE'] == (None, None)
+    assert np.array_equal(results['STD003'][0], np.full(4, len('data/STD003.jpg')))
+
+
+def test_single_worker_runs_inline():
+    encoder = ParallelEncoder(fake_encode, max_workers=1)
+    results = list(encoder.encode(_students(2)))
+    assert [student['student_id'] for student, _, _ in results] == ['STD000', 'STD001', 'BAD', 'NOFACE']
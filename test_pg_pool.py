@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test PostgreSQL connection pool (ใช้ connection ปลอม ไม่ต้องมี PostgreSQL)
+"""
+
+import gc
+import time
+
+import pytest
+
+from pg_pool import PgPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise RuntimeError('server closed the connection unexpectedly')
+        self.conn.executed.append(sql)
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.rollbacks = 0
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.broken:
+            raise RuntimeError('connection already closed')
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_pool(clock=None, **kwargs):
+    clock = clock or Clock()
+    created = []
+
+    def connect():
+        created.append(FakeConnection())
+        return created[-1]
+
+    kwargs.setdefault('checkout_timeout', 0.05)
+    return PgPool(connect, clock=clock, **kwargs), created, clock
+
+
+def test_lazy_creation_reuse_and_timeout():
+    pool, created, _ = make_pool(clock=time.monotonic, max_size=2)
+    assert created == []
+
+    first = pool.getconn()
+    pool.putconn(first)
+    assert first.rollbacks == 1
+    assert pool.getconn() is first
+    second = pool.getconn()
+    assert len(created) == 2
+
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+
+    pool.putconn(second)
+    pool.putconn(second)  # คืนซ้ำไม่ทำให้อยู่ใน pool สองครั้ง
+    stats = pool.stats()
+    assert stats['in_use'] == 1 and stats['idle'] == 1 and stats['size'] == 2
+    assert stats['timeouts'] == 1 and stats['checkouts'] == 3
+
+
+def test_idle_connections_are_validated_and_recycled():
+    pool, created, clock = make_pool(max_size=2, validate_after=30, max_lifetime=100)
+    conn = pool.getconn()
+    pool.putconn(conn)
+
+    clock.now = 10
+    assert pool.getconn() is conn and conn.executed == []
+    pool.putconn(conn)
+
+    clock.now = 50  # ว่างนานเกิน validate_after -> SELECT 1
+    assert pool.getconn() is conn and conn.executed == ['SELECT 1']
+    pool.putconn(conn)
+
+    clock.now = 90
+    conn.broken = True  # server ตัด connection ระหว่างว่าง
+    replacement = pool.getconn()
+    assert replacement is not conn and conn.closed
+    pool.putconn(replacement)
+
+    clock.now = 300  # อายุเกิน max_lifetime
+    assert pool.getconn() is not replacement
+    stats = pool.stats()
+    assert stats['validation_failures'] == 1 and stats['recycled'] == 1 and stats['size'] == 1
+    assert len(created) == 3
+
+
+def test_connections_closed_by_caller_free_their_slot():
+    pool, created, _ = make_pool(max_size=1)
+    conn = pool.getconn()
+    conn.close()  # code เดิมที่ conn.close() โดยไม่ putconn
+    assert pool.getconn() is not conn
+    assert pool.stats()['size'] == 1
+
+
+def test_leaked_connections_are_reclaimed():
+    clock = Clock()
+    pool = PgPool(FakeConnection, max_size=2, checkout_timeout=0.05, max_checkout=60, clock=clock)
+
+    def failing_handler():
+        conn = pool.getconn()
+        conn.cursor().execute('SELECT 1')
+        raise ValueError('handler error ก่อน putconn')
+
+    for _ in range(5):
+        with pytest.raises(ValueError):
+            failing_handler()
+    gc.collect()  # ไม่พึ่งจังหวะ garbage collect ของ interpreter
+    conn = pool.getconn()  # connection ที่ถูก garbage collect ได้ที่คืน ไม่ PoolTimeout
+    held = pool.getconn()
+    assert pool.stats()['leaked'] >= 1
+
+    clock.now = 61  # ยืมนานเกิน max_checkout - ปิดทิ้งแล้วเปิดใหม่
+    replacement = pool.getconn()
+    assert conn.closed and held.closed and not replacement.closed
+    pool.putconn(conn)  # คืนช้ากว่ากำหนด - ไม่กลับเข้า pool
+    stats = pool.stats()
+    assert stats['in_use'] == 1 and stats['idle'] == 0 and stats['size'] == 1
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test roster cache (lookup ทีละคน + invalidation ตามโรงเรียน)
+"""
+
+import pytest
+
+from roster_cache import RosterCache
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.students = {
+            ('SCH001', 'STD001'): {'student_id': 'STD001', 'name': 'สมชาย', 'school_id': 'SCH001'},
+            ('SCH002', 'STD100'): {'student_id': 'STD100', 'name': 'สมหญิง', 'school_id': 'SCH002'},
+        }
+        self.reads = 0
+        self.listeners = []
+
+    def on_write(self, listener):
+        self.listeners.append(listener)
+
+    def get_student(self, school_id, student_id):
+        self.reads += 1
+        student = self.students.get((school_id, student_id))
+        return dict(student) if student else None
+
+    def update_name(self, school_id, student_id, name):
+        self.students[(school_id, student_id)]['name'] = name
+        for listener in self.listeners:
+            listener('students', school_id)
+
+
+def test_lookups_hit_cache_and_are_scoped_by_school():
+    db = FakeDatabase()
+    roster = RosterCache(db)
+
+    assert roster.get('SCH001', 'STD001')['name'] == 'สมชาย'
+    roster.get('SCH001', 'STD001')['name'] = 'changed'  # ผู้เรียกแก้ copy ได้โดยไม่กระทบ cache
+    assert roster.get('SCH001', 'STD001')['name'] == 'สมชาย'
+    assert db.reads == 1
+
+    assert roster.get('SCH002', 'STD001') is None
+    assert roster.get('SCH001', 'not-a-student') is None
+    assert roster.get('SCH001', '') is None
+    assert roster.stats()['hits'] == 2
+
+
+def test_student_writes_invalidate_only_that_school():
+    db = FakeDatabase()
+    roster = RosterCache(db)
+    roster.get('SCH001', 'STD001')
+    roster.get('SCH002', 'STD100')
+
+    db.update_name('SCH001', 'STD001', 'สมชาย ใจดี')
+    assert roster.get('SCH001', 'STD001')['name'] == 'สมชาย ใจดี'
+    assert roster.get('SCH002', 'STD100')['name'] == 'สมหญิง'
+    assert db.reads == 3
+
+
+def test_get_student_uses_single_row_query(tmp_path, monkeypatch):
+    pytest.importorskip('dotenv')
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    import database_universal
+
+    database = database_universal.Database()
+    roster = RosterCache(database)
+    database.add_student('STD001', 'Test', 'M1', 'SCH001', '')
+    assert database.get_student('SCH001', 'STD001')['name'] == 'Test'
+    assert database.get_student('SCH002', 'STD001') is None
+
+    assert roster.get('SCH001', 'STD001')['class_name'] == 'M1'
+    database.update_student('STD001', 'Renamed', 'M2', 'SCH001', '')
+    assert roster.get('SCH001', 'STD001')['name'] == 'Renamed'
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test per-school face gallery cache
+"""
+
+import numpy as np
+
+from school_gallery_cache import SchoolGalleryCache
+
+DIM = 64
+
+
+def _roster(school_id, n=10):
+    return [{'student_id': f'{school_id}-{i}', 'name': f'Student {i}', 'seed': hash(school_id) % 1000 + i}
+            for i in range(n)]
+
+
+def _features(student):
+    return np.random.default_rng(student['seed']).random(DIM)
+
+
+def _cache(max_bytes=None):
+    loads = []
+
+    def loader(school_id):
+        loads.append(school_id)
+        return _roster(school_id)
+
+    return SchoolGalleryCache(loader, _features, DIM, max_bytes=max_bytes), loads
+
+
+def test_lazy_load_per_school():
+    cache, loads = _cache()
+
+    sch1 = cache.get('SCH001')
+    cache.get('SCH001')
+    sch2 = cache.get('SCH002')
+
+    assert loads == ['SCH001', 'SCH002']
+    assert set(sch1.gallery.ids).isdisjoint(sch2.gallery.ids)
+    assert sch1.names['SCH001-3'] == 'Student 3'
+
+
+def test_lru_eviction_under_budget():
+    cache, loads = _cache()
+    one_school = cache.get('SCH001').nbytes
+    cache.max_bytes = one_school * 2
+
+    cache.get('SCH002')
+    cache.get('SCH001')           # SCH001 ใช้ล่าสุด
+    cache.get('SCH003')           # ต้องไล่ SCH002 ออก
+
+    assert 'SCH001' in cache and 'SCH003' in cache
+    assert 'SCH002' not in cache
+    cache.get('SCH002')
+    assert loads.count('SCH002') == 2
+
+
+def test_invalidation_hooks():
+    cache, loads = _cache()
+    entry = cache.get('SCH001')
+
+    cache.remove_student('SCH001', 'SCH001-0')
+    assert 'SCH001-0' not in entry.gallery
+
+    cache.upsert_student('SCH001', {'student_id': 'NEW', 'name': 'New', 'seed': 1})
+    assert entry.names['NEW'] == 'New'
+
+    cache.upsert_student('SCH009', {'student_id': 'X', 'name': 'X', 'seed': 2})
+    assert 'SCH009' not in cache
+
+    cache.invalidate('SCH001')
+    cache.get('SCH001')
+    assert loads == ['SCH001', 'SCH001']
+
+
+def test_ttl_expiry_reloads_school():
+    now = [0.0]
+    loads = []
+
+    def loader(school_id):
+        loads.append(school_id)
+        return _roster(school_id)
+
+    cache = SchoolGalleryCache(loader, _features, DIM, ttl=60, clock=lambda: now[0])
+    cache.get('SCH001')
+    now[0] = 59
+    cache.get('SCH001')
+    now[0] = 61
+    assert 'SCH001' not in cache
+    cache.get('SCH001')
+    assert loads == ['SCH001', 'SCH001']
+
+
+def test_load_racing_invalidate_is_not_cached():
+    rosters = {'SCH001': _roster('SCH001', 3)}
+    cache = None
+
+    def loader(school_id):
+        students = list(rosters[school_id])
+        # นำเข้ารายชื่อใหม่ระหว่างที่กำลังโหลด
+        rosters[school_id] = _roster(school_id, 5)
+        cache.invalidate(school_id)
+        return students
+
+    cache = SchoolGalleryCache(loader, _features, DIM)
+    assert len(cache.get('SCH001').gallery) == 3
+    assert 'SCH001' not in cache
+    assert len(cache.get('SCH001').gallery) == 5
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test SQLite connection pool (WAL, reuse, backup)
+"""
+
+import sqlite3
+import zipfile
+
+from sqlite_pool import SQLitePool, get_pool
+
+
+def test_reuses_connections_with_wal_settings(tmp_path):
+    pool = SQLitePool(str(tmp_path / 'test.db'))
+    conn = pool.acquire()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == pool.busy_timeout_ms
+    conn.close()
+    conn.close()  # close ซ้ำไม่ทำให้ connection อยู่ใน pool สองครั้ง
+
+    assert pool.acquire() is conn
+    assert pool.acquire() is not conn
+    assert pool.stats()['created'] == 2 and pool.stats()['reused'] == 1
+    assert get_pool(str(tmp_path / 'test.db')) is get_pool(str(tmp_path / '.' / 'test.db'))
+
+
+def test_uncommitted_work_is_rolled_back_and_readers_are_not_blocked(tmp_path):
+    pool = SQLitePool(str(tmp_path / 'test.db'))
+    conn = pool.acquire()
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.commit()
+
+    conn.execute('INSERT INTO t VALUES (1)')      # เปิด write transaction ค้างไว้
+    reader = pool.acquire()
+    assert reader.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+    reader.close()
+
+    conn.close()                                  # คืน pool โดยไม่ commit
+    conn = pool.acquire()
+    assert not conn.in_transaction
+    assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+
+
+def test_backup_includes_wal_contents(tmp_path, monkeypatch):
+    from backup_manager import BackupManager
+
+    monkeypatch.chdir(tmp_path)
+    manager = BackupManager(db_path='data/database.db', backup_dir='backups')
+    conn = manager.pool.acquire()
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.execute('INSERT INTO t VALUES (42)')
+    conn.commit()
+    conn.close()
+
+    result = manager.create_backup(include_images=False)
+    with zipfile.ZipFile(result['backup_file']) as zipf:
+        zipf.extract('database.db', 'check')
+    copy = sqlite3.connect('check/database.db')
+    assert copy.execute('SELECT x FROM t').fetchone()[0] == 42
+    copy.close()
+
+    conn = manager.pool.acquire()
+    conn.execute('DELETE FROM t')
+    conn.commit()
+    conn.close()
+    assert manager.restore_backup(result['backup_file'])['success']
+    conn = manager.pool.acquire()
+    assert conn.execute('SELECT x FROM t').fetchone()[0] == 42
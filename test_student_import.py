@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test streaming bulk student import (chunk + vectorized validation + batched upsert)
+"""
+
+import os
+import zipfile
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from job_runner import JobCancelled
+from student_import_system import StudentImportSystem, iter_chunks, validate_chunk
+
+
+class FakeDatabase:
+    def __init__(self, other_school_ids=()):
+        self.students = {}
+        self.other_school_ids = set(other_school_ids)
+        self.batches = []
+
+    def upsert_students(self, school_id, students):
+        self.batches.append(len(students))
+        result = {'inserted': 0, 'updated': 0, 'conflicts': []}
+        for student in students:
+            if student['student_id'] in self.other_school_ids:
+                result['conflicts'].append(student['student_id'])
+                continue
+            result['updated' if student['student_id'] in self.students else 'inserted'] += 1
+            self.students[student['student_id']] = dict(student, school_id=school_id)
+        return result
+
+
+def _write_csv(path, rows):
+    lines = ['student_id,name,class_name,parent_line_id'] + [','.join(row) for row in rows]
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def test_validate_chunk_reports_row_numbers():
+    df = pd.DataFrame({
+        'student_id': [1001.0, '', 'STD3', 'STD3', 'X' * 60],
+        'name': ['สมชาย', 'ไม่มีรหัส', 'สมหญิง', 'ซ้ำ', 'ยาว'],
+    }, index=range(2, 7))
+    seen = {'STD9'}
+    students, errors = validate_chunk(df, seen)
+
+    assert [s['student_id'] for s in students] == ['1001', 'STD3']
+    assert [(row, message) for row, _, message in errors] == [
+        (3, 'ข้อมูลไม่ครบ'), (5, 'รหัสนักเรียนซ้ำในไฟล์'), (6, 'รหัสนักเรียนยาวเกิน 50 ตัวอักษร')]
+    assert seen == {'STD9', '1001', 'STD3'}
+
+
+def test_bulk_import_streams_chunks_and_collects_errors(tmp_path):
+    rows = [(f'STD{i:04d}', f'นักเรียน {i}', 'ม.1/1', '') for i in range(1, 1201)]
+    rows[10] = ('STD0011', '', 'ม.1/1', '')
+    rows.append(('STD0001', 'ซ้ำ', 'ม.1/1', ''))
+    rows.append(('OTHER01', 'โรงเรียนอื่น', 'ม.1/1', ''))
+    path = _write_csv(tmp_path / 'students.csv', rows)
+
+    db = FakeDatabase(other_school_ids={'OTHER01'})
+    progress = []
+    result = StudentImportSystem(db).bulk_import(path, 'SCH001', chunk_size=500,
+                                                 progress=lambda done, total, counts: progress.append((done, total)))
+
+    assert result['success'] and result['total'] == 1202
+    assert result['imported'] == 1199 and result['inserted'] == 1199
+    assert db.batches == [499, 500, 201]
+    assert progress == [(500, 1202), (1000, 1202), (1202, 1202)]
+    assert result['errors'] == ['แถว 12 (STD0011): ข้อมูลไม่ครบ', 'แถว 1202 (STD0001): รหัสนักเรียนซ้ำในไฟล์',
+                                'แถว 1203 (OTHER01): รหัสนักเรียนนี้เป็นของโรงเรียนอื่น']
+
+
+def test_cancelled_import_propagates_and_removes_extracted_images(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = _write_csv(tmp_path / 'students.csv', [('STD0001', 'ก', 'ม.1/1', '')])
+    images = tmp_path / 'images.zip'
+    with zipfile.ZipFile(images, 'w') as archive:
+        archive.writestr('STD0001.jpg', b'jpeg')
+
+    def cancel(done, total, counts):
+        raise JobCancelled('job cancelled')
+
+    system = StudentImportSystem(FakeDatabase())
+    with pytest.raises(JobCancelled):
+        system.import_with_images(path, str(images), 'SCH001', progress=cancel)
+    with pytest.raises(JobCancelled):
+        system.import_from_excel(path, 'SCH001', progress=cancel)
+
+    # นำเข้าไม่สำเร็จก็ลบโฟลเดอร์ที่แตก ZIP
+    missing = tmp_path / 'missing.csv'
+    missing.write_text('student_id\nSTD1\n', encoding='utf-8')
+    assert system.import_with_images(str(missing), str(images), 'SCH001')['success'] is False
+    assert os.listdir(tmp_path / 'data') == []
+
+
+def test_excel_chunks_skip_blank_rows_and_keep_row_numbers(tmp_path):
+    openpyxl = pytest.importorskip('openpyxl')
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['student_id', 'name'])
+    sheet.append([1001, 'สมชาย'])
+    sheet.append([None, None])
+    sheet.append(['STD2', 'สมหญิง'])
+    path = str(tmp_path / 'students.xlsx')
+    workbook.save(path)
+
+    chunks = list(iter_chunks(path, chunk_size=1))
+    assert [list(chunk.index) for chunk in chunks] == [[2], [4]]
+
+    missing = str(tmp_path / 'missing.csv')
+    with open(missing, 'w', encoding='utf-8') as f:
+        f.write('student_id,class_name\nSTD1,ม.1\n')
+    assert StudentImportSystem(FakeDatabase()).import_from_excel(missing, 'SCH001')['success'] is False
+
+
+def test_xls_is_read_with_xlrd_in_chunks(monkeypatch):
+    # เขียนไฟล์ .xls ไม่ได้ (ต้องใช้ xlwt) - ตรวจว่าไม่ส่งให้ openpyxl และแบ่ง chunk ตามเลขแถวเดิม
+    calls = []
+
+    def read_excel(file, **kwargs):
+        calls.append((file, kwargs.get('engine')))
+        return pd.DataFrame({' student_id ': ['1001', None, 'STD2', 'STD3'], 'name': ['ก', None, 'ข', 'ค']})
+
+    monkeypatch.setattr(pd, 'read_excel', read_excel)
+    chunks = list(iter_chunks('upload/students.XLS', chunk_size=2))
+
+    assert calls == [('upload/students.XLS', 'xlrd')]
+    assert [list(chunk.index) for chunk in chunks] == [[2, 4], [5]]
+    assert list(chunks[0]['student_id']) == ['1001', 'STD2']
+
+
+def test_upsert_students_keeps_images_and_other_schools(tmp_path, monkeypatch):
+    pytest.importorskip('dotenv')
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    import database_universal
+
+    database = database_universal.Database()
+    database.add_student('STD001', 'เดิม', 'ม.1', 'SCH001', 'data/students/STD001.jpg', 'line-1')
+    database.add_student('STD900', 'โรงเรียนอื่น', 'ม.1', 'SCH002', None)
+
+    result = database.upsert_students('SCH001', [
+        {'student_id': 'STD001', 'name': 'ใหม่', 'class_name': 'ม.2', 'parent_line_token': ''},
+        {'student_id': 'STD002', 'name': 'เพิ่ม', 'class_name': 'ม.2', 'parent_line_token': 'line-2'},
+        {'student_id': 'STD900', 'name': 'ชนกัน', 'class_name': 'ม.2', 'parent_line_token': ''},
+    ])
+    assert result == {'inserted': 1, 'updated': 1, 'conflicts': ['STD900']}
+
+    updated = database.get_student('SCH001', 'STD001')
+    assert (updated['name'], updated['image_path'], updated['parent_line_token']) == (
+        'ใหม่', 'data/students/STD001.jpg', 'line-1')
+    assert database.get_student('SCH001', 'STD002')['parent_line_token'] == 'line-2'
+    assert database.get_student('SCH002', 'STD900')['name'] == 'โรงเรียนอื่น'
+
+    database.set_student_images('SCH001', {'STD002': 'data/students/STD002.jpg'})
+    assert database.get_student('SCH001', 'STD002')['image_path'] == 'data/students/STD002.jpg'
@@ -1,5 +1,6 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for
 import cv2
+from face_detector import detector_registry
 import numpy as np
 import os
 import json
@@ -11,7 +12,7 @@ app = Flask(__name__)
 
 class WebStudentSystem:
     def __init__(self):
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.face_cascade = detector_registry.get()
         self.face_recognizer = cv2.face.LBPHFaceRecognizer_create()
         
         self.students_data = {}